@@ -2,6 +2,11 @@
 
 import xbmc
 from paths import qr_path
+from jobs import shutdown as shutdown_jobs
+from thumbnails import shutdown as shutdown_thumbnails
+from calibration import start_calibration
+from speculative import cancel_all_sessions
+from governor import start_governor, stop_governor
 from database import replace_engine
 from flask_backend import run_server
 from kodi_gui import show_notification
@@ -30,6 +35,12 @@ def main():
     # closed, if settings are already open when instantiated no changes will be detected.
     monitor = SettingsMonitor()
 
+    # Throttle encoders while media is playing
+    start_governor()
+
+    # Measure encoder preset speeds in background if not calibrated yet
+    start_calibration()
+
     # Start flask server in new thread, don't wait for address if unavailable
     server_instance = run_server(timeout=1)
     if server_instance:
@@ -44,6 +55,11 @@ def main():
                 server_instance.shutdown()
                 server_instance.server_close()
             xbmc.log("Closed web server", xbmc.LOGINFO)
+            # Cancel queued clips + thumbnails (running clips finish), stop speculative encodes
+            shutdown_jobs()
+            shutdown_thumbnails()
+            cancel_all_sessions()
+            stop_governor()
             break
 
         # Restart flask if user made changes
@@ -62,6 +78,9 @@ def main():
             replace_engine()
             xbmc.log("Finished restarting database", xbmc.LOGINFO)
 
+            # Calibrate if auto preset was just enabled
+            start_calibration()
+
             # Start new server (waits up to 2 minutes if address is unavailable)
             server_instance = run_server()
             xbmc.log("Finished restarting flask...", xbmc.LOGINFO)
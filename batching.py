@@ -0,0 +1,244 @@
+'''Coalesces clip requests for the same source so the source is only decoded
+once. Requests that arrive while an earlier request for the same source is
+waiting for a scheduler slot join its batch if their ranges overlap or are
+at most BATCH_MAX_GAP seconds apart (the shared ffmpeg process decodes
+everything between clips, distant clips start a separate batch). The whole
+batch is generated by a single ffmpeg process with one output per clip.
+Requests with exactly the same range as a queued or running request reuse
+its output (hard link).
+
+Each request still runs in its own job (own filename, progress, database
+row). The batch is encoded in a background thread, jobs mirror the batch
+progress and can be cancelled individually (the shared ffmpeg process is
+only killed if every request in the batch was cancelled).
+'''
+
+import os
+import shutil
+import threading
+import xbmc
+from jobs import Job, get_current_job
+from paths import output_path
+from encoder import gen_mp4, gen_mp4_batch, remove_output, BATCH_MAX_GAP
+from scheduler import scheduler, INTERACTIVE
+
+
+# Seconds between progress/cancellation checks while waiting for a batch
+WAIT_INTERVAL = 0.5
+
+# Lists of batches waiting for a scheduler slot ((source, audio_track,
+# priority) keys)
+pending = {}
+
+# Requests that have not finished yet ((source, audio_track, start, duration)
+# keys), used to find requests with exactly the same range
+inflight = {}
+
+# Protects pending and inflight
+lock = threading.Lock()
+
+
+class ClipRequest:  # pylint: disable=too-many-instance-attributes
+    '''A single clip requested by a job, generated as part of a Batch.'''
+
+    def __init__(self, start_time, duration, filename, job):
+        self.start_time = start_time
+        self.duration = duration
+        self.filename = filename
+        self.output = os.path.join(output_path, f'{filename}.mp4')
+        self.job = job
+
+        # Set when job is cancelled before batch finishes
+        self.cancelled = False
+
+        # Mode returned by encoder (None if failed), set before batch finishes
+        self.mode = None
+        self.batch = None
+
+    def is_cancelled(self):
+        '''Returns True if job that requested clip was cancelled.'''
+        return self.cancelled or bool(self.job and self.job.cancelled.is_set())
+
+    def wait(self):
+        '''Blocks until batch finishes, copies batch progress to job. Returns
+        False if job was cancelled first (batch is cancelled if every request
+        in it was cancelled), True when batch finished.
+        '''
+        while not self.batch.finished.wait(WAIT_INTERVAL):
+            if self.job is None:
+                continue
+            if self.job.cancelled.is_set():
+                self.cancelled = True
+                self.batch.cancel_if_abandoned()
+                return False
+            self.job.speed = self.batch.job.speed
+            self.job.update_progress(self.batch.job.progress)
+        return True
+
+
+class Batch:
+    '''Clips from the same source and audio track generated together. The
+    job attribute is an unregistered Job that tracks the shared ffmpeg
+    process (progress, cancellation).
+    '''
+
+    def __init__(self, source, audio_track):
+        self.source = source
+        self.audio_track = audio_track
+        self.requests = []
+        self.job = Job(None, ())
+        self.finished = threading.Event()
+
+        # Range covered by requests (source timestamps)
+        self.start = None
+        self.end = None
+
+    def accepts(self, start_time, duration):
+        '''Returns True if range overlaps the batch range or is at most
+        BATCH_MAX_GAP seconds away from it (always True if batch is empty).
+        '''
+        if not self.requests:
+            return True
+        start = float(start_time)
+        return start <= self.end + BATCH_MAX_GAP \
+            and start + float(duration) >= self.start - BATCH_MAX_GAP
+
+    def add(self, request):
+        '''Adds ClipRequest to batch, extends batch range to include it.'''
+        start = float(request.start_time)
+        end = start + float(request.duration)
+        self.requests.append(request)
+        self.start = start if self.start is None else min(self.start, start)
+        self.end = end if self.end is None else max(self.end, end)
+        request.batch = self
+
+    def cancel_if_abandoned(self):
+        '''Kills ffmpeg if every request in batch was cancelled.'''
+        if all(request.is_cancelled() for request in self.requests):
+            self.job.cancel()
+
+    def run(self):
+        '''Runs in background thread, generates clips of all requests that
+        were not cancelled, removes output of requests cancelled while
+        encoding.
+        '''
+        try:
+            requests = [request for request in self.requests if not request.is_cancelled()]
+            clips = [
+                (request.start_time, request.duration, request.filename)
+                for request in requests
+            ]
+            if len(clips) == 1:
+                modes = [gen_mp4(self.source, self.audio_track, *clips[0], self.job)]
+            elif clips:
+                modes = gen_mp4_batch(self.source, self.audio_track, clips, self.job)
+            else:
+                modes = []
+
+            for request, mode in zip(requests, modes):
+                request.mode = mode
+                if request.is_cancelled() and os.path.exists(request.output):
+                    os.remove(request.output)
+
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # Waiting jobs would otherwise never finish
+            xbmc.log(f"Batch failed with unexpected error: {e!r}", xbmc.LOGERROR)
+
+        finally:
+            with lock:
+                for request in self.requests:
+                    inflight.pop(get_range_key(self, request), None)
+            self.finished.set()
+
+
+def get_range_key(batch, request):
+    '''Returns key used to find requests with the same source and range.'''
+    return (batch.source, batch.audio_track, float(request.start_time), float(request.duration))
+
+
+def remove_pending(key, batch):
+    '''Takes pending key and Batch, removes batch from pending (called with
+    lock held once batch has a slot, later requests start a new batch).
+    '''
+    batches = pending[key]
+    batches.remove(batch)
+    if not batches:
+        del pending[key]
+
+
+def link_output(existing, output):
+    '''Takes path to existing clip and output path, hard links existing clip
+    to output (copies if the filesystem does not support hard links, both use
+    the same disk space until one is deleted). Any file already at output is
+    removed first (may share its inode with another clip). Encoders remove
+    outputs before writing too, so clips sharing an inode are never
+    modified. Returns True if successful.
+    '''
+    try:
+        remove_output(output)
+        try:
+            os.link(existing, output)
+        except OSError:
+            shutil.copyfile(existing, output)
+        return True
+    except OSError as e:
+        xbmc.log(f"Failed to reuse {existing}: {e}", xbmc.LOGERROR)
+        return False
+
+
+def batch_gen_mp4(source, audio_track, start_time, duration, filename, priority=INTERACTIVE):  # pylint: disable=too-many-arguments
+    '''Runs in job worker thread. Takes source file path, audio track index,
+    start timestamp, duration, output filename, and scheduler priority.
+    Generates MP4 together with other requests for the same source (see
+    module docstring). Returns mode used (batch, reuse, or any gen_mp4 mode)
+    if successful, None if error or cancelled.
+    '''
+    request = ClipRequest(start_time, duration, filename, get_current_job())
+    key = (source, audio_track, priority)
+
+    with lock:
+        # Join batch waiting for a slot with a nearby range, or start new batch
+        batches = pending.setdefault(key, [])
+        batch = next(
+            (waiting for waiting in batches if waiting.accepts(start_time, duration)), None
+        )
+        leader = batch is None
+        if leader:
+            batch = Batch(source, audio_track)
+            batches.append(batch)
+
+        # Reuse output of request with exactly the same range
+        original = inflight.get(get_range_key(batch, request))
+        if original:
+            if leader:
+                remove_pending(key, batch)
+            request.batch = original.batch
+        else:
+            batch.add(request)
+            inflight[get_range_key(batch, request)] = request
+
+    if original:
+        xbmc.log(f"Reusing output of {original.filename} for {filename}", xbmc.LOGINFO)
+        if not request.wait():
+            return None
+        if original.mode and link_output(original.output, request.output):
+            return 'reuse'
+
+        # Original failed or was cancelled, generate separately
+        with scheduler.slot(priority):
+            return gen_mp4(source, audio_track, start_time, duration, filename, request.job)
+
+    if leader:
+        # Wait for slot, close batch (later requests start a new batch)
+        with scheduler.slot(priority):
+            with lock:
+                remove_pending(key, batch)
+            threading.Thread(target=batch.run, daemon=True).start()
+            finished = request.wait()
+            # Hold slot until ffmpeg exits (even if this job was cancelled)
+            batch.finished.wait()
+    else:
+        xbmc.log(f"Added {filename} to batch of {source}", xbmc.LOGINFO)
+        finished = request.wait()
+
+    return request.mode if finished else None
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+'''Development script used to measure encode speed of different clip
+generation modes with a real ffmpeg binary, and history database lookup
+and search latency as the number of entries grows. Not included in packaged zip.
+
+Kodi modules are mocked (settings are read from the SETTINGS dict below),
+clips are written to a temporary directory that is removed on exit.
+
+Usage:
+    python3 benchmark.py segments [--source FILE] [--duration 600] [--segments N]
+    python3 benchmark.py caps [--source FILE] [--duration 60] [--max-height 1080] [--max-fps 30]
+    python3 benchmark.py history [--rows 200000] [--lookups 1000]
+'''
+
+import os
+import sys
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import subprocess
+from unittest.mock import Mock
+
+
+# Settings returned by mocked xbmcaddon.Addon().getSetting
+SETTINGS = {
+    'db_type': 'SQLite',
+    'mb_per_min': '20',
+}
+
+# Temporary addon_data directory (database and output)
+profile_path = tempfile.mkdtemp(prefix='record_button_benchmark_')
+
+# Mock Kodi modules before importing addon modules
+sys.modules['xbmc'] = Mock()
+sys.modules['xbmcgui'] = Mock()
+sys.modules['xbmcaddon'] = Mock(Addon=Mock(return_value=Mock(
+    getSetting=lambda setting: SETTINGS.get(setting, ''),
+    getAddonInfo=lambda info: profile_path
+)))
+sys.modules['xbmcvfs'] = Mock(
+    translatePath=lambda path: path,
+    exists=os.path.exists,
+    mkdir=os.mkdir
+)
+
+# Hide SQL statements echoed by database module
+logging.disable(logging.INFO)
+
+# pylint: disable=wrong-import-position
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from encoder import (
+    get_keyframes,
+    get_segments,
+    encode_mp4,
+    segmented_encode_mp4,
+    probe_source,
+    get_video_options,
+    SEGMENT_THREADS
+)
+import database
+from database import (
+    GeneratedFile,
+    get_orm_entry,
+    is_duplicate,
+    get_fingerprint_matches,
+    load_history_search_results
+)
+
+
+def create_test_source(path, duration, size='1920x1080', rate=30):
+    '''Takes output path and duration, writes H.264/AAC test pattern (1080p
+    30fps by default) with a keyframe every 2 seconds (similar to broadcast
+    sources).
+    '''
+    print(f"Generating {duration} second {size} {rate}fps test source...")
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate={rate}:duration={duration}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', str(rate * 2),
+        '-c:a', 'aac', '-shortest', path
+    ], check=True)
+
+
+def timed(function, *args):
+    '''Takes function and args, returns seconds taken to run function.'''
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def benchmark_segments(args):
+    '''Compares single process encode with segmented parallel encode.'''
+    tmp = os.path.join(profile_path, 'output')
+    source = args.source
+    if not source:
+        source = os.path.join(tmp, 'source.mp4')
+        create_test_source(source, args.duration)
+
+    keyframes = get_keyframes(source, 0, args.duration)
+    count = args.segments or max(2, (os.cpu_count() or 2) // SEGMENT_THREADS)
+    segments = get_segments(keyframes, 0, args.duration, count)
+    bitrate = int(int(SETTINGS['mb_per_min']) * 1024 * 1024 * 8 / 60)
+
+    single = timed(
+        encode_mp4, source, 0, 0, args.duration, os.path.join(tmp, 'single.mp4'), bitrate
+    )
+    parallel = timed(
+        segmented_encode_mp4,
+        source,
+        0,
+        0,
+        args.duration,
+        os.path.join(tmp, 'segmented.mp4'),
+        bitrate,
+        segments
+    )
+
+    print(f"Clip duration:     {args.duration} seconds ({os.cpu_count()} cores)")
+    print(f"Single process:    {single:.1f} seconds")
+    print(f"{len(segments)} segments:       {parallel:.1f} seconds")
+    print(f"Speedup:           {single / parallel:.2f}x")
+
+
+def benchmark_caps(args):
+    '''Compares source resolution encode with max resolution/frame rate caps.'''
+    tmp = os.path.join(profile_path, 'output')
+    source = args.source
+    if not source:
+        source = os.path.join(tmp, 'source.mp4')
+        create_test_source(source, args.duration, '3840x2160', 60)
+
+    bitrate = int(int(SETTINGS['mb_per_min']) * 1024 * 1024 * 8 / 60)
+    probe = probe_source(source)
+
+    uncapped = timed(
+        encode_mp4, source, 0, 0, args.duration, os.path.join(tmp, 'uncapped.mp4'), bitrate
+    )
+
+    SETTINGS['max_height'] = args.max_height
+    SETTINGS['max_fps'] = args.max_fps
+    SETTINGS['tonemap_hdr'] = 'true'
+    video_options = get_video_options(probe)
+    capped = timed(
+        lambda: encode_mp4(
+            source,
+            0,
+            0,
+            args.duration,
+            os.path.join(tmp, 'capped.mp4'),
+            bitrate,
+            video_options=video_options
+        )
+    )
+
+    print(f"Clip duration:     {args.duration} seconds")
+    print(f"Video filters:     {video_options.get('vf', 'none (source within caps)')}")
+    print(f"Source resolution: {uncapped:.1f} seconds")
+    print(f"Capped:            {capped:.1f} seconds")
+    print(f"Speedup:           {uncapped / capped:.2f}x")
+
+
+def insert_history_rows(start, count):
+    '''Takes first row number and count, inserts fake history entries.'''
+    with Session(database.engine) as session:
+        session.execute(insert(GeneratedFile), [
+            {
+                'source': f'/media/show/episode_{row // 50}.mkv',
+                'audio_track': 0,
+                'output': f'clip_{row}.mp4',
+                'start_time': row % 50 * 60.0,
+                'duration': 30.0,
+                'timestamp': f'2024-01-01_00:00:00.{row:06d}',
+                'show_name': 'Show Name',
+                'episode_name': f'Episode {row // 50}',
+                'renamed': False,
+                'fingerprint': f'{row:064x}',
+                'media_type': 'clip'
+            }
+            for row in range(start, start + count)
+        ])
+        session.commit()
+
+
+def uncached(function):
+    '''Takes database read function, returns wrapper that clears the history
+    read cache first (measures query latency, not cache hits).
+    '''
+    def wrapper(arg):
+        database.read_cache.clear()
+        return function(arg)
+    return wrapper
+
+
+def search_like(search_string):
+    '''Runs history search without full-text index (LIKE scans).'''
+    database.read_cache.clear()
+    database.fulltext_search = False
+    try:
+        return load_history_search_results(search_string)
+    finally:
+        database.fulltext_search = True
+        # Don't serve LIKE results to full-text searches
+        database.read_cache.clear()
+
+
+def benchmark_history(args):
+    '''Measures single entry lookup and history search latency (full-text
+    index vs LIKE scans) as history grows to args.rows.
+    '''
+    sizes = [size for size in (1000, 10000, 100000) if size < args.rows] + [args.rows]
+    benchmarks = (
+        ('get_orm_entry', uncached(get_orm_entry), lambda row: f'clip_{row}.mp4'),
+        ('is_duplicate', is_duplicate, lambda row: f'clip_{row}.mp4'),
+        ('fingerprint', get_fingerprint_matches, lambda row: f'{row:064x}'),
+        ('search', uncached(load_history_search_results), lambda row: f'Episode {row // 50}'),
+        ('search (LIKE)', search_like, lambda row: f'Episode {row // 50}'),
+        ('search (cached)', load_history_search_results, lambda row: 'Episode 0')
+    )
+    print(f"{'Rows':>10}" + ''.join(f'{name:>16}' for name, _, _ in benchmarks))
+    rows = 0
+    for size in sizes:
+        while rows < size:
+            count = min(10000, size - rows)
+            insert_history_rows(rows, count)
+            rows += count
+
+        results = []
+        for _, function, make_arg in benchmarks:
+            samples = [random.randrange(rows) for _ in range(args.lookups)]
+            elapsed = sum(timed(function, make_arg(row)) for row in samples)
+            results.append(f'{elapsed / args.lookups * 1000:.3f} ms')
+        print(f"{rows:>10}" + ''.join(f'{result:>16}' for result in results))
+
+
+def main():
+    '''Parses command line args, runs selected benchmark.'''
+    parser = argparse.ArgumentParser(description='Benchmark clip generation modes')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    segments = subparsers.add_parser('segments', help='Segmented parallel encode vs single process')
+    segments.add_argument('--source', help='Source file (default: generated test pattern)')
+    segments.add_argument('--duration', type=float, default=600, help='Clip duration (seconds)')
+    segments.add_argument('--segments', type=int, help='Number of segments (default: cores / 2)')
+    segments.set_defaults(function=benchmark_segments)
+
+    caps = subparsers.add_parser('caps', help='Max resolution/frame rate caps vs source resolution')
+    caps.add_argument(
+        '--source',
+        help='Source file, e.g. 4K HDR (default: generated 4K 60fps test pattern)'
+    )
+    caps.add_argument('--duration', type=float, default=60, help='Clip duration (seconds)')
+    caps.add_argument('--max-height', default='1080', help='Maximum output height')
+    caps.add_argument('--max-fps', default='30', help='Maximum output frame rate')
+    caps.set_defaults(function=benchmark_caps)
+
+    history = subparsers.add_parser(
+        'history',
+        help='History lookup/search latency vs number of entries'
+    )
+    history.add_argument('--rows', type=int, default=200000, help='Number of history entries')
+    history.add_argument('--lookups', type=int, default=1000, help='Lookups timed at each size')
+    history.set_defaults(function=benchmark_history)
+
+    args = parser.parse_args()
+    try:
+        args.function(args)
+    finally:
+        shutil.rmtree(profile_path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+'''Self-calibrating libx264 preset. Slower presets compress better but the
+default (medium) is far too slow on low power hosts, so the encode speed of
+each preset is measured on this host by encoding a synthetic test source at
+several resolutions (minus the time taken to start ffmpeg and generate the
+source, measured by a run without encoding). Clips are then encoded with the
+slowest preset that still finishes within the configured multiple of the clip
+duration.
+
+Calibration runs in the background on first start (and on demand from the
+webapp) while media is not playing (encodes are throttled during playback),
+results are stored in addon_data (speed depends on the host, so they
+are never shared through the database).
+'''
+
+import os
+import json
+import time
+import threading
+import xbmc
+import ffmpeg
+import xbmcaddon
+from paths import calibration_path
+from scheduler import scheduler, MAINTENANCE
+from governor import get_ffmpeg_command, get_thread_options, is_playback_active
+from jobs import submit_unique_job, get_current_job
+
+
+# libx264 presets in order from fastest to slowest (slower presets than
+# medium are never worth the encode time for clips)
+PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium')
+
+# Output heights measured (16:9), clips use the nearest height at or above
+# their output height
+CALIBRATION_HEIGHTS = (480, 720, 1080, 2160)
+
+# Test source frame rate and duration (seconds) encoded for each preset
+CALIBRATION_FPS = 30
+CALIBRATION_DURATION = 2
+
+# Encode time targets (multiple of clip duration) selectable in settings
+ENCODE_TIME_TARGETS = ('0.25', '0.5', '1', '2')
+DEFAULT_ENCODE_TIME_TARGET = 1.0
+
+# Slower presets are not measured once a preset is slower than this (realtime
+# multiple, can't meet the largest target)
+MIN_SPEED = 1 / float(ENCODE_TIME_TARGETS[-1])
+
+# Minimum encode time (seconds) after subtracting the baseline run, avoids
+# dividing by zero if the baseline took as long as the encode
+MIN_ENCODE_TIME = 0.01
+
+# Seconds between checks while waiting for playback to stop
+PLAYBACK_WAIT_INTERVAL = 10
+
+
+class CalibrationCache:
+    '''Calibration results read from addon_data, loaded on first use and
+    replaced when calibration finishes (None until loaded or not calibrated).
+    '''
+
+    def __init__(self):
+        self.results = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        '''Returns loaded results, reads file if not loaded yet.'''
+        with self.lock:
+            if self.results is None and os.path.exists(calibration_path):
+                try:
+                    with open(calibration_path, 'r', encoding='utf-8') as file:
+                        self.results = json.load(file)
+                except (OSError, ValueError):
+                    xbmc.log("Failed to read encoder calibration, ignoring", xbmc.LOGWARNING)
+            return self.results
+
+    def save(self, results):
+        '''Takes results dict, writes to addon_data and replaces loaded results.'''
+        temp = f'{calibration_path}.part'
+        with self.lock:
+            with open(temp, 'w', encoding='utf-8') as file:
+                json.dump(results, file)
+            os.replace(temp, calibration_path)
+            self.results = results
+
+
+calibration_cache = CalibrationCache()
+
+
+def is_auto_preset_enabled():
+    '''Returns True if automatic preset selection is enabled in settings.'''
+    return xbmcaddon.Addon().getSetting('auto_preset') == 'true'
+
+
+def get_encode_time_target():
+    '''Returns max encode time as a multiple of clip duration (float).'''
+    value = xbmcaddon.Addon().getSetting('encode_time_target')
+    if value in ENCODE_TIME_TARGETS:
+        return float(value)
+    return DEFAULT_ENCODE_TIME_TARGET
+
+
+def load_calibration():
+    '''Returns calibration results dict (heights key contains speed of each
+    preset at each height, realtime multiple), or None if not calibrated.
+    '''
+    return calibration_cache.load()
+
+
+def save_calibration(results):
+    '''Takes calibration results dict, writes to addon_data and replaces
+    loaded results.
+    '''
+    calibration_cache.save(results)
+
+
+def run_test_source(height, name, **options):
+    '''Takes output height, name used in log messages, and output options.
+    Encodes test source (with the same niceness and affinity as clips) and
+    discards output. Returns elapsed seconds, or None if ffmpeg failed.
+    '''
+    width = height * 16 // 9
+    stream = ffmpeg.input(
+        f'testsrc2=size={width}x{height}:rate={CALIBRATION_FPS}:duration={CALIBRATION_DURATION}',
+        f='lavfi'
+    ).output(
+        '-',
+        f='null',
+        pix_fmt='yuv420p',
+        **options
+    )
+    start = time.perf_counter()
+    try:
+        stream.run(cmd=get_ffmpeg_command(), capture_stdout=True, capture_stderr=True)
+    except ffmpeg.Error as e:
+        xbmc.log(f"Failed to calibrate {name} at {height}p:", xbmc.LOGERROR)
+        xbmc.log(e.stderr.decode(errors='replace'), xbmc.LOGERROR)
+        return None
+    return time.perf_counter() - start
+
+
+def measure_baseline(height):
+    '''Takes output height, returns seconds taken to start ffmpeg and
+    generate the test source without encoding it (subtracted from preset
+    encode times), or 0 if ffmpeg failed.
+    '''
+    return run_test_source(height, 'baseline', vcodec='wrapped_avframe') or 0.0
+
+
+def measure_preset(height, preset, baseline=0.0):
+    '''Takes output height, libx264 preset, and baseline seconds (see
+    measure_baseline). Encodes test source with the configured threads (not
+    halved for playback), returns encode speed as a multiple of realtime, or
+    None if ffmpeg failed.
+    '''
+    elapsed = run_test_source(
+        height,
+        f'{preset} preset',
+        vcodec='libx264',
+        preset=preset,
+        **get_thread_options(throttle=False)
+    )
+    if elapsed is None:
+        return None
+    return round(CALIBRATION_DURATION / max(elapsed - baseline, MIN_ENCODE_TIME), 3)
+
+
+def wait_for_playback(job):
+    '''Takes calibration Job (None if not running in a job), waits until media
+    is not playing (ffmpeg is throttled during playback, skewing results).
+    Returns False if job was cancelled while waiting.
+    '''
+    cancelled = job.cancelled if job else threading.Event()
+    while is_playback_active():
+        if cancelled.wait(PLAYBACK_WAIT_INTERVAL):
+            return False
+    return True
+
+
+def measure_height(height, index, job):
+    '''Takes calibration height, its index in CALIBRATION_HEIGHTS, and
+    calibration Job (None if not running in a job). Returns dict with speed of
+    each preset (fastest first, slower presets skipped once too slow for any
+    target), or None if cancelled.
+    '''
+    speeds = {}
+    total = len(CALIBRATION_HEIGHTS) * len(PRESETS)
+    baseline = measure_baseline(height)
+    for step, preset in enumerate(PRESETS):
+        if job and job.cancelled.is_set():
+            return None
+        speed = measure_preset(height, preset, baseline)
+        if job:
+            job.update_progress((index * len(PRESETS) + step + 1) / total)
+        if speed is None:
+            break
+        speeds[preset] = speed
+        if speed < MIN_SPEED:
+            break
+    return speeds
+
+
+def calibrate():
+    '''Runs in job worker thread. Measures speed of each preset at each
+    calibration height, saves and returns results dict. Each height waits for
+    playback to stop, then for a maintenance slot so clips are never delayed
+    (measured again if playback started while measuring). Returns None if
+    cancelled or if no preset could be measured.
+    '''
+    job = get_current_job()
+    heights = {}
+    xbmc.log("Calibrating encoder presets", xbmc.LOGINFO)
+    for index, height in enumerate(CALIBRATION_HEIGHTS):
+        while True:
+            if not wait_for_playback(job):
+                return None
+            with scheduler.slot(MAINTENANCE):
+                speeds = measure_height(height, index, job)
+            if speeds is None:
+                return None
+            if not is_playback_active():
+                break
+            xbmc.log(f"Playback started while calibrating {height}p, measuring again", xbmc.LOGINFO)
+        if speeds:
+            heights[str(height)] = speeds
+            xbmc.log(f"Calibrated presets at {height}p: {speeds}", xbmc.LOGINFO)
+
+    if not heights:
+        xbmc.log("Encoder calibration failed, using default preset", xbmc.LOGERROR)
+        return None
+
+    results = {'time': time.time(), 'fps': CALIBRATION_FPS, 'heights': heights}
+    save_calibration(results)
+    return results
+
+
+def start_calibration(force=False):
+    '''Queues calibration job if automatic preset is enabled and host has not
+    been calibrated (always queued if force is True). Returns Job (existing
+    job if already running), or None if not needed.
+    '''
+    if not force and (not is_auto_preset_enabled() or load_calibration()):
+        return None
+    return submit_unique_job(calibrate)
+
+
+def get_preset(height, fps):
+    '''Takes output height and frame rate, returns (preset, speed) tuple with
+    the slowest calibrated preset fast enough to meet the encode time target
+    (fastest preset if none are), and its measured speed adjusted for frame
+    rate. Returns None if automatic preset is disabled or not calibrated.
+    '''
+    results = load_calibration()
+    if not is_auto_preset_enabled() or not results:
+        return None
+
+    # Use nearest calibrated height at or above output (largest if above all)
+    heights = sorted(int(calibrated) for calibrated in results['heights'])
+    calibrated = next((h for h in heights if h >= height), heights[-1])
+    speeds = results['heights'][str(calibrated)]
+
+    # Speed drops in proportion to frame rate (more frames per second of clip)
+    scale = results.get('fps', CALIBRATION_FPS) / (fps or CALIBRATION_FPS)
+    required = 1 / get_encode_time_target()
+    measured = [(preset, speeds[preset] * scale) for preset in PRESETS if preset in speeds]
+    fast_enough = [result for result in measured if result[1] >= required]
+    preset, speed = fast_enough[-1] if fast_enough else measured[0]
+    return preset, round(speed, 2)
+
+
+def get_calibration_stats():
+    '''Returns dict with auto preset setting, encode time target, calibration
+    results (None if not calibrated), and preset chosen for each calibrated
+    height at the calibration frame rate.
+    '''
+    results = load_calibration()
+    presets = {}
+    if results:
+        for height in results['heights']:
+            chosen = get_preset(int(height), CALIBRATION_FPS)
+            presets[height] = chosen[0] if chosen else None
+    return {
+        'enabled': is_auto_preset_enabled(),
+        'target': get_encode_time_target(),
+        'calibration': results,
+        'presets': presets
+    }
@@ -1,21 +1,104 @@
 '''SqlAlchemy ORM model used to track generated clips, utility functions used
 to find, modify, and delete existing entries.
+
+create_all only creates missing tables, so changes to existing tables are
+made by versioned migrations (see MIGRATIONS). The number applied is stored in
+the schema_version table, each migration runs once when the addon starts or
+the database is changed in settings (works on SQLite and MySQL). Missing
+indexes declared on the models are created after the migrations.
+
+History search uses a full-text index: an FTS5 trigram table kept in sync by
+triggers on SQLite (substring matches), a FULLTEXT index on MySQL (word prefix
+matches). Queries too short for the index fall back to LIKE scans.
+
+Every write to history is logged in the history_changes table with an
+increasing sequence number, so clients can fetch only entries changed since
+the sequence they last loaded (deleted or renamed filenames are kept as
+tombstones for the last HISTORY_CHANGE_WINDOW changes).
+
+History reads are cached in memory for a few seconds (see ReadCache), every
+history write made by this process clears the cache.
 '''
 
-# pylint: disable=too-few-public-methods
+# pylint: disable=too-few-public-methods, too-many-lines
 
 import os
+import re
+import time
+import json
+import base64
+import hashlib
 import logging
 import datetime
+import functools
+import threading
+from collections import OrderedDict
 import xbmc
 import xbmcvfs
 import xbmcaddon
 from sqlalchemy import URL
 from sqlalchemy.pool import NullPool
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, Session
-from sqlalchemy import create_engine, Integer, Float, String, Boolean, select, desc, or_
+from sqlalchemy.sql import table as sql_table, column as sql_column
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import (
+    DeclarativeBase,
+    Mapped,
+    mapped_column,
+    Session,
+    make_transient_to_detached
+)
+from sqlalchemy import (
+    create_engine,
+    Integer,
+    BigInteger,
+    Float,
+    String,
+    Text,
+    Boolean,
+    Index,
+    select,
+    delete,
+    update,
+    tuple_,
+    and_,
+    desc,
+    func,
+    inspect,
+    text,
+    or_
+)
 from kodi_gui import autodelete_notification
-from paths import output_path, database_path
+from paths import output_path, database_path, get_thumbnail_path
+
+
+# Index key prefix length for long string columns on MySQL (InnoDB keys are
+# limited to 3072 bytes, 768 utf8mb4 characters)
+MYSQL_INDEX_PREFIX = 255
+
+# Shortest search string (SQLite) or word (MySQL) found by full-text index
+# (trigrams, default innodb_ft_min_token_size), shorter searches use LIKE
+FULLTEXT_MIN_LENGTH = 3
+
+# Number of most recent history changes deltas are served for, older
+# tombstones are pruned (clients further behind reload the whole history)
+HISTORY_CHANGE_WINDOW = 1000
+
+# SQLite FTS5 table indexing history columns searched from the history menu
+history_fts = sql_table(
+    'history_fts',
+    sql_column('rowid'),
+    sql_column('history_fts'),
+    sql_column('rank')
+)
+
+# Seconds history reads are cached (writes from other Kodi instances sharing
+# a MySQL database are seen after this delay), max number of cached results
+READ_CACHE_TTL = 10
+READ_CACHE_SIZE = 256
+
+# Output file extension of each media type
+MEDIA_EXTENSIONS = {'clip': 'mp4', 'snapshot': 'jpg'}
 
 
 def get_mysql_url():
@@ -54,8 +137,12 @@ def replace_engine():
     global engine  # pylint: disable=global-statement
     # Get new engine based on current settings
     engine = get_configured_engine()
-    # Create database tables if they don't exist
-    Base.metadata.create_all(engine)
+    # Create database tables if they don't exist, migrate existing tables
+    create_schema(engine)
+    global fulltext_search  # pylint: disable=global-statement
+    fulltext_search = has_fulltext_index(engine)
+    # Discard results read from previous database
+    read_cache.clear()
 
 
 class SQLAlchemyLogHandler(logging.Handler):
@@ -75,6 +162,22 @@ class Base(DeclarativeBase):  # pylint: disable=missing-class-docstring
 class GeneratedFile(Base):
     '''Stores all parameters used to generate a single file.'''
     __tablename__ = "history"
+    __table_args__ = (
+        # Filenames are unique, used by every single file lookup
+        Index('ix_history_output', 'output', unique=True),
+        # Autodelete cutoff, fingerprint matches newest first
+        Index('ix_history_timestamp', 'timestamp'),
+        # History menu (full quality clips newest first), show name filter
+        Index('ix_history_parent_id_timestamp', 'parent_id', 'timestamp'),
+        Index('ix_history_show_name_timestamp', 'show_name', 'timestamp'),
+        # Regenerate missing clips (source order)
+        Index(
+            'ix_history_source_start_time',
+            'source',
+            'start_time',
+            mysql_length={'source': MYSQL_INDEX_PREFIX}
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -101,10 +204,107 @@ class GeneratedFile(Base):
     # Track if user has renamed the file (prevent auto delete)
     renamed: Mapped[bool] = mapped_column(Boolean, default=False)
 
+    # SHA-256 of generation parameters (see get_fingerprint), used to reuse
+    # existing output instead of encoding identical clips again
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=True, index=True)
+
+    # Type of output (clip or snapshot), NULL for rows created before
+    # snapshots were added (always clips)
+    media_type: Mapped[str] = mapped_column(String(10), nullable=True, default='clip')
+
+    # Extra renditions link to the full quality clip generated with them (ID
+    # of its row), rendition is the encoder RENDITION_PROFILES key. Both NULL
+    # for full quality clips.
+    parent_id: Mapped[int] = mapped_column(Integer, nullable=True, index=True)
+    rendition: Mapped[str] = mapped_column(String(10), nullable=True)
+
     def __repr__(self) -> str:
         return f"GeneratedFile(id={self.id!r}, output={self.output!r}, timestamp={self.timestamp!r})"  # pylint: disable=line-too-long
 
 
+class KeyframeIndex(Base):
+    '''Stores video keyframe timestamps of a single source file, used to seek
+    to the nearest keyframe before a clip without reading the whole file.
+    '''
+    __tablename__ = "keyframes"
+    __table_args__ = (
+        Index('ix_keyframes_source', 'source', mysql_length={'source': MYSQL_INDEX_PREFIX}),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    # Absolute path to source file
+    source: Mapped[str] = mapped_column(String(999), nullable=False)
+
+    # Source size (bytes) and modification time, index is stale if changed
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    mtime: Mapped[float] = mapped_column(Float, nullable=False)
+
+    # JSON list of keyframe timestamps (seconds)
+    keyframes: Mapped[str] = mapped_column(Text, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"KeyframeIndex(id={self.id!r}, source={self.source!r})"
+
+
+class ProbeCache(Base):
+    '''Stores ffprobe output (format and stream info) of a single source file,
+    avoids probing the same source again (slow on network shares).
+    '''
+    __tablename__ = "probe_cache"
+    __table_args__ = (
+        Index('ix_probe_cache_source', 'source', mysql_length={'source': MYSQL_INDEX_PREFIX}),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    # Absolute path to source file
+    source: Mapped[str] = mapped_column(String(999), nullable=False)
+
+    # Source size (bytes) and modification time, cache is stale if changed
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    mtime: Mapped[float] = mapped_column(Float, nullable=False)
+
+    # JSON ffprobe output
+    probe: Mapped[str] = mapped_column(Text, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"ProbeCache(id={self.id!r}, source={self.source!r})"
+
+
+class HistoryChange(Base):
+    '''Logs each write to history (see record_change). Only the newest change
+    of each entry is kept, deleted or renamed filenames are kept as tombstones.
+    '''
+    __tablename__ = "history_changes"
+    # Never reuse sequence numbers of removed rows (SQLite)
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    # Change sequence number, increases with every write
+    seq: Mapped[int] = mapped_column(primary_key=True)
+
+    # ID and filename of changed full quality clip (history row)
+    entry_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    output: Mapped[str] = mapped_column(String(50), nullable=False)
+
+    # True if filename was deleted or renamed (no longer in history)
+    deleted: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+
+    def __repr__(self) -> str:
+        return f"HistoryChange(seq={self.seq!r}, output={self.output!r}, deleted={self.deleted!r})"
+
+
+class SchemaVersion(Base):
+    '''Stores number of MIGRATIONS applied to the database (single row).'''
+    __tablename__ = "schema_version"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"SchemaVersion(version={self.version!r})"
+
+
 # Create engine for local sqlite database
 # This persists even if database type is changed in settings because closing and
 # re-opening causes Kodi to hang on exit
@@ -115,8 +315,297 @@ local_engine = create_engine(f'sqlite:///{database_path}?timeout=5', echo=True)
 # for configured external database (MySQL or PostgreSQL)
 engine = get_configured_engine()
 
-# Create database tables if they don't exist
-Base.metadata.create_all(engine)
+
+def add_missing_columns(connection):
+    '''Takes connection, adds columns (and their indexes) that were added to
+    the models after the tables were created. New columns must be nullable.
+    '''
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        added = set()
+        for column in table.columns:
+            if column.name not in existing:
+                xbmc.log(f"Database: Adding {table.name}.{column.name} column", xbmc.LOGINFO)
+                column_type = column.type.compile(connection.dialect)
+                connection.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                ))
+                added.add(column.name)
+        for index in table.indexes:
+            if added.intersection(column.name for column in index.columns):
+                index.create(connection, checkfirst=True)
+
+
+def remove_duplicate_outputs(connection):
+    '''Takes connection, deletes all but the newest entry with each filename
+    (older entries point to the same file, must be removed before the unique
+    index is created). Renditions of deleted entries are moved to the newest,
+    which is logged as changed so history menus reload it.
+    '''
+    duplicates = connection.scalars(select(
+        GeneratedFile.output
+    ).group_by(
+        GeneratedFile.output
+    ).having(
+        func.count() > 1
+    )).all()
+
+    for output in duplicates:
+        rows = connection.execute(select(
+            GeneratedFile.id,
+            GeneratedFile.source,
+            GeneratedFile.timestamp
+        ).where(
+            GeneratedFile.output == output
+        ).order_by(
+            desc(GeneratedFile.id)
+        )).all()
+        ids = [row.id for row in rows]
+        for row in rows[1:]:
+            xbmc.log(
+                f"Database: Removing duplicate entry {row.id} for {output} "
+                f"(source: {row.source}, created: {row.timestamp}), keeping {ids[0]}",
+                xbmc.LOGINFO
+            )
+        connection.execute(update(
+            GeneratedFile
+        ).where(
+            GeneratedFile.parent_id.in_(ids[1:])
+        ).values(
+            parent_id=ids[0]
+        ))
+        connection.execute(delete(GeneratedFile).where(GeneratedFile.id.in_(ids[1:])))
+        connection.execute(delete(HistoryChange).where(
+            HistoryChange.entry_id == ids[0],
+            HistoryChange.deleted.is_(False)
+        ))
+        connection.execute(HistoryChange.__table__.insert().values(
+            entry_id=ids[0],
+            output=output,
+            deleted=False
+        ))
+
+
+def create_fulltext_index(connection):
+    '''Takes connection, creates full-text index on history columns searched
+    from the history menu. SQLite uses an external content FTS5 table with the
+    trigram tokenizer (kept in sync by triggers), skipped with a warning if
+    SQLite was built without it (search keeps using LIKE). MySQL uses a
+    FULLTEXT index (maintained by InnoDB).
+    '''
+    if connection.dialect.name == 'mysql':
+        indexes = [index['name'] for index in inspect(connection).get_indexes('history')]
+        if 'ix_history_fulltext' not in indexes:
+            connection.execute(text(
+                'ALTER TABLE history ADD FULLTEXT INDEX ix_history_fulltext '
+                '(output, show_name, episode_name)'
+            ))
+        return
+
+    try:
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5("
+            "output, show_name, episode_name, "
+            "content='history', content_rowid='id', tokenize='trigram')"
+        ))
+    except OperationalError as e:
+        xbmc.log(
+            f"Database: Full-text search not supported, using LIKE ({e.args[0]})",
+            xbmc.LOGWARNING
+        )
+        return
+
+    delete_row = (
+        "INSERT INTO history_fts(history_fts, rowid, output, show_name, episode_name) "
+        "VALUES ('delete', old.id, old.output, old.show_name, old.episode_name);"
+    )
+    insert_row = (
+        "INSERT INTO history_fts(rowid, output, show_name, episode_name) "
+        "VALUES (new.id, new.output, new.show_name, new.episode_name);"
+    )
+    for trigger, event, body in (
+        ('history_fts_insert', 'AFTER INSERT ON history', insert_row),
+        ('history_fts_delete', 'AFTER DELETE ON history', delete_row),
+        (
+            'history_fts_update',
+            'AFTER UPDATE OF output, show_name, episode_name ON history',
+            delete_row + insert_row
+        )
+    ):
+        connection.execute(text(f'CREATE TRIGGER IF NOT EXISTS {trigger} {event} BEGIN {body} END'))
+
+    # Rank filename matches above show/episode name matches, index existing rows
+    connection.execute(text(
+        "INSERT INTO history_fts(history_fts, rank) VALUES ('rank', 'bm25(2.0, 1.0, 1.0)')"
+    ))
+    connection.execute(text("INSERT INTO history_fts(history_fts) VALUES ('rebuild')"))
+
+
+def has_fulltext_index(target_engine):
+    '''Takes engine, returns True if history full-text index exists.'''
+    inspector = inspect(target_engine)
+    if target_engine.dialect.name == 'mysql':
+        indexes = [index['name'] for index in inspector.get_indexes('history')]
+        return 'ix_history_fulltext' in indexes
+    return inspector.has_table('history_fts')
+
+
+def create_indexes(connection):
+    '''Takes connection, creates indexes declared on models that don't exist.
+    Runs after migrations on every start, so adding an index to a model does
+    not need a migration.
+    '''
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+# Schema changes applied to existing databases in order, version is the
+# number applied. Only append (never reorder or remove), each must be safe to
+# run on a database created with the current models (new databases run all).
+# Indexes are created by create_indexes after the migrations.
+MIGRATIONS = [
+    # 1: columns added before versioned migrations
+    add_missing_columns,
+    # 2: unique filenames (unique index created by create_indexes)
+    remove_duplicate_outputs,
+    # 3: history search
+    create_fulltext_index
+]
+
+
+def get_schema_version(connection):
+    '''Takes connection, returns number of migrations applied (0 if none).'''
+    return connection.scalar(select(SchemaVersion.version)) or 0
+
+
+def set_schema_version(connection, version):
+    '''Takes connection and number of migrations applied, writes to database.'''
+    connection.execute(delete(SchemaVersion))
+    connection.execute(SchemaVersion.__table__.insert().values(id=1, version=version))
+
+
+def create_schema(target_engine):
+    '''Takes engine, creates missing tables then applies migrations newer
+    than the stored schema version (each in its own transaction, version is
+    updated after each so an interrupted upgrade resumes where it stopped),
+    then creates missing indexes.
+    '''
+    Base.metadata.create_all(target_engine)
+    with target_engine.connect() as connection:
+        current = get_schema_version(connection)
+
+    if current > len(MIGRATIONS):
+        xbmc.log(
+            f"Database: Schema version {current} is newer than supported ({len(MIGRATIONS)})",
+            xbmc.LOGWARNING
+        )
+        return
+
+    for version, migration in enumerate(MIGRATIONS[current:], current + 1):
+        xbmc.log(f"Database: Migrating to version {version} ({migration.__name__})", xbmc.LOGINFO)
+        with target_engine.begin() as connection:
+            migration(connection)
+            set_schema_version(connection, version)
+
+    with target_engine.begin() as connection:
+        create_indexes(connection)
+
+
+# Create database tables if they don't exist, migrate existing tables
+create_schema(engine)
+
+# Use full-text index for history search if supported (see create_fulltext_index)
+fulltext_search = has_fulltext_index(engine)
+
+
+class ReadCache:
+    '''Bounded in-memory cache of history read results (least recently used
+    evicted first), each result expires ttl seconds after it was read. Avoids
+    a new connection per request (MySQL engine uses NullPool). Cleared by
+    every history write made by this process, results read while a write was
+    committed are not stored. None results (not found) are never stored, so
+    a missing entry is found as soon as it is written by another instance.
+    '''
+
+    def __init__(self, ttl=READ_CACHE_TTL, size=READ_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.lock = threading.Lock()
+        # Key: (expiry time, result)
+        self.entries = OrderedDict()
+        # Incremented by clear
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def call(self, key, function):
+        '''Takes hashable key and function, returns cached result if not
+        expired, otherwise calls function and caches result. Exceptions are
+        raised (not cached).
+        '''
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached and cached[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+            generation = self.generation
+
+        result = function()
+
+        with self.lock:
+            # Result may be stale if history was written while reading
+            if result is not None and generation == self.generation:
+                self.entries[key] = (time.monotonic() + self.ttl, result)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        '''Removes all cached results (called after history is written).'''
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def get_stats(self):
+        '''Returns dict with number of cached results, max size, ttl
+        (seconds), hit and miss counts, and hit rate (0-1).
+        '''
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
+
+# Shared by all history reads
+read_cache = ReadCache()
+
+
+def cached_read(function):
+    '''Decorator, caches history read function results in read_cache (keyed
+    by function name and arguments). Cached results are shared between
+    callers and must not be modified.
+    '''
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        key = (function.__name__, json.dumps([args, kwargs], sort_keys=True, default=str))
+        return read_cache.call(key, lambda: function(*args, **kwargs))
+    return wrapper
+
+
+def get_read_cache_stats():
+    '''Returns dict with history read cache size and hit/miss counts.'''
+    return read_cache.get_stats()
 
 
 def get_timestamp():
@@ -129,10 +618,43 @@ def get_filename_query(filename):
     return select(GeneratedFile).where(GeneratedFile.output == filename)
 
 
-def get_orm_entry(filename):
-    '''Takes existing clip filename, returns ORM entry.'''
+@cached_read
+def get_entry_values(filename):
+    '''Takes existing clip filename, returns dict with column values of its
+    ORM entry (None if not found).
+    '''
     with Session(engine) as session:
-        return session.scalar(get_filename_query(filename))
+        entry = session.scalar(get_filename_query(filename))
+        if entry is None:
+            return None
+        return {attr.key: getattr(entry, attr.key) for attr in inspect(GeneratedFile).column_attrs}
+
+
+def get_orm_entry(filename):
+    '''Takes existing clip filename, returns ORM entry (None if not found).
+    Each call returns a new detached entry built from the cached column
+    values, so callers can modify or delete it without affecting others.
+    '''
+    values = get_entry_values(filename)
+    if values is None:
+        return None
+    entry = GeneratedFile(**values)
+    make_transient_to_detached(entry)
+    return entry
+
+
+def get_fingerprint(source, audio_track, start_time, duration, bitrate):
+    '''Takes parameters used to generate clip, returns SHA-256 hex digest
+    identifying the output (identical for clips that would be identical).
+    '''
+    params = json.dumps([
+        source,
+        int(audio_track),
+        round(float(start_time), 3),
+        round(float(duration), 3),
+        int(bitrate)
+    ])
+    return hashlib.sha256(params.encode()).hexdigest()
 
 
 def log_generated_file(  # pylint: disable=too-many-arguments
@@ -142,66 +664,451 @@ def log_generated_file(  # pylint: disable=too-many-arguments
     duration,
     filename,
     show_name,
-    episode_name
+    episode_name,
+    fingerprint=None,
+    media_type='clip',
+    renditions=()
 ):
-    '''Takes parameters used to generate clip, logs ORM entry to database.'''
+    '''Takes parameters used to generate clip, optional fingerprint, optional
+    media type (clip or snapshot), and optional list of (filename, rendition)
+    tuples with extra renditions generated with the clip. Logs ORM entry to
+    database (plus entry linked to it for each rendition).
+    '''
     with Session(engine) as session:
-        session.add(GeneratedFile(
+        entry = GeneratedFile(
             source=source,
             audio_track=audio_track,
-            output=f'{filename}.mp4',
+            output=f'{filename}.{MEDIA_EXTENSIONS[media_type]}',
             start_time=start_time,
             duration=duration,
             timestamp=get_timestamp(),
             show_name=show_name,
             episode_name=episode_name,
-            renamed=False
-        ))
+            renamed=False,
+            fingerprint=fingerprint,
+            media_type=media_type
+        )
+        session.add(entry)
+        session.flush()
+        record_change(session, entry)
+
+        for rendition_filename, rendition in renditions:
+            session.add(GeneratedFile(
+                source=source,
+                audio_track=audio_track,
+                output=f'{rendition_filename}.mp4',
+                start_time=start_time,
+                duration=duration,
+                timestamp=entry.timestamp,
+                show_name=show_name,
+                episode_name=episode_name,
+                renamed=False,
+                media_type=media_type,
+                parent_id=entry.id,
+                rendition=rendition
+            ))
         session.commit()
+    read_cache.clear()
+
 
+def record_change(session, entry, deleted=False):
+    '''Takes open session, history ORM entry, and bool (True if entry is being
+    deleted or renamed, logs tombstone for its current filename). Logs change
+    with the next sequence number, replaces older changes of the same entry.
+    Changes to extra renditions are logged as a change to their clip.
+    '''
+    if entry.parent_id is not None:
+        entry = session.get(GeneratedFile, entry.parent_id)
+        if entry is None:
+            return
+        deleted = False
+    session.execute(delete(HistoryChange).where(
+        HistoryChange.entry_id == entry.id,
+        HistoryChange.deleted.is_(False)
+    ))
+
+    # Prune tombstones no longer served (see get_oldest_history_seq)
+    newest = session.scalar(select(func.max(HistoryChange.seq))) or 0
+    session.execute(delete(HistoryChange).where(
+        HistoryChange.deleted.is_(True),
+        HistoryChange.seq <= get_oldest_history_seq(newest)
+    ))
+    session.add(HistoryChange(entry_id=entry.id, output=entry.output, deleted=deleted))
+
+
+def get_oldest_history_seq(seq):
+    '''Takes current history change sequence number, returns oldest since
+    value changes can be loaded for (older tombstones may be pruned).
+    '''
+    return max(0, seq - HISTORY_CHANGE_WINDOW)
 
-def load_history_json():
-    '''Returns list of (timestamp, filename) tuples for every file in database.'''
 
-    # Query output filename and timestamp columns
+def get_history_seq():
+    '''Returns sequence number of the newest history change (0 if none). Not
+    cached, history ETags must change as soon as another instance writes.
+    '''
     with Session(engine) as session:
-        stmt = select(
-            GeneratedFile.timestamp,
+        return session.scalar(select(func.max(HistoryChange.seq))) or 0
+
+
+def get_fingerprint_matches(fingerprint):
+    '''Takes fingerprint, returns list of filenames of clips generated with
+    identical parameters (newest first). Renamed clips keep their fingerprint.
+    '''
+    with Session(engine) as session:
+        return session.scalars(select(
             GeneratedFile.output
+        ).where(
+            GeneratedFile.fingerprint == fingerprint
         ).order_by(
             desc(GeneratedFile.timestamp)
-        )
-        result = session.execute(stmt).all()
-        # Convert to list of tuples with timestamp and filename
-        history = [tuple(entry) for entry in result]
+        )).all()
+
 
-    return history
+def set_fingerprint(filename, fingerprint):
+    '''Takes clip filename and fingerprint, updates entry (called when clip
+    is regenerated with current settings).
+    '''
+    with Session(engine) as session:
+        entry = session.scalar(get_filename_query(filename))
+        if entry:
+            entry.fingerprint = fingerprint
+            session.commit()
+    read_cache.clear()
 
 
-def load_history_search_results(search_string):
-    '''Takes search_string, returns list of (timestamp, filename) tuples for
-    entries with filename, show_name, or episode_name containing search_string.
+def get_keyframe_index(source, size, mtime):
+    '''Takes source file path, size, and mtime. Returns list of keyframe
+    timestamps, or None if source has not been indexed or changed since.
     '''
+    with Session(engine) as session:
+        entry = session.scalar(select(KeyframeIndex).where(
+            KeyframeIndex.source == source,
+            KeyframeIndex.size == size,
+            KeyframeIndex.mtime == mtime
+        ))
+        if entry:
+            return json.loads(entry.keyframes)
+    return None
+
 
-    # Query output filename and timestamp columns
+def save_keyframe_index(source, size, mtime, keyframes):
+    '''Takes source file path, size, mtime, and list of keyframe timestamps.
+    Writes to database, replaces existing (stale) index for the same source.
+    '''
     with Session(engine) as session:
-        stmt = select(
-            GeneratedFile.timestamp,
+        session.execute(delete(KeyframeIndex).where(KeyframeIndex.source == source))
+        session.add(KeyframeIndex(
+            source=source,
+            size=size,
+            mtime=mtime,
+            keyframes=json.dumps(keyframes)
+        ))
+        session.commit()
+
+
+def get_cached_probe(source, size, mtime):
+    '''Takes source file path, size, and mtime. Returns cached ffprobe output
+    (dict), or None if source has not been probed or changed since.
+    '''
+    with Session(engine) as session:
+        entry = session.scalar(select(ProbeCache).where(
+            ProbeCache.source == source,
+            ProbeCache.size == size,
+            ProbeCache.mtime == mtime
+        ))
+        if entry:
+            return json.loads(entry.probe)
+    return None
+
+
+def save_cached_probe(source, size, mtime, probe):
+    '''Takes source file path, size, mtime, and ffprobe output (dict). Writes
+    to database, replaces existing (stale) output for the same source.
+    '''
+    with Session(engine) as session:
+        session.execute(delete(ProbeCache).where(ProbeCache.source == source))
+        session.add(ProbeCache(
+            source=source,
+            size=size,
+            mtime=mtime,
+            probe=json.dumps(probe)
+        ))
+        session.commit()
+
+
+def group_renditions(session, result):
+    '''Takes open session and list of (id, timestamp, filename) rows of full
+    quality clips. Returns list of (timestamp, filename, renditions) tuples,
+    renditions is a list of filenames of extra renditions linked to the clip.
+    '''
+    renditions = {}
+    ids = [entry.id for entry in result]
+    if ids:
+        for parent_id, output in session.execute(select(
+            GeneratedFile.parent_id,
             GeneratedFile.output
         ).where(
-            or_(
+            GeneratedFile.parent_id.in_(ids)
+        ).order_by(
+            GeneratedFile.id
+        )).all():
+            renditions.setdefault(parent_id, []).append(output)
+
+    return [
+        (entry.timestamp, entry.output, renditions.get(entry.id, []))
+        for entry in result
+    ]
+
+
+def get_history_filters(filters):
+    '''Takes dict of history filters (all optional): start and end (dates in
+    YYYY-MM-DD syntax, inclusive), show (exact show name), renamed (bool),
+    media_type (clip or snapshot). Returns list of WHERE clauses. Raises
+    ValueError if a filter is unsupported or invalid.
+    '''
+    clauses = []
+    for key, value in filters.items():
+        if key == 'start':
+            start = datetime.date.fromisoformat(value)
+            clauses.append(GeneratedFile.timestamp >= start.strftime('%Y-%m-%d'))
+        elif key == 'end':
+            # Timestamps compare as strings, anything before next day is inside range
+            end = datetime.date.fromisoformat(value) + datetime.timedelta(days=1)
+            clauses.append(GeneratedFile.timestamp < end.strftime('%Y-%m-%d'))
+        elif key == 'show':
+            clauses.append(GeneratedFile.show_name == value)
+        elif key == 'renamed':
+            if not isinstance(value, bool):
+                raise ValueError("renamed filter must be true or false")
+            clauses.append(GeneratedFile.renamed == value)
+        elif key == 'media_type':
+            if value not in MEDIA_EXTENSIONS:
+                raise ValueError(f"Unsupported media type: {value}")
+            # Entries from before snapshots were added have no media type
+            if value == 'clip':
+                clauses.append(or_(
+                    GeneratedFile.media_type == value,
+                    GeneratedFile.media_type.is_(None)
+                ))
+            else:
+                clauses.append(GeneratedFile.media_type == value)
+        else:
+            raise ValueError(f"Unsupported filter: {key}")
+    return clauses
+
+
+def encode_cursor(values):
+    '''Takes sort key values of last entry on a page, returns opaque cursor
+    string passed back by the client to get the next page.
+    '''
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, length):
+    '''Takes cursor string and number of sort keys, returns list of sort key
+    values (last two are timestamp and id). Raises ValueError if invalid.
+    '''
+    if not isinstance(cursor, str):
+        raise ValueError("Invalid cursor")
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(values, list) or len(values) != length \
+            or not isinstance(values[-2], str) or not isinstance(values[-1], int):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def get_keyset_clause(keys, values):
+    '''Takes list of (column, descending) sort keys and cursor values, returns
+    WHERE clause selecting entries sorted after the cursor. Uses a row value
+    comparison if all keys sort the same direction (index range scan).
+    '''
+    if len({descending for _, descending in keys}) == 1:
+        columns = tuple_(*[expression for expression, _ in keys])
+        return columns < tuple_(*values) if keys[0][1] else columns > tuple_(*values)
+
+    clauses = []
+    for i, ((expression, descending), value) in enumerate(zip(keys, values)):
+        after = expression < value if descending else expression > value
+        equal = [key[0] == previous for key, previous in zip(keys[:i], values[:i])]
+        clauses.append(and_(*equal, after))
+    return or_(*clauses)
+
+
+def add_fulltext_search(stmt, search_string, dialect):
+    '''Takes SELECT statement, search string, and database dialect name.
+    Returns statement filtered by full-text index (selects rank column) and
+    (column, descending) sort key of the rank (best matches first), or None
+    if search string is too short for the index.
+    '''
+    if dialect == 'mysql':
+        # Every word of the search must start a word in one of the columns
+        words = [
+            word for word in re.findall(r'\w+', search_string)
+            if len(word) >= FULLTEXT_MIN_LENGTH
+        ]
+        if not words:
+            return None
+        score = match(
+            GeneratedFile.output,
+            GeneratedFile.show_name,
+            GeneratedFile.episode_name,
+            against=' '.join(f'+{word}*' for word in words)
+        ).in_boolean_mode()
+        return stmt.add_columns(score.label('rank')).where(score), (score, True)
+
+    if len(search_string) < FULLTEXT_MIN_LENGTH:
+        return None
+    # Quoted phrase (special characters are literal), trigrams match substrings
+    phrase = '"' + search_string.replace('"', '""') + '"'
+    return stmt.add_columns(
+        history_fts.c.rank.label('rank')
+    ).join(
+        history_fts,
+        history_fts.c.rowid == GeneratedFile.id
+    ).where(
+        history_fts.c.history_fts.op('MATCH')(phrase)
+    ), (history_fts.c.rank, False)
+
+
+@cached_read
+def load_history_page(  # pylint: disable=too-many-arguments, too-many-locals, unused-argument
+    search_string=None,
+    filters=None,
+    cursor=None,
+    limit=None,
+    seq=None
+):
+    '''Takes optional search string, dict of filters (see get_history_filters),
+    cursor (from previous page), page size, and history change sequence
+    number (see get_history_seq). Returns list of (timestamp, filename,
+    renditions) tuples (extra renditions are grouped with their clip) and
+    cursor for next page (None if no more entries).
+
+    The seq arg is only part of the cache key: pass the seq sent with the
+    results (read before calling) so results cached before a newer change
+    written by another instance are never sent with that change's seq.
+
+    Entries are sorted newest first (timestamp then id, keyset pagination on
+    the parent_id + timestamp index). Searches match filename, show_name, or
+    episode_name, ranked best first if the full-text index is used. Raises
+    ValueError if cursor or filters are invalid.
+    '''
+    stmt = select(
+        GeneratedFile.id,
+        GeneratedFile.timestamp,
+        GeneratedFile.output
+    ).where(
+        GeneratedFile.parent_id.is_(None),
+        *get_history_filters(filters or {})
+    )
+    keys = [(GeneratedFile.timestamp, True), (GeneratedFile.id, True)]
+
+    if search_string:
+        fulltext = None
+        if fulltext_search:
+            fulltext = add_fulltext_search(stmt, search_string, engine.dialect.name)
+        if fulltext:
+            stmt, rank = fulltext
+            keys.insert(0, rank)
+        else:
+            stmt = stmt.where(or_(
                 GeneratedFile.output.contains(search_string),
                 GeneratedFile.show_name.contains(search_string),
                 GeneratedFile.episode_name.contains(search_string)
+            ))
+
+    if cursor is not None:
+        stmt = stmt.where(get_keyset_clause(keys, decode_cursor(cursor, len(keys))))
+    stmt = stmt.order_by(*[
+        desc(expression) if descending else expression for expression, descending in keys
+    ])
+    if limit:
+        # Extra row shows if there is another page
+        stmt = stmt.limit(limit + 1)
+
+    with Session(engine) as session:
+        result = session.execute(stmt).all()
+        next_cursor = None
+        if limit and len(result) > limit:
+            result = result[:limit]
+            last = result[-1]
+            next_cursor = encode_cursor(
+                ([last.rank] if len(keys) > 2 else []) + [last.timestamp, last.id]
             )
+        history = group_renditions(session, result)
+
+    return history, next_cursor
+
+
+def load_history_json(filters=None, seq=None):
+    '''Takes optional dict of filters (see get_history_filters) and history
+    change sequence number (see load_history_page), returns list of
+    (timestamp, filename, renditions) tuples for every matching file in
+    database, newest first (extra renditions are grouped with their clip).
+    '''
+    return load_history_page(filters=filters, seq=seq)[0]
+
+
+def load_history_search_results(search_string, filters=None):
+    '''Takes search_string and optional dict of filters, returns list of
+    (timestamp, filename, renditions) tuples for entries with filename,
+    show_name, or episode_name containing search_string (extra renditions are
+    grouped with their clip). Uses the full-text index if available (ranked),
+    otherwise newest first.
+    '''
+    return load_history_page(search_string, filters)[0]
+
+
+@cached_read
+def load_history_changes(since, filters=None, seq=None):  # pylint: disable=unused-argument
+    '''Takes change sequence number, optional dict of filters (see
+    get_history_filters), and current sequence number (cache key only, see
+    load_history_page). Returns list of (timestamp, filename, renditions)
+    tuples for matching entries added or changed after since (newest first),
+    and list of filenames deleted or renamed after since (tombstones). If
+    filters are given, entries changed so they no longer match are also
+    returned as deleted (removed from filtered views).
+
+    Since must not be older than get_oldest_history_seq (tombstones pruned).
+    '''
+    with Session(engine) as session:
+        changes = session.execute(select(
+            HistoryChange.entry_id,
+            HistoryChange.output,
+            HistoryChange.deleted
+        ).where(
+            HistoryChange.seq > since
         ).order_by(
-            desc(GeneratedFile.timestamp)
-        )
-        result = session.execute(stmt).all()
-        # Convert to list of tuples with timestamp and filename
-        history = [tuple(entry) for entry in result]
+            HistoryChange.seq
+        )).all()
+
+        # Filename may be deleted and reused, client removes deleted first
+        deleted = list(dict.fromkeys(change.output for change in changes if change.deleted))
+        ids = [change.entry_id for change in changes if not change.deleted]
+        if not ids:
+            return [], deleted
+
+        result = session.execute(select(
+            GeneratedFile.id,
+            GeneratedFile.timestamp,
+            GeneratedFile.output
+        ).where(
+            GeneratedFile.id.in_(ids),
+            GeneratedFile.parent_id.is_(None),
+            *get_history_filters(filters or {})
+        ).order_by(
+            desc(GeneratedFile.timestamp),
+            desc(GeneratedFile.id)
+        )).all()
 
-    return history
+        if filters:
+            matched = {row.id for row in result}
+            deleted = list(dict.fromkeys(deleted + [
+                change.output for change in changes
+                if not change.deleted and change.entry_id not in matched
+            ]))
+        return group_renditions(session, result), deleted
 
 
 def rename_entry(old, new):
@@ -216,26 +1123,65 @@ def rename_entry(old, new):
             os.path.join(output_path, new)
         )
 
+    # Move cached thumbnail to new name (old URL no longer has a thumbnail)
+    if xbmcvfs.exists(get_thumbnail_path(old)):
+        xbmcvfs.rename(get_thumbnail_path(old), get_thumbnail_path(new))
+
     # Rename in database
     with Session(engine) as session:
         entry = session.scalar(get_filename_query(old))
+        record_change(session, entry, deleted=True)
         entry.output = new
         entry.renamed = True
+        record_change(session, entry)
         session.commit()
+    read_cache.clear()
 
 
 def delete_entry(filename):
-    '''Takes clip filename, deletes from database and disk.'''
+    '''Takes clip filename, deletes from database and disk (along with any
+    extra renditions generated with the clip).
+    '''
 
     # Delete from database
     with Session(engine) as session:
         entry = session.scalar(get_filename_query(filename))
-        session.delete(entry)
+        renditions = session.scalars(select(
+            GeneratedFile
+        ).where(
+            GeneratedFile.parent_id == entry.id
+        )).all()
+        filenames = [filename] + [rendition.output for rendition in renditions]
+        for row in [entry] + renditions:
+            session.delete(row)
+        record_change(session, entry, deleted=True)
         session.commit()
+    read_cache.clear()
+
+    # If file exists on disk, delete (along with cached thumbnail)
+    for output in filenames:
+        if xbmcvfs.exists(os.path.join(output_path, output)):
+            xbmcvfs.delete(os.path.join(output_path, output))
+        if xbmcvfs.exists(get_thumbnail_path(output)):
+            xbmcvfs.delete(get_thumbnail_path(output))
+
+
+def get_missing_files():
+    '''Returns list of ORM objects for clips that no longer exist on disk,
+    ordered by source file (then start time).
+    '''
+    with Session(engine) as session:
+        entries = session.scalars(select(
+            GeneratedFile
+        ).order_by(
+            GeneratedFile.source,
+            GeneratedFile.start_time
+        )).all()
 
-    # If file exists on disk, delete
-    if xbmcvfs.exists(os.path.join(output_path, filename)):
-        xbmcvfs.delete(os.path.join(output_path, filename))
+    return [
+        entry for entry in entries
+        if not xbmcvfs.exists(os.path.join(output_path, entry.output))
+    ]
 
 
 def is_duplicate(filename):
@@ -283,15 +1229,19 @@ def bulk_delete(entries, keep_renamed=False):
 
             xbmc.log(f"Automatically deleting {entry.output}", xbmc.LOGINFO)
 
-            # If file exists on disk, delete
+            # If file exists on disk, delete (along with cached thumbnail)
             if xbmcvfs.exists(os.path.join(output_path, entry.output)):
                 xbmcvfs.delete(os.path.join(output_path, entry.output))
+            if xbmcvfs.exists(get_thumbnail_path(entry.output)):
+                xbmcvfs.delete(get_thumbnail_path(entry.output))
 
             # Delete from database
             session.delete(entry)
+            record_change(session, entry, deleted=True)
             deleted += 1
 
         session.commit()
+    read_cache.clear()
 
     # Show notification if clips were deleted
     if deleted > 0:
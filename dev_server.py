@@ -35,12 +35,39 @@ def get_playing_now():
     return jsonify({"title": "Nothing", "subtext": "Season 1 Episode 1"})
 
 
+# Filenames changed or deleted since server started (index + 1 is the seq
+# of each change), used to mock history deltas requested with since param
+history_changes = []
+
+
 @app.get('/get_history')
 def get_history():
-    '''Returns mock JSON with existing clips, used to populate history menu.'''
-    history = load_history()
-    payload = [(key, value["output"]) for key, value in history.items()]
-    return jsonify(payload)
+    '''Returns mock JSON with existing clips, used to populate history menu.
+    Paginated (dict with history, next_cursor, and seq keys) if limit or
+    cursor param is given. If since param is given returns dict with seq,
+    changed, and deleted keys (changes after since). ETag is the current seq.
+    '''
+    seq = len(history_changes)
+    if request.args.get('since') is not None:
+        data = get_history_changes(int(request.args['since']))
+    else:
+        data = get_history_page(None, request.args)
+        if isinstance(data, dict):
+            data['seq'] = seq
+
+    response = jsonify(data)
+    response.set_etag(f'history-{seq}')
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.post('/search_history')
+def search_history():
+    '''Takes JSON with search string in query attribute, returns mock JSON
+    with entries containing query (paginated same as get_history).
+    '''
+    data = request.get_json()
+    return jsonify(get_history_page(data['query'], data))
 
 
 @app.get("/get_playtime")
@@ -51,15 +78,14 @@ def get_playtime():
 
 @app.post("/submit")
 def submit():
-    '''Waits 2 seconds to allow loading animation to appear, returns random
-    filename to allow download button to appear.
+    '''Returns mock job ID and random filename, job result is returned by
+    /jobs/<job_id>/result after a delay to allow loading animation to appear.
     '''
-    time.sleep(1)
     filename = ''.join(
         random.choice(string.ascii_letters + string.digits)
         for _ in range(16)
     )
-    return jsonify(f'{filename}.mp4')
+    return jsonify({'job_id': f'{filename}.mp4', 'filename': f'{filename}.mp4'}), 202
 
 
 @app.post('/delete')
@@ -68,14 +94,15 @@ def delete():
     test_history.json.
     '''
 
-    filename = request.get_json()
+    filename = request.get_json()['filename']
 
     # Remove from history file
     history = load_history()
     history = {i: history[i] for i in history if history[i]['output'] != filename}
     save_history(history)
+    history_changes.append(filename)
 
-    return (f"{filename} deleted", 200)
+    return jsonify({'deleted': filename})
 
 
 @app.post('/rename')
@@ -102,15 +129,24 @@ def rename():
             history[i]['output'] = new
             break
     save_history(history)
+    history_changes.extend([old, new])
     return jsonify({'filename': new})
 
 
 @app.post("/regenerate")
 def regenerate():
-    '''Waits 2 seconds to allow frontend animation to run, returns filename.'''
+    '''Returns mock job ID (filename), result is returned by /jobs endpoint.'''
+    filename = request.get_json()['filename']
+    return jsonify({'job_id': filename, 'filename': filename}), 202
+
+
+@app.get("/jobs/<job_id>/result")
+def job_result(job_id):
+    '''Waits 2 seconds to allow frontend animation to run, returns mock job
+    result (mock job IDs are the filename).
+    '''
     time.sleep(2)
-    filename = request.get_json()
-    return jsonify(f'{filename}.mp4')
+    return jsonify({'filename': job_id})
 
 
 def is_duplicate(filename):
@@ -128,6 +164,50 @@ def is_duplicate(filename):
     return False
 
 
+def get_history_entries(search_string=None):
+    '''Takes optional search string, returns list of (timestamp, filename,
+    renditions) entries in test_history.json (newest first) with filename or
+    source containing search string.
+    '''
+    history = load_history()
+    return [
+        (key, history[key]['output'], [])
+        for key in sorted(history, reverse=True)
+        if not search_string
+        or search_string.lower() in history[key]['output'].lower()
+        or search_string.lower() in history[key].get('source', '').lower()
+    ]
+
+
+def get_history_page(search_string, params):
+    '''Takes search string (None for all entries) and dict of request params
+    (limit, cursor from previous page). Returns list of entries if not
+    paginated, dict with history and next_cursor keys if limit or cursor param
+    was given (mock cursor is the offset of the next page).
+    '''
+    entries = get_history_entries(search_string)
+    limit = params.get('limit')
+    cursor = params.get('cursor')
+    if limit is None and cursor is None:
+        return entries
+
+    offset = int(cursor) if cursor else 0
+    end = offset + int(limit) if limit else len(entries)
+    next_cursor = str(end) if end < len(entries) else None
+    return {'history': entries[offset:end], 'next_cursor': next_cursor}
+
+
+def get_history_changes(since):
+    '''Takes seq from a previous get_history response, returns dict with
+    current seq, changed entries, and deleted filenames since then.
+    '''
+    changed_filenames = set(history_changes[since:])
+    changed = [entry for entry in get_history_entries() if entry[1] in changed_filenames]
+    existing = {entry[1] for entry in changed}
+    deleted = sorted(changed_filenames - existing)
+    return {'seq': len(history_changes), 'changed': changed, 'deleted': deleted}
+
+
 def get_timestamp():
     '''Returns current timestamp, used as key in test_history.json.'''
     return datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S.%f')
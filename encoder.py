@@ -0,0 +1,1372 @@
+'''Functions used to generate clips with ffmpeg. Clips are smart cut (only
+the partial GOPs at each end are re-encoded) or stream copied (remuxed) when
+the source codecs and bitrate allow it, otherwise fully re-encoded.
+
+Each source gets a keyframe index (stored in database) used to seek on the
+input side to the keyframe before the clip, so encode time does not depend
+on where the clip is in the source. Source ffprobe output is also cached in
+the database (shared by all Kodi instances using the same MySQL database).
+
+If progressive downloads are enabled clips are written as fragmented MP4 (moov
+at the start, fragments appended at each keyframe) so the file can be served
+while ffmpeg is still writing it.
+
+ffmpeg reports progress on stdout (-progress pipe:1), which is passed to the
+job generating the clip (shown on frontend, job can be cancelled). Only the
+last lines of stderr are kept and logged if ffmpeg fails.
+
+Long clips can be split into keyframe-aligned segments encoded by multiple
+ffmpeg processes at the same time (libx264 threading scales poorly past a few
+threads), then joined without re-encoding.
+
+Extra lower resolution renditions of a clip are encoded by the same ffmpeg
+process as the full quality clip (split filter feeds one encoder per
+rendition), so the source is only read and decoded once.
+
+Re-encoded clips use the libx264 preset chosen by calibration (see
+calibration.py) for their output resolution, if enabled.
+'''
+
+# pylint: disable=too-many-lines
+
+import os
+import bisect
+from fractions import Fraction
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import xbmc
+import ffmpeg
+import xbmcaddon
+from sqlalchemy.exc import OperationalError
+from paths import output_path
+from scheduler import scheduler
+from calibration import get_preset
+from governor import get_ffmpeg_command, get_thread_options, get_allowed_cpus, get_int_setting
+from database import (
+    get_keyframe_index,
+    save_keyframe_index,
+    get_cached_probe,
+    save_cached_probe
+)
+
+
+# Codecs that can be copied into an MP4 without re-encoding
+COPY_VIDEO_CODECS = ('h264',)
+COPY_AUDIO_CODECS = ('aac',)
+
+# Clips shorter than this are remuxed or fully re-encoded (smart cut has no
+# benefit)
+SMART_CUT_MIN_DURATION = 10
+
+# H.264 profiles libx264 can match when re-encoding smart cut edges (ffprobe
+# profile name: libx264 profile). Other profiles (e.g. High 10) are not smart
+# cut, edges joined with copied GOPs must be decodable with the same settings.
+SMART_CUT_PROFILES = {
+    'Constrained Baseline': 'baseline',
+    'Baseline': 'baseline',
+    'Main': 'main',
+    'High': 'high'
+}
+
+# Pixel formats of SMART_CUT_PROFILES sources (8-bit 4:2:0)
+SMART_CUT_PIX_FMTS = ('yuv420p', 'yuvj420p')
+
+# Fragmented MP4 flags (output is only ever appended, never rewritten)
+FRAGMENTED_MOVFLAGS = 'frag_keyframe+empty_moov+default_base_moof'
+
+# Clips generated in one pass must overlap or be at most this many seconds
+# apart (a few GOPs), the shared input decodes everything between them
+BATCH_MAX_GAP = 10
+
+# Number of ffmpeg stderr lines kept (logged if ffmpeg fails)
+STDERR_LINES = 50
+
+# Clips at least this long (seconds) are split into segments encoded in
+# parallel (if enabled in settings)
+SEGMENT_MIN_DURATION = 120
+
+# Minimum segment length (seconds), shorter segments spend too much time on
+# process startup and rate control warmup
+SEGMENT_MIN_LENGTH = 20
+
+# Number of libx264 threads used by each segment encoder
+SEGMENT_THREADS = 2
+
+# Fraction of segmented encode progress spent encoding segments (the rest is
+# joining segments and encoding audio)
+SEGMENT_PROGRESS = 0.9
+
+# JPEG quality of snapshots (2-31, lower is better)
+SNAPSHOT_QUALITY = 2
+
+# Scaler used when source is above the max height setting (fastest, quality
+# loss is not noticeable at clip bitrates)
+SCALE_FLAGS = 'fast_bilinear'
+
+# Transfer characteristics of HDR sources (PQ, HLG)
+HDR_TRANSFERS = ('smpte2084', 'arib-std-b67')
+
+# Filters that tone map HDR to SDR (BT.709), requires ffmpeg with zimg
+TONEMAP_FILTERS = [
+    ('zscale', {'t': 'linear', 'npl': 100}),
+    ('format', {'pix_fmts': 'gbrpf32le'}),
+    ('zscale', {'p': 'bt709'}),
+    ('tonemap', {'tonemap': 'hable', 'desat': 0}),
+    ('zscale', {'t': 'bt709', 'm': 'bt709', 'r': 'tv'}),
+    ('format', {'pix_fmts': 'yuv420p'}),
+]
+
+# Extra renditions that can be generated with each clip (enabled in settings,
+# name keys), max height and video bitrate of each (never exceeds source)
+RENDITION_PROFILES = {
+    '480p': {'height': 480, 'bitrate': 1000000},
+    '720p': {'height': 720, 'bitrate': 2500000},
+}
+
+# Sources currently being indexed in background threads
+indexing = set()
+indexing_lock = threading.Lock()
+
+
+def get_bitrate():
+    '''Returns bit/s calculated from user-configured quality (MB per minute).'''
+    mb_per_min = int(xbmcaddon.Addon().getSetting('mb_per_min'))
+    return int(mb_per_min * 1024 * 1024 * 8 / 60)
+
+
+class EncodeCancelled(Exception):
+    '''Raised by run_ffmpeg when the job running ffmpeg was cancelled.'''
+
+
+def remove_output(path):
+    '''Takes output path, removes existing file before ffmpeg writes to it.
+    Outputs may be hard links shared with a deduplicated clip (see
+    batching.link_output), overwriting in place would change both clips.
+    '''
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def run_ffmpeg(stream, job=None, duration=None, progress_range=(0.0, 1.0), part=None):  # pylint: disable=too-many-arguments
+    '''Takes ffmpeg-python stream, optional Job, output duration (seconds),
+    and optional (start, end) tuple with the fraction of the job this run
+    covers (for jobs that run ffmpeg multiple times). Runs ffmpeg, reports
+    progress to job until ffmpeg exits. Optional part arg is passed to
+    Job.update_progress (runs in parallel report progress separately).
+
+    Raises EncodeCancelled if job was cancelled, ffmpeg.Error (with last
+    STDERR_LINES lines of stderr) if ffmpeg failed.
+    '''
+    if job and job.cancelled.is_set():
+        raise EncodeCancelled()
+
+    process = stream.global_args(
+        '-nostdin', '-nostats', '-progress', 'pipe:1'
+    ).run_async(
+        cmd=get_ffmpeg_command(),
+        pipe_stdout=True,
+        pipe_stderr=True,
+        overwrite_output=True
+    )
+    if job:
+        job.add_process(process)
+
+    # Read stderr in background (ffmpeg blocks if pipe fills up)
+    stderr = deque(maxlen=STDERR_LINES)
+    reader = threading.Thread(target=stderr.extend, args=(process.stderr,), daemon=True)
+    reader.start()
+
+    try:
+        for line in process.stdout:
+            key, _, value = line.decode('utf-8', 'replace').strip().partition('=')
+            if job and duration and key == 'out_time_us' and value.isdigit():
+                fraction = min(int(value) / 1000000 / float(duration), 1.0)
+                start, end = progress_range
+                job.update_progress(start + (end - start) * fraction, part)
+            elif job and key == 'speed':
+                job.speed = value
+        process.wait()
+        reader.join()
+    finally:
+        if job:
+            job.remove_process(process)
+
+    if job and job.cancelled.is_set():
+        raise EncodeCancelled()
+    if process.returncode:
+        raise ffmpeg.Error('ffmpeg', None, b''.join(stderr))
+
+
+def get_output_options():
+    '''Returns dict with extra MP4 output options (movflags for fragmented
+    output if progressive downloads are enabled).
+    '''
+    if xbmcaddon.Addon().getSetting('progressive_download') == 'true':
+        return {'movflags': FRAGMENTED_MOVFLAGS}
+    return {}
+
+
+def get_video_stream(probe):
+    '''Takes ffprobe output, returns dict with first video stream info (or
+    None if source has no video stream).
+    '''
+    for stream in probe.get('streams', []):
+        if stream.get('codec_type') == 'video':
+            return stream
+    return None
+
+
+def get_audio_stream(probe, audio_track):
+    '''Takes ffprobe output and audio track index, returns dict with audio
+    stream info (or None if track does not exist).
+    '''
+    audio_streams = [
+        stream for stream in probe.get('streams', [])
+        if stream.get('codec_type') == 'audio'
+    ]
+    if int(audio_track) < len(audio_streams):
+        return audio_streams[int(audio_track)]
+    return None
+
+
+def get_frame_rate(video_stream):
+    '''Takes ffprobe video stream dict, returns frame rate as float (0 if
+    unknown).
+    '''
+    try:
+        return float(Fraction(video_stream.get('avg_frame_rate', '0')))
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def get_video_filters(probe):
+    '''Takes ffprobe output, returns list of (filter name, options dict)
+    tuples that scale the video down to the max height setting, drop frames
+    down to the max frame rate setting, and tone map HDR to SDR when scaling
+    (if enabled). Empty list if source is within limits (or not probed).
+    '''
+    video_stream = get_video_stream(probe)
+    if not video_stream:
+        return []
+
+    filters = []
+    max_height = get_int_setting('max_height')
+    if max_height and int(video_stream.get('height', 0)) > max_height:
+        filters.append(('scale', {'w': -2, 'h': max_height, 'flags': SCALE_FLAGS}))
+
+    max_fps = get_int_setting('max_fps')
+    if max_fps and get_frame_rate(video_stream) > max_fps:
+        filters.append(('fps', {'fps': max_fps}))
+
+    # Tone map after scaling (fewer pixels to convert)
+    if filters and filters[0][0] == 'scale' \
+            and video_stream.get('color_transfer') in HDR_TRANSFERS \
+            and xbmcaddon.Addon().getSetting('tonemap_hdr') == 'true':
+        filters += TONEMAP_FILTERS
+
+    return filters
+
+
+def get_video_options(probe):
+    '''Takes ffprobe output, returns dict with vf output option applying
+    get_video_filters (plus pix_fmt if tone mapped, output is 8 bit SDR).
+    Empty dict if source is within limits.
+    '''
+    filters = get_video_filters(probe)
+    if not filters:
+        return {}
+
+    options = {'vf': ','.join(
+        f"{name}={':'.join(f'{key}={value}' for key, value in args.items())}"
+        for name, args in filters
+    )}
+    if filters[-1] == TONEMAP_FILTERS[-1]:
+        options['pix_fmt'] = 'yuv420p'
+    return options
+
+
+def get_preset_options(probe):
+    '''Takes ffprobe output, returns dict with libx264 preset output option
+    chosen by calibration for the output resolution and frame rate (after max
+    height/fps settings). Empty dict if auto preset is disabled or not
+    calibrated (ffmpeg default preset).
+    '''
+    video_stream = get_video_stream(probe) or {}
+    height = int(video_stream.get('height', 0))
+    if get_int_setting('max_height'):
+        height = min(height, get_int_setting('max_height'))
+    fps = get_frame_rate(video_stream)
+    if get_int_setting('max_fps'):
+        fps = min(fps, get_int_setting('max_fps')) if fps else get_int_setting('max_fps')
+
+    chosen = get_preset(height, fps)
+    if not chosen:
+        return {}
+    preset, speed = chosen
+    xbmc.log(f"Using {preset} preset for {height}p (calibrated {speed}x realtime)", xbmc.LOGINFO)
+    return {'preset': preset}
+
+
+def apply_video_filters(stream, probe):
+    '''Takes ffmpeg-python video stream and ffprobe output, returns stream
+    with get_video_filters applied (used where -vf can't be, filter graphs).
+    '''
+    for name, args in get_video_filters(probe):
+        stream = stream.filter(name, **args)
+    return stream
+
+
+def can_copy_video(probe, bitrate):
+    '''Takes ffprobe output and target bitrate. Returns True if video can be
+    copied without re-encoding (MP4-compatible codec, source bitrate not
+    higher than target, resolution and frame rate within limits).
+    '''
+    video_stream = get_video_stream(probe)
+    if not video_stream or video_stream.get('codec_name') not in COPY_VIDEO_CODECS:
+        return False
+    if get_video_filters(probe):
+        return False
+    return int(probe['format']['bit_rate']) <= bitrate
+
+
+def get_smart_cut_options(probe):
+    '''Takes ffprobe output, returns dict of libx264 options matching the
+    source video profile, level and reference frames, used to re-encode smart
+    cut edges that are joined with copied GOPs (MP4 header only describes the
+    first piece, so every piece must fit within it). Returns None if edges
+    can't match the source (profile not supported, not 8-bit 4:2:0,
+    interlaced, or level unknown).
+    '''
+    stream = get_video_stream(probe) or {}
+    profile = SMART_CUT_PROFILES.get(stream.get('profile'))
+    level = stream.get('level')
+    if profile is None or not isinstance(level, int) or level <= 0:
+        return None
+    if stream.get('pix_fmt') not in SMART_CUT_PIX_FMTS:
+        return None
+    if stream.get('field_order', 'progressive') not in ('progressive', 'unknown'):
+        return None
+
+    # ffprobe level is 10x the H.264 level (41 = 4.1)
+    options = {'profile:v': profile, 'level': f'{level / 10:g}'}
+    if stream.get('refs'):
+        options['refs'] = str(stream['refs'])
+    return options
+
+
+def can_stream_copy(probe, audio_track, bitrate):
+    '''Takes ffprobe output, audio track index, and target bitrate. Returns
+    True if video and audio can be copied without re-encoding (MP4-compatible
+    codecs, stereo or mono audio, source bitrate not higher than target).
+    '''
+    if not can_copy_video(probe, bitrate):
+        return False
+
+    audio_stream = get_audio_stream(probe, audio_track)
+    if not audio_stream or audio_stream.get('codec_name') not in COPY_AUDIO_CODECS:
+        return False
+    return int(audio_stream.get('channels', 0)) <= 2
+
+
+def parse_keyframes(probe):
+    '''Takes ffprobe output with packet pts_time and flags entries, returns
+    sorted list of keyframe timestamps.
+    '''
+    return sorted(
+        float(packet['pts_time'])
+        for packet in probe.get('packets', [])
+        if 'K' in packet.get('flags', '')
+        and packet.get('pts_time', 'N/A') != 'N/A'
+    )
+
+
+def get_keyframes(source, start_time, end_time):
+    '''Takes source file path, start and end timestamps. Returns sorted list
+    of video keyframe timestamps between start and end (read from packet flags).
+    Only reads the requested range, used when source has not been indexed yet.
+    '''
+    probe = ffmpeg.probe(
+        source,
+        select_streams='v:0',
+        show_entries='packet=pts_time,flags',
+        read_intervals=f'{start_time}%{end_time}'
+    )
+    return get_keyframes_in_range(parse_keyframes(probe), start_time, end_time)
+
+
+def get_keyframes_in_range(keyframes, start_time, end_time):
+    '''Takes sorted list of keyframe timestamps, start and end timestamps.
+    Returns keyframes between start and end.
+    '''
+    first = bisect.bisect_left(keyframes, start_time)
+    last = bisect.bisect_right(keyframes, end_time)
+    return keyframes[first:last]
+
+
+def get_seek_point(keyframes, start_time):
+    '''Takes sorted list of keyframe timestamps and clip start timestamp.
+    Returns timestamp of last keyframe at or before start (0 if none).
+    '''
+    index = bisect.bisect_right(keyframes, float(start_time))
+    return keyframes[index - 1] if index else 0
+
+
+def get_source_signature(source):
+    '''Takes source file path, returns (size, mtime) tuple used to detect if
+    source changed since it was indexed. Returns None if unable to stat.
+    '''
+    try:
+        stat = os.stat(source)
+        return (stat.st_size, stat.st_mtime)
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+def probe_source(source):
+    '''Takes source file path, returns ffprobe output (format and streams).
+    Reads from database cache if source has not changed since last probed,
+    otherwise probes source and writes output to cache.
+    '''
+    signature = get_source_signature(source)
+    if signature is None:
+        return ffmpeg.probe(source)
+
+    try:
+        probe = get_cached_probe(source, *signature)
+        if probe is not None:
+            return probe
+    except OperationalError as e:
+        xbmc.log("Failed to read probe cache due to SQL error:", xbmc.LOGERROR)
+        xbmc.log(e.args[0], xbmc.LOGERROR)
+
+    probe = ffmpeg.probe(source)
+    try:
+        save_cached_probe(source, *signature, probe)
+    except OperationalError as e:
+        xbmc.log("Failed to write probe cache due to SQL error:", xbmc.LOGERROR)
+        xbmc.log(e.args[0], xbmc.LOGERROR)
+    return probe
+
+
+def build_keyframe_index(source):
+    '''Takes source file path, reads packet flags of the whole source (no
+    decoding) and writes keyframe timestamps to database.
+    '''
+    signature = get_source_signature(source)
+    if signature is None:
+        return
+
+    xbmc.log(f"Building keyframe index of {source}", xbmc.LOGINFO)
+    try:
+        probe = ffmpeg.probe(
+            source,
+            select_streams='v:0',
+            show_entries='packet=pts_time,flags'
+        )
+        keyframes = parse_keyframes(probe)
+        save_keyframe_index(source, *signature, keyframes)
+        xbmc.log(f"Indexed {len(keyframes)} keyframes in {source}", xbmc.LOGINFO)
+
+    except ffmpeg.Error as e:
+        xbmc.log("Failed to build keyframe index due to ffmpeg error:", xbmc.LOGERROR)
+        xbmc.log(str(e.stderr, "utf-8"), xbmc.LOGERROR)
+
+    except OperationalError as e:
+        xbmc.log("Failed to save keyframe index due to SQL error:", xbmc.LOGERROR)
+        xbmc.log(e.args[0], xbmc.LOGERROR)
+
+    finally:
+        with indexing_lock:
+            indexing.discard(source)
+
+
+def load_keyframe_index(source):
+    '''Takes source file path, returns list of keyframe timestamps from
+    database, or None if source has not been indexed (or changed since).
+    '''
+    signature = get_source_signature(source)
+    if signature is None:
+        return None
+    try:
+        return get_keyframe_index(source, *signature)
+    except OperationalError as e:
+        xbmc.log("Failed to read keyframe index due to SQL error:", xbmc.LOGERROR)
+        xbmc.log(e.args[0], xbmc.LOGERROR)
+        return None
+
+
+def schedule_keyframe_index(source):
+    '''Takes source file path, builds keyframe index in background thread if
+    source has not been indexed yet. Called when user presses record button
+    so index is usually ready before the clip is generated.
+    '''
+    if get_source_signature(source) is None or load_keyframe_index(source) is not None:
+        return
+
+    with indexing_lock:
+        if source in indexing:
+            return
+        indexing.add(source)
+
+    threading.Thread(target=build_keyframe_index, args=(source,), daemon=True).start()
+
+
+def get_remux_stream(source, audio_track, start_time, duration, output, **options):  # pylint: disable=too-many-arguments
+    '''Takes source file path, audio track index, start timestamp, duration,
+    output path, and extra output options. Returns ffmpeg stream that copies
+    streams to MP4 without re-encoding (cut points snap to the nearest source
+    keyframe).
+    '''
+    return ffmpeg.input(
+        source,
+        ss=start_time
+    ).output(
+        output,
+        t=duration,
+        c="copy",
+        avoid_negative_ts="make_zero",
+        map=["0:v:0", f"0:a:{audio_track}"],
+        **options
+    )
+
+
+def remux_mp4(source, audio_track, start_time, duration, output, job=None):  # pylint: disable=too-many-arguments
+    '''Takes source file path, audio track index, start timestamp, duration,
+    output path, and optional Job (progress). Copies streams to MP4 without
+    re-encoding.
+    '''
+    run_ffmpeg(get_remux_stream(
+        source,
+        audio_track,
+        start_time,
+        duration,
+        output,
+        **get_output_options()
+    ), job, duration)
+
+
+def encode_video_piece(  # pylint: disable=too-many-arguments
+    source,
+    start_time,
+    duration,
+    output,
+    bitrate,
+    pix_fmt,
+    job=None,
+    progress_range=(0.0, 1.0),
+    part=None,
+    threads=None,
+    video_options=None
+):
+    '''Takes source file path, start timestamp, duration, output path,
+    bitrate, pixel format, optional Job, progress range and progress part.
+    Re-encodes video only (no audio) to MPEG-TS piece used by smart_cut_mp4
+    and segmented_encode_mp4 (pixel format must match other pieces). Optional
+    threads arg overrides the configured libx264 thread count, optional
+    video_options dict (from get_video_options) is added to output options.
+    '''
+    thread_options = {'threads': str(threads)} if threads else get_thread_options()
+    run_ffmpeg(ffmpeg.input(
+        source,
+        ss=start_time,
+        t=duration
+    ).output(
+        output,
+        vcodec="libx264",
+        b=str(bitrate),
+        map="0:v:0",
+        an=None,
+        **{'pix_fmt': pix_fmt, **(video_options or {})},
+        **thread_options
+    ), job, duration, progress_range, part)
+
+
+def join_video_pieces(  # pylint: disable=too-many-arguments
+    pieces,
+    tmp,
+    source,
+    audio_track,
+    start_time,
+    duration,
+    output,
+    job=None,
+    progress_range=(0.0, 1.0)
+):
+    '''Takes list of video-only MPEG-TS piece paths, temp dir path, source
+    file path, audio track index, clip start timestamp, duration, output path,
+    optional Job and progress range. Joins pieces with concat demuxer without
+    re-encoding, adds audio from source re-encoded to AAC (cheap).
+    '''
+    # Write concat demuxer playlist
+    playlist = os.path.join(tmp, 'pieces.txt')
+    with open(playlist, 'w', encoding='utf-8') as file:
+        for piece in pieces:
+            escaped = piece.replace("'", "'\\''")
+            file.write(f"file '{escaped}'\n")
+
+    video = ffmpeg.input(playlist, f='concat', safe=0)
+    audio = ffmpeg.input(source, ss=start_time, t=duration)
+    run_ffmpeg(ffmpeg.output(
+        video['v:0'],
+        audio[f'a:{audio_track}'],
+        output,
+        vcodec="copy",
+        acodec="aac",
+        ac="2",
+        **get_output_options()
+    ), job, duration, progress_range)
+
+
+def smart_cut_mp4(  # pylint: disable=too-many-arguments,too-many-locals
+    source,
+    audio_track,
+    start_time,
+    duration,
+    output,
+    bitrate,
+    keyframes,
+    pix_fmt='yuv420p',
+    job=None,
+    video_options=None
+):
+    '''Takes source file path, audio track index, start timestamp, duration,
+    output path, bitrate, list of keyframe timestamps within the clip, source
+    pixel format, optional Job (progress), and optional libx264 options
+    matching the source (see get_smart_cut_options). Re-encodes video from
+    start to first keyframe and from last keyframe to end, copies video
+    between keyframes, joins pieces with concat demuxer. Audio is re-encoded
+    for the whole clip (cheap).
+
+    Progress: edges are the first half of the job, joining the second half.
+    '''
+    end_time = float(start_time) + float(duration)
+    first_keyframe = keyframes[0]
+    last_keyframe = keyframes[-1]
+
+    # Write pieces to hidden dir on same filesystem as output
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(output), prefix='.smartcut_') as tmp:
+        pieces = []
+
+        # Re-encode partial GOP before first keyframe (if start is not a keyframe)
+        if first_keyframe > float(start_time):
+            pieces.append(os.path.join(tmp, 'head.ts'))
+            encode_video_piece(
+                source,
+                start_time,
+                first_keyframe - float(start_time),
+                pieces[-1],
+                bitrate,
+                pix_fmt,
+                job,
+                (0.0, 0.25),
+                video_options=video_options
+            )
+
+        # Copy full GOPs between first and last keyframe (seek slightly past
+        # first keyframe, input seek with copy snaps back to the keyframe)
+        pieces.append(os.path.join(tmp, 'middle.ts'))
+        run_ffmpeg(ffmpeg.input(
+            source,
+            ss=first_keyframe + 0.001,
+            t=last_keyframe - first_keyframe
+        ).output(
+            pieces[-1],
+            vcodec="copy",
+            map="0:v:0",
+            an=None
+        ), job, last_keyframe - first_keyframe, (0.25, 0.3))
+
+        # Re-encode partial GOP after last keyframe
+        if end_time > last_keyframe:
+            pieces.append(os.path.join(tmp, 'tail.ts'))
+            encode_video_piece(
+                source,
+                last_keyframe,
+                end_time - last_keyframe,
+                pieces[-1],
+                bitrate,
+                pix_fmt,
+                job,
+                (0.3, 0.5),
+                video_options=video_options
+            )
+
+        # Join video pieces without re-encoding, add audio from source
+        join_video_pieces(
+            pieces, tmp, source, audio_track, start_time, duration, output, job, (0.5, 1.0)
+        )
+
+
+def get_segment_count(duration):
+    '''Takes clip duration, returns number of segments to encode in parallel
+    (enough to use the cores not taken by other running encodes, each at least
+    SEGMENT_MIN_LENGTH seconds). Returns 1 if disabled or clip is too short.
+    '''
+    if xbmcaddon.Addon().getSetting('segmented_encode') != 'true' \
+            or float(duration) < SEGMENT_MIN_DURATION:
+        return 1
+
+    # Share cores (or configured thread cap) with other running encodes
+    threads = int(get_thread_options().get('threads', 0)) or len(get_allowed_cpus())
+    threads //= max(1, scheduler.running)
+    return max(1, min(threads // SEGMENT_THREADS, int(float(duration) // SEGMENT_MIN_LENGTH)))
+
+
+def get_segments(keyframes, start_time, duration, count):
+    '''Takes sorted list of keyframe timestamps (whole source), clip start
+    timestamp, duration, and number of segments. Returns list of (start,
+    duration) tuples splitting the clip at the keyframes closest to evenly
+    spaced split points. Returns fewer segments if there are not enough
+    keyframes (each segment is at least SEGMENT_MIN_LENGTH seconds).
+    '''
+    start = float(start_time)
+    end = start + float(duration)
+    candidates = get_keyframes_in_range(
+        keyframes, start + SEGMENT_MIN_LENGTH, end - SEGMENT_MIN_LENGTH
+    )
+
+    boundaries = [start]
+    for i in range(1, count):
+        if not candidates:
+            break
+        target = start + float(duration) * i / count
+        index = bisect.bisect_left(candidates, target)
+        nearest = candidates[max(0, index - 1):index + 1]
+        keyframe = min(nearest, key=lambda k, target=target: abs(k - target))
+        if keyframe - boundaries[-1] >= SEGMENT_MIN_LENGTH:
+            boundaries.append(keyframe)
+    boundaries.append(end)
+
+    return [(a, round(b - a, 6)) for a, b in zip(boundaries, boundaries[1:])]
+
+
+@contextmanager
+def segment_slots(segments):
+    '''Context manager, takes list of (start, duration) segment tuples (from
+    get_segments). Takes a scheduler slot for each segment after the first
+    (caller holds one) without waiting, so segments only use free slots.
+    Yields segments, adjacent segments are merged if fewer slots were free.
+    Releases the extra slots when the block exits.
+    '''
+    taken = 0
+    try:
+        while taken < len(segments) - 1 and scheduler.acquire(blocking=False):
+            taken += 1
+        if taken < len(segments) - 1:
+            start, duration = segments[0][0], sum(segment[1] for segment in segments)
+            segments = get_segments(
+                [segment[0] for segment in segments[1:]], start, duration, taken + 1
+            )
+        yield segments
+    finally:
+        for _ in range(taken):
+            scheduler.release()
+
+
+def segmented_encode_mp4(  # pylint: disable=too-many-arguments
+    source,
+    audio_track,
+    start_time,
+    duration,
+    output,
+    bitrate,
+    segments,
+    pix_fmt='yuv420p',
+    job=None,
+    video_options=None
+):
+    '''Takes source file path, audio track index, start timestamp, duration,
+    output path, bitrate, list of (start, duration) segment tuples (from
+    get_segments), source pixel format, optional Job (progress), and optional
+    video_options dict (from get_video_options, applied to every segment). Encodes
+    video of each segment in a separate ffmpeg process at the same time, then
+    joins segments without re-encoding and adds audio.
+
+    Segments after the first start on a keyframe, so each encoder decodes
+    only its own part of the source.
+    '''
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(output), prefix='.segments_') as tmp:
+        pieces = [os.path.join(tmp, f'{index}.ts') for index in range(len(segments))]
+
+        with ThreadPoolExecutor(max_workers=len(segments)) as pool:
+            futures = [
+                pool.submit(
+                    encode_video_piece,
+                    source,
+                    segment_start,
+                    segment_duration,
+                    piece,
+                    bitrate,
+                    pix_fmt,
+                    job,
+                    (0.0, SEGMENT_PROGRESS * segment_duration / float(duration)),
+                    index,
+                    SEGMENT_THREADS,
+                    video_options=video_options
+                )
+                for index, ((segment_start, segment_duration), piece)
+                in enumerate(zip(segments, pieces))
+            ]
+            # Raise first error (after all segments exit)
+            for future in futures:
+                future.result()
+
+        join_video_pieces(
+            pieces,
+            tmp,
+            source,
+            audio_track,
+            start_time,
+            duration,
+            output,
+            job,
+            (SEGMENT_PROGRESS, 1.0)
+        )
+
+
+def get_encode_stream(  # pylint: disable=too-many-arguments
+    source,
+    audio_track,
+    start_time,
+    duration,
+    output,
+    bitrate,
+    seek_point=None,
+    **options
+):
+    '''Takes source file path, audio track index, start timestamp, duration,
+    output path, bitrate, optional seek point (keyframe timestamp before
+    start), and extra output options. Returns ffmpeg stream that re-encodes to
+    H.264/AAC MP4.
+
+    If seek point is given seeks to the keyframe on the input side and trims
+    exactly on the output side (only decodes from keyframe to start). If not
+    given seeks on the input side to start (ffmpeg finds keyframe itself).
+    '''
+    if seek_point is None:
+        stream = ffmpeg.input(source, ss=start_time)
+        trim = {}
+    else:
+        stream = ffmpeg.input(source, ss=seek_point)
+        trim = {'ss': round(float(start_time) - seek_point, 6)}
+
+    return stream.output(
+        output,
+        **trim,
+        t=duration,
+        vcodec="libx264",
+        b=str(bitrate),
+        acodec="aac",
+        ac="2",
+        map=["0:v:0", f"0:a:{audio_track}"],
+        **get_thread_options(),
+        **options
+    )
+
+
+def encode_mp4(  # pylint: disable=too-many-arguments
+    source,
+    audio_track,
+    start_time,
+    duration,
+    output,
+    bitrate,
+    seek_point=None,
+    job=None,
+    video_options=None
+):
+    '''Takes source file path, audio track index, start timestamp, duration,
+    output path, bitrate, optional seek point, optional Job (progress), and
+    optional video_options dict (from get_video_options). Re-encodes to
+    H.264/AAC MP4.
+    '''
+    run_ffmpeg(get_encode_stream(
+        source,
+        audio_track,
+        start_time,
+        duration,
+        output,
+        bitrate,
+        seek_point,
+        **(video_options or {}),
+        **get_output_options()
+    ), job, duration)
+
+
+def gen_mp4(source, audio_track, start_time, duration, filename, job=None):  # pylint: disable=too-many-arguments
+    '''Takes source file path, audio track index, start timestamp, duration,
+    output filename, and optional Job (receives progress, can be cancelled).
+    Generates MP4 and writes to disk.
+    Returns name of mode used (smartcut, remux, segmented, or encode) if
+    generated successfully, None if error or cancelled.
+    '''
+    output = os.path.join(output_path, f'{filename}.mp4')
+    try:
+        remove_output(output)
+
+        # Get target bitrate from quality setting
+        target_bitrate = get_bitrate()
+
+        # Clamp bitrate to input file original bitrate
+        probe = probe_source(source)
+        bitrate = min(target_bitrate, int(probe['format']['bit_rate']))
+
+        xbmc.log(f"Generating clip of {source}", level=xbmc.LOGINFO)
+        xbmc.log(
+            f"Start time = {start_time}, duration = {duration}, output file = {filename}",
+            level=xbmc.LOGINFO
+        )
+
+        # Get keyframe index, build in background for next clip if missing
+        keyframes = load_keyframe_index(source)
+        if keyframes is None:
+            schedule_keyframe_index(source)
+
+        # Avoid re-encoding if source is already compatible
+        if xbmcaddon.Addon().getSetting('stream_copy') == 'true' \
+                and can_copy_video(probe, target_bitrate):
+            mode = copy_mp4(
+                source, audio_track, start_time, duration, output, bitrate, probe, keyframes, job
+            )
+            if mode:
+                return mode
+
+        # Scale/frame rate caps and calibrated preset, used by both encode modes
+        video_options = {**get_video_options(probe), **get_preset_options(probe)}
+
+        # Split long clips into segments encoded in parallel (if enabled and
+        # source indexed, segments are split on keyframes). Each segment after
+        # the first needs a free scheduler slot
+        if keyframes:
+            segments = get_segments(
+                keyframes, start_time, duration, get_segment_count(duration)
+            )
+            with segment_slots(segments) as segments:
+                if len(segments) > 1:
+                    xbmc.log(f"Encoding {len(segments)} segments in parallel", xbmc.LOGINFO)
+                    segmented_encode_mp4(
+                        source,
+                        audio_track,
+                        start_time,
+                        duration,
+                        output,
+                        bitrate,
+                        segments,
+                        get_video_stream(probe).get('pix_fmt', 'yuv420p'),
+                        job,
+                        video_options
+                    )
+                    xbmc.log(
+                        "Generated clip (mode = segmented, "
+                        f"preset = {video_options.get('preset', 'default')})",
+                        level=xbmc.LOGINFO
+                    )
+                    return 'segmented'
+
+        # Create MP4, seek to nearest keyframe before start if source indexed
+        encode_mp4(
+            source,
+            audio_track,
+            start_time,
+            duration,
+            output,
+            bitrate,
+            get_seek_point(keyframes, start_time) if keyframes else None,
+            job=job,
+            video_options=video_options
+        )
+        xbmc.log(
+            f"Generated clip (mode = encode, preset = {video_options.get('preset', 'default')})",
+            level=xbmc.LOGINFO
+        )
+        return 'encode'
+
+    except ffmpeg.Error as e:
+        xbmc.log("Failed to generate file due to ffmpeg error:", xbmc.LOGERROR)
+        xbmc.log(str(e.stderr, "utf-8"), xbmc.LOGERROR)
+
+    except EncodeCancelled:
+        xbmc.log(f"Cancelled generating {filename}, removing partial output", xbmc.LOGINFO)
+        if os.path.exists(output):
+            os.remove(output)
+
+    return None
+
+
+def get_batch_groups(clips):
+    '''Takes list of (start_time, duration, filename) tuples, returns list of
+    lists of clip indices (each sorted by start time). Clips are grouped if
+    their ranges overlap or are at most BATCH_MAX_GAP seconds apart.
+    '''
+    groups = []
+    end = None
+    for index in sorted(range(len(clips)), key=lambda i: float(clips[i][0])):
+        start = float(clips[index][0])
+        if end is None or start > end + BATCH_MAX_GAP:
+            groups.append([])
+            end = start
+        groups[-1].append(index)
+        end = max(end, start + float(clips[index][1]))
+    return groups
+
+
+def encode_batch_pass(  # pylint: disable=too-many-arguments
+    source,
+    audio_track,
+    clips,
+    outputs,
+    bitrate,
+    video_options,
+    keyframes,
+    job=None,
+    progress_range=(0.0, 1.0)
+):
+    '''Takes source file path, audio track index, list of (start_time,
+    duration, filename) tuples close together in the source, output paths,
+    bitrate, video options, keyframe index (None if not indexed), optional
+    Job and progress range. Encodes every clip with one ffmpeg process.
+    '''
+    # Seek to keyframe before earliest clip, each output trims exactly
+    first = min(float(start_time) for start_time, _, _ in clips)
+    seek_point = get_seek_point(keyframes, first) if keyframes else first
+
+    stream = ffmpeg.input(source, ss=seek_point)
+    run_ffmpeg(ffmpeg.merge_outputs(*[
+        stream.output(
+            output,
+            ss=round(float(start_time) - seek_point, 6),
+            t=duration,
+            vcodec="libx264",
+            b=str(bitrate),
+            acodec="aac",
+            ac="2",
+            map=["0:v:0", f"0:a:{audio_track}"],
+            **video_options,
+            **get_thread_options(),
+            **get_output_options()
+        )
+        for (start_time, duration, _), output in zip(clips, outputs)
+    ]), job, max(float(duration) for _, duration, _ in clips), progress_range)
+
+
+def gen_mp4_batch(source, audio_track, clips, job=None):  # pylint: disable=too-many-locals
+    '''Takes source file path, audio track index, list of (start_time,
+    duration, filename) tuples, and optional Job. Generates clips that are
+    close together (see get_batch_groups) with a single ffmpeg process
+    (source is read and decoded once, each output is trimmed and encoded
+    separately), distant clips are encoded by separate passes. Sources that
+    can be stream copied are generated one clip at a time with gen_mp4
+    instead (copying is cheaper than a shared decode).
+    Returns list with mode of each clip (batch, or mode used by gen_mp4),
+    None entries for clips that failed.
+    '''
+    outputs = [os.path.join(output_path, f'{filename}.mp4') for _, _, filename in clips]
+    modes = [None] * len(clips)
+    try:
+        for output in outputs:
+            remove_output(output)
+        target_bitrate = get_bitrate()
+        probe = probe_source(source)
+        bitrate = min(target_bitrate, int(probe['format']['bit_rate']))
+
+        if xbmcaddon.Addon().getSetting('stream_copy') == 'true' \
+                and can_copy_video(probe, target_bitrate):
+            return [gen_mp4(source, audio_track, *clip, job) for clip in clips]
+
+        keyframes = load_keyframe_index(source)
+        if keyframes is None:
+            schedule_keyframe_index(source)
+        video_options = {**get_video_options(probe), **get_preset_options(probe)}
+
+        groups = get_batch_groups(clips)
+        for number, group in enumerate(groups):
+            xbmc.log(f"Generating {len(group)} clips of {source} in one pass", level=xbmc.LOGINFO)
+            try:
+                encode_batch_pass(
+                    source,
+                    audio_track,
+                    [clips[index] for index in group],
+                    [outputs[index] for index in group],
+                    bitrate,
+                    video_options,
+                    keyframes,
+                    job,
+                    (number / len(groups), (number + 1) / len(groups))
+                )
+                for index in group:
+                    modes[index] = 'batch'
+            except ffmpeg.Error as e:
+                xbmc.log("Failed to generate batch due to ffmpeg error:", xbmc.LOGERROR)
+                xbmc.log(str(e.stderr, "utf-8"), xbmc.LOGERROR)
+
+        xbmc.log(f"Generated {modes.count('batch')} clips (mode = batch)", level=xbmc.LOGINFO)
+        return modes
+
+    except ffmpeg.Error as e:
+        xbmc.log("Failed to probe batch source due to ffmpeg error:", xbmc.LOGERROR)
+        xbmc.log(str(e.stderr, "utf-8"), xbmc.LOGERROR)
+
+    except EncodeCancelled:
+        xbmc.log("Cancelled generating batch, removing partial output", xbmc.LOGINFO)
+        for output in outputs:
+            if os.path.exists(output):
+                os.remove(output)
+
+    return [None] * len(clips)
+
+
+def get_rendition_profiles():
+    '''Returns list of RENDITION_PROFILES keys enabled in settings.'''
+    settings = xbmcaddon.Addon()
+    return [
+        name for name in RENDITION_PROFILES
+        if settings.getSetting(f'rendition_{name}') == 'true'
+    ]
+
+
+def get_rendition_filename(filename, rendition):
+    '''Takes clip filename (no extension) and rendition name (None for full
+    quality clip), returns rendition filename (no extension).
+    '''
+    return f'{filename}_{rendition}' if rendition else filename
+
+
+def gen_mp4_renditions(source, audio_track, start_time, duration, renditions, job=None):  # pylint: disable=too-many-arguments,too-many-locals
+    '''Takes source file path, audio track index, start timestamp, duration,
+    list of (filename, rendition) tuples, and optional Job. Rendition is a
+    RENDITION_PROFILES key (scaled down, lower bitrate) or None (full
+    resolution at quality setting bitrate). Generates all renditions with a
+    single ffmpeg process (source decoded once, split between encoders).
+    Returns "renditions" if successful, None if error or cancelled (all
+    outputs are removed).
+    '''
+    outputs = [os.path.join(output_path, f'{filename}.mp4') for filename, _ in renditions]
+    try:
+        for output in outputs:
+            remove_output(output)
+        probe = probe_source(source)
+        bitrate = min(get_bitrate(), int(probe['format']['bit_rate']))
+        # Height after max height setting applied (renditions never upscale)
+        source_height = int((get_video_stream(probe) or {}).get('height', 0))
+        if get_int_setting('max_height'):
+            source_height = min(source_height, get_int_setting('max_height'))
+
+        # Calibrated preset (same for every rendition, they share one process)
+        preset_options = get_preset_options(probe)
+
+        xbmc.log(
+            f"Generating {len(renditions)} renditions of {source} in one pass",
+            level=xbmc.LOGINFO
+        )
+
+        # Seek to keyframe before start, each output trims exactly
+        keyframes = load_keyframe_index(source)
+        if keyframes is None:
+            schedule_keyframe_index(source)
+        seek_point = get_seek_point(keyframes, start_time) if keyframes else float(start_time)
+
+        # Max height/fps and tone mapping applied once before split
+        stream = ffmpeg.input(source, ss=seek_point)
+        video = apply_video_filters(stream['v:0'], probe)
+        if len(renditions) > 1:
+            split = video.filter_multi_output('split', len(renditions))
+            videos = [split.stream(i) for i in range(len(renditions))]
+        else:
+            videos = [video]
+
+        streams = []
+        for video, (_, rendition), output in zip(videos, renditions, outputs):
+            video_bitrate = bitrate
+            if rendition:
+                profile = RENDITION_PROFILES[rendition]
+                video_bitrate = min(bitrate, profile['bitrate'])
+                if not source_height or source_height > profile['height']:
+                    video = video.filter('scale', -2, profile['height'])
+            streams.append(ffmpeg.output(
+                video,
+                stream[f'a:{audio_track}'],
+                output,
+                ss=round(float(start_time) - seek_point, 6),
+                t=duration,
+                vcodec="libx264",
+                b=str(video_bitrate),
+                acodec="aac",
+                ac="2",
+                **preset_options,
+                **get_thread_options(),
+                **get_output_options()
+            ))
+        run_ffmpeg(ffmpeg.merge_outputs(*streams), job, duration)
+
+        xbmc.log(
+            "Generated clip (mode = renditions, "
+            f"preset = {preset_options.get('preset', 'default')})",
+            level=xbmc.LOGINFO
+        )
+        return 'renditions'
+
+    except ffmpeg.Error as e:
+        xbmc.log("Failed to generate renditions due to ffmpeg error:", xbmc.LOGERROR)
+        xbmc.log(str(e.stderr, "utf-8"), xbmc.LOGERROR)
+
+    except EncodeCancelled:
+        xbmc.log("Cancelled generating renditions, removing partial output", xbmc.LOGINFO)
+
+    for output in outputs:
+        if os.path.exists(output):
+            os.remove(output)
+    return None
+
+
+def gen_snapshot(source, timestamp, filename):
+    '''Takes source file path, timestamp, and output filename. Writes frame
+    at timestamp to disk as full resolution JPEG. Seeks on the input side (only
+    decodes from the keyframe before timestamp), so does not wait for a
+    scheduler slot. Returns "snapshot" if successful, None if error.
+    '''
+    output = os.path.join(output_path, f'{filename}.jpg')
+    try:
+        xbmc.log(f"Generating snapshot of {source} at {timestamp}", level=xbmc.LOGINFO)
+        run_ffmpeg(ffmpeg.input(
+            source,
+            ss=timestamp
+        ).output(
+            output,
+            vframes=1,
+            update=1,
+            **{'q:v': SNAPSHOT_QUALITY}
+        ))
+        return 'snapshot'
+
+    except ffmpeg.Error as e:
+        xbmc.log("Failed to generate snapshot due to ffmpeg error:", xbmc.LOGERROR)
+        xbmc.log(str(e.stderr, "utf-8"), xbmc.LOGERROR)
+        if os.path.exists(output):
+            os.remove(output)
+
+    return None
+
+
+def pipe_mp4(source, audio_track, start_time, duration):
+    '''Takes source file path, audio track index, start timestamp, and
+    duration. Starts ffmpeg writing fragmented MP4 to stdout (nothing written
+    to disk). Remuxes if source is compatible and stream copy is enabled,
+    otherwise re-encodes (smart cut needs intermediate files).
+    Returns (process, mode) tuple, or None if error.
+    '''
+    try:
+        target_bitrate = get_bitrate()
+        probe = probe_source(source)
+        bitrate = min(target_bitrate, int(probe['format']['bit_rate']))
+
+        xbmc.log(f"Streaming clip of {source}", level=xbmc.LOGINFO)
+        xbmc.log(f"Start time = {start_time}, duration = {duration}", level=xbmc.LOGINFO)
+
+        # Muxer can't be guessed from pipe, can't seek back to write moov
+        options = {'f': 'mp4', 'movflags': FRAGMENTED_MOVFLAGS}
+
+        if xbmcaddon.Addon().getSetting('stream_copy') == 'true' \
+                and can_stream_copy(probe, audio_track, bitrate):
+            stream = get_remux_stream(
+                source, audio_track, start_time, duration, 'pipe:1', **options
+            )
+            mode = 'remux'
+        else:
+            keyframes = load_keyframe_index(source)
+            if keyframes is None:
+                schedule_keyframe_index(source)
+            stream = get_encode_stream(
+                source,
+                audio_track,
+                start_time,
+                duration,
+                'pipe:1',
+                bitrate,
+                get_seek_point(keyframes, start_time) if keyframes else None,
+                **get_video_options(probe),
+                **get_preset_options(probe),
+                **options
+            )
+            mode = 'encode'
+
+        # Only log errors (stderr is read after ffmpeg exits, must not fill)
+        process = stream.global_args('-loglevel', 'error').run_async(
+            cmd=get_ffmpeg_command(),
+            pipe_stdout=True,
+            pipe_stderr=True
+        )
+        return process, mode
+
+    except ffmpeg.Error as e:
+        xbmc.log("Failed to stream clip due to ffmpeg error:", xbmc.LOGERROR)
+        xbmc.log(str(e.stderr, "utf-8"), xbmc.LOGERROR)
+
+    return None
+
+
+def copy_mp4(  # pylint: disable=too-many-arguments
+    source,
+    audio_track,
+    start_time,
+    duration,
+    output,
+    bitrate,
+    probe,
+    index=None,
+    job=None
+):
+    '''Called by gen_mp4 when source video can be copied. Smart cuts if
+    enabled, clip contains at least 2 keyframes, and edges can be encoded
+    with settings matching the source, otherwise remuxes if audio can also be
+    copied. Optional index arg (keyframe index of whole source) skips reading
+    keyframes from source, optional job receives progress. Returns name of
+    mode used, or None if clip must be fully re-encoded (not compatible, or
+    ffmpeg error).
+    '''
+    try:
+        if xbmcaddon.Addon().getSetting('smart_cut') == 'true' \
+                and float(duration) >= SMART_CUT_MIN_DURATION:
+            edge_options = get_smart_cut_options(probe)
+            end_time = float(start_time) + float(duration)
+            keyframes = []
+            if edge_options is None:
+                xbmc.log("Source profile can't be matched, not smart cutting", xbmc.LOGINFO)
+            elif index is not None:
+                keyframes = get_keyframes_in_range(index, float(start_time), end_time)
+            else:
+                keyframes = get_keyframes(source, float(start_time), end_time)
+            if len(keyframes) >= 2:
+                xbmc.log("Source is compatible, smart cutting", level=xbmc.LOGINFO)
+                smart_cut_mp4(
+                    source,
+                    audio_track,
+                    start_time,
+                    duration,
+                    output,
+                    bitrate,
+                    keyframes,
+                    get_video_stream(probe).get('pix_fmt', 'yuv420p'),
+                    job,
+                    edge_options
+                )
+                xbmc.log("Generated clip (mode = smartcut)", level=xbmc.LOGINFO)
+                return 'smartcut'
+
+        # Remux (faster than smart cut, but cuts snap to nearest keyframe),
+        # also used if smart cut is not possible
+        if can_stream_copy(probe, audio_track, bitrate):
+            xbmc.log("Source is compatible, copying streams", level=xbmc.LOGINFO)
+            remux_mp4(source, audio_track, start_time, duration, output, job)
+            xbmc.log("Generated clip (mode = remux)", level=xbmc.LOGINFO)
+            return 'remux'
+
+    except ffmpeg.Error as e:
+        xbmc.log("Stream copy failed, falling back to re-encode:", xbmc.LOGWARNING)
+        xbmc.log(str(e.stderr, "utf-8"), xbmc.LOGWARNING)
+
+    return None
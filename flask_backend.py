@@ -2,32 +2,59 @@
 playing media, record clips, download and rename clips, etc.
 '''
 
+# pylint: disable=too-many-lines
+
 import os
+import math
 import time
 import json
 import string
 import random
 import socket
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from socketserver import ThreadingMixIn
 from wsgiref.simple_server import make_server, WSGIServer
 import xbmc
-import ffmpeg
 import xbmcgui
 import segno
 import xbmcaddon
 from sqlalchemy.exc import OperationalError
-from flask import Flask, request, render_template, jsonify, send_from_directory
+from flask import Flask, Response, request, render_template, jsonify, send_from_directory
 from paths import output_path, qr_path
 from kodi_gui import address_unavailable_error, generate_notification, show_notification
+from jobs import submit_job, submit_unique_job, get_job, get_current_job
+from encoder import (
+    get_bitrate,
+    gen_snapshot,
+    gen_mp4_renditions,
+    get_rendition_profiles,
+    get_rendition_filename,
+    pipe_mp4,
+    schedule_keyframe_index
+)
+from batching import batch_gen_mp4, link_output
+from speculative import start_session, pop_session
+from thumbnails import get_thumbnail
+from calibration import start_calibration, get_calibration_stats
+from scheduler import scheduler, QueueFullError, INTERACTIVE, REGENERATE, MAINTENANCE
 from database import (
+    get_fingerprint,
+    get_fingerprint_matches,
+    set_fingerprint,
     log_generated_file,
     load_history_json,
     load_history_search_results,
+    load_history_page,
+    load_history_changes,
+    get_history_seq,
+    get_oldest_history_seq,
+    get_read_cache_stats,
     rename_entry,
     delete_entry,
     is_duplicate,
     get_orm_entry,
+    get_missing_files,
     autodelete
 )
 
@@ -35,6 +62,35 @@ from database import (
 # Read currently-playing info
 player = xbmc.Player()
 
+# Bytes read per chunk when streaming clips that are still being written
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Seconds to wait for more output before reading again when streaming
+STREAM_POLL_INTERVAL = 0.25
+
+# Default and max seconds job result requests wait for the job to finish
+RESULT_TIMEOUT = 30
+RESULT_MAX_TIMEOUT = 60
+
+# Seconds between progress events sent to frontend
+EVENT_INTERVAL = 0.5
+
+# Seconds ephemeral clips can wait to be downloaded before being discarded
+EPHEMERAL_EXPIRATION = 300
+
+# Largest page size accepted by history endpoints
+HISTORY_MAX_PAGE_SIZE = 200
+
+# History endpoint params passed to database as filters
+HISTORY_FILTERS = ('start', 'end', 'show', 'renamed', 'media_type')
+
+# Seconds browsers cache thumbnails (URL changes when clip does)
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60
+
+# Ephemeral clips (not written to disk) waiting to be downloaded (token keys)
+ephemeral_clips = {}
+ephemeral_clips_lock = threading.Lock()
+
 # Serve contents of node_modules as static files
 app = Flask(__name__, static_url_path='', static_folder='node_modules')
 
@@ -135,15 +191,66 @@ def serve():
 @app.get("/get_playtime")
 def get_playtime():
     '''Returns JSON with current timestamp in playing media. Called when user
-    presses record button to get clip start time.
+    presses record button to get clip start time. Starts building keyframe
+    index of playing file in background if it has not been indexed yet.
+
+    If speculative encoding is enabled starts encoding from current timestamp
+    and adds session_id key to response (sent back to /submit). Skipped if
+    extra renditions are enabled (all renditions are encoded in one pass).
     '''
     try:
         playtime = player.getTime()
-        return jsonify({'playtime': playtime})
+        source = player.getPlayingFile()
+        schedule_keyframe_index(source)
+        payload = {'playtime': playtime}
+
+        # Skip if ephemeral (clip is not encoded until downloaded)
+        settings = xbmcaddon.Addon()
+        if settings.getSetting('speculative_encoding') == 'true' \
+                and settings.getSetting('ephemeral_clips') != 'true' \
+                and not get_rendition_profiles():
+            session = start_session(source, get_audio_track(), playtime)
+            if session:
+                payload['session_id'] = session.id
+
+        return jsonify(payload)
     except RuntimeError:
         return jsonify({'error': 'Nothing playing'}), 500
 
 
+def get_stream_output(filename):
+    '''Takes output filename (no extension), returns full path if progressive
+    downloads are enabled (passed to submit_job so the fragmented MP4 can be
+    streamed while encoding), otherwise returns None.
+    '''
+    if xbmcaddon.Addon().getSetting('progressive_download') == 'true':
+        return os.path.join(output_path, f'{filename}.mp4')
+    return None
+
+
+def get_audio_track():
+    '''Returns index of audio track currently selected in Kodi player.'''
+
+    # Get current audio track using local API call (can't find xbmc method)
+    response = xbmc.executeJSONRPC(json.dumps({
+        "jsonrpc": "2.0",
+        "method": "Player.GetProperties",
+        "params": {
+            "playerid": 1,
+            "properties": ["currentaudiostream"]
+        },
+        "id": 1
+    }))
+    response_data = json.loads(response)
+    return response_data.get(
+        'result', {}
+    ).get(
+        'currentaudiostream', {}
+    ).get(
+        'index', 0
+    )
+
+
 @app.get("/get_playing_now")
 def get_playing_now():
     '''Returns JSON with title of currently playing media and sub-title (show,
@@ -174,13 +281,24 @@ def get_playing_now():
 
 @app.post("/submit")
 def submit():
-    '''Receives JSON payload when user releases record button. Generates
-    requested MP4 and returns JSON with filename key.
+    '''Receives JSON payload when user releases record button. Queues job to
+    generate requested MP4, returns JSON with job_id and filename keys (plus
+    stream key with URL that serves MP4 while encoding if progressive
+    downloads are enabled).
+
+    If ephemeral clips are enabled the clip is logged in the database but not
+    generated, returns JSON with filename and stream keys (URL where ffmpeg
+    output is piped directly to the response).
+
+    Returns 429 with Retry-After header if too many clips are queued.
     '''
     try:
         # Get stop time immediately
         stop_time = player.getTime()
 
+        # Reject if encoder is saturated (don't start speculative session)
+        scheduler.admit(INTERACTIVE)
+
         # Parse post body, calculcate clip duration
         data = request.get_json()
         duration = stop_time - float(data["startTime"])
@@ -197,81 +315,281 @@ def submit():
         episode_name = video_info_tag.getTitle()
 
         source = player.getPlayingFile()
+        audio_stream_index = get_audio_track()
+
+        # Get speculative session started by /get_playtime (if any), discard
+        # if user changed source or audio track while recording
+        session = pop_session(data.get('sessionId'))
+        if session and not session.matches(source, audio_stream_index, data["startTime"]):
+            session.cancel()
+            session = None
+
+        # Log clip without generating, encoded when user downloads it
+        if xbmcaddon.Addon().getSetting('ephemeral_clips') == 'true':
+            if session:
+                session.cancel()
+            return jsonify(add_ephemeral_clip(
+                source,
+                audio_stream_index,
+                data["startTime"],
+                str(duration),
+                filename,
+                show_name,
+                episode_name
+            ))
 
-        # Get current audio track using local API call (can't find xbmc method)
-        response = xbmc.executeJSONRPC(json.dumps({
-            "jsonrpc": "2.0",
-            "method": "Player.GetProperties",
-            "params": {
-                "playerid": 1,
-                "properties": ["currentaudiostream"]
-            },
-            "id": 1
-        }))
-        response_data = json.loads(response)
-        audio_stream_index = response_data.get(
-            'result', {}
-        ).get(
-            'currentaudiostream', {}
-        ).get(
-            'index', 0
-        )
-
-        # Generate, write params to database and return filename if successful
-        if gen_mp4(
+        # Queue job to generate clip, return job ID immediately
+        job = submit_job(
+            generate_clip,
             source,
             audio_stream_index,
             data["startTime"],
             str(duration),
-            filename
-        ):
+            filename,
+            show_name,
+            episode_name,
+            session,
+            output=get_stream_output(filename)
+        )
+        return jsonify(get_job_response(job, f'{filename}.mp4')), 202
+
+    except QueueFullError as e:
+        return queue_full_response(e)
+
+    except RuntimeError as e:
+        xbmc.log("Failed to generate file due to Kodi RuntimeError:", xbmc.LOGERROR)
+        xbmc.log(e.args[0], xbmc.LOGERROR)
+
+    except OperationalError as e:
+        xbmc.log("Failed to generate file due to SQL error:", xbmc.LOGERROR)
+        xbmc.log(e.args[0], xbmc.LOGERROR)
+
+    return jsonify({'error': 'Unable to generate file, see Kodi logs for details'}), 500
+
+
+@app.post("/snapshot")
+def snapshot():
+    '''Called when user presses snapshot button. Writes current frame of
+    playing media to disk as full resolution JPEG and logs it in database.
+    Runs in request thread (single frame, doesn't wait for a scheduler slot),
+    returns JSON with filename and mode keys.
+    '''
+    try:
+        # Get timestamp immediately
+        timestamp = player.getTime()
+        source = player.getPlayingFile()
+
+        # Generate random 16 char string
+        filename = ''.join(
+            random.choice(string.ascii_letters + string.digits)
+            for _ in range(16)
+        )
+
+        # Get show and episode names for history search
+        video_info_tag = player.getVideoInfoTag()
+        show_name = video_info_tag.getTVShowTitle()
+        episode_name = video_info_tag.getTitle()
+
+        mode = gen_snapshot(source, timestamp, filename)
+        if mode:
             log_generated_file(
                 source,
-                audio_stream_index,
-                data["startTime"],
-                str(duration),
+                0,
+                timestamp,
+                0,
                 filename,
                 show_name,
-                episode_name
+                episode_name,
+                media_type='snapshot'
             )
-            generate_notification()
-            return jsonify({'filename': f'{filename}.mp4'})
+            return jsonify({'filename': f'{filename}.jpg', 'mode': mode})
 
     except RuntimeError as e:
-        xbmc.log("Failed to generate file due to Kodi RuntimeError:", xbmc.LOGERROR)
+        xbmc.log("Failed to generate snapshot due to Kodi RuntimeError:", xbmc.LOGERROR)
         xbmc.log(e.args[0], xbmc.LOGERROR)
 
+    except OperationalError as e:
+        xbmc.log("Failed to generate snapshot due to SQL error:", xbmc.LOGERROR)
+        xbmc.log(e.args[0], xbmc.LOGERROR)
+
+    return jsonify({'error': 'Unable to generate snapshot, see Kodi logs for details'}), 500
+
+
+def add_ephemeral_clip(  # pylint: disable=too-many-arguments
+    source,
+    audio_track,
+    start_time,
+    duration,
+    filename,
+    show_name,
+    episode_name
+):
+    '''Logs clip params and fingerprint in database (so it can be
+    regenerated from history later, and deduplicated once it exists on disk),
+    adds clip to ephemeral_clips with a random token. Returns dict with
+    filename and stream (URL that downloads clip once) keys.
+    '''
+    log_generated_file(
+        source,
+        audio_track,
+        start_time,
+        duration,
+        filename,
+        show_name,
+        episode_name,
+        get_fingerprint(source, audio_track, start_time, duration, get_bitrate())
+    )
+
+    token = ''.join(
+        random.choice(string.ascii_letters + string.digits)
+        for _ in range(32)
+    )
+    with ephemeral_clips_lock:
+        # Discard clips that were never downloaded
+        cutoff = time.time() - EPHEMERAL_EXPIRATION
+        for expired in [t for t, clip in ephemeral_clips.items() if clip['time'] < cutoff]:
+            del ephemeral_clips[expired]
+
+        ephemeral_clips[token] = {
+            'source': source,
+            'audio_track': audio_track,
+            'start_time': start_time,
+            'duration': duration,
+            'filename': f'{filename}.mp4',
+            'time': time.time()
+        }
+
+    return {'filename': f'{filename}.mp4', 'stream': f'ephemeral/{token}'}
+
+
+def generate_clip(  # pylint: disable=too-many-arguments
+    source,
+    audio_track,
+    start_time,
+    duration,
+    filename,
+    show_name,
+    episode_name,
+    session=None
+):
+    '''Runs in job worker thread. Generates MP4, writes params to database and
+    returns dict with filename and mode (dedup, speculative, renditions, or
+    mode returned by batch_gen_mp4) keys if successful, returns None if error.
+
+    If extra renditions are enabled in settings generates them with the clip
+    in a single ffmpeg pass (result gets renditions key with filenames).
+    Otherwise reuses existing clip with identical parameters if one exists on
+    disk, or finalizes speculative session if given (falls back to
+    batch_gen_mp4 if failed).
+    '''
+    try:
+        fingerprint = get_fingerprint(source, audio_track, start_time, duration, get_bitrate())
+        renditions = [
+            (get_rendition_filename(filename, rendition), rendition)
+            for rendition in get_rendition_profiles()
+        ]
+        if renditions:
+            if session:
+                session.cancel()
+            with scheduler.slot(INTERACTIVE):
+                mode = gen_mp4_renditions(
+                    source,
+                    audio_track,
+                    start_time,
+                    duration,
+                    [(filename, None)] + renditions,
+                    get_current_job()
+                )
+        elif link_existing_clip(fingerprint, filename):
+            mode = 'dedup'
+            if session:
+                session.cancel()
+        elif session and session.finalize(float(duration), filename):
+            mode = 'speculative'
+        else:
+            mode = batch_gen_mp4(source, audio_track, start_time, duration, filename)
+        if mode:
+            log_generated_file(
+                source,
+                audio_track,
+                start_time,
+                duration,
+                filename,
+                show_name,
+                episode_name,
+                fingerprint,
+                renditions=renditions
+            )
+            generate_notification()
+            result = {'filename': f'{filename}.mp4', 'mode': mode}
+            if renditions:
+                result['renditions'] = [f'{output}.mp4' for output, _ in renditions]
+            return result
+
     except OperationalError as e:
         xbmc.log("Failed to generate file due to SQL error:", xbmc.LOGERROR)
         xbmc.log(e.args[0], xbmc.LOGERROR)
 
-    return jsonify({'error': 'Unable to generate file, see Kodi logs for details'}), 500
+    return None
 
 
 @app.post("/regenerate")
 def regenerate():
     '''Takes JSON with filename of clip deleted from disk that still exists in
-    database. Uses source file path, start timestamp, duration, and output
-    filename logged in database to regenerate clip, returns JSON with filename.
+    database. Queues job to regenerate clip using source file path, start
+    timestamp, duration, and output filename logged in database. Returns JSON
+    with job_id and filename keys (plus stream key if progressive downloads
+    are enabled). Returns 429 with Retry-After header if too many clips are
+    queued.
     '''
     try:
         # Read filename from post body, get ORM entry from database
+        scheduler.admit(REGENERATE)
         data = request.get_json()
         xbmc.log(f"Regenerating {data['filename']}", xbmc.LOGINFO)
         entry = get_orm_entry(data['filename'])
 
+        # Extra renditions are regenerated without the full quality clip
+        if entry.rendition:
+            job = submit_job(
+                regenerate_rendition,
+                entry.source,
+                entry.audio_track,
+                entry.start_time,
+                entry.duration,
+                data['filename'],
+                entry.rendition
+            )
+            return jsonify(get_job_response(job, data['filename'])), 202
+
+        # Snapshots are a single frame (don't need output streamed)
+        if entry.media_type == 'snapshot':
+            job = submit_job(
+                regenerate_snapshot,
+                entry.source,
+                entry.start_time,
+                data['filename']
+            )
+            return jsonify(get_job_response(job, data['filename'])), 202
+
         # Prevent double extension
         output = data['filename'].replace('.mp4', '')
 
-        # Regenerate with params from database, return filename if successful
-        if gen_mp4(
+        # Queue job to regenerate with params from database
+        job = submit_job(
+            regenerate_clip,
             entry.source,
             entry.audio_track,
             entry.start_time,
             entry.duration,
-            output
-        ):
-            return jsonify({'filename': f"{data['filename']}.mp4"})
+            output,
+            f"{data['filename']}.mp4",
+            output=get_stream_output(output)
+        )
+        return jsonify(get_job_response(job, f"{data['filename']}.mp4")), 202
+
+    except QueueFullError as e:
+        return queue_full_response(e)
 
     except OperationalError as e:
         xbmc.log("Failed to regenerate file due to SQL error:", xbmc.LOGERROR)
@@ -280,51 +598,452 @@ def regenerate():
     return jsonify({'error': 'Unable to generate file, see Kodi logs for details'}), 500
 
 
-def get_bitrate():
-    '''Returns bit/s calculated from user-configured quality (MB per minute).'''
-    mb_per_min = int(xbmcaddon.Addon().getSetting('mb_per_min'))
-    return int(mb_per_min * 1024 * 1024 * 8 / 60)
+def regenerate_clip(  # pylint: disable=too-many-arguments
+    source,
+    audio_track,
+    start_time,
+    duration,
+    output,
+    filename,
+    priority=REGENERATE
+):
+    '''Runs in job worker thread. Regenerates MP4 with params from database
+    (reuses existing clip with identical parameters if one exists on disk),
+    returns dict with filename and mode keys if successful, None if error.
+    Optional priority arg is the scheduler priority class.
+    '''
+    try:
+        fingerprint = get_fingerprint(source, audio_track, start_time, duration, get_bitrate())
+        if link_existing_clip(fingerprint, output):
+            mode = 'dedup'
+        else:
+            mode = batch_gen_mp4(source, audio_track, start_time, duration, output, priority)
+        if mode:
+            # Update fingerprint (quality setting may have changed)
+            set_fingerprint(f'{output}.mp4', fingerprint)
+            return {'filename': filename, 'mode': mode}
+
+    except OperationalError as e:
+        xbmc.log("Failed to regenerate file due to SQL error:", xbmc.LOGERROR)
+        xbmc.log(e.args[0], xbmc.LOGERROR)
+
+    return None
+
+
+def regenerate_rendition(  # pylint: disable=too-many-arguments
+    source,
+    audio_track,
+    start_time,
+    duration,
+    filename,
+    rendition,
+    priority=REGENERATE
+):
+    '''Runs in job worker thread. Regenerates extra rendition with params from
+    database, returns dict with filename and mode keys if successful, None if
+    error. Optional priority arg is the scheduler priority class.
+    '''
+    with scheduler.slot(priority):
+        mode = gen_mp4_renditions(
+            source,
+            audio_track,
+            start_time,
+            duration,
+            [(os.path.splitext(filename)[0], rendition)],
+            get_current_job()
+        )
+    if mode:
+        return {'filename': filename, 'mode': mode}
+    return None
+
+
+def regenerate_snapshot(source, timestamp, filename):
+    '''Runs in job worker thread. Regenerates snapshot with params from
+    database, returns dict with filename and mode keys if successful, None if
+    error.
+    '''
+    mode = gen_snapshot(source, timestamp, os.path.splitext(filename)[0])
+    if mode:
+        return {'filename': filename, 'mode': mode}
+    return None
 
 
-def gen_mp4(source, audio_track, start_time, duration, filename):
-    '''Takes source file path, audtio track index, start timestamp, duration,
-    and output filename. Generates MP4, writes to disk and database.
-    Returns True if generated successfully, False if error.
+@app.post("/regenerate_missing")
+def regenerate_missing():
+    '''Queues job that regenerates every clip in database that no longer
+    exists on disk (returns existing job if one is already running). Returns
+    JSON with job_id and queue keys.
     '''
+    job = submit_unique_job(regenerate_missing_clips)
+    return jsonify({'job_id': job.id, 'queue': scheduler.get_stats()}), 202
+
+
+def regenerate_missing_clips():
+    '''Runs in job worker thread. Regenerates every clip missing from disk
+    with a pool of workers (one per scheduler slot, lowest priority so
+    recording is not delayed). Clips are queued in source order so clips of
+    the same source run together (batched into one ffmpeg pass, source stays
+    in the page cache). Reports progress after each clip.
+
+    Returns dict with total, regenerated, and failed (lists of filenames)
+    keys, or None if cancelled (queued clips are skipped, running clips
+    finish) or database error.
+    '''
+    job = get_current_job()
     try:
-        # Get target bitrate from quality setting, input file original bitrate
-        bitrate = get_bitrate()
+        entries = get_missing_files()
+    except OperationalError as e:
+        xbmc.log("Failed to find missing clips due to SQL error:", xbmc.LOGERROR)
+        xbmc.log(e.args[0], xbmc.LOGERROR)
+        return None
+
+    xbmc.log(f"Regenerating {len(entries)} missing clips", xbmc.LOGINFO)
+    regenerated = []
+    failed = []
+    with ThreadPoolExecutor(
+        max_workers=scheduler.get_limit(),
+        thread_name_prefix='record_button_bulk'
+    ) as pool:
+        futures = {
+            pool.submit(regenerate_missing_clip, entry, job): entry.output
+            for entry in entries
+        }
+        for future in as_completed(futures):
+            if future.result():
+                regenerated.append(futures[future])
+            else:
+                failed.append(futures[future])
+            if job:
+                job.update_progress((len(regenerated) + len(failed)) / len(entries))
+
+    if job and job.cancelled.is_set():
+        return None
+
+    xbmc.log(
+        f"Regenerated {len(regenerated)} missing clips, {len(failed)} failed",
+        xbmc.LOGINFO
+    )
+    return {'total': len(entries), 'regenerated': regenerated, 'failed': failed}
+
+
+def regenerate_missing_clip(entry, job=None):
+    '''Runs in bulk worker thread. Takes ORM entry and bulk Job, regenerates
+    clip, extra rendition, or snapshot (skipped if job was cancelled).
+    Returns True if successful.
+    '''
+    if job and job.cancelled.is_set():
+        return False
+    if entry.media_type == 'snapshot':
+        return regenerate_snapshot(entry.source, entry.start_time, entry.output) is not None
+    if entry.rendition:
+        return regenerate_rendition(
+            entry.source,
+            entry.audio_track,
+            entry.start_time,
+            entry.duration,
+            entry.output,
+            entry.rendition,
+            MAINTENANCE
+        ) is not None
+    return regenerate_clip(
+        entry.source,
+        entry.audio_track,
+        entry.start_time,
+        entry.duration,
+        entry.output.replace('.mp4', ''),
+        entry.output,
+        MAINTENANCE
+    ) is not None
+
+
+def link_existing_clip(fingerprint, filename):
+    '''Takes fingerprint of clip parameters and output filename (no
+    extension). Hard links newest clip generated with identical parameters
+    (found by fingerprint, works after renaming) to the output path.
+    Returns True if linked, False if no identical clip exists on disk.
+    '''
+    output = os.path.join(output_path, f'{filename}.mp4')
+    for existing in get_fingerprint_matches(fingerprint):
+        path = os.path.join(output_path, existing)
+        if path != output and os.path.exists(path) and link_output(path, output):
+            xbmc.log(f"Reusing identical clip {existing} for {filename}.mp4", xbmc.LOGINFO)
+            return True
+    return False
+
 
-        # Clamp bitrate to input file original bitrate
-        original_bitrate = int(ffmpeg.probe(source)['format']['bit_rate'])
-        bitrate = min(bitrate, original_bitrate)
+def queue_full_response(error):
+    '''Takes QueueFullError, returns 429 response with Retry-After header.'''
+    response = jsonify({
+        'error': f'Too many clips in progress, try again in {error.retry_after} seconds',
+        'retry_after': error.retry_after
+    })
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
 
-        xbmc.log(f"Generating clip of {source}", level=xbmc.LOGINFO)
-        xbmc.log(
-            f"Start time = {start_time}, duration = {duration}, output file = {filename}",
-            level=xbmc.LOGINFO
+
+def get_job_response(job, filename):
+    '''Takes queued Job and output filename, returns dict with job_id,
+    filename, and queue (scheduler stats) keys, adds stream URL if job output
+    can be streamed.
+    '''
+    response = {'job_id': job.id, 'filename': filename, 'queue': scheduler.get_stats()}
+    if job.output:
+        response['stream'] = f'jobs/{job.id}/download'
+    return response
+
+
+@app.get('/jobs/<job_id>')
+def job_status(job_id):
+    '''Returns JSON with status of job ID in URL path (queued, running,
+    complete, or failed) and result if finished.
+    '''
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.get('/jobs/<job_id>/result')
+def job_result(job_id):
+    '''Waits for job ID in URL path to finish, returns JSON result. Returns
+    status and queue stats with 202 if job is still running after timeout
+    seconds (optional query param, default 30, clamped to 0-60) so frontend
+    can request again. Returns 400 if timeout is not a number.
+    '''
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    try:
+        timeout = float(request.args.get('timeout', RESULT_TIMEOUT))
+        if math.isnan(timeout):
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'timeout must be a number'}), 400
+    timeout = min(max(timeout, 0), RESULT_MAX_TIMEOUT)
+
+    if not job.wait(timeout):
+        return jsonify({**job.to_dict(), 'queue': scheduler.get_stats()}), 202
+
+    if job.status == 'complete':
+        return jsonify(job.result)
+    if job.status == 'cancelled':
+        return jsonify({'error': 'Clip cancelled', 'status': 'cancelled'}), 409
+    return jsonify({'error': 'Unable to generate file, see Kodi logs for details'}), 500
+
+
+@app.get('/jobs/<job_id>/events')
+def job_events(job_id):
+    '''Server-Sent Events stream with status, progress (percent, speed, eta)
+    and queue stats of job ID in URL path. Sends an event every EVENT_INTERVAL
+    seconds, last event (type done) is sent when job finishes.
+    '''
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return Response(
+        stream_job_events(job),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def stream_job_events(job):
+    '''Takes Job, yields SSE messages until job finishes.'''
+    while True:
+        finished = job.finished.is_set()
+        payload = json.dumps({
+            **job.to_dict(),
+            'progress': job.get_progress(),
+            'queue': scheduler.get_stats()
+        })
+        if finished:
+            yield f'event: done\ndata: {payload}\n\n'
+            return
+        yield f'data: {payload}\n\n'
+        job.wait(EVENT_INTERVAL)
+
+
+@app.post('/jobs/<job_id>/cancel')
+def job_cancel(job_id):
+    '''Cancels job ID in URL path (kills ffmpeg, partial output is deleted).
+    Returns 409 if job already finished.
+    '''
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if not job.cancel():
+        return jsonify({'error': 'Job already finished', 'status': job.status}), 409
+    return jsonify({'job_id': job.id, 'status': 'cancelling'})
+
+
+@app.get('/queue')
+def queue_status():
+    '''Returns JSON with encode limit, number of encodes running and queued,
+    and estimated wait time (seconds) for a new clip.
+    '''
+    return jsonify(scheduler.get_stats())
+
+
+@app.post('/calibrate')
+def calibrate():
+    '''Queues job that measures encode speed of each libx264 preset (returns
+    existing job if one is already running). Returns JSON with job_id and
+    queue keys.
+    '''
+    job = start_calibration(force=True)
+    return jsonify({'job_id': job.id, 'queue': scheduler.get_stats()}), 202
+
+
+@app.get('/calibration')
+def calibration_status():
+    '''Returns JSON with auto preset setting, encode time target, measured
+    speed of each preset (null if not calibrated), and preset chosen for each
+    calibrated resolution.
+    '''
+    return jsonify(get_calibration_stats())
+
+
+@app.get('/history_cache')
+def history_cache_status():
+    '''Returns JSON with number of cached history reads, max size, ttl, and
+    hit/miss counts.
+    '''
+    return jsonify(get_read_cache_stats())
+
+
+@app.get('/jobs/<job_id>/download')
+def job_download(job_id):
+    '''Streams fragmented MP4 written by job ID in URL path while it is still
+    being written, response ends when the job finishes and all output is sent.
+    '''
+    job = get_job(job_id)
+    if job is None or job.output is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return Response(
+        stream_job_output(job),
+        mimetype='video/mp4',
+        headers={
+            'Content-Disposition': f'attachment; filename={os.path.basename(job.output)}',
+            'Cache-Control': 'no-store'
+        }
+    )
+
+
+def stream_job_output(job):
+    '''Takes Job with output path, yields chunks of output file as they are
+    written until the job finishes. Fragmented MP4 output is only appended to,
+    so bytes that were already sent never change.
+    '''
+
+    # Wait for ffmpeg to create output (job may still be queued)
+    while not os.path.exists(job.output):
+        if job.wait(STREAM_POLL_INTERVAL) and not os.path.exists(job.output):
+            xbmc.log(f"Job {job.id} finished without writing output", xbmc.LOGERROR)
+            return
+
+    with open(job.output, 'rb') as file:
+        while True:
+            # Check before reading so output written before finishing is sent
+            finished = job.finished.is_set()
+            chunk = file.read(STREAM_CHUNK_SIZE)
+            if chunk:
+                yield chunk
+            elif finished:
+                return
+            else:
+                job.wait(STREAM_POLL_INTERVAL)
+
+
+@app.get('/ephemeral/<token>')
+def ephemeral_download(token):
+    '''Encodes ephemeral clip with token in URL path, pipes ffmpeg output
+    directly to a chunked response (never written to disk). Each token can
+    only be downloaded once, clip can be regenerated from history later.
+    Returns 429 with Retry-After header if too many clips are queued (token
+    can be downloaded again).
+    '''
+    with ephemeral_clips_lock:
+        clip = ephemeral_clips.pop(token, None)
+    if clip is None:
+        return jsonify({'error': 'Clip not found'}), 404
+
+    try:
+        scheduler.admit(INTERACTIVE)
+    except QueueFullError as e:
+        # Keep clip so download can be retried
+        with ephemeral_clips_lock:
+            ephemeral_clips[token] = clip
+        return queue_full_response(e)
+
+    # Hold scheduler slot until response is closed
+    scheduler.acquire(INTERACTIVE)
+    start = time.time()
+    process = None
+    response = None
+    try:
+        result = pipe_mp4(
+            clip['source'],
+            clip['audio_track'],
+            clip['start_time'],
+            clip['duration']
+        )
+        if result is None:
+            return jsonify({'error': 'Unable to generate file, see Kodi logs for details'}), 500
+        process, mode = result
+        xbmc.log(f"Streaming {clip['filename']} (mode = {mode})", xbmc.LOGINFO)
+
+        response = Response(
+            stream_process_output(process),
+            mimetype='video/mp4',
+            headers={
+                'Content-Disposition': f"attachment; filename={clip['filename']}",
+                'Cache-Control': 'no-store'
+            }
         )
-        # Create MP4
-        ffmpeg.input(
-            source
-        ).output(
-            os.path.join(output_path, f'{filename}.mp4'),
-            ss=start_time,
-            t=duration,
-            vcodec="libx264",
-            b=str(bitrate),
-            acodec="aac",
-            ac="2",
-            map=["0:v:0", f"0:a:{audio_track}"]
-        ).run(overwrite_output=True, capture_stderr=True)
-
-        return True
-
-    except ffmpeg.Error as e:
-        xbmc.log("Failed to generate file due to ffmpeg error:", xbmc.LOGERROR)
-        xbmc.log(str(e.stderr, "utf-8"), xbmc.LOGERROR)
+        response.call_on_close(lambda: close_process_stream(process, start))
+        return response
 
-    return False
+    finally:
+        # Free slot (and stop ffmpeg) if failed before response was created
+        if response is None:
+            if process is not None:
+                process.kill()
+            scheduler.release()
+
+
+def stream_process_output(process):
+    '''Takes ffmpeg process writing to stdout, yields chunks of output until
+    ffmpeg exits. Kills ffmpeg if the client disconnects before it finishes.
+    '''
+    finished = False
+    try:
+        while True:
+            chunk = process.stdout.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                finished = True
+                break
+            yield chunk
+    finally:
+        if not finished:
+            xbmc.log("Client disconnected, stopping ffmpeg", xbmc.LOGINFO)
+            process.kill()
+        _, stderr = process.communicate()
+        if finished and process.returncode:
+            xbmc.log(f"ffmpeg exited with code {process.returncode}:", xbmc.LOGERROR)
+            xbmc.log(str(stderr, "utf-8"), xbmc.LOGERROR)
+
+
+def close_process_stream(process, start):
+    '''Called when ephemeral response is closed. Kills ffmpeg if still running
+    (client disconnected before first chunk was sent), frees scheduler slot.
+    '''
+    if process.poll() is None:
+        process.kill()
+        process.wait()
+    scheduler.release(time.time() - start)
 
 
 @app.get('/download/<filename>')
@@ -333,19 +1052,123 @@ def download(filename):
     return send_from_directory(output_path, filename, as_attachment=True)
 
 
+@app.get('/thumbnail/<filename>')
+def thumbnail(filename):
+    '''Serves JPEG poster frame of clip in URL path (generated on first
+    request). History menu adds the clip timestamp to the URL, so the response
+    can be cached indefinitely (a new clip with the same name gets a new URL).
+    '''
+    try:
+        path = get_thumbnail(filename)
+    except TimeoutError:
+        return jsonify({'error': 'Thumbnail not ready, try again later'}), 503
+    if path is None:
+        return jsonify({'error': 'Thumbnail not available'}), 404
+
+    response = send_from_directory(
+        output_path,
+        os.path.basename(path),
+        mimetype='image/jpeg',
+        max_age=THUMBNAIL_MAX_AGE
+    )
+    response.cache_control.immutable = True
+    return response
+
+
+def get_history_params(params):
+    '''Takes dict of request params, returns dict of history filters (see
+    database.get_history_filters), cursor, and page size (None if not
+    paginated). Raises ValueError if page size is invalid.
+    '''
+    filters = {key: params[key] for key in HISTORY_FILTERS if params.get(key) not in (None, '')}
+    if isinstance(filters.get('renamed'), str):
+        filters['renamed'] = {'true': True, 'false': False}.get(filters['renamed'].lower())
+
+    limit = params.get('limit')
+    if limit is not None:
+        limit = int(limit)
+        if not 0 < limit <= HISTORY_MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {HISTORY_MAX_PAGE_SIZE}")
+    return filters, params.get('cursor'), limit
+
+
+def get_history_data(search_string, params, seq=None):
+    '''Takes search string (None for all entries), dict of request params
+    (filters, cursor, limit), and history change sequence number sent with
+    the response (cached results older than seq are not used). Returns list
+    of entries if not paginated, dict with history and next_cursor keys if
+    limit or cursor param was given. Raises ValueError if params are invalid.
+    '''
+    filters, cursor, limit = get_history_params(params)
+    if limit is None and cursor is None:
+        if search_string is None:
+            return load_history_json(filters, seq)
+        return load_history_search_results(search_string, filters)
+    history, next_cursor = load_history_page(search_string, filters, cursor, limit, seq)
+    return {'history': history, 'next_cursor': next_cursor}
+
+
+def get_history_changes(params, seq):
+    '''Takes dict of request params (since and optional filters) and current
+    history change sequence number. Returns dict with seq, changed (entries
+    added or changed after since), and deleted (filenames deleted or renamed
+    after since, or changed so they no longer match filters) keys. Returns
+    None if since is too old (changes pruned, client must reload). Raises
+    ValueError if params are invalid.
+    '''
+    since = int(params['since'])
+    if not 0 <= since <= seq:
+        raise ValueError(f"since must be between 0 and {seq}")
+    if since < get_oldest_history_seq(seq):
+        return None
+    changed, deleted = load_history_changes(since, get_history_params(params)[0], seq)
+    return {'seq': seq, 'changed': changed, 'deleted': deleted}
+
+
 @app.get('/get_history')
 def get_history():
-    '''Returns JSON with existing clips, used to populate history menu.'''
-    return jsonify(load_history_json())
+    '''Returns JSON with existing clips, used to populate history menu.
+    Optional query params filter entries (start, end, show, renamed,
+    media_type) and paginate (limit, cursor from previous page), paginated
+    responses include the history change sequence number (seq).
+
+    If since param is given (seq from a previous response) only entries
+    changed after since are returned, along with deleted filenames (410 if
+    since is too old, client must reload). ETag is the current seq, returns
+    304 if it matches If-None-Match (no changes).
+    '''
+    # Read seq first, changes written while loading are sent again next time
+    seq = get_history_seq()
+    try:
+        if request.args.get('since') is not None:
+            data = get_history_changes(request.args, seq)
+            if data is None:
+                return jsonify({'error': 'History changes since seq are no longer available'}), 410
+        else:
+            data = get_history_data(None, request.args, seq)
+            if isinstance(data, dict):
+                data['seq'] = seq
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Browser must revalidate cached history (304 if unchanged)
+    response = jsonify(data)
+    response.set_etag(f'history-{seq}')
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 @app.post('/search_history')
 def search_history():
     '''Takes JSON with search string in query attribute, returns JSON with all
-    entries with parameters that contain query.
+    entries with parameters that contain query (best matches first). Accepts
+    the same filter and pagination attributes as get_history.
     '''
     data = request.get_json()
-    return jsonify(load_history_search_results(data['query']))
+    try:
+        return jsonify(get_history_data(data['query'], data))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 
 @app.post('/delete')
@@ -371,9 +1194,10 @@ def rename():
     old = data['old']
     new = data['new'].strip()
 
-    # Add extension if missing
-    if not new.lower().endswith('.mp4'):
-        new = f'{new}.mp4'
+    # Add extension if missing (same as original, snapshots are JPEG)
+    extension = os.path.splitext(old)[1].lower() or '.mp4'
+    if not new.lower().endswith(extension):
+        new = f'{new}{extension}'
 
     # Return error if file with same name exists
     if is_duplicate(new):
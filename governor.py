@@ -0,0 +1,208 @@
+'''Resource governor for ffmpeg processes. Encoders are launched with the
+niceness, I/O class, CPU affinity and thread cap configured in settings so
+they don't compete with Kodi's video decoder. While media is playing (not
+paused) a background thread throttles every thread of running encoders
+harder (fewer cores, lowest priority) and gives them their cores back when
+playback pauses or stops.
+
+Affinity and priority changes are only supported on Linux, other platforms
+run ffmpeg with the default command.
+'''
+
+import os
+import glob
+import shutil
+import threading
+import xbmc
+import xbmcaddon
+
+
+# Seconds between playback state checks
+POLL_INTERVAL = 2
+
+# Niceness used while throttled (lowest priority)
+THROTTLED_NICE = 19
+
+# ionice class numbers (best-effort, idle)
+IONICE_CLASSES = {'Best effort': '2', 'Idle': '3'}
+
+# Set by start_governor, cleared by stop_governor
+stop_event = threading.Event()
+
+
+def get_int_setting(setting, default=0):
+    '''Takes setting ID, returns value as int (or default if invalid).'''
+    value = xbmcaddon.Addon().getSetting(setting)
+    if not isinstance(value, str) or not value.strip().isdigit():
+        return default
+    return int(value)
+
+
+def get_allowed_cpus():
+    '''Returns set of CPU core numbers encoders can use (from settings, all
+    cores if not set or invalid).
+    '''
+    available = set(range(os.cpu_count() or 1))
+    value = xbmcaddon.Addon().getSetting('encoder_cpus')
+    if isinstance(value, str) and value.strip():
+        try:
+            cpus = {int(cpu) for cpu in value.split(',')} & available
+            if cpus:
+                return cpus
+        except ValueError:
+            xbmc.log(f"Invalid encoder_cpus setting: {value}", xbmc.LOGWARNING)
+    return available
+
+
+def get_throttled_cpus():
+    '''Returns set of CPU cores encoders are limited to during playback (the
+    last half of allowed cores, at least 1).
+    '''
+    allowed = sorted(get_allowed_cpus())
+    return set(allowed[len(allowed) // 2:])
+
+
+def is_playback_active():
+    '''Returns True if throttling is enabled and media is playing (not paused).'''
+    if xbmcaddon.Addon().getSetting('throttle_playback') != 'true':
+        return False
+    return xbmc.Player().isPlaying() and not xbmc.getCondVisibility('Player.Paused')
+
+
+def get_ffmpeg_command():
+    '''Returns ffmpeg command list (passed to ffmpeg-python run cmd arg) with
+    nice, ionice and taskset wrappers for configured limits. Each wrapper execs
+    the next, so the ffmpeg PID is the same as the launched process.
+    '''
+    cmd = []
+    if os.name == 'posix':
+        nice = get_int_setting('encoder_nice')
+        if nice and shutil.which('nice'):
+            cmd += ['nice', '-n', str(min(nice, THROTTLED_NICE))]
+
+        ionice = IONICE_CLASSES.get(xbmcaddon.Addon().getSetting('encoder_ionice'))
+        if ionice and shutil.which('ionice'):
+            cmd += ['ionice', '-c', ionice]
+
+        cpus = get_allowed_cpus()
+        if len(cpus) < (os.cpu_count() or 1) and shutil.which('taskset'):
+            cmd += ['taskset', '-c', ','.join(str(cpu) for cpu in sorted(cpus))]
+
+    return cmd + ['ffmpeg']
+
+
+def get_thread_options(throttle=True):
+    '''Returns dict with -threads output option for libx264 encodes (halved
+    if throttle is True and media is playing when the encode starts), empty
+    dict if not capped.
+    '''
+    threads = get_int_setting('encoder_threads')
+    if throttle and is_playback_active():
+        threads = max(1, (threads or len(get_allowed_cpus())) // 2)
+    if threads:
+        return {'threads': str(threads)}
+    return {}
+
+
+def get_ffmpeg_pids():
+    '''Returns list of PIDs of running ffmpeg processes started by Kodi.'''
+    pids = []
+    for children in glob.glob(f'/proc/{os.getpid()}/task/*/children'):
+        try:
+            with open(children, 'r', encoding='utf-8') as file:
+                pids.extend(int(pid) for pid in file.read().split())
+        except OSError:
+            continue
+
+    ffmpeg_pids = []
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/comm', 'r', encoding='utf-8') as file:
+                if file.read().strip() == 'ffmpeg':
+                    ffmpeg_pids.append(pid)
+        except OSError:
+            continue
+    return ffmpeg_pids
+
+
+def get_thread_ids(pid):
+    '''Takes PID, returns list of IDs of every thread of the process (Linux
+    applies affinity and niceness per thread, encoder threads that already
+    started keep their own). Returns [pid] if threads can't be listed.
+    '''
+    try:
+        return [int(tid) for tid in os.listdir(f'/proc/{pid}/task')]
+    except (OSError, ValueError):
+        return [pid]
+
+
+def apply_limits(pid, cpus, nice=None):
+    '''Takes PID, set of CPU cores, and optional niceness. Sets affinity of
+    every thread of process, raises niceness of threads below nice (never
+    lowered, requires privileges Kodi may not have). Threads that exited are
+    ignored, other failures are logged. Returns True if limits were applied
+    to every thread.
+    '''
+    applied = True
+    for tid in get_thread_ids(pid):
+        try:
+            os.sched_setaffinity(tid, cpus)
+            if nice is not None and os.getpriority(os.PRIO_PROCESS, tid) < nice:
+                os.setpriority(os.PRIO_PROCESS, tid, nice)
+        except ProcessLookupError:
+            continue
+        except OSError as e:
+            xbmc.log(f"Failed to apply limits to ffmpeg ({pid}) thread {tid}: {e}", xbmc.LOGWARNING)
+            applied = False
+    return applied
+
+
+class Governor:
+    '''Polls playback state, throttles running ffmpeg processes while media is
+    playing and relaxes them when playback pauses or stops. Relaxing restores
+    CPU affinity only, throttled processes keep the lowest priority until
+    they exit (lowering niceness requires privileges).
+    '''
+
+    def __init__(self):
+        # PIDs currently throttled
+        self.throttled = set()
+
+    def update(self):
+        '''Called every POLL_INTERVAL seconds, applies limits to processes
+        whose state changed since last update.
+        '''
+        pids = get_ffmpeg_pids()
+        playing = is_playback_active()
+
+        # Forget processes that exited
+        self.throttled &= set(pids)
+
+        for pid in pids:
+            # Failures are logged once, not retried every poll
+            if playing and pid not in self.throttled:
+                apply_limits(pid, get_throttled_cpus(), THROTTLED_NICE)
+                self.throttled.add(pid)
+                xbmc.log(f"Throttling ffmpeg ({pid}) during playback", xbmc.LOGDEBUG)
+            elif not playing and pid in self.throttled:
+                apply_limits(pid, get_allowed_cpus())
+                self.throttled.discard(pid)
+                xbmc.log(f"Relaxing ffmpeg ({pid}) CPU affinity", xbmc.LOGDEBUG)
+
+    def run(self):
+        '''Runs in background thread until stop_governor is called.'''
+        while not stop_event.wait(POLL_INTERVAL):
+            self.update()
+
+
+def start_governor():
+    '''Starts governor in background thread (Linux only), called at startup.'''
+    if not hasattr(os, 'sched_setaffinity'):
+        return
+    stop_event.clear()
+    threading.Thread(target=Governor().run, daemon=True).start()
+
+
+def stop_governor():
+    '''Stops governor thread, called when Kodi exits.'''
+    stop_event.set()
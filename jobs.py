@@ -0,0 +1,226 @@
+'''Background job queue used to generate clips without blocking web server
+threads. Each job gets a random ID returned to the frontend, which polls the
+/jobs endpoints to get the status and result. Jobs that run ffmpeg report
+progress and can be cancelled (kills the ffmpeg process).
+'''
+
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import xbmc
+
+
+# Maximum number of jobs that can run at the same time (jobs wait for a
+# scheduler slot before starting ffmpeg, so this only limits threads)
+MAX_WORKERS = 16
+
+# Number of seconds finished jobs are kept before being removed from registry
+JOB_EXPIRATION = 3600
+
+# Worker pool used to run all jobs
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='record_button_job')
+
+# Registry of all queued, running, and recently finished jobs (ID keys)
+jobs = {}
+jobs_lock = threading.Lock()
+
+# Job running in the current worker thread (see get_current_job)
+current = threading.local()
+
+
+class Job:  # pylint: disable=too-many-instance-attributes
+    '''Tracks status and result of a single background job. The target
+    function must return a JSON-serializable result if successful or None if
+    it failed.
+
+    The optional output arg is the path of the file written by the target
+    function, used to stream the file to the frontend while the job runs.
+    '''
+
+    def __init__(self, target, args, output=None):
+        self.id = uuid.uuid4().hex
+        self.target = target
+        self.args = args
+        self.output = output
+
+        # One of queued, running, complete, failed, cancelled
+        self.status = 'queued'
+        self.result = None
+
+        # Set when job finishes (successful or not)
+        self.finished = threading.Event()
+        self.finished_time = None
+
+        # Fraction done (0-1), ffmpeg speed string (eg 2.5x), time first
+        # ffmpeg process started (excludes time waiting for scheduler)
+        self.progress = 0.0
+        self.speed = None
+        self.encode_started = None
+
+        # Progress of parts encoded in parallel (part keys, summed)
+        self.parts = {}
+        self.parts_lock = threading.Lock()
+
+        # Set by cancel, running ffmpeg processes are killed
+        self.cancelled = threading.Event()
+        self.processes = set()
+        self.process_lock = threading.Lock()
+
+    def run(self):
+        '''Called by worker pool, runs target function and stores result.'''
+        if self.cancelled.is_set():
+            self.finish()
+            return
+
+        self.status = 'running'
+        current.job = self
+        try:
+            self.result = self.target(*self.args)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # Log unexpected errors (would otherwise be swallowed by executor)
+            xbmc.log(f"Job {self.id} failed with unexpected error: {e!r}", xbmc.LOGERROR)
+            self.result = None
+        finally:
+            current.job = None
+
+        self.finish()
+
+    def finish(self):
+        '''Sets final status, notifies threads waiting for job to finish.'''
+        if self.result is not None:
+            self.status = 'complete'
+            self.progress = 1.0
+        elif self.cancelled.is_set():
+            self.status = 'cancelled'
+        else:
+            self.status = 'failed'
+        self.finished_time = time.time()
+        self.finished.set()
+
+    def add_process(self, process):
+        '''Called by run_ffmpeg when an ffmpeg process starts. Kills the
+        process immediately if job was already cancelled.
+        '''
+        with self.process_lock:
+            self.processes.add(process)
+            if self.cancelled.is_set():
+                process.kill()
+        if self.encode_started is None:
+            self.encode_started = time.time()
+
+    def remove_process(self, process):
+        '''Called by run_ffmpeg when an ffmpeg process exits.'''
+        with self.process_lock:
+            self.processes.discard(process)
+
+    def update_progress(self, progress, part=None):
+        '''Called by run_ffmpeg with fraction of job done (0-1). If part is
+        given progress is the fraction done by that part, job progress is the
+        sum of all parts (used when parts are encoded at the same time).
+        '''
+        if part is None:
+            self.progress = progress
+            return
+        with self.parts_lock:
+            self.parts[part] = progress
+            self.progress = sum(self.parts.values())
+
+    def cancel(self):
+        '''Cancels job, kills ffmpeg if running. Returns False if job already
+        finished, otherwise True.
+        '''
+        if self.finished.is_set():
+            return False
+        self.cancelled.set()
+        with self.process_lock:
+            for process in self.processes:
+                process.kill()
+        xbmc.log(f"Cancelled job {self.id}", xbmc.LOGINFO)
+        return True
+
+    def get_progress(self):
+        '''Returns dict with percent done, ffmpeg speed, and estimated seconds
+        remaining (None until progress is reported).
+        '''
+        eta = None
+        if self.encode_started and 0 < self.progress < 1:
+            elapsed = time.time() - self.encode_started
+            eta = round(elapsed * (1 - self.progress) / self.progress, 1)
+        return {
+            'percent': round(self.progress * 100, 1),
+            'speed': self.speed,
+            'eta': eta
+        }
+
+    def wait(self, timeout=None):
+        '''Blocks until job finishes or timeout seconds elapse. Returns True if
+        job finished, False if still queued or running.
+        '''
+        return self.finished.wait(timeout)
+
+    def to_dict(self):
+        '''Returns dict with job ID, status, and result (if finished).'''
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'result': self.result
+        }
+
+
+def prune_jobs():
+    '''Removes jobs that finished more than JOB_EXPIRATION seconds ago.'''
+    cutoff = time.time() - JOB_EXPIRATION
+    with jobs_lock:
+        for job_id in [
+            job_id for job_id, job in jobs.items()
+            if job.finished_time and job.finished_time < cutoff
+        ]:
+            del jobs[job_id]
+
+
+def submit_job(target, *args, output=None):
+    '''Takes function and args, queues function to run in worker pool.
+    Optional output kwarg is the path of the file written by the function.
+    Returns Job object used to check status and get result.
+    '''
+    prune_jobs()
+    job = Job(target, args, output)
+    with jobs_lock:
+        jobs[job.id] = job
+    executor.submit(job.run)
+    xbmc.log(f"Queued job {job.id}", xbmc.LOGINFO)
+    return job
+
+
+def submit_unique_job(target, *args):
+    '''Takes function and args, returns unfinished Job with the same target
+    if one is queued or running (jobs that must only run once at a time),
+    otherwise queues function to run in worker pool like submit_job.
+    '''
+    prune_jobs()
+    with jobs_lock:
+        for job in jobs.values():
+            if job.target is target and not job.finished.is_set():
+                return job
+        job = Job(target, args)
+        jobs[job.id] = job
+    executor.submit(job.run)
+    xbmc.log(f"Queued job {job.id}", xbmc.LOGINFO)
+    return job
+
+
+def get_current_job():
+    '''Returns Job running in the current thread (None if not in a job).'''
+    return getattr(current, 'job', None)
+
+
+def get_job(job_id):
+    '''Takes job ID, returns Job object (or None if not found).'''
+    with jobs_lock:
+        return jobs.get(job_id)
+
+
+def shutdown():
+    '''Cancels queued jobs, called when Kodi exits. Running jobs finish.'''
+    executor.shutdown(wait=False, cancel_futures=True)
@@ -19,6 +19,7 @@ exclude_from_zip = [
     '.env',
     '.gitignore',
     '.gitlab-ci.yml',
+    'benchmark.py',
     'kodi_record_button.zip',
     'dev_server.py',
     'package_addon.py',
@@ -34,7 +35,15 @@ exclude_from_zip = [
     'test_history.json',
     'mock_kodi_modules.py',
     'test_database.py',
-    'test_flask_backend.py'
+    'test_flask_backend.py',
+    'test_jobs.py',
+    'test_encoder.py',
+    'test_speculative.py',
+    'test_scheduler.py',
+    'test_governor.py',
+    'test_batching.py',
+    'test_thumbnails.py',
+    'test_calibration.py'
 ]
 
 
@@ -1,4 +1,6 @@
-'''Contains paths to sqlite database and QR code shown in startup notification.'''
+'''Contains paths to sqlite database, clips and thumbnails, encoder calibration,
+and QR code shown in startup notification.
+'''
 
 import os
 import xbmcvfs
@@ -22,5 +24,15 @@ if not xbmcvfs.exists(output_path):
 # Get absolute path to sqlite3 database
 database_path = os.path.join(profile_path, 'history.db')
 
+# Get absolute path to encoder calibration results (per host, never shared)
+calibration_path = os.path.join(profile_path, 'calibration.json')
+
 # Get absolute path to web interface QR code link
 qr_path = os.path.join(profile_path, 'qr_code_link.png')
+
+
+def get_thumbnail_path(filename):
+    '''Takes clip filename, returns path to its cached thumbnail (hidden file
+    in output directory).
+    '''
+    return os.path.join(output_path, f'.{filename}.jpg')
@@ -0,0 +1,172 @@
+'''Global scheduler that limits how many ffmpeg encodes run at the same time
+(too many libx264 processes stutter Kodi playback and slow every encode).
+Callers wait for a slot in priority order: clips recorded by the user run
+before regenerated clips, which run before maintenance work.
+'''
+
+import os
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+import xbmcaddon
+
+
+# Priority classes (lower runs first)
+INTERACTIVE = 0
+REGENERATE = 1
+MAINTENANCE = 2
+PRIORITY_NAMES = {
+    INTERACTIVE: 'interactive',
+    REGENERATE: 'regenerate',
+    MAINTENANCE: 'maintenance'
+}
+
+# Maximum number of waiting requests before new requests are rejected
+MAX_QUEUED = 6
+
+# Initial estimate of seconds each encode holds a slot (updated as encodes
+# finish, used to estimate wait time)
+DEFAULT_DURATION = 30.0
+
+# Weight of newest sample in moving averages
+AVERAGE_WEIGHT = 0.3
+
+
+class QueueFullError(Exception):
+    '''Raised by Scheduler.admit when too many requests are waiting. The
+    retry_after attribute is the estimated number of seconds until a slot is
+    available.
+    '''
+
+    def __init__(self, retry_after):
+        super().__init__(f'Encode queue is full, retry after {retry_after} seconds')
+        self.retry_after = retry_after
+
+
+def get_default_limit():
+    '''Returns default max concurrent encodes (half of CPU cores, min 1).'''
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+class Scheduler:
+    '''Priority gate around ffmpeg encodes. Each caller holds a slot while its
+    ffmpeg process runs, waiting callers are admitted by priority class then
+    arrival order.
+    '''
+
+    def __init__(self):
+        self.condition = threading.Condition()
+
+        # Heap of (priority, arrival) tuples waiting for a slot
+        self.waiting = []
+        self.arrivals = itertools.count()
+        self.running = 0
+
+        # Moving averages (seconds) used to estimate wait time
+        self.average_duration = DEFAULT_DURATION
+        self.average_wait = 0.0
+
+    @staticmethod
+    def get_limit():
+        '''Returns max concurrent encodes from settings (0 = automatic).'''
+        try:
+            limit = int(xbmcaddon.Addon().getSetting('max_encodes'))
+        except (TypeError, ValueError):
+            limit = 0
+        return limit if limit > 0 else get_default_limit()
+
+    def admit(self, priority=INTERACTIVE):
+        '''Raises QueueFullError if MAX_QUEUED requests are already waiting
+        at the same or higher priority. Called before queueing a request.
+        '''
+        with self.condition:
+            ahead = sum(1 for waiting in self.waiting if waiting[0] <= priority)
+            if ahead >= MAX_QUEUED:
+                raise QueueFullError(max(1, round(self.estimate_wait(priority))))
+
+    def acquire(self, priority=INTERACTIVE, blocking=True):
+        '''Waits until a slot is available and no higher priority (or earlier)
+        caller is waiting, then takes the slot. If blocking is False returns
+        False immediately instead of waiting. Returns True when slot taken.
+        '''
+        ticket = (priority, next(self.arrivals))
+        start = time.time()
+        with self.condition:
+            if not blocking:
+                if self.waiting or self.running >= self.get_limit():
+                    return False
+                self.running += 1
+                return True
+
+            heapq.heappush(self.waiting, ticket)
+
+            # Wake periodically in case limit was raised in settings
+            while self.waiting[0] != ticket or self.running >= self.get_limit():
+                self.condition.wait(1)
+
+            heapq.heappop(self.waiting)
+            self.running += 1
+            self.average_wait = update_average(self.average_wait, time.time() - start)
+
+            # Next caller may also fit if there are multiple free slots
+            self.condition.notify_all()
+        return True
+
+    def release(self, duration=None):
+        '''Frees slot taken by acquire. Optional duration (seconds the slot
+        was held) updates the estimate used to calculate wait times.
+        '''
+        with self.condition:
+            self.running -= 1
+            if duration is not None:
+                self.average_duration = update_average(self.average_duration, duration)
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE):
+        '''Context manager that holds a slot while the block runs.'''
+        self.acquire(priority)
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.release(time.time() - start)
+
+    def estimate_wait(self, priority=INTERACTIVE):
+        '''Returns estimated seconds a new caller with priority would wait
+        (must hold condition lock).
+        '''
+        ahead = sum(1 for waiting in self.waiting if waiting[0] <= priority)
+        limit = self.get_limit()
+        if self.running + ahead < limit:
+            return 0.0
+        # Each batch of limit callers ahead takes ~1 average duration
+        return (ahead // limit + 1) * self.average_duration
+
+    def get_stats(self):
+        '''Returns dict with slot limit, number running, number waiting (total
+        and per priority class), and estimated wait for a new clip (seconds).
+        '''
+        with self.condition:
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self.waiting:
+                queued[PRIORITY_NAMES[priority]] += 1
+            return {
+                'limit': self.get_limit(),
+                'running': self.running,
+                'queued': len(self.waiting),
+                'queued_by_priority': queued,
+                'average_wait': round(self.average_wait, 1),
+                'estimated_wait': round(self.estimate_wait(INTERACTIVE), 1)
+            }
+
+
+def update_average(average, sample):
+    '''Returns exponential moving average updated with new sample.'''
+    return average + AVERAGE_WEIGHT * (sample - average)
+
+
+# Shared by all ffmpeg callers
+scheduler = Scheduler()
@@ -0,0 +1,299 @@
+'''Speculative clip encoding. When the user presses the record button an
+ffmpeg session starts encoding from the clip start time in real time, so when
+the button is released only the last few seconds remain to be encoded.
+Sessions that are not finalized by /submit within SESSION_TIMEOUT seconds are
+cancelled and their partial output is deleted.
+'''
+
+import os
+import uuid
+import threading
+import subprocess
+from collections import deque
+import xbmc
+import ffmpeg
+import xbmcaddon
+from paths import output_path
+from encoder import (
+    get_bitrate,
+    probe_source,
+    can_copy_video,
+    get_video_options,
+    get_output_options,
+    run_ffmpeg
+)
+from scheduler import scheduler, INTERACTIVE
+from governor import get_ffmpeg_command, get_thread_options
+
+
+# Seconds to wait for /submit before cancelling session
+SESSION_TIMEOUT = 120
+
+# Maximum number of sessions encoding at the same time
+MAX_SESSIONS = 2
+
+# Maximum seconds encoded by a single session (ffmpeg exits after this)
+MAX_DURATION = 600
+
+# Maximum seconds to wait for encoder to catch up to the stop time
+FINALIZE_TIMEOUT = 30
+
+# Registry of active sessions (ID keys)
+sessions = {}
+sessions_lock = threading.Lock()
+
+
+class SpeculativeSession:  # pylint: disable=too-many-instance-attributes
+    '''Runs ffmpeg encoding from the clip start time at the source frame rate
+    (-re) until finalized with the clip duration or cancelled.
+    '''
+
+    def __init__(self, source, audio_track, start_time):
+        self.id = uuid.uuid4().hex
+        self.source = source
+        self.audio_track = audio_track
+        self.start_time = float(start_time)
+
+        # Hidden file in output dir, trimmed to final clip when finalized
+        self.temp_output = os.path.join(output_path, f'.speculative_{self.id}.mp4')
+
+        self.process = None
+        self.started = False
+        self.cancelled = False
+
+        # True while ffmpeg holds a scheduler slot
+        self.holds_slot = False
+
+        # Number of seconds encoded so far (read from ffmpeg -progress output)
+        self.encoded = 0.0
+
+        # Last lines of ffmpeg stderr, logged if encode fails
+        self.stderr = deque(maxlen=50)
+
+        # Notified when ffmpeg starts, reports progress, or exits
+        self.condition = threading.Condition()
+
+        # Cancel session if not finalized before timeout
+        self.timer = threading.Timer(SESSION_TIMEOUT, self.timeout)
+        self.timer.daemon = True
+
+    def matches(self, source, audio_track, start_time):
+        '''Returns True if session was started with the same source, audio
+        track, and start time as a /submit request.
+        '''
+        return (
+            self.source == source
+            and int(self.audio_track) == int(audio_track)
+            and abs(self.start_time - float(start_time)) < 0.001
+        )
+
+    def start(self):
+        '''Runs in background thread. Starts ffmpeg unless the source can be
+        stream copied (already fast, nothing to gain from speculating).
+        '''
+        self.timer.start()
+        try:
+            probe = probe_source(self.source)
+            target_bitrate = get_bitrate()
+            if xbmcaddon.Addon().getSetting('stream_copy') == 'true' \
+                    and can_copy_video(probe, target_bitrate):
+                xbmc.log("Source can be stream copied, skipping speculative encode", xbmc.LOGINFO)
+                return
+            bitrate = min(target_bitrate, int(probe['format']['bit_rate']))
+
+            # Don't wait for a slot (clip would be generated normally first)
+            if not scheduler.acquire(INTERACTIVE, blocking=False):
+                xbmc.log("No free encode slot, skipping speculative encode", xbmc.LOGINFO)
+                return
+
+            with self.condition:
+                self.holds_slot = True
+                if self.cancelled:
+                    self.release_slot()
+                    return
+                xbmc.log(f"Starting speculative encode of {self.source}", xbmc.LOGINFO)
+                self.process = ffmpeg.input(
+                    self.source,
+                    ss=self.start_time,
+                    re=None
+                ).output(
+                    self.temp_output,
+                    t=MAX_DURATION,
+                    vcodec="libx264",
+                    b=str(bitrate),
+                    acodec="aac",
+                    ac="2",
+                    map=["0:v:0", f"0:a:{self.audio_track}"],
+                    **get_video_options(probe),
+                    **get_thread_options()
+                ).global_args(
+                    '-nostats', '-progress', 'pipe:1'
+                ).run_async(
+                    cmd=get_ffmpeg_command(),
+                    pipe_stdin=True,
+                    pipe_stdout=True,
+                    pipe_stderr=True,
+                    overwrite_output=True
+                )
+
+            threading.Thread(target=self.read_progress, daemon=True).start()
+            threading.Thread(target=self.read_stderr, daemon=True).start()
+
+        except ffmpeg.Error as e:
+            xbmc.log("Failed to start speculative encode due to ffmpeg error:", xbmc.LOGERROR)
+            xbmc.log(str(e.stderr, "utf-8"), xbmc.LOGERROR)
+            self.release_slot()
+
+        finally:
+            with self.condition:
+                self.started = True
+                self.condition.notify_all()
+
+    def read_progress(self):
+        '''Runs in background thread, parses ffmpeg -progress output and
+        updates number of seconds encoded.
+        '''
+        for line in self.process.stdout:
+            key, _, value = line.decode('utf-8', 'replace').strip().partition('=')
+            if key == 'out_time_us' and value.isdigit():
+                with self.condition:
+                    self.encoded = int(value) / 1000000
+                    self.condition.notify_all()
+
+        # ffmpeg exited
+        self.release_slot()
+        with self.condition:
+            self.condition.notify_all()
+
+    def read_stderr(self):
+        '''Runs in background thread, keeps last lines of ffmpeg stderr (must
+        be read or ffmpeg blocks when pipe is full).
+        '''
+        for line in self.process.stderr:
+            self.stderr.append(line.decode('utf-8', 'replace').rstrip())
+
+    def stop(self):
+        '''Asks ffmpeg to stop (writes q to stdin) so the output is finalized,
+        kills ffmpeg if it does not exit within 10 seconds.
+        '''
+        try:
+            self.process.stdin.write(b'q')
+            self.process.stdin.flush()
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def finalize(self, duration, filename):
+        '''Takes clip duration (seconds) and output filename. Waits for the
+        encoder to reach the stop time, stops it and trims the output to the
+        clip duration without re-encoding. Returns True if successful, False
+        if clip must be generated normally.
+        '''
+        self.timer.cancel()
+        with self.condition:
+            self.condition.wait_for(lambda: self.started, timeout=FINALIZE_TIMEOUT)
+            if self.process is None:
+                return False
+
+            # Wait for encoder to catch up (usually a fraction of a second)
+            self.condition.wait_for(
+                lambda: self.encoded >= duration or self.process.poll() is not None,
+                timeout=FINALIZE_TIMEOUT
+            )
+            caught_up = self.encoded >= duration
+
+        if not caught_up:
+            xbmc.log("Speculative encode did not reach stop time, cancelling", xbmc.LOGWARNING)
+            xbmc.log("\n".join(self.stderr), xbmc.LOGWARNING)
+            self.cancel()
+            return False
+
+        try:
+            self.stop()
+            run_ffmpeg(ffmpeg.input(
+                self.temp_output
+            ).output(
+                os.path.join(output_path, f'{filename}.mp4'),
+                t=duration,
+                c="copy",
+                **get_output_options()
+            ))
+            return True
+
+        except ffmpeg.Error as e:
+            xbmc.log("Failed to finalize speculative encode due to ffmpeg error:", xbmc.LOGERROR)
+            xbmc.log(str(e.stderr, "utf-8"), xbmc.LOGERROR)
+            return False
+
+        finally:
+            self.remove_temp_output()
+
+    def cancel(self):
+        '''Kills ffmpeg (if running) and deletes partial output.'''
+        self.timer.cancel()
+        with self.condition:
+            self.cancelled = True
+            if self.process and self.process.poll() is None:
+                self.process.kill()
+                self.process.wait()
+        self.release_slot()
+        with sessions_lock:
+            sessions.pop(self.id, None)
+        self.remove_temp_output()
+
+    def release_slot(self):
+        '''Frees scheduler slot taken by start (only the first call frees).'''
+        with self.condition:
+            if not self.holds_slot:
+                return
+            self.holds_slot = False
+        scheduler.release()
+
+    def timeout(self):
+        '''Called by timer if session was not finalized, cancels session.'''
+        xbmc.log(f"Speculative session {self.id} abandoned, cancelling", xbmc.LOGINFO)
+        self.cancel()
+
+    def remove_temp_output(self):
+        '''Deletes temporary output file if it exists.'''
+        try:
+            os.remove(self.temp_output)
+        except FileNotFoundError:
+            pass
+
+
+def start_session(source, audio_track, start_time):
+    '''Takes source file path, audio track index, and clip start time. Starts
+    speculative encode in background thread, returns session (or None if the
+    maximum number of sessions are already running).
+    '''
+    with sessions_lock:
+        if len(sessions) >= MAX_SESSIONS:
+            xbmc.log("Too many speculative sessions, skipping", xbmc.LOGINFO)
+            return None
+        session = SpeculativeSession(source, audio_track, start_time)
+        sessions[session.id] = session
+
+    threading.Thread(target=session.start, daemon=True).start()
+    return session
+
+
+def pop_session(session_id):
+    '''Takes session ID sent by /submit, removes session from registry and
+    returns it (or None if session does not exist or timed out).
+    '''
+    with sessions_lock:
+        return sessions.pop(session_id, None)
+
+
+def cancel_all_sessions():
+    '''Cancels all active sessions, called when Kodi exits.'''
+    with sessions_lock:
+        active = list(sessions.values())
+    for session in active:
+        session.cancel()
@@ -4,6 +4,10 @@ import {
     open_history_menu,
     show_edit_modal,
 } from './modals.js';
+import {
+    wait_for_job,
+    watch_job,
+} from './jobs.js';
 
 const {
     download_button,
@@ -21,9 +25,32 @@ const {
 const history_contents = document.getElementById('history-contents');
 const history_search = document.getElementById('search-input');
 
+// Regenerate missing clips elements
+const regen_missing_button = document.getElementById('regen-missing-button');
+const regen_missing_status = document.getElementById('regen-missing-status');
+
 // Header element in rename modal
 const original_name = document.getElementById('original-filename');
 
+// Milliseconds after last keystroke before searching
+const SEARCH_DELAY = 150;
+
+// Number of history cards loaded at a time (next page loaded on scroll)
+const HISTORY_PAGE_SIZE = 20;
+
+// Element below last card, next page loaded when scrolled into view
+const history_menu = document.getElementById('history-menu');
+const history_sentinel = document.getElementById('history-sentinel');
+
+// Cursor for next page of current history or search (null if all loaded)
+let next_cursor = null;
+let loading_page = false;
+let history_observer;
+
+// History change sequence when history was last loaded (null until loaded),
+// used to request only changes since then
+let history_seq = null;
+
 
 function sleep(ms) {
     return new Promise((resolve) => {
@@ -51,7 +78,7 @@ async function handleDownload(filename) {
 }
 
 
-// Called by delete buttons in history menu, deletes mp4 from backend
+// Called by delete buttons in history menu, deletes file from backend
 async function delete_file(button) {
     // Send filename from dataset attribute to backend
     const response = await fetch('/delete', {
@@ -65,12 +92,12 @@ async function delete_file(button) {
     const data = await response.json();
     console.log(data);
 
-    // Reload history contents
-    load_history();
+    // Remove deleted card
+    refresh_history();
 }
 
 
-// Called by edit buttons in history menu, opens edit modal for selected mp4
+// Called by edit buttons in history menu, opens edit modal for selected file
 function edit_file(event) {
     event.stopPropagation();
 
@@ -85,7 +112,99 @@ function edit_file(event) {
 }
 
 
-// Takes get_history response object, adds card to history menu for each entry
+// Takes history entry (timestamp, filename, renditions), returns card HTML
+function create_history_card(entry) {
+    const timestamp = entry[0];
+    const filename = entry[1];
+    const renditions = entry[2] || [];
+
+    // Download button for each extra rendition (e.g. 480p copy)
+    const rendition_buttons = renditions.map((rendition) => `
+        <a class="history-download-button button bg-zinc-700 text-sm mx-1 py-1" data-filename="${rendition}">
+            ${rendition.replace(/^.*_/, '').replace('.mp4', '')}
+        </a>`).join('');
+    return `<div
+            class="history-card bg-zinc-900 rounded-xl px-5 py-3 text-white mb-3"
+            data-filename="${filename}"
+            data-timestamp="${timestamp}"
+        >
+            <img
+                class="history-thumbnail w-full aspect-video object-cover rounded-lg bg-zinc-800 mb-2"
+                src="/thumbnail/${encodeURIComponent(filename)}?v=${encodeURIComponent(timestamp)}"
+                loading="lazy"
+                alt=""
+            >
+            <h1 class="text-lg font-semibold line-clamp-1">${filename}</h1>
+            <h1 class="text-md text-zinc-500">${new Date(timestamp.replace(/_/g, ' ')).toLocaleString()}</h1>
+            ${renditions.length ? `<div class="flex justify-center mt-2">${rendition_buttons}</div>` : ''}
+            <div class="flex mt-2">
+                <a class="history-download-button history-menu-button ms-auto" data-filename="${filename}">
+                    <i class="fas fa-file-download m-auto"></i>
+                </a>
+                <a class="history-edit-button history-menu-button mx-3" data-filename="${filename}">
+                    <i class="fas fa-pencil-alt m-auto"></i>
+                </a>
+                <a class="history-delete-button history-menu-button me-auto" data-filename="${filename}">
+                    <i class="fas fa-trash-alt m-auto"></i>
+                </a>
+            </div>
+        </div>`;
+}
+
+
+// Takes array of history entries, returns array of card elements
+function build_history_cards(entries) {
+    const cards = document.createElement('div');
+    cards.innerHTML = entries.map(create_history_card).join('');
+
+    // Hide thumbnails that failed to load (clip missing from disk)
+    cards.querySelectorAll('.history-thumbnail').forEach((thumbnail) => {
+        thumbnail.addEventListener('error', () => thumbnail.classList.add('hidden'));
+    });
+
+    // Add button listeners
+    cards.querySelectorAll('.history-download-button').forEach((button) => {
+        button.addEventListener('click', () => handleDownload(button.dataset.filename));
+    });
+    cards.querySelectorAll('.history-edit-button').forEach((button) => {
+        button.addEventListener('click', (event) => edit_file(event));
+    });
+    cards.querySelectorAll('.history-delete-button').forEach((button) => {
+        button.addEventListener('click', () => delete_file(button));
+    });
+
+    return [...cards.children];
+}
+
+
+// Takes array of history entries, appends card for each to history menu
+function add_history_cards(entries) {
+    history_contents.append(...build_history_cards(entries));
+}
+
+
+// Shows placeholder if history menu has no cards, removes it otherwise
+function update_history_placeholder() {
+    const placeholder = document.getElementById('history-empty');
+    if (history_contents.querySelector('.history-card')) {
+        placeholder?.remove();
+    } else if (!placeholder) {
+        history_contents.insertAdjacentHTML(
+            'beforeend',
+            '<h1 id="history-empty" class="text-lg">No files found</h1>',
+        );
+    }
+}
+
+
+// Re-observe sentinel below last card (loads next page if still visible)
+function check_history_sentinel() {
+    history_observer.unobserve(history_sentinel);
+    history_observer.observe(history_sentinel);
+}
+
+
+// Takes first page of get_history response, replaces history menu cards
 async function populate_history_menu(history_json) {
     // Fade out old contents then empty div
     history_contents.classList.add('opacity-0');
@@ -93,64 +212,113 @@ async function populate_history_menu(history_json) {
     history_contents.innerHTML = '';
 
     // Add card div for each item in JSON
-    if (Object.keys(history_json).length) {
-        history_json.forEach((entry) => {
-            const timestamp = entry[0];
-            const filename = entry[1];
-            history_contents.insertAdjacentHTML(
-                'beforeend',
-                `<div class="bg-zinc-900 rounded-xl px-5 py-3 text-white mb-3">
-                    <h1 class="text-lg font-semibold line-clamp-1">${filename}</h1>
-                    <h1 class="text-md text-zinc-500">${new Date(timestamp.replace(/_/g, ' ')).toLocaleString()}</h1>
-                    <div class="flex mt-2">
-                        <a class="history-download-button history-menu-button ms-auto" data-filename="${filename}">
-                            <i class="fas fa-file-download m-auto"></i>
-                        </a>
-                        <a class="history-edit-button history-menu-button mx-3" data-filename="${filename}">
-                            <i class="fas fa-pencil-alt m-auto"></i>
-                        </a>
-                        <a class="history-delete-button history-menu-button me-auto" data-filename="${filename}">
-                            <i class="fas fa-trash-alt m-auto"></i>
-                        </a>
-                    </div>
-                </div>`,
-            );
-        });
+    add_history_cards(history_json);
+    update_history_placeholder();
 
-        // Add button listeners
-        document.querySelectorAll('.history-download-button').forEach((button) => {
-            button.addEventListener('click', () => handleDownload(button.dataset.filename));
-        });
-        document.querySelectorAll('.history-edit-button').forEach((button) => {
-            button.addEventListener('click', (event) => edit_file(event));
-        });
-        document.querySelectorAll('.history-delete-button').forEach((button) => {
-            button.addEventListener('click', () => delete_file(button));
+    // Fade in new contents
+    history_contents.classList.remove('opacity-0');
+    check_history_sentinel();
+}
+
+
+// Takes search string (empty for all files) and cursor (null for first page),
+// returns page of history entries and cursor for next page (null if last)
+async function fetch_history_page(search_string, cursor) {
+    let response;
+    if (search_string) {
+        response = await fetch('/search_history', {
+            method: 'POST',
+            body: JSON.stringify({ query: search_string, limit: HISTORY_PAGE_SIZE, cursor }),
+            headers: {
+                Accept: 'application/json, text/plain, */*',
+                'Content-Type': 'application/json',
+            },
         });
     } else {
-        history_contents.insertAdjacentHTML(
-            'beforeend',
-            '<h1 class="text-lg">No files found</h1>',
-        );
+        const params = new URLSearchParams({ limit: HISTORY_PAGE_SIZE });
+        if (cursor) {
+            params.set('cursor', cursor);
+        }
+        response = await fetch(`/get_history?${params}`);
     }
-
-    // Fade in new contents
-    history_contents.classList.remove('opacity-0');
+    return response.json();
 }
 
 
-// Request history from backend and add card to history menu for each file
+// Request first page of history from backend and add card to history menu
+// for each file (more pages are loaded when user scrolls to the bottom)
 async function load_history() {
-    // Request new history contents
-    // Returns array of tuples containing timestamp and filename
-    let history_json = await fetch('/get_history');
-    history_json = await history_json.json();
-
     // Clear history search
     history_search.value = '';
 
-    // Add card div for each item in response
-    await populate_history_menu(history_json);
+    const page = await fetch_history_page('', null);
+    next_cursor = page.next_cursor;
+    history_seq = page.seq;
+    await populate_history_menu(page.history);
+}
+
+
+// Takes filename, returns its card in history menu (undefined if not loaded)
+function find_history_card(filename) {
+    return [...history_contents.querySelectorAll('.history-card')].find(
+        (card) => card.dataset.filename === filename,
+    );
+}
+
+
+// Takes get_history delta (changed entries newest first, deleted filenames),
+// removes deleted cards and inserts changed cards in timestamp order
+function apply_history_changes(delta) {
+    delta.deleted.forEach((filename) => find_history_card(filename)?.remove());
+
+    delta.changed.forEach((entry) => {
+        find_history_card(entry[1])?.remove();
+        const cards = [...history_contents.querySelectorAll('.history-card')];
+        const next = cards.find((card) => card.dataset.timestamp < entry[0]);
+        const [card] = build_history_cards([entry]);
+        if (next) {
+            next.before(card);
+        // Skip if older than every loaded card (added when its page loads)
+        } else if (!next_cursor) {
+            history_contents.append(card);
+        }
+    });
+
+    update_history_placeholder();
+    check_history_sentinel();
+}
+
+
+// Requests history changes since last load and patches history menu cards
+// (304 if nothing changed). Reloads first page instead if search results are
+// shown or history was never loaded.
+async function refresh_history() {
+    if (history_seq === null || history_search.value) {
+        await load_history();
+        return;
+    }
+
+    const seq = history_seq;
+    const response = await fetch(`/get_history?since=${seq}`, {
+        cache: 'no-store',
+        headers: { 'If-None-Match': `"history-${seq}"` },
+    });
+    if (response.status === 304) {
+        return;
+    }
+    if (!response.ok) {
+        // Database changed (e.g. switched in settings) or changes since seq
+        // pruned (410), reload
+        await load_history();
+        return;
+    }
+    const delta = await response.json();
+
+    // Ignore if history was reloaded or searched while waiting
+    if (seq === history_seq && !history_search.value) {
+        apply_history_changes(delta);
+        history_seq = delta.seq;
+    }
 }
 
 
@@ -160,28 +328,55 @@ document.addEventListener('DOMContentLoaded', () => {
 });
 
 
-// Takes search_string, requests all history entries with filenames starting
-// with search_string and adds card to history menu for each file
+// Takes search_string, requests first page of history entries with filename,
+// show, or episode matching search_string (best matches first) and adds card
+// to history menu for each file
 async function search_history(search_string) {
-    let history_json = await fetch('/search_history', {
-        method: 'POST',
-        body: JSON.stringify({ query: search_string }),
-        headers: {
-            Accept: 'application/json, text/plain, */*',
-            'Content-Type': 'application/json',
-        },
-    });
-    history_json = await history_json.json();
+    const page = await fetch_history_page(search_string, null);
+
+    // Ignore results if search changed while waiting for response
+    if (search_string !== history_search.value) {
+        return;
+    }
+
+    next_cursor = page.next_cursor;
+    await populate_history_menu(page.history);
+}
 
-    // Add card div for each item in response
-    await populate_history_menu(history_json);
+
+// Called when user scrolls near the bottom of the history menu, appends next
+// page of current history or search results
+async function load_next_page() {
+    if (!next_cursor || loading_page) {
+        return;
+    }
+    loading_page = true;
+    const cursor = next_cursor;
+    try {
+        const page = await fetch_history_page(history_search.value, cursor);
+
+        // Ignore if history was reloaded or searched while waiting
+        if (cursor === next_cursor) {
+            next_cursor = page.next_cursor;
+            add_history_cards(page.history);
+        }
+    } finally {
+        loading_page = false;
+    }
+    check_history_sentinel();
 }
+history_observer = new IntersectionObserver((entries) => {
+    if (entries[0].isIntersecting) {
+        load_next_page();
+    }
+}, { root: history_menu, rootMargin: '400px' });
 
 
-// Update history menu contents on search input
+// Update history menu contents once user stops typing
+let search_timer;
 history_search.addEventListener('input', () => {
-    const search_string = history_search.value;
-    search_history(search_string);
+    clearTimeout(search_timer);
+    search_timer = setTimeout(() => search_history(history_search.value), SEARCH_DELAY);
 });
 
 
@@ -216,8 +411,8 @@ async function rename_file(button) {
     show_edit_modal(false);
 
     if (response.ok) {
-        // Reload history contents
-        load_history();
+        // Replace renamed card
+        refresh_history();
 
         // Detect if file linked by main download button was renamed from history
         // menu instead of the input below download button
@@ -244,6 +439,42 @@ async function rename_file(button) {
         console.log(data);
     }
 }
+
+
+// Called by regenerate missing button in history menu header
+// Starts bulk job that regenerates every clip missing from disk, shows
+// progress under search box, shows summary and reloads history when done
+async function regenerate_missing() {
+    regen_missing_button.disabled = true;
+    regen_missing_status.classList.remove('hidden');
+    regen_missing_status.innerHTML = 'Finding missing clips...';
+
+    const response = await fetch('/regenerate_missing', { method: 'POST' });
+    const { job_id } = await response.json();
+    await watch_job(job_id, (job) => {
+        if (job.status === 'running' && job.progress) {
+            regen_missing_status.innerHTML = `Regenerating ${Math.round(job.progress.percent)}%`;
+        }
+    });
+
+    const result = await wait_for_job(job_id);
+    const data = await result.json();
+    if (result.ok && data.total === 0) {
+        regen_missing_status.innerHTML = 'No missing clips';
+    } else if (result.ok) {
+        let summary = `Regenerated ${data.regenerated.length} of ${data.total} clips`;
+        if (data.failed.length) {
+            summary += ` (failed: ${data.failed.join(', ')})`;
+        }
+        regen_missing_status.innerHTML = summary;
+        load_history();
+    } else {
+        regen_missing_status.innerHTML = 'Failed to regenerate missing clips';
+    }
+    regen_missing_button.disabled = false;
+}
+regen_missing_button.addEventListener('click', regenerate_missing);
+
 edit_button.addEventListener('click', () => rename_file(edit_button));
 rename_button.addEventListener('click', () => rename_file(rename_button));
 
@@ -252,5 +483,6 @@ export {
     delete_file,
     edit_file,
     load_history,
+    refresh_history,
     rename_file,
 };
@@ -0,0 +1,77 @@
+// Takes job_id returned by /submit or /regenerate, waits for backend to finish
+// the job and returns the final response (backend returns 202 if still running)
+// Optional on_update callback receives job status + queue stats while waiting
+async function wait_for_job(job_id, on_update = null) {
+    // Poll more often if caller displays status
+    const url = on_update ? `/jobs/${job_id}/result?timeout=5` : `/jobs/${job_id}/result`;
+    let response = await fetch(url);
+    while (response.status === 202) {
+        if (on_update) {
+            on_update(await response.json());
+        }
+        response = await fetch(url);
+    }
+    return response;
+}
+
+
+// Takes job status (or /submit response) with queue stats, returns string
+// describing wait (empty if encoding already started)
+function format_queue_status(job) {
+    if (job.status === 'running' || !job.queue || job.queue.running < job.queue.limit) {
+        return '';
+    }
+    const wait = Math.round(job.queue.estimated_wait);
+    return `Waiting for encoder (${job.queue.queued} queued, ~${wait}s)`;
+}
+
+// Takes job_id, subscribes to server-sent progress events until the job
+// finishes. The on_update callback receives job status, progress, and queue
+// stats. Resolves when job finishes (or if the event stream fails, caller
+// gets the final result from wait_for_job either way)
+function watch_job(job_id, on_update) {
+    return new Promise((resolve) => {
+        const events = new EventSource(`/jobs/${job_id}/events`);
+        events.onmessage = (event) => on_update(JSON.parse(event.data));
+        events.addEventListener('done', () => {
+            events.close();
+            resolve();
+        });
+        events.onerror = () => {
+            events.close();
+            resolve();
+        };
+    });
+}
+
+
+// Takes job_id, asks backend to cancel job (kills ffmpeg if running)
+async function cancel_job(job_id) {
+    await fetch(`/jobs/${job_id}/cancel`, { method: 'POST' });
+}
+
+
+// Takes job status from watch_job, returns string with queue position while
+// waiting for encoder or percent done, speed, and time remaining once running
+function format_job_status(job) {
+    if (job.status !== 'running' || !job.progress) {
+        return format_queue_status(job);
+    }
+    let status = `Encoding ${Math.round(job.progress.percent)}%`;
+    if (job.progress.speed) {
+        status += ` (${job.progress.speed}`;
+        if (job.progress.eta !== null) {
+            status += `, ~${Math.ceil(job.progress.eta)}s left`;
+        }
+        status += ')';
+    }
+    return status;
+}
+
+export {
+    wait_for_job,
+    watch_job,
+    cancel_job,
+    format_queue_status,
+    format_job_status,
+};
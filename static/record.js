@@ -4,8 +4,15 @@ import {
 } from './modals.js';
 import {
     handleDownload,
-    load_history,
+    refresh_history,
 } from './history.js';
+import {
+    wait_for_job,
+    watch_job,
+    cancel_job,
+    format_queue_status,
+    format_job_status,
+} from './jobs.js';
 
 const {
     download_div,
@@ -24,11 +31,17 @@ const episode_details = document.getElementById('episode-details');
 const record_button = document.getElementById('record-button');
 const record_text = document.getElementById('record-button-text');
 const record_spinner = document.getElementById('spinner');
+const queue_status = document.getElementById('queue-status');
+const cancel_button = document.getElementById('cancel-button');
+const snapshot_button = document.getElementById('snapshot-button');
 
 // Track if currently recording + start timestamp
 let recording = false;
 let start_time = '';
 
+// Speculative encode session started by backend when record button pressed
+let session_id = null;
+
 
 // Update playing now info every 5 seconds (except while recording)
 async function update_playing_now() {
@@ -43,46 +56,130 @@ update_playing_now();
 setInterval(update_playing_now, 5000);
 
 
+// Takes URL and filename, adds URL to download button and shows it
+function show_download_button(href, filename) {
+    download_button.href = href;
+    rename_input.dataset.original = filename;
+    rename_input.placeholder = filename;
+    rename_input.value = '';
+
+    // Show download button, scroll into view if needed
+    download_div.classList.remove('opacity-0', 'pointer-events-none');
+    download_div.classList.add('show-result');
+    download_div.scrollIntoView({ behavior: 'smooth' });
+}
+
+
 // Called by stopRecording, send post to backend, receive generated filename
 async function generateFile() {
-    // Send starttime, backend gets endtime + playing file and generates clip
-    const response = await fetch('/submit', {
+    // Send starttime, backend gets endtime + playing file and queues clip
+    let response = await fetch('/submit', {
         method: 'POST',
-        body: JSON.stringify({ startTime: start_time }),
+        body: JSON.stringify({ startTime: start_time, sessionId: session_id }),
         headers: {
             Accept: 'application/json, text/plain, */*',
             'Content-Type': 'application/json',
         },
     });
+
+    // Wait for backend to finish generating clip
+    if (response.ok) {
+        const job = await response.json();
+
+        // Ephemeral clips are encoded when downloaded (never saved on Kodi
+        // host, can't rename), show download button immediately
+        if (!job.job_id) {
+            rename_input.disabled = true;
+            show_download_button(job.stream, job.filename);
+            console.log(`Logged ephemeral clip: ${job.filename}`);
+            refresh_history();
+            start_time = '';
+            session_id = null;
+            return;
+        }
+
+        // Show download button immediately if clip can be downloaded while
+        // encoding (can't rename until finished, not in database yet)
+        if (job.stream) {
+            rename_input.disabled = true;
+            show_download_button(job.stream, job.filename);
+        }
+
+        // Show queue position while waiting for encoder, then encode
+        // progress, allow cancelling until finished
+        queue_status.innerHTML = format_queue_status(job);
+        cancel_button.dataset.job = job.job_id;
+        cancel_button.classList.remove('hidden');
+        await watch_job(job.job_id, (status) => {
+            queue_status.innerHTML = format_job_status(status);
+        });
+        cancel_button.classList.add('hidden');
+        queue_status.innerHTML = '';
+        response = await wait_for_job(job.job_id);
+    }
     const data = await response.json();
+    rename_input.disabled = false;
 
     if (response.ok) {
         // Add link to download button, clear rename input
-        download_button.href = `download/${data.filename}`;
-        rename_input.dataset.original = data.filename;
-        rename_input.placeholder = data.filename;
-        rename_input.value = '';
-        console.log(`Generated: ${data.filename}`);
-
-        // Show download button, scroll into view if needed
-        download_div.classList.remove('opacity-0', 'pointer-events-none');
-        download_div.classList.add('show-result');
-        download_div.scrollIntoView({ behavior: 'smooth' });
-
-        // Reload history menu contents
-        load_history();
+        show_download_button(`download/${data.filename}`, data.filename);
+        console.log(`Generated: ${data.filename} (${data.mode})`);
+
+        // Add new card to history menu
+        refresh_history();
     } else {
-        // Show error in modal
-        error_body.innerHTML = data.error;
-        show_error_modal(true);
+        // Hide download button if shown while encoding
+        download_div.classList.add('opacity-0', 'pointer-events-none');
+        download_div.classList.remove('show-result');
+
+        // Show error in modal (unless user cancelled)
+        if (data.status !== 'cancelled') {
+            error_body.innerHTML = data.error;
+            show_error_modal(true);
+        }
         console.log(data);
     }
 
-    // Clear old start_time
+    // Clear old start_time and session
     start_time = '';
+    session_id = null;
 }
 
 
+// Cancel clip currently being generated
+cancel_button.addEventListener('click', () => {
+    cancel_button.classList.add('hidden');
+    queue_status.innerHTML = 'Cancelling...';
+    cancel_job(cancel_button.dataset.job);
+});
+
+
+// Called when user clicks snapshot button, backend saves current frame as JPEG
+async function takeSnapshot() {
+    snapshot_button.disabled = true;
+    download_div.classList.add('opacity-0', 'pointer-events-none');
+    download_div.classList.remove('show-result');
+
+    try {
+        const response = await fetch('/snapshot', { method: 'POST' });
+        const data = await response.json();
+        if (response.ok) {
+            show_download_button(`download/${data.filename}`, data.filename);
+            console.log(`Generated: ${data.filename} (${data.mode})`);
+            refresh_history();
+        } else {
+            error_body.innerHTML = data.error;
+            show_error_modal(true);
+        }
+    } catch (e) {
+        error_body.innerHTML = 'Failed due to backend error, see Kodi logs for details';
+        show_error_modal(true);
+    }
+    snapshot_button.disabled = false;
+}
+snapshot_button.addEventListener('click', takeSnapshot);
+
+
 // Called when user clicks record button
 async function startRecording() {
     // Change button background to red
@@ -97,6 +194,7 @@ async function startRecording() {
     if (result.ok) {
         const data = await result.json();
         start_time = data.playtime;
+        session_id = data.session_id || null;
     } else {
         console.log('Unable to get start time');
     }
@@ -172,7 +270,7 @@ async function regenerate_file(button) {
     regen_body.innerHTML = '<div id="spinner" class="loading-animation h-24"><div></div><div></div><div></div><div></div></div>';
 
     // Send filename to backend, wait for regen to complete
-    const response = await fetch('/regenerate', {
+    let response = await fetch('/regenerate', {
         method: 'POST',
         body: JSON.stringify({ filename: button.dataset.target }),
         headers: {
@@ -180,11 +278,24 @@ async function regenerate_file(button) {
             'Content-Type': 'application/json',
         },
     });
+    let streamed = false;
+    if (response.ok) {
+        const job = await response.json();
+
+        // Start download immediately if clip can be downloaded while encoding
+        if (job.stream) {
+            window.location.href = job.stream;
+            streamed = true;
+        }
+        response = await wait_for_job(job.job_id);
+    }
 
     if (response.ok) {
-        // Hide modal and download file
+        // Hide modal and download file (unless already downloaded)
         show_regen_modal(false);
-        handleDownload(button.dataset.target);
+        if (!streamed) {
+            handleDownload(button.dataset.target);
+        }
     } else {
         // Show error in modal
         error_body.innerHTML = 'Failed due to backend error, see Kodi logs for details';
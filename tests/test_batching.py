@@ -0,0 +1,209 @@
+# pylint: disable=line-too-long, missing-module-docstring, missing-function-docstring
+
+import os
+import time
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+import mock_kodi_modules
+import batching
+from jobs import Job
+from scheduler import scheduler
+from batching import batch_gen_mp4, pending, inflight
+
+
+def run_in_threads(*requests):
+    '''Takes tuples of batch_gen_mp4 args, runs each in a Job in a separate
+    thread while all scheduler slots are taken (requests queue up), releases
+    the slot once all requests are waiting. Returns list of Jobs.
+    '''
+    jobs = [Job(batch_gen_mp4, args) for args in requests]
+    with patch.object(scheduler, 'get_limit', return_value=1):
+        scheduler.acquire()
+        threads = [threading.Thread(target=job.run) for job in jobs]
+        for thread in threads:
+            thread.start()
+            # Start in order (first request is batch leader)
+            time.sleep(0.05)
+        scheduler.release()
+        for thread in threads:
+            thread.join(timeout=10)
+    return jobs
+
+
+def write_output(*args):
+    '''Mock gen_mp4 that writes empty output file.'''
+    with open(os.path.join(batching.output_path, f'{args[4]}.mp4'), 'w', encoding='utf-8'):
+        pass
+    return 'encode'
+
+
+class TestBatchGenMp4(TestCase):
+    def setUp(self):
+        # Write output to temporary directory
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+        patcher = patch('batching.output_path', tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        # Confirm registries empty after all requests finish
+        self.assertEqual(pending, {})
+        self.assertEqual(inflight, {})
+
+    def test_single_request(self):
+        # Confirm single request generated with gen_mp4, slot released
+        with patch('batching.gen_mp4', return_value='encode') as mock_gen_mp4:
+            self.assertEqual(batch_gen_mp4('/path/to/source.mkv', 0, '10.0', '20.0', 'clip'), 'encode')
+            self.assertEqual(mock_gen_mp4.call_args.args[:5], ('/path/to/source.mkv', 0, '10.0', '20.0', 'clip'))
+            self.assertEqual(scheduler.running, 0)
+
+    def test_batch_requests(self):
+        # Simulate 3 phones clipping the same source while encoder busy
+        with patch('batching.gen_mp4_batch', return_value=['batch', 'batch', 'batch']) as mock_batch, \
+             patch('batching.gen_mp4') as mock_gen_mp4:
+
+            jobs = run_in_threads(
+                ('/path/to/source.mkv', 0, '10.0', '20.0', 'clip1'),
+                ('/path/to/source.mkv', 0, '15.0', '30.0', 'clip2'),
+                ('/path/to/source.mkv', 0, '40.0', '10.0', 'clip3')
+            )
+
+            # Confirm all clips generated by a single ffmpeg process
+            mock_batch.assert_called_once()
+            self.assertFalse(mock_gen_mp4.called)
+            self.assertEqual(mock_batch.call_args.args[2], [
+                ('10.0', '20.0', 'clip1'),
+                ('15.0', '30.0', 'clip2'),
+                ('40.0', '10.0', 'clip3')
+            ])
+
+            # Confirm each job got its own result
+            self.assertEqual([job.result for job in jobs], ['batch', 'batch', 'batch'])
+            self.assertEqual(scheduler.running, 0)
+
+    def test_distant_requests_not_batched(self):
+        # Simulate requests for the same source an hour apart, third request
+        # near the first
+        with patch('batching.gen_mp4_batch', return_value=['batch', 'batch']) as mock_batch, \
+             patch('batching.gen_mp4', return_value='encode') as mock_gen_mp4:
+
+            jobs = run_in_threads(
+                ('/path/to/source.mkv', 0, '10.0', '20.0', 'clip1'),
+                ('/path/to/source.mkv', 0, '3600.0', '20.0', 'late'),
+                ('/path/to/source.mkv', 0, '35.0', '10.0', 'clip2')
+            )
+
+            # Confirm nearby requests batched, distant request generated separately
+            mock_batch.assert_called_once()
+            self.assertEqual(mock_batch.call_args.args[2], [
+                ('10.0', '20.0', 'clip1'),
+                ('35.0', '10.0', 'clip2')
+            ])
+            mock_gen_mp4.assert_called_once()
+            self.assertEqual(mock_gen_mp4.call_args.args[:5], ('/path/to/source.mkv', 0, '3600.0', '20.0', 'late'))
+            self.assertEqual([job.result for job in jobs], ['batch', 'encode', 'batch'])
+            self.assertEqual(scheduler.running, 0)
+
+    def test_different_sources_not_batched(self):
+        with patch('batching.gen_mp4', return_value='encode') as mock_gen_mp4, \
+             patch('batching.gen_mp4_batch') as mock_batch:
+
+            jobs = run_in_threads(
+                ('/path/to/source.mkv', 0, '10.0', '20.0', 'clip1'),
+                ('/path/to/other.mkv', 0, '10.0', '20.0', 'clip2')
+            )
+            self.assertEqual(mock_gen_mp4.call_count, 2)
+            self.assertFalse(mock_batch.called)
+            self.assertEqual([job.result for job in jobs], ['encode', 'encode'])
+
+    def test_reuse_exact_match(self):
+        # Simulate 2 requests with exactly the same range
+        with patch('batching.gen_mp4', side_effect=write_output) as mock_gen_mp4:
+            jobs = run_in_threads(
+                ('/path/to/source.mkv', 0, '10.0', '20.0', 'clip1'),
+                ('/path/to/source.mkv', 0, '10.0', '20.0', 'clip2')
+            )
+
+            # Confirm only encoded once, second clip hard linked to first
+            mock_gen_mp4.assert_called_once()
+            self.assertEqual([job.result for job in jobs], ['encode', 'reuse'])
+            first = os.stat(os.path.join(batching.output_path, 'clip1.mp4'))
+            second = os.stat(os.path.join(batching.output_path, 'clip2.mp4'))
+            self.assertEqual(first.st_ino, second.st_ino)
+
+    def test_link_output_existing(self):
+        # Simulate output path already hard linked to another clip
+        other = os.path.join(batching.output_path, 'other.mp4')
+        existing = os.path.join(batching.output_path, 'existing.mp4')
+        output = os.path.join(batching.output_path, 'output.mp4')
+        for path, content in ((other, 'other'), (existing, 'existing')):
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(content)
+        os.link(other, output)
+
+        # Confirm output replaced by link to existing clip, other clip unchanged
+        with patch('batching.os.link', side_effect=OSError):
+            self.assertTrue(batching.link_output(existing, output))
+        with open(other, 'r', encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'other')
+        with open(output, 'r', encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'existing')
+
+    def test_reuse_original_failed(self):
+        # Simulate first request failing, confirm second generated separately
+        with patch('batching.gen_mp4', side_effect=[None, 'encode']) as mock_gen_mp4:
+            jobs = run_in_threads(
+                ('/path/to/source.mkv', 0, '10.0', '20.0', 'clip1'),
+                ('/path/to/source.mkv', 0, '10.0', '20.0', 'clip2')
+            )
+            self.assertEqual(mock_gen_mp4.call_count, 2)
+            self.assertEqual([job.status for job in jobs], ['failed', 'complete'])
+
+    def test_cancelled_request_skipped(self):
+        # Simulate second request cancelled before batch starts
+        with patch('batching.gen_mp4', return_value='encode') as mock_gen_mp4, \
+             patch('batching.gen_mp4_batch') as mock_batch:
+
+            jobs = [
+                Job(batch_gen_mp4, ('/path/to/source.mkv', 0, '10.0', '20.0', 'clip1')),
+                Job(batch_gen_mp4, ('/path/to/source.mkv', 0, '40.0', '20.0', 'clip2'))
+            ]
+            with patch.object(scheduler, 'get_limit', return_value=1):
+                scheduler.acquire()
+                threads = [threading.Thread(target=job.run) for job in jobs]
+                for thread in threads:
+                    thread.start()
+                    time.sleep(0.05)
+                jobs[1].cancel()
+                scheduler.release()
+                for thread in threads:
+                    thread.join(timeout=10)
+
+            # Confirm only first clip generated
+            self.assertFalse(mock_batch.called)
+            self.assertEqual(mock_gen_mp4.call_args.args[4], 'clip1')
+            self.assertEqual([job.status for job in jobs], ['complete', 'cancelled'])
+
+    def test_all_requests_cancelled(self):
+        # Simulate slow encode, cancel only request while running
+        started = threading.Event()
+        def slow_gen_mp4(*args):
+            started.set()
+            args[5].cancelled.wait(10)
+            return None
+
+        with patch('batching.gen_mp4', side_effect=slow_gen_mp4):
+            job = Job(batch_gen_mp4, ('/path/to/source.mkv', 0, '10.0', '20.0', 'clip1'))
+            thread = threading.Thread(target=job.run)
+            thread.start()
+            started.wait(10)
+            job.cancel()
+            thread.join(timeout=10)
+
+            # Confirm shared encode cancelled, job finished as cancelled
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(job.status, 'cancelled')
+            self.assertEqual(scheduler.running, 0)
@@ -0,0 +1,261 @@
+# pylint: disable=line-too-long, missing-module-docstring, missing-function-docstring
+
+import os
+import json
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+import ffmpeg
+import mock_kodi_modules
+import calibration
+from jobs import Job
+from calibration import (
+    calibrate,
+    measure_baseline,
+    measure_preset,
+    wait_for_playback,
+    start_calibration,
+    get_preset,
+    get_calibration_stats,
+    load_calibration,
+    CalibrationCache,
+    MIN_SPEED
+)
+
+
+# Mock calibration results (slower presets skipped once too slow at 2160p)
+mock_results = {
+    'time': 0,
+    'fps': 30,
+    'heights': {
+        '720': {'ultrafast': 20.0, 'superfast': 12.0, 'veryfast': 8.0, 'faster': 5.0, 'fast': 3.0, 'medium': 2.0},
+        '1080': {'ultrafast': 8.0, 'superfast': 5.0, 'veryfast': 3.0, 'faster': 1.5, 'fast': 1.2, 'medium': 0.8},
+        '2160': {'ultrafast': 1.2, 'superfast': 0.4}
+    }
+}
+
+
+def mock_settings(**settings):
+    '''Returns patch that mocks Addon().getSetting with keyword arg values.'''
+    mock_addon = MagicMock()
+    mock_addon.return_value.getSetting = lambda setting: settings.get(setting, '')
+    return patch('xbmcaddon.Addon', mock_addon)
+
+
+class TestCalibration(TestCase):
+    def setUp(self):
+        # Write calibration results to temporary directory, start uncalibrated
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'calibration.json')
+        for target, value in (('calibration_path', self.path), ('calibration_cache', CalibrationCache())):
+            patcher = patch.object(calibration, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_results(self, results):
+        with open(self.path, 'w', encoding='utf-8') as file:
+            json.dump(results, file)
+
+    def test_get_preset(self):
+        self.write_results(mock_results)
+        with mock_settings(auto_preset='true', encode_time_target='1'):
+            # Confirm slowest preset at least realtime chosen
+            self.assertEqual(get_preset(1080, 30), ('fast', 1.2))
+
+            # Confirm nearest calibrated height at or above output used
+            self.assertEqual(get_preset(576, 25), ('medium', 2.4))
+            self.assertEqual(get_preset(1440, 30), ('ultrafast', 1.2))
+
+            # Confirm speed scaled by frame rate (twice as many frames to encode)
+            self.assertEqual(get_preset(1080, 60), ('veryfast', 1.5))
+
+            # Confirm fastest preset used if none meet target
+            self.assertEqual(get_preset(2160, 60), ('ultrafast', 0.6))
+
+            # Confirm above largest calibrated height uses largest
+            self.assertEqual(get_preset(4320, 30), ('ultrafast', 1.2))
+
+        # Confirm stricter target picks faster preset
+        with mock_settings(auto_preset='true', encode_time_target='0.25'):
+            self.assertEqual(get_preset(1080, 30), ('superfast', 5.0))
+
+        # Confirm invalid target falls back to realtime
+        with mock_settings(auto_preset='true', encode_time_target='invalid'):
+            self.assertEqual(get_preset(1080, 30), ('fast', 1.2))
+
+    def test_get_preset_disabled(self):
+        # Confirm None if not calibrated
+        with mock_settings(auto_preset='true'):
+            self.assertIsNone(get_preset(1080, 30))
+
+        # Confirm None if calibrated but disabled
+        self.write_results(mock_results)
+        with mock_settings(auto_preset='false'):
+            self.assertIsNone(get_preset(1080, 30))
+
+    def test_invalid_results(self):
+        # Confirm corrupt results file treated as not calibrated
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write('{')
+        self.assertIsNone(load_calibration())
+
+    def test_measure_preset(self):
+        with patch('calibration.ffmpeg.nodes.OutputStream.run') as mock_run, \
+             patch('calibration.get_ffmpeg_command', return_value=['nice', '-n', '10', 'ffmpeg']):
+            self.assertIsInstance(measure_preset(1080, 'veryfast'), float)
+
+            # Confirm runs with same limits as clip encodes
+            self.assertEqual(mock_run.call_args.kwargs['cmd'], ['nice', '-n', '10', 'ffmpeg'])
+
+        # Simulate 1.5s run with 0.5s baseline, confirm only encode time counted
+        with patch('calibration.ffmpeg.nodes.OutputStream.run'), \
+             patch('calibration.time.perf_counter', side_effect=[10.0, 11.5]):
+            self.assertEqual(measure_preset(1080, 'veryfast', 0.5), 2.0)
+
+        # Confirm baseline longer than encode does not divide by zero
+        with patch('calibration.ffmpeg.nodes.OutputStream.run'), \
+             patch('calibration.time.perf_counter', side_effect=[10.0, 10.5]):
+            self.assertEqual(measure_preset(1080, 'veryfast', 1.0), 200.0)
+
+        with patch('calibration.ffmpeg.nodes.OutputStream.run', side_effect=ffmpeg.Error('ffmpeg', None, b'error')):
+            self.assertIsNone(measure_preset(1080, 'veryfast'))
+
+    def test_measure_preset_args(self):
+        with patch('calibration.ffmpeg.nodes.OutputStream.run', autospec=True) as mock_run:
+            measure_preset(720, 'fast')
+            args = mock_run.call_args.args[0].get_args()
+            self.assertEqual(args[:4], ['-f', 'lavfi', '-i', 'testsrc2=size=1280x720:rate=30:duration=2'])
+            self.assertEqual(args[args.index('-preset') + 1], 'fast')
+            self.assertEqual(args[args.index('-f', 2) + 1], 'null')
+            self.assertEqual(args[-1], '-')
+
+        # Confirm configured threads used during playback (not halved)
+        with patch('calibration.ffmpeg.nodes.OutputStream.run', autospec=True) as mock_run, \
+             patch('governor.is_playback_active', return_value=True), \
+             mock_settings(encoder_threads='4'):
+            measure_preset(720, 'fast')
+            args = mock_run.call_args.args[0].get_args()
+            self.assertEqual(args[args.index('-threads') + 1], '4')
+
+    def test_measure_baseline(self):
+        # Confirm test source generated without encoding
+        with patch('calibration.ffmpeg.nodes.OutputStream.run', autospec=True) as mock_run, \
+             patch('calibration.time.perf_counter', side_effect=[10.0, 10.25]):
+            self.assertEqual(measure_baseline(720), 0.25)
+            args = mock_run.call_args.args[0].get_args()
+            self.assertEqual(args[:4], ['-f', 'lavfi', '-i', 'testsrc2=size=1280x720:rate=30:duration=2'])
+            self.assertEqual(args[args.index('-vcodec') + 1], 'wrapped_avframe')
+            self.assertNotIn('-preset', args)
+
+        # Confirm nothing subtracted if ffmpeg failed
+        with patch('calibration.ffmpeg.nodes.OutputStream.run', side_effect=ffmpeg.Error('ffmpeg', None, b'error')):
+            self.assertEqual(measure_baseline(720), 0.0)
+
+    def test_calibrate(self):
+        # Simulate every preset slower than the last, medium 4K too slow
+        def mock_measure(height, preset, baseline):
+            self.assertEqual(baseline, 0.1)
+            return round(3000 / height / (calibration.PRESETS.index(preset) + 1), 3)
+
+        with patch('calibration.measure_preset', side_effect=mock_measure) as mock_measure_preset, \
+             patch('calibration.measure_baseline', return_value=0.1) as mock_measure_baseline:
+            job = Job(calibrate, ())
+            job.run()
+            results = job.result
+
+            # Confirm every preset measured until too slow for any target
+            self.assertEqual(len(results['heights']['480']), 6)
+            self.assertEqual(list(results['heights']['2160']), ['ultrafast', 'superfast', 'veryfast'])
+            self.assertLess(results['heights']['2160']['veryfast'], MIN_SPEED)
+            self.assertEqual(mock_measure_preset.call_count, 21)
+
+            # Confirm baseline measured once per height
+            self.assertEqual(mock_measure_baseline.call_count, 4)
+
+            # Confirm results saved and loaded by get_preset
+            with open(self.path, 'r', encoding='utf-8') as file:
+                self.assertEqual(json.load(file), results)
+            with mock_settings(auto_preset='true'):
+                self.assertEqual(get_preset(1080, 30)[0], 'superfast')
+
+    def test_calibrate_playback(self):
+        # Simulate playback before first height, started again while measuring it
+        playback = [True, False, True, False, False] + [False] * 6
+        with patch('calibration.measure_preset', return_value=MIN_SPEED / 2) as mock_measure_preset, \
+             patch('calibration.measure_baseline', return_value=0.0) as mock_measure_baseline, \
+             patch('calibration.is_playback_active', side_effect=playback) as mock_is_playback_active, \
+             patch('calibration.PLAYBACK_WAIT_INTERVAL', 0):
+            results = calibrate()
+
+            # Confirm waited for playback to stop, first height measured again
+            self.assertEqual(mock_is_playback_active.call_count, len(playback))
+            self.assertEqual([call.args[0] for call in mock_measure_baseline.call_args_list], [480, 480, 720, 1080, 2160])
+            self.assertEqual(mock_measure_preset.call_count, 5)
+            self.assertEqual(list(results['heights']), ['480', '720', '1080', '2160'])
+
+    def test_wait_for_playback(self):
+        # Confirm returns immediately if not playing
+        with patch('calibration.is_playback_active', return_value=False):
+            self.assertTrue(wait_for_playback(None))
+
+        # Confirm returns False if job cancelled while waiting
+        job = Job(MagicMock(), ())
+        job.cancel()
+        with patch('calibration.is_playback_active', return_value=True):
+            self.assertFalse(wait_for_playback(job))
+
+    def test_calibrate_failed(self):
+        # Simulate ffmpeg without libx264, confirm nothing saved
+        with patch('calibration.measure_preset', return_value=None) as mock_measure_preset, \
+             patch('calibration.measure_baseline', return_value=0.0):
+            self.assertIsNone(calibrate())
+            self.assertEqual(mock_measure_preset.call_count, 4)
+            self.assertFalse(os.path.exists(self.path))
+
+    def test_calibrate_cancelled(self):
+        # Simulate user cancelling job while first preset is measured
+        job = Job(calibrate, ())
+        def cancel(*_):
+            job.cancel()
+            return 10.0
+
+        with patch('calibration.measure_preset', side_effect=cancel) as mock_measure_preset, \
+             patch('calibration.measure_baseline', return_value=0.0):
+            job.run()
+            self.assertEqual(job.status, 'cancelled')
+            mock_measure_preset.assert_called_once()
+            self.assertFalse(os.path.exists(self.path))
+
+    def test_start_calibration(self):
+        job = Job(MagicMock(), ())
+        with patch('calibration.submit_unique_job', return_value=job) as mock_submit_job:
+            # Confirm not started if disabled
+            with mock_settings(auto_preset='false'):
+                self.assertIsNone(start_calibration())
+                self.assertFalse(mock_submit_job.called)
+
+            # Confirm started if enabled and not calibrated
+            with mock_settings(auto_preset='true'):
+                self.assertIs(start_calibration(), job)
+                mock_submit_job.assert_called_once_with(calibrate)
+
+            # Confirm not started if already calibrated unless forced
+            job.run()
+            self.write_results(mock_results)
+            with mock_settings(auto_preset='true'):
+                self.assertIsNone(start_calibration())
+                self.assertIs(start_calibration(force=True), job)
+                self.assertEqual(mock_submit_job.call_count, 2)
+
+    def test_get_calibration_stats(self):
+        with mock_settings(auto_preset='true', encode_time_target='2'):
+            self.assertEqual(
+                get_calibration_stats(),
+                {'enabled': True, 'target': 2.0, 'calibration': None, 'presets': {}}
+            )
+
+            self.write_results(mock_results)
+            stats = get_calibration_stats()
+            self.assertEqual(stats['calibration'], mock_results)
+            self.assertEqual(stats['presets'], {'720': 'medium', '1080': 'medium', '2160': 'ultrafast'})
@@ -4,24 +4,53 @@ import os
 import datetime
 import unittest
 from unittest.mock import patch, MagicMock
+from sqlalchemy import create_engine, inspect, text, select, desc
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects import mysql
 import mock_kodi_modules
-from paths import database_path
+from paths import database_path, output_path
 from database import (
     get_mysql_url,
     get_configured_engine,
     Base,
     GeneratedFile,
+    KeyframeIndex,
+    ProbeCache,
+    HistoryChange,
     engine,
+    read_cache,
+    ReadCache,
     get_timestamp,
     get_filename_query,
     get_orm_entry,
+    get_keyframe_index,
+    save_keyframe_index,
+    get_cached_probe,
+    save_cached_probe,
+    add_missing_columns,
+    create_schema,
+    get_schema_version,
+    MIGRATIONS,
+    get_fingerprint,
+    get_fingerprint_matches,
+    set_fingerprint,
     log_generated_file,
     load_history_json,
     load_history_search_results,
+    load_history_page,
+    load_history_changes,
+    get_history_seq,
+    get_oldest_history_seq,
+    record_change,
+    encode_cursor,
+    get_keyset_clause,
+    add_fulltext_search,
     rename_entry,
     delete_entry,
     is_duplicate,
+    get_missing_files,
+    bulk_delete,
     autodelete
 )
 
@@ -95,7 +124,12 @@ class TestDatabase(unittest.TestCase):
         # Delete all database entries after each test
         with Session(self.engine) as session:
             session.query(GeneratedFile).delete()
+            session.query(KeyframeIndex).delete()
+            session.query(ProbeCache).delete()
+            session.query(HistoryChange).delete()
             session.commit()
+        # Rows deleted directly, clear cached reads
+        read_cache.clear()
 
     def test_generated_file_orm(self):
         # Create test entry, confirm repr method prints correct string
@@ -116,7 +150,7 @@ class TestDatabase(unittest.TestCase):
         query = get_filename_query('test.mp4')
         self.assertEqual(
             str(query),
-            'SELECT history.id, history.source, history.audio_track, history.output, history.start_time, history.duration, history.timestamp, history.show_name, history.episode_name, history.renamed \nFROM history \nWHERE history.output = :output_1'
+            'SELECT history.id, history.source, history.audio_track, history.output, history.start_time, history.duration, history.timestamp, history.show_name, history.episode_name, history.renamed, history.fingerprint, history.media_type, history.parent_id, history.rendition \nFROM history \nWHERE history.output = :output_1'
         )
 
     def test_get_orm_entry(self):
@@ -142,6 +176,44 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(entry.output, 'test.mp4')
         self.assertEqual(entry.timestamp, '2023-09-23_23:19:39.681760')
 
+    def test_keyframe_index(self):
+        # Confirm returns None for source that has not been indexed
+        self.assertIsNone(get_keyframe_index('/path/to/source.mp4', 1000, 1234.5))
+
+        # Save index, confirm returned with same size and mtime
+        save_keyframe_index('/path/to/source.mp4', 1000, 1234.5, [0.0, 2.002, 4.004])
+        self.assertEqual(get_keyframe_index('/path/to/source.mp4', 1000, 1234.5), [0.0, 2.002, 4.004])
+
+        # Confirm returns None if source size or mtime changed
+        self.assertIsNone(get_keyframe_index('/path/to/source.mp4', 2000, 1234.5))
+        self.assertIsNone(get_keyframe_index('/path/to/source.mp4', 1000, 9999.0))
+
+        # Save new index for changed source, confirm stale index replaced
+        save_keyframe_index('/path/to/source.mp4', 2000, 9999.0, [0.0, 5.0])
+        self.assertEqual(get_keyframe_index('/path/to/source.mp4', 2000, 9999.0), [0.0, 5.0])
+        with Session(self.engine) as session:
+            self.assertEqual(session.query(KeyframeIndex).count(), 1)
+
+    def test_probe_cache(self):
+        probe = {'format': {'bit_rate': '1500000'}, 'streams': [{'codec_type': 'video'}]}
+
+        # Confirm returns None for source that has not been probed
+        self.assertIsNone(get_cached_probe('/path/to/source.mp4', 1000, 1234.5))
+
+        # Save probe output, confirm returned with same size and mtime
+        save_cached_probe('/path/to/source.mp4', 1000, 1234.5, probe)
+        self.assertEqual(get_cached_probe('/path/to/source.mp4', 1000, 1234.5), probe)
+
+        # Confirm invalidated if source size or mtime changed
+        self.assertIsNone(get_cached_probe('/path/to/source.mp4', 2000, 1234.5))
+        self.assertIsNone(get_cached_probe('/path/to/source.mp4', 1000, 9999.0))
+
+        # Save output for changed source, confirm stale output replaced
+        save_cached_probe('/path/to/source.mp4', 2000, 9999.0, {'format': {}})
+        self.assertEqual(get_cached_probe('/path/to/source.mp4', 2000, 9999.0), {'format': {}})
+        with Session(self.engine) as session:
+            self.assertEqual(session.query(ProbeCache).count(), 1)
+
     def test_log_generated_file(self):
         # Create test entry
         log_generated_file(
@@ -158,6 +230,176 @@ class TestDatabase(unittest.TestCase):
         entry = get_orm_entry('logged.mp4')
         self.assertEqual(entry.output, 'logged.mp4')
         self.assertEqual(entry.show_name, 'Show Name')
+        self.assertEqual(entry.media_type, 'clip')
+
+    def test_log_generated_snapshot(self):
+        # Confirm snapshot logged with JPEG extension and media type
+        log_generated_file('/path/to/source.mp4', 0, 123.4567, 0, 'frame', 'Show Name', 'Episode Name', media_type='snapshot')
+        entry = get_orm_entry('frame.jpg')
+        self.assertEqual(entry.media_type, 'snapshot')
+        self.assertEqual(entry.duration, 0)
+
+    def test_get_fingerprint(self):
+        # Confirm identical params (different types/precision) have same fingerprint
+        fingerprint = get_fingerprint('/path/to/source.mp4', 0, 23.4567, 100.0, 2796202)
+        self.assertEqual(len(fingerprint), 64)
+        self.assertEqual(fingerprint, get_fingerprint('/path/to/source.mp4', '0', '23.4567', '100.0000001', '2796202'))
+
+        # Confirm any different param changes fingerprint
+        self.assertNotEqual(fingerprint, get_fingerprint('/path/to/other.mp4', 0, 23.4567, 100.0, 2796202))
+        self.assertNotEqual(fingerprint, get_fingerprint('/path/to/source.mp4', 1, 23.4567, 100.0, 2796202))
+        self.assertNotEqual(fingerprint, get_fingerprint('/path/to/source.mp4', 0, 23.5, 100.0, 2796202))
+        self.assertNotEqual(fingerprint, get_fingerprint('/path/to/source.mp4', 0, 23.4567, 90.0, 2796202))
+        self.assertNotEqual(fingerprint, get_fingerprint('/path/to/source.mp4', 0, 23.4567, 100.0, 1500000))
+
+    def test_fingerprint_matches(self):
+        # Create 2 entries with same fingerprint, 1 with different fingerprint
+        for filename, fingerprint in (('first', 'a' * 64), ('second', 'a' * 64), ('other', 'b' * 64)):
+            log_generated_file(
+                source='/path/to/source.mp4',
+                audio_track=0,
+                start_time=23.4567,
+                duration=100.0,
+                filename=filename,
+                show_name='Show Name',
+                episode_name='Episode Name',
+                fingerprint=fingerprint
+            )
+
+        # Confirm returns matching filenames newest first
+        self.assertEqual(get_fingerprint_matches('a' * 64), ['second.mp4', 'first.mp4'])
+
+        # Confirm still found after renaming
+        rename_entry('first.mp4', 'renamed.mp4')
+        self.assertEqual(get_fingerprint_matches('a' * 64), ['second.mp4', 'renamed.mp4'])
+
+        # Confirm set_fingerprint updates entry
+        set_fingerprint('other.mp4', 'a' * 64)
+        self.assertEqual(len(get_fingerprint_matches('a' * 64)), 3)
+        self.assertEqual(get_fingerprint_matches('b' * 64), [])
+
+    def test_add_missing_columns(self):
+        # Create database with history table from before fingerprint column was added
+        old_engine = create_engine('sqlite://')
+        with old_engine.begin() as connection:
+            connection.execute(text('CREATE TABLE history (id INTEGER PRIMARY KEY, output VARCHAR(50))'))
+        Base.metadata.create_all(old_engine)
+
+        # Confirm column and index added, existing columns untouched
+        with old_engine.begin() as connection:
+            add_missing_columns(connection)
+        inspector = inspect(old_engine)
+        columns = [column['name'] for column in inspector.get_columns('history')]
+        self.assertEqual(columns[:2], ['id', 'output'])
+        self.assertIn('fingerprint', columns)
+        self.assertIn('ix_history_fingerprint', [index['name'] for index in inspector.get_indexes('history')])
+
+        # Confirm running again has no effect
+        with old_engine.begin() as connection:
+            add_missing_columns(connection)
+
+    def test_create_schema(self):
+        # Create database from before migrations were added (no indexes, no
+        # columns added later, duplicate filename)
+        old_engine = create_engine('sqlite://')
+        with old_engine.begin() as connection:
+            connection.execute(text(
+                'CREATE TABLE history (id INTEGER PRIMARY KEY, source VARCHAR(999), audio_track INTEGER, '
+                'output VARCHAR(50), start_time FLOAT, duration FLOAT, timestamp VARCHAR(26), '
+                'show_name VARCHAR(100), episode_name VARCHAR(100), renamed BOOLEAN)'
+            ))
+            for row_id, output in ((1, 'clip.mp4'), (2, 'clip.mp4'), (3, 'other.mp4'), (4, 'clip_480p.mp4')):
+                connection.execute(text(
+                    f"INSERT INTO history (id, source, audio_track, output, start_time, duration, timestamp, show_name, episode_name, renamed) "
+                    f"VALUES ({row_id}, '/source.mp4', 0, '{output}', 0, 10, '2024-01-0{row_id}_00:00:00.000000', '', '', 0)"
+                ))
+
+        # Confirm all migrations applied
+        create_schema(old_engine)
+        with old_engine.connect() as connection:
+            self.assertEqual(get_schema_version(connection), len(MIGRATIONS))
+
+        # Confirm older duplicate removed, new columns and indexes added
+        with Session(old_engine) as session:
+            self.assertEqual(
+                session.scalars(select(GeneratedFile.output).order_by(GeneratedFile.id)).all(),
+                ['clip.mp4', 'other.mp4', 'clip_480p.mp4']
+            )
+        indexes = {index['name']: index for index in inspect(old_engine).get_indexes('history')}
+        self.assertTrue(indexes['ix_history_output']['unique'])
+        self.assertEqual(indexes['ix_history_parent_id_timestamp']['column_names'], ['parent_id', 'timestamp'])
+        self.assertIn('ix_history_timestamp', indexes)
+        self.assertIn('ix_history_source_start_time', indexes)
+        self.assertIn('ix_history_fingerprint', indexes)
+
+        # Confirm existing entries added to full-text index
+        with old_engine.connect() as connection:
+            self.assertEqual(connection.execute(text("SELECT rowid FROM history_fts WHERE history_fts MATCH 'other'")).all(), [(3,)])
+
+        # Confirm kept duplicate logged as changed (history menus reload it)
+        with Session(old_engine) as session:
+            self.assertEqual(
+                [(change.entry_id, change.output, change.deleted) for change in session.scalars(select(HistoryChange))],
+                [(2, 'clip.mp4', False)]
+            )
+
+        # Confirm duplicate filenames rejected
+        with self.assertRaises(IntegrityError), old_engine.begin() as connection:
+            connection.execute(text("INSERT INTO history (id, output) VALUES (5, 'other.mp4')"))
+
+        # Confirm running again has no effect (already up to date), missing indexes still created
+        with old_engine.begin() as connection:
+            connection.execute(text('DROP INDEX ix_history_timestamp'))
+        with patch('database.MIGRATIONS', [MagicMock(__name__='mock')] * len(MIGRATIONS)) as mock_migrations:
+            create_schema(old_engine)
+            self.assertFalse(mock_migrations[0].called)
+        self.assertIn('ix_history_timestamp', [index['name'] for index in inspect(old_engine).get_indexes('history')])
+
+    def test_create_schema_resume(self):
+        # Simulate database with first migration applied, confirm only later migrations run
+        new_engine = create_engine('sqlite://')
+        migrations = [MagicMock(__name__=f'migration_{i}') for i in range(3)]
+        with patch('database.MIGRATIONS', migrations[:1]):
+            create_schema(new_engine)
+        with patch('database.MIGRATIONS', migrations):
+            create_schema(new_engine)
+        self.assertEqual([migration.call_count for migration in migrations], [1, 1, 1])
+
+        # Simulate failed migration, confirm version not updated (retried next start)
+        migrations.append(MagicMock(__name__='migration_3', side_effect=OperationalError('', {}, Exception())))
+        with patch('database.MIGRATIONS', migrations), self.assertRaises(OperationalError):
+            create_schema(new_engine)
+        with new_engine.connect() as connection:
+            self.assertEqual(get_schema_version(connection), 3)
+
+        # Confirm database from newer version is not migrated
+        with patch('database.MIGRATIONS', migrations[:2]):
+            create_schema(new_engine)
+        self.assertEqual(migrations[1].call_count, 1)
+
+    def test_history_query_plans(self):
+        # Confirm lookups and history menu use indexes instead of scanning table
+        def get_plan(stmt):
+            compiled = stmt.compile(self.engine, compile_kwargs={'literal_binds': True})
+            with self.engine.connect() as connection:
+                return ' '.join(row[-1] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {compiled}')))
+
+        self.assertIn('USING INDEX ix_history_output', get_plan(get_filename_query('test.mp4')))
+        plan = get_plan(select(GeneratedFile.id).where(GeneratedFile.parent_id.is_(None)).order_by(desc(GeneratedFile.timestamp)))
+        self.assertIn('ix_history_parent_id_timestamp', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+        # Confirm next page (and show filter) seeks to cursor in index
+        keys = [(GeneratedFile.timestamp, True), (GeneratedFile.id, True)]
+        for filters, index in (([], 'ix_history_parent_id_timestamp'), ([GeneratedFile.show_name == 'Show'], 'ix_history_show_name_timestamp')):
+            plan = get_plan(select(GeneratedFile.id).where(
+                GeneratedFile.parent_id.is_(None),
+                *filters,
+                get_keyset_clause(keys, ['2024-01-01_00:00:00.000000', 5])
+            ).order_by(desc(GeneratedFile.timestamp), desc(GeneratedFile.id)).limit(21))
+            self.assertIn(f'{index} (', plan)
+            self.assertIn('timestamp<?', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
 
     def test_load_history_json(self):
         # Create test entry
@@ -171,13 +413,45 @@ class TestDatabase(unittest.TestCase):
             episode_name='Episode Name'
         )
 
-        # Confirm method returns list containing a single tuple with 2 params
+        # Confirm method returns list containing a single tuple with 3 params
         history = load_history_json()
         self.assertEqual(len(history), 1)
         self.assertIsInstance(history, list)
         self.assertIsInstance(history[0], tuple)
-        self.assertEqual(len(history[0]), 2)
+        self.assertEqual(len(history[0]), 3)
         self.assertEqual(history[0][1], 'test.mp4')
+        self.assertEqual(history[0][2], [])
+
+    def test_load_history_renditions(self):
+        # Create clip with 2 extra renditions, separate clip without
+        log_generated_file('/path/to/source.mp4', 0, 23.4567, 100.0, 'single', 'Show Name', 'Episode Name')
+        log_generated_file(
+            '/path/to/source.mp4', 0, 23.4567, 100.0, 'grouped', 'Show Name', 'Episode Name',
+            renditions=[('grouped_480p', '480p'), ('grouped_720p', '720p')]
+        )
+
+        # Confirm renditions linked to clip
+        parent = get_orm_entry('grouped.mp4')
+        rendition = get_orm_entry('grouped_480p.mp4')
+        self.assertEqual(rendition.parent_id, parent.id)
+        self.assertEqual(rendition.rendition, '480p')
+        self.assertEqual(rendition.timestamp, parent.timestamp)
+        self.assertIsNone(parent.parent_id)
+
+        # Confirm renditions listed with clip instead of separately
+        history = load_history_json()
+        self.assertEqual([entry[1:] for entry in history], [
+            ('grouped.mp4', ['grouped_480p.mp4', 'grouped_720p.mp4']),
+            ('single.mp4', [])
+        ])
+        search_results = load_history_search_results('Show Name')
+        self.assertEqual(sorted(search_results), sorted(history))
+
+        # Confirm deleting clip deletes renditions
+        delete_entry('grouped.mp4')
+        self.assertIsNone(get_orm_entry('grouped_480p.mp4'))
+        self.assertIsNone(get_orm_entry('grouped_720p.mp4'))
+        self.assertEqual(len(load_history_json()), 1)
 
     def test_load_history_search_results(self):
         # Create test entries with different filenames and show names
@@ -215,17 +489,334 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(search_results[0][1], 'search for this.mp4')
 
         # Search for a show name shared by 2 entries, confirm 2 results
+        # (ranked by full-text index, order of equal matches not checked)
         search_results = load_history_search_results("First Show")
-        self.assertEqual(len(search_results), 2)
-        self.assertEqual(search_results[0][1], 'E7JI8wNLeCr7xopi.mp4')
-        self.assertEqual(search_results[1][1], 'search for this.mp4')
+        self.assertEqual(
+            sorted(entry[1] for entry in search_results),
+            ['E7JI8wNLeCr7xopi.mp4', 'search for this.mp4']
+        )
 
         # Search for episode name shared by all 3, confirm 3 results
         search_results = load_history_search_results("Episode Title")
-        self.assertEqual(len(search_results), 3)
-        self.assertEqual(search_results[0][1], 'IylJp5LtP5A7D9Lb.mp4')
-        self.assertEqual(search_results[1][1], 'E7JI8wNLeCr7xopi.mp4')
-        self.assertEqual(search_results[2][1], 'search for this.mp4')
+        self.assertEqual(
+            sorted(entry[1] for entry in search_results),
+            ['E7JI8wNLeCr7xopi.mp4', 'IylJp5LtP5A7D9Lb.mp4', 'search for this.mp4']
+        )
+
+        # Confirm case insensitive, quotes and operators treated as text
+        self.assertEqual(len(load_history_search_results("FIRST show")), 2)
+        self.assertEqual(load_history_search_results('"first" OR show'), [])
+
+        # Confirm 1-2 character searches still match substrings (LIKE fallback)
+        self.assertEqual(len(load_history_search_results("7x")), 1)
+        self.assertEqual(len(load_history_search_results("")), 3)
+
+    def test_search_ranking(self):
+        # Create older entry with search term in filename, newer with term in episode name
+        log_generated_file('/path/to/source.mp4', 0, 0, 10, 'best goal', 'Football', 'Final')
+        log_generated_file('/path/to/source.mp4', 0, 0, 10, 'clip', 'Football', 'Final best goal')
+        log_generated_file('/path/to/source.mp4', 0, 0, 10, 'other', 'Football', 'Semi final')
+
+        # Confirm filename match ranked first, only matching entries returned
+        search_results = load_history_search_results("goal")
+        self.assertEqual([entry[1] for entry in search_results], ['best goal.mp4', 'clip.mp4'])
+
+        # Confirm LIKE used if full-text index is not supported (newest first)
+        with patch('database.fulltext_search', False):
+            read_cache.clear()
+            search_results = load_history_search_results("goal")
+            self.assertEqual([entry[1] for entry in search_results], ['clip.mp4', 'best goal.mp4'])
+
+    def test_load_history_page(self):
+        # Create 5 entries with identical timestamps (cursor must break ties by id)
+        with patch('database.get_timestamp', return_value='2024-01-02_03:04:05.000000'):
+            for i in range(5):
+                log_generated_file('/path/to/source.mp4', 0, i, 10, f'clip{i}', 'Show', 'Episode')
+
+        # Confirm every entry returned once across pages, newest first
+        pages = []
+        history, cursor = load_history_page(limit=2)
+        pages.append(history)
+        while cursor:
+            history, cursor = load_history_page(cursor=cursor, limit=2)
+            pages.append(history)
+        self.assertEqual([[entry[1] for entry in page] for page in pages], [
+            ['clip4.mp4', 'clip3.mp4'],
+            ['clip2.mp4', 'clip1.mp4'],
+            ['clip0.mp4']
+        ])
+
+        # Confirm no cursor when page size matches remaining entries
+        self.assertIsNone(load_history_page(limit=5)[1])
+
+        # Confirm invalid cursor rejected
+        for cursor in ('invalid', 'WzFd', encode_cursor(['2024-01-02', 'id']), 5, 0, [], {'id': 1}):
+            with self.assertRaises(ValueError):
+                load_history_page(cursor=cursor, limit=2)
+
+    def test_search_pages(self):
+        # Create entries ranked differently (filename match ranked first)
+        log_generated_file('/path/to/source.mp4', 0, 0, 10, 'goal', 'Show', 'Episode')
+        for i in range(3):
+            log_generated_file('/path/to/source.mp4', 0, i, 10, f'clip{i}', 'Show', f'Best goal {i}')
+        ranked = [entry[1] for entry in load_history_search_results('goal')]
+        self.assertEqual(ranked[0], 'goal.mp4')
+
+        # Confirm pages follow rank order (full-text) and newest first (LIKE)
+        for fulltext, expected in ((True, ranked), (False, ['clip2.mp4', 'clip1.mp4', 'clip0.mp4', 'goal.mp4'])):
+            with patch('database.fulltext_search', fulltext):
+                read_cache.clear()
+                history, cursor = load_history_page('goal', limit=3)
+                self.assertIsNotNone(cursor)
+                history += load_history_page('goal', cursor=cursor, limit=3)[0]
+                self.assertEqual([entry[1] for entry in history], expected)
+
+    def test_history_filters(self):
+        # Create entries on different dates, shows, and media types
+        for day, filename, show, media_type in (
+            ('2024-01-01', 'first', 'Show A', 'clip'),
+            ('2024-01-02', 'second', 'Show B', 'snapshot'),
+            ('2024-01-03', 'third', 'Show A', 'clip')
+        ):
+            with patch('database.get_timestamp', return_value=f'{day}_12:00:00.000000'):
+                log_generated_file('/path/to/source.mp4', 0, 0, 10, filename, show, 'Episode', media_type=media_type)
+        rename_entry('third.mp4', 'renamed.mp4')
+
+        def filenames(**filters):
+            return [entry[1] for entry in load_history_json(filters)]
+
+        # Confirm date range inclusive
+        self.assertEqual(filenames(start='2024-01-02'), ['renamed.mp4', 'second.jpg'])
+        self.assertEqual(filenames(end='2024-01-02'), ['second.jpg', 'first.mp4'])
+        self.assertEqual(filenames(start='2024-01-02', end='2024-01-02'), ['second.jpg'])
+
+        # Confirm show, renamed, and media type filters
+        self.assertEqual(filenames(show='Show A'), ['renamed.mp4', 'first.mp4'])
+        self.assertEqual(filenames(renamed=True), ['renamed.mp4'])
+        self.assertEqual(filenames(renamed=False, media_type='clip'), ['first.mp4'])
+        self.assertEqual(filenames(media_type='snapshot'), ['second.jpg'])
+
+        # Confirm filters combined with search
+        self.assertEqual([entry[1] for entry in load_history_search_results('Show', {'show': 'Show B'})], ['second.jpg'])
+
+        # Confirm invalid filters rejected
+        for filters in ({'start': '01/02/2024'}, {'renamed': 'yes'}, {'media_type': 'gif'}, {'unknown': 1}):
+            with self.assertRaises(ValueError):
+                load_history_json(filters)
+
+    def test_fulltext_search_mysql(self):
+        # Confirm MySQL matches every word of search as a word prefix, ranked
+        stmt, rank = add_fulltext_search(select(GeneratedFile.id), 'best go goal!', 'mysql')
+        compiled = stmt.compile(dialect=mysql.dialect())
+        self.assertIn('MATCH (history.output, history.show_name, history.episode_name) AGAINST (%s IN BOOLEAN MODE)', str(compiled))
+        self.assertIn('+best* +goal*', compiled.params.values())
+
+        # Confirm rank selected, highest score first
+        self.assertIn('IN BOOLEAN MODE) AS `rank`', str(compiled))
+        self.assertTrue(rank[1])
+
+        # Confirm None (LIKE fallback) if every word shorter than min token size
+        self.assertIsNone(add_fulltext_search(select(GeneratedFile.id), 'a b', 'mysql'))
+
+    def test_fulltext_index_sync(self):
+        # Confirm renamed and deleted entries updated in full-text index
+        log_generated_file('/path/to/source.mp4', 0, 0, 10, 'original', 'Show', 'Episode')
+        rename_entry('original.mp4', 'renamed.mp4')
+        self.assertEqual(load_history_search_results("original"), [])
+        self.assertEqual(load_history_search_results("renamed")[0][1], 'renamed.mp4')
+        delete_entry('renamed.mp4')
+        self.assertEqual(load_history_search_results("renamed"), [])
+        with Session(self.engine) as session:
+            self.assertEqual(session.execute(text("SELECT count(*) FROM history_fts WHERE history_fts MATCH 'renamed'")).scalar(), 0)
+
+    def test_load_history_changes(self):
+        # Confirm no changes in empty database
+        self.assertEqual(load_history_changes(get_history_seq()), ([], []))
+
+        log_generated_file('/path/to/source.mp4', 0, 0, 10, 'first', 'Show', 'Episode')
+        seq = get_history_seq()
+        log_generated_file('/path/to/source.mp4', 0, 10, 10, 'second', 'Show', 'Episode', renditions=[('second_480p', '480p')])
+        log_generated_file('/path/to/other.mp4', 0, 0, 10, 'other', 'Other', 'Episode')
+
+        # Confirm only entries logged after seq returned (newest first), one
+        # change per clip (renditions grouped with clip, not logged separately)
+        changed, deleted = load_history_changes(seq)
+        self.assertEqual([entry[1] for entry in changed], ['other.mp4', 'second.mp4'])
+        self.assertEqual(changed[1][2], ['second_480p.mp4'])
+        self.assertEqual(deleted, [])
+        self.assertEqual(get_history_seq(), seq + 2)
+
+        # Confirm filters applied to changed entries
+        self.assertEqual([entry[1] for entry in load_history_changes(seq, {'show': 'Show'})[0]], ['second.mp4'])
+
+        # Confirm rename returns new name and tombstone for old name, delete
+        # returns tombstone (including clips changed before since)
+        seq = get_history_seq()
+        with patch('database.xbmcvfs'):
+            rename_entry('first.mp4', 'renamed.mp4')
+            delete_entry('second.mp4')
+        changed, deleted = load_history_changes(seq)
+        self.assertEqual([entry[1] for entry in changed], ['renamed.mp4'])
+        self.assertEqual(deleted, ['first.mp4', 'second.mp4'])
+
+        # Confirm sequence never goes backwards, older changes of each entry
+        # replaced (renamed clip logged once, deleted clip only tombstone)
+        self.assertGreater(get_history_seq(), seq)
+        with Session(self.engine) as session:
+            changes = session.execute(select(HistoryChange.output, HistoryChange.deleted).order_by(HistoryChange.seq)).all()
+        self.assertEqual(changes, [('other.mp4', False), ('first.mp4', True), ('renamed.mp4', False), ('second.mp4', True)])
+
+        # Confirm filename reused after delete returned as deleted and changed
+        log_generated_file('/path/to/source.mp4', 0, 30, 10, 'second', 'Show', 'Episode')
+        changed, deleted = load_history_changes(seq)
+        self.assertEqual([entry[1] for entry in changed], ['second.mp4', 'renamed.mp4'])
+        self.assertEqual(deleted, ['first.mp4', 'second.mp4'])
+
+        # Confirm no changes since current seq
+        self.assertEqual(load_history_changes(get_history_seq()), ([], []))
+
+    def test_load_history_changes_filtered(self):
+        log_generated_file('/path/to/source.mp4', 0, 0, 10, 'first', 'Show', 'Episode')
+        log_generated_file('/path/to/source.mp4', 0, 10, 10, 'second', 'Show', 'Episode')
+        seq = get_history_seq()
+
+        # Rename clip (no longer matches renamed filter), confirm removed from filtered view
+        with patch('database.xbmcvfs'):
+            rename_entry('first.mp4', 'renamed.mp4')
+        changed, deleted = load_history_changes(seq, {'renamed': False})
+        self.assertEqual(changed, [])
+        self.assertEqual(deleted, ['first.mp4', 'renamed.mp4'])
+
+        # Confirm unfiltered view gets renamed clip as changed
+        changed, deleted = load_history_changes(seq)
+        self.assertEqual([entry[1] for entry in changed], ['renamed.mp4'])
+        self.assertEqual(deleted, ['first.mp4'])
+
+    def test_prune_tombstones(self):
+        # Delete 4 clips with a 2 change window
+        with patch('database.HISTORY_CHANGE_WINDOW', 2), patch('database.xbmcvfs'):
+            for name in ('first', 'second', 'third', 'fourth'):
+                log_generated_file('/path/to/source.mp4', 0, 0, 10, name, 'Show', 'Episode')
+            for name in ('first', 'second', 'third', 'fourth'):
+                delete_entry(f'{name}.mp4')
+
+            # Confirm oldest tombstone pruned, every tombstone after oldest served seq kept
+            seq = get_history_seq()
+            self.assertEqual(get_oldest_history_seq(seq), seq - 2)
+            with Session(self.engine) as session:
+                tombstones = session.scalars(select(HistoryChange.output).where(HistoryChange.deleted.is_(True)).order_by(HistoryChange.seq)).all()
+            self.assertEqual(tombstones, ['second.mp4', 'third.mp4', 'fourth.mp4'])
+            self.assertEqual(load_history_changes(seq - 2)[1], ['third.mp4', 'fourth.mp4'])
+
+    def test_read_cache(self):
+        log_generated_file('/path/to/source.mp4', 0, 0, 10, 'first', 'Show', 'Episode')
+
+        # Confirm repeated reads served from cache (no query) until history written
+        stats = read_cache.get_stats()
+        with patch('database.Session', wraps=Session) as mock_session:
+            self.assertEqual(len(load_history_json()), 1)
+            self.assertEqual(get_orm_entry('first.mp4').output, 'first.mp4')
+            self.assertEqual(len(load_history_json()), 1)
+            self.assertEqual(get_orm_entry('first.mp4').output, 'first.mp4')
+            self.assertEqual(mock_session.call_count, 2)
+        self.assertEqual(read_cache.get_stats()['hits'], stats['hits'] + 2)
+        self.assertEqual(read_cache.get_stats()['misses'], stats['misses'] + 2)
+
+        # Confirm each caller gets its own entry (changes not shared)
+        entry = get_orm_entry('first.mp4')
+        entry.show_name = 'Modified'
+        self.assertIsNot(get_orm_entry('first.mp4'), entry)
+        self.assertEqual(get_orm_entry('first.mp4').show_name, 'Show')
+
+        # Confirm missing entries and history sequence are never cached
+        with patch('database.Session', wraps=Session) as mock_session:
+            self.assertIsNone(get_orm_entry('missing.mp4'))
+            self.assertIsNone(get_orm_entry('missing.mp4'))
+            get_history_seq()
+            get_history_seq()
+            self.assertEqual(mock_session.call_count, 4)
+
+        # Confirm each write path invalidates cached reads
+        log_generated_file('/path/to/source.mp4', 0, 10, 10, 'second', 'Show', 'Episode')
+        self.assertEqual(len(load_history_json()), 2)
+        self.assertEqual(len(load_history_search_results('second')), 1)
+        with patch('database.xbmcvfs'):
+            rename_entry('second.mp4', 'renamed.mp4')
+            self.assertEqual(load_history_search_results('second'), [])
+            self.assertIsNotNone(get_orm_entry('renamed.mp4'))
+            delete_entry('renamed.mp4')
+            self.assertIsNone(get_orm_entry('renamed.mp4'))
+            self.assertEqual(len(load_history_json()), 1)
+            bulk_delete([get_orm_entry('first.mp4')])
+            self.assertEqual(load_history_json(), [])
+
+        # Confirm different arguments cached separately
+        self.assertEqual(load_history_json({'show': 'Show'}), [])
+        self.assertEqual(read_cache.call(('load_history_json', 'key'), lambda: 'result'), 'result')
+        self.assertEqual(read_cache.call(('load_history_json', 'key'), lambda: 'other'), 'result')
+
+    def test_read_cache_other_instance(self):
+        log_generated_file('/path/to/source.mp4', 0, 0, 10, 'first', 'Show', 'Episode')
+        since = get_history_seq()
+
+        # Warm cache with delta and full history read with the current seq
+        self.assertEqual(load_history_changes(since, seq=since), ([], []))
+        self.assertEqual(len(load_history_json(seq=since)), 1)
+
+        # Simulate another instance sharing the database (cache not cleared)
+        with Session(self.engine) as session:
+            entry = GeneratedFile(
+                source='/path/to/source.mp4', audio_track=0, output='other.mp4', start_time=10,
+                duration=10, timestamp=get_timestamp(), show_name='Show', episode_name='Episode', renamed=False
+            )
+            session.add(entry)
+            session.flush()
+            record_change(session, entry)
+            session.commit()
+
+        # Confirm next delta and full history read with the new seq include the change
+        seq = get_history_seq()
+        self.assertGreater(seq, since)
+        changed, deleted = load_history_changes(since, seq=seq)
+        self.assertEqual([entry[1] for entry in changed], ['other.mp4'])
+        self.assertEqual(deleted, [])
+        self.assertEqual(len(load_history_json(seq=seq)), 2)
+
+    def test_read_cache_expiry(self):
+        cache = ReadCache(ttl=10, size=2)
+        with patch('database.time.monotonic', return_value=100):
+            self.assertEqual(cache.call('a', lambda: 1), 1)
+            self.assertEqual(cache.call('a', lambda: 2), 1)
+
+        # Confirm result read again after ttl (writes from other Kodi instances)
+        with patch('database.time.monotonic', return_value=111):
+            self.assertEqual(cache.call('a', lambda: 3), 3)
+
+            # Confirm least recently used result evicted when full
+            cache.call('b', lambda: 4)
+            cache.call('a', lambda: 5)
+            cache.call('c', lambda: 6)
+            self.assertEqual(cache.call('a', lambda: 7), 3)
+            self.assertEqual(cache.call('b', lambda: 8), 8)
+        self.assertEqual(cache.get_stats(), {
+            'size': 2, 'max_size': 2, 'ttl': 10, 'hits': 3, 'misses': 5, 'hit_rate': 0.375
+        })
+
+        # Confirm result not stored if cache cleared (history written) while reading
+        def read_during_write():
+            cache.clear()
+            return 'stale'
+        self.assertEqual(cache.call('d', read_during_write), 'stale')
+        self.assertEqual(cache.call('d', lambda: 'fresh'), 'fresh')
+
+        # Confirm exceptions not cached
+        with self.assertRaises(ValueError):
+            cache.call('e', MagicMock(side_effect=ValueError))
+        self.assertEqual(cache.call('e', lambda: 9), 9)
+
+        # Confirm None (not found) not cached
+        self.assertIsNone(cache.call('f', lambda: None))
+        self.assertEqual(cache.call('f', lambda: 10), 10)
 
     def test_rename_entry(self):
         # Create test file to rename
@@ -240,10 +831,17 @@ class TestDatabase(unittest.TestCase):
         )
 
         # Rename, confirm old name no longer exists, new name does exist
-        rename_entry('original.mp4', 'new_name.mp4')
-        self.assertIsNone(get_orm_entry('original.mp4'))
-        entry = get_orm_entry('new_name.mp4')
-        self.assertEqual(entry.output, 'new_name.mp4')
+        with patch('database.xbmcvfs.rename') as mock_rename:
+            rename_entry('original.mp4', 'new_name.mp4')
+            self.assertIsNone(get_orm_entry('original.mp4'))
+            entry = get_orm_entry('new_name.mp4')
+            self.assertEqual(entry.output, 'new_name.mp4')
+
+            # Confirm cached thumbnail moved with clip
+            mock_rename.assert_called_with(
+                os.path.join(output_path, '.original.mp4.jpg'),
+                os.path.join(output_path, '.new_name.mp4.jpg')
+            )
 
     def test_delete_entry(self):
         # Create test file to delete, confirm exists
@@ -259,8 +857,12 @@ class TestDatabase(unittest.TestCase):
         self.assertIsNotNone(get_orm_entry('delete me.mp4'))
 
         # Delete, confirm no longer exists
-        delete_entry('delete me.mp4')
-        self.assertIsNone(get_orm_entry('delete me.mp4'))
+        with patch('database.xbmcvfs.delete') as mock_delete:
+            delete_entry('delete me.mp4')
+            self.assertIsNone(get_orm_entry('delete me.mp4'))
+
+            # Confirm cached thumbnail deleted with clip
+            mock_delete.assert_any_call(os.path.join(output_path, '.delete me.mp4.jpg'))
 
     def test_is_duplicate(self):
         # Create test file
@@ -278,6 +880,31 @@ class TestDatabase(unittest.TestCase):
         self.assertTrue(is_duplicate('exists.mp4'))
         self.assertFalse(is_duplicate('new.mp4'))
 
+    def test_get_missing_files(self):
+        # Create entries from 2 sources, logged out of order
+        for source, start, filename in (
+            ('/path/to/b.mkv', 10.0, 'b1'),
+            ('/path/to/a.mkv', 50.0, 'a2'),
+            ('/path/to/b.mkv', 5.0, 'b0'),
+            ('/path/to/a.mkv', 20.0, 'a1'),
+        ):
+            log_generated_file(
+                source=source,
+                audio_track=0,
+                start_time=start,
+                duration=10.0,
+                filename=filename,
+                show_name='Show Name',
+                episode_name='Episode Name'
+            )
+
+        # Simulate b1.mp4 still on disk, confirm others returned in source order
+        with patch('database.xbmcvfs.exists', side_effect=lambda path: path.endswith('b1.mp4')):
+            missing = get_missing_files()
+            self.assertEqual([entry.output for entry in missing], ['a1.mp4', 'a2.mp4', 'b0.mp4'])
+            self.assertEqual(missing[0].source, '/path/to/a.mkv')
+            self.assertEqual(missing[0].start_time, 20.0)
+
     def test_autodelete(self):
         # Get current datetime object
         now = datetime.datetime.now()
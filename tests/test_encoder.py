@@ -0,0 +1,1353 @@
+# pylint: disable=line-too-long, missing-module-docstring, missing-function-docstring
+
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch, MagicMock, call
+import ffmpeg
+from sqlalchemy.exc import OperationalError
+import mock_kodi_modules
+from paths import output_path
+from encoder import (
+    get_bitrate,
+    can_stream_copy,
+    can_copy_video,
+    get_video_filters,
+    get_video_options,
+    get_keyframes,
+    get_keyframes_in_range,
+    get_seek_point,
+    get_source_signature,
+    probe_source,
+    build_keyframe_index,
+    load_keyframe_index,
+    schedule_keyframe_index,
+    smart_cut_mp4,
+    get_segment_count,
+    get_segments,
+    segmented_encode_mp4,
+    segment_slots,
+    gen_mp4,
+    gen_mp4_batch,
+    gen_snapshot,
+    gen_mp4_renditions,
+    get_rendition_profiles,
+    pipe_mp4,
+    run_ffmpeg,
+    get_smart_cut_options,
+    get_batch_groups,
+    EncodeCancelled
+)
+from jobs import Job
+from scheduler import scheduler
+
+
+# Mock ffprobe output for H.264/AAC stereo source
+mock_probe_h264_aac = {
+    'format': {'bit_rate': '1500000'},
+    'streams': [
+        {'codec_type': 'video', 'codec_name': 'h264', 'pix_fmt': 'yuv420p10le'},
+        {'codec_type': 'audio', 'codec_name': 'aac', 'channels': 2},
+        {'codec_type': 'audio', 'codec_name': 'ac3', 'channels': 6}
+    ]
+}
+
+# Mock ffprobe output for 8-bit High profile H.264/AAC source (smart cut
+# edges can match source settings)
+mock_probe_h264_high = {
+    'format': {'bit_rate': '1500000'},
+    'streams': [
+        {
+            'codec_type': 'video',
+            'codec_name': 'h264',
+            'profile': 'High',
+            'level': 41,
+            'refs': 4,
+            'pix_fmt': 'yuv420p',
+            'field_order': 'progressive'
+        },
+        {'codec_type': 'audio', 'codec_name': 'aac', 'channels': 2}
+    ]
+}
+
+
+def mock_stream_copy_setting(setting):
+    if setting == 'stream_copy':
+        return 'true'
+    return None
+
+
+def mock_segmented_setting(setting):
+    if setting == 'segmented_encode':
+        return 'true'
+    return None
+
+
+def mock_smart_cut_setting(setting):
+    if setting in ('stream_copy', 'smart_cut'):
+        return 'true'
+    return None
+
+
+def create_mock_process(stdout, stderr=(), returncode=0):
+    '''Returns mock ffmpeg process with stdout/stderr lines and exit code.'''
+    process = MagicMock()
+    process.stdout = [line.encode() for line in stdout]
+    process.stderr = [line.encode() for line in stderr]
+    process.returncode = returncode
+    return process
+
+
+class TestRunFfmpeg(TestCase):
+    def test_progress(self):
+        # Simulate ffmpeg -progress output for 10 second clip
+        stream = MagicMock()
+        stream.global_args.return_value.run_async.return_value = create_mock_process([
+            'out_time_us=2500000\n',
+            'speed=2.5x\n',
+            'progress=continue\n',
+            'out_time_us=N/A\n',
+            'out_time_us=5000000\n',
+            'progress=end\n'
+        ])
+        job = Job(MagicMock(), ())
+
+        # Confirm progress written to stdout, progress mapped to given range
+        run_ffmpeg(stream, job, '10.0', (0.5, 1.0))
+        stream.global_args.assert_called_once_with('-nostdin', '-nostats', '-progress', 'pipe:1')
+        self.assertEqual(job.progress, 0.75)
+        self.assertEqual(job.speed, '2.5x')
+
+        # Confirm process removed from job after exit
+        self.assertEqual(job.processes, set())
+        self.assertIsNotNone(job.encode_started)
+
+    def test_error(self):
+        # Simulate ffmpeg failing with more stderr lines than kept
+        stream = MagicMock()
+        stream.global_args.return_value.run_async.return_value = create_mock_process(
+            [],
+            [f'line {i}\n' for i in range(100)],
+            returncode=1
+        )
+
+        # Confirm raises ffmpeg.Error with only last lines of stderr
+        with self.assertRaises(ffmpeg.Error) as context:
+            run_ffmpeg(stream)
+        lines = context.exception.stderr.decode().splitlines()
+        self.assertEqual(len(lines), 50)
+        self.assertEqual(lines[-1], 'line 99')
+
+    def test_cancelled(self):
+        # Confirm ffmpeg not started if job already cancelled
+        stream = MagicMock()
+        job = Job(MagicMock(), ())
+        job.cancel()
+        with self.assertRaises(EncodeCancelled):
+            run_ffmpeg(stream, job, '10.0')
+        self.assertFalse(stream.global_args.called)
+
+    def test_cancelled_while_running(self):
+        # Simulate job cancelled while ffmpeg running (killed, non-zero exit)
+        stream = MagicMock()
+        job = Job(MagicMock(), ())
+        process = create_mock_process([], returncode=-9)
+        stream.global_args.return_value.run_async.return_value = process
+
+        def cancel_while_running():
+            job.cancel()
+            yield b'progress=end\n'
+        process.stdout = cancel_while_running()
+
+        # Confirm raises EncodeCancelled (not ffmpeg.Error), process killed
+        with self.assertRaises(EncodeCancelled):
+            run_ffmpeg(stream, job, '10.0')
+        process.kill.assert_called_once()
+
+
+class TestGetBitrate(TestCase):
+    def test_get_bitrate(self):
+        with patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+            # Mock quality setting to 20 MB/min
+            mock_addon.return_value.getSetting.return_value = '20'
+            # Confirm correct bitrate
+            self.assertEqual(get_bitrate(), 2796202)
+
+
+class TestCanStreamCopy(TestCase):
+    def test_compatible_source(self):
+        # H.264/AAC stereo source below target bitrate can be copied
+        self.assertTrue(can_stream_copy(mock_probe_h264_aac, 0, 2796202))
+
+    def test_bitrate_too_high(self):
+        # Source bitrate above target bitrate must be re-encoded
+        self.assertFalse(can_stream_copy(mock_probe_h264_aac, 0, 1000000))
+
+    def test_incompatible_audio(self):
+        # Second audio track is 5.1 AC3, must be re-encoded
+        self.assertFalse(can_stream_copy(mock_probe_h264_aac, 1, 2796202))
+        # Audio track that does not exist
+        self.assertFalse(can_stream_copy(mock_probe_h264_aac, 2, 2796202))
+
+    def test_incompatible_video(self):
+        # HEVC source must be re-encoded
+        probe = {
+            'format': {'bit_rate': '1500000'},
+            'streams': [
+                {'codec_type': 'video', 'codec_name': 'hevc'},
+                {'codec_type': 'audio', 'codec_name': 'aac', 'channels': 2}
+            ]
+        }
+        self.assertFalse(can_stream_copy(probe, 0, 2796202))
+
+    def test_no_stream_info(self):
+        # Should return False if probe output has no streams
+        self.assertFalse(can_stream_copy({'format': {'bit_rate': '1500000'}}, 0, 2796202))
+
+
+# Mock ffprobe output for 4K 60fps HDR (PQ) HEVC source
+mock_probe_4k_hdr = {
+    'format': {'bit_rate': '40000000'},
+    'streams': [{
+        'codec_type': 'video',
+        'codec_name': 'hevc',
+        'height': 2160,
+        'avg_frame_rate': '60000/1001',
+        'color_transfer': 'smpte2084'
+    }]
+}
+
+
+def mock_limit_settings(setting):
+    '''Mock getSetting with 1080p/30fps limits and tone mapping enabled.'''
+    return {'max_height': '1080', 'max_fps': '30', 'tonemap_hdr': 'true'}.get(setting, 'Source')
+
+
+class TestVideoLimits(TestCase):
+    def test_no_limits(self):
+        # Confirm no filters with default settings (source resolution)
+        self.assertEqual(get_video_filters(mock_probe_4k_hdr), [])
+        self.assertEqual(get_video_options(mock_probe_4k_hdr), {})
+
+    def test_source_above_limits(self):
+        with patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+            mock_addon.return_value.getSetting = mock_limit_settings
+
+            # Confirm scaled with fast scaler, frames dropped, tone mapped after scaling
+            filters = get_video_filters(mock_probe_4k_hdr)
+            self.assertEqual(filters[0], ('scale', {'w': -2, 'h': 1080, 'flags': 'fast_bilinear'}))
+            self.assertEqual(filters[1], ('fps', {'fps': 30}))
+            self.assertEqual([name for name, _ in filters[2:]], ['zscale', 'format', 'zscale', 'tonemap', 'zscale', 'format'])
+
+            # Confirm converted to -vf string, 8 bit output
+            options = get_video_options(mock_probe_4k_hdr)
+            self.assertTrue(options['vf'].startswith('scale=w=-2:h=1080:flags=fast_bilinear,fps=fps=30,zscale=t=linear:npl=100,'))
+            self.assertTrue(options['vf'].endswith('tonemap=tonemap=hable:desat=0,zscale=t=bt709:m=bt709:r=tv,format=pix_fmts=yuv420p'))
+            self.assertEqual(options['pix_fmt'], 'yuv420p')
+
+    def test_source_within_limits(self):
+        # Simulate 1080p 24fps HDR source, confirm not scaled or tone mapped
+        probe = {'streams': [{'codec_type': 'video', 'height': 1080, 'avg_frame_rate': '24000/1001', 'color_transfer': 'smpte2084'}]}
+        with patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+            mock_addon.return_value.getSetting = mock_limit_settings
+            self.assertEqual(get_video_filters(probe), [])
+
+            # Confirm only frame rate limited if source above max fps
+            probe['streams'][0]['avg_frame_rate'] = '60/1'
+            self.assertEqual(get_video_options(probe), {'vf': 'fps=fps=30'})
+
+            # Confirm unknown frame rate ignored
+            probe['streams'][0]['avg_frame_rate'] = '0/0'
+            self.assertEqual(get_video_filters(probe), [])
+
+    def test_can_copy_video_above_limits(self):
+        # Confirm compatible source re-encoded if above max height
+        probe = {'format': {'bit_rate': '1500000'}, 'streams': [{'codec_type': 'video', 'codec_name': 'h264', 'height': 2160}]}
+        self.assertTrue(can_copy_video(probe, 2796202))
+        with patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+            mock_addon.return_value.getSetting = mock_limit_settings
+            self.assertFalse(can_copy_video(probe, 2796202))
+
+    def test_encode_above_limits(self):
+        # Confirm limits applied to re-encoded clip
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value=mock_probe_4k_hdr), \
+             patch('encoder.load_keyframe_index', return_value=None), \
+             patch('encoder.schedule_keyframe_index'), \
+             patch('encoder.run_ffmpeg') as mock_run_ffmpeg, \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_limit_settings
+            self.assertEqual(gen_mp4('/path/to/source.mkv', 0, '23.4567', '100.0', 'output'), 'encode')
+            args = mock_run_ffmpeg.call_args.args[0].get_args()
+            self.assertIn('-vf', args)
+            self.assertTrue(args[args.index('-vf') + 1].startswith('scale=w=-2:h=1080'))
+
+    def test_encode_calibrated_preset(self):
+        # Confirm preset chosen for capped output resolution and frame rate
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value=mock_probe_4k_hdr), \
+             patch('encoder.load_keyframe_index', return_value=None), \
+             patch('encoder.schedule_keyframe_index'), \
+             patch('encoder.get_preset', return_value=('veryfast', 1.5)) as mock_get_preset, \
+             patch('encoder.run_ffmpeg') as mock_run_ffmpeg, \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_limit_settings
+            self.assertEqual(gen_mp4('/path/to/source.mkv', 0, '23.4567', '100.0', 'output'), 'encode')
+            mock_get_preset.assert_called_once_with(1080, 30)
+            args = mock_run_ffmpeg.call_args.args[0].get_args()
+            self.assertEqual(args[args.index('-preset') + 1], 'veryfast')
+
+        # Confirm ffmpeg default preset if not calibrated
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value=mock_probe_4k_hdr), \
+             patch('encoder.load_keyframe_index', return_value=None), \
+             patch('encoder.schedule_keyframe_index'), \
+             patch('encoder.get_preset', return_value=None) as mock_get_preset, \
+             patch('encoder.run_ffmpeg') as mock_run_ffmpeg:
+
+            gen_mp4('/path/to/source.mkv', 0, '23.4567', '100.0', 'output')
+            mock_get_preset.assert_called_once_with(2160, 60000 / 1001)
+            self.assertNotIn('-preset', mock_run_ffmpeg.call_args.args[0].get_args())
+
+    def test_renditions_above_limits(self):
+        # Confirm limits applied once before split, 720p rendition scaled from capped video
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value=mock_probe_4k_hdr), \
+             patch('encoder.load_keyframe_index', return_value=[0.0]), \
+             patch('encoder.run_ffmpeg') as mock_run_ffmpeg, \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_limit_settings
+            gen_mp4_renditions('/path/to/source.mkv', 0, '23.0', '10.0', [('clip', None), ('clip_720p', '720p')])
+            args = mock_run_ffmpeg.call_args.args[0].get_args()
+            graph = args[args.index('-filter_complex') + 1]
+            self.assertEqual(graph.count(']tonemap='), 1)
+            self.assertLess(graph.index('tonemap'), graph.index('split=2'))
+            self.assertIn('scale=-2:720', graph)
+            self.assertNotIn('-vf', args)
+
+
+class TestGetKeyframes(TestCase):
+    def test_get_keyframes(self):
+        # Mock ffprobe packet output with keyframes before, inside, and after range
+        mock_packets = {'packets': [
+            {'pts_time': '9.500000', 'flags': 'K_'},
+            {'pts_time': '10.000000', 'flags': '__'},
+            {'pts_time': '22.000000', 'flags': 'K_'},
+            {'pts_time': '12.000000', 'flags': 'K_'},
+            {'pts_time': 'N/A', 'flags': 'K_'},
+            {'pts_time': '40.000000', 'flags': 'K_'}
+        ]}
+        with patch('encoder.ffmpeg.probe', return_value=mock_packets) as mock_probe:
+            # Confirm only keyframes in range returned, sorted
+            self.assertEqual(get_keyframes('/path/to/source.mp4', 10.0, 30.0), [12.0, 22.0])
+
+            # Confirm only read packets in requested range
+            mock_probe.assert_called_once_with(
+                '/path/to/source.mp4',
+                select_streams='v:0',
+                show_entries='packet=pts_time,flags',
+                read_intervals='10.0%30.0'
+            )
+
+
+    def test_get_keyframes_in_range(self):
+        keyframes = [0.0, 2.0, 4.0, 6.0, 8.0]
+        self.assertEqual(get_keyframes_in_range(keyframes, 2.0, 6.5), [2.0, 4.0, 6.0])
+        self.assertEqual(get_keyframes_in_range(keyframes, 8.5, 10.0), [])
+
+    def test_get_seek_point(self):
+        keyframes = [0.0, 2.0, 4.0, 6.0]
+        # Confirm returns last keyframe at or before start
+        self.assertEqual(get_seek_point(keyframes, '5.5'), 4.0)
+        self.assertEqual(get_seek_point(keyframes, 4.0), 4.0)
+        self.assertEqual(get_seek_point(keyframes, 100), 6.0)
+        # Confirm returns 0 if no keyframe before start
+        self.assertEqual(get_seek_point([1.0, 3.0], 0.5), 0)
+
+
+class TestProbeSource(TestCase):
+    def test_probe_source_cached(self):
+        # Confirm returns cached output without probing if source unchanged
+        with patch('encoder.get_source_signature', return_value=(1000, 1234.5)), \
+             patch('encoder.get_cached_probe', return_value=mock_probe_h264_aac) as mock_get, \
+             patch('encoder.ffmpeg.probe') as mock_probe:
+
+            self.assertEqual(probe_source('/path/to/source.mp4'), mock_probe_h264_aac)
+            mock_get.assert_called_once_with('/path/to/source.mp4', 1000, 1234.5)
+            self.assertFalse(mock_probe.called)
+
+    def test_probe_source_not_cached(self):
+        # Confirm probes source and writes output to cache if not cached (or changed)
+        with patch('encoder.get_source_signature', return_value=(1000, 1234.5)), \
+             patch('encoder.get_cached_probe', return_value=None), \
+             patch('encoder.save_cached_probe') as mock_save, \
+             patch('encoder.ffmpeg.probe', return_value=mock_probe_h264_aac) as mock_probe:
+
+            self.assertEqual(probe_source('/path/to/source.mp4'), mock_probe_h264_aac)
+            mock_probe.assert_called_once_with('/path/to/source.mp4')
+            mock_save.assert_called_once_with('/path/to/source.mp4', 1000, 1234.5, mock_probe_h264_aac)
+
+    def test_probe_source_unable_to_stat(self):
+        # Confirm probes source without using cache if unable to stat
+        with patch('encoder.get_cached_probe') as mock_get, \
+             patch('encoder.save_cached_probe') as mock_save, \
+             patch('encoder.ffmpeg.probe', return_value=mock_probe_h264_aac):
+
+            self.assertEqual(probe_source('/path/to/source.mp4'), mock_probe_h264_aac)
+            self.assertFalse(mock_get.called)
+            self.assertFalse(mock_save.called)
+
+    def test_probe_source_sql_error(self):
+        # Confirm still returns probe output if database is locked
+        with patch('encoder.get_source_signature', return_value=(1000, 1234.5)), \
+             patch('encoder.get_cached_probe', side_effect=OperationalError("", "", "Database locked")), \
+             patch('encoder.save_cached_probe', side_effect=OperationalError("", "", "Database locked")), \
+             patch('encoder.ffmpeg.probe', return_value=mock_probe_h264_aac):
+
+            self.assertEqual(probe_source('/path/to/source.mp4'), mock_probe_h264_aac)
+
+
+class TestKeyframeIndex(TestCase):
+    def test_get_source_signature(self):
+        # Confirm returns size and mtime of existing file
+        with tempfile.NamedTemporaryFile() as file:
+            file.write(b'12345')
+            file.flush()
+            size, mtime = get_source_signature(file.name)
+            self.assertEqual(size, 5)
+            self.assertEqual(mtime, os.stat(file.name).st_mtime)
+
+        # Confirm returns None for missing file
+        self.assertIsNone(get_source_signature('/path/to/source.mp4'))
+
+    def test_build_keyframe_index(self):
+        # Mock ffprobe packet output for whole file
+        mock_packets = {'packets': [
+            {'pts_time': '0.000000', 'flags': 'K_'},
+            {'pts_time': '0.041708', 'flags': '__'},
+            {'pts_time': '2.002000', 'flags': 'K_'}
+        ]}
+        with patch('encoder.get_source_signature', return_value=(1000, 1234.5)), \
+             patch('encoder.ffmpeg.probe', return_value=mock_packets) as mock_probe, \
+             patch('encoder.save_keyframe_index') as mock_save:
+
+            build_keyframe_index('/path/to/source.mp4')
+
+            # Confirm read whole file, saved keyframes with size and mtime
+            mock_probe.assert_called_once_with(
+                '/path/to/source.mp4',
+                select_streams='v:0',
+                show_entries='packet=pts_time,flags'
+            )
+            mock_save.assert_called_once_with('/path/to/source.mp4', 1000, 1234.5, [0.0, 2.002])
+
+    def test_build_keyframe_index_error(self):
+        # Confirm nothing saved if ffprobe fails
+        with patch('encoder.get_source_signature', return_value=(1000, 1234.5)), \
+             patch('encoder.ffmpeg.probe', side_effect=ffmpeg.Error(cmd="", stdout="", stderr="".encode())), \
+             patch('encoder.save_keyframe_index') as mock_save:
+
+            build_keyframe_index('/path/to/source.mp4')
+            self.assertFalse(mock_save.called)
+
+    def test_load_keyframe_index(self):
+        # Confirm looks up index with current size and mtime
+        with patch('encoder.get_source_signature', return_value=(1000, 1234.5)), \
+             patch('encoder.get_keyframe_index', return_value=[0.0, 2.0]) as mock_get:
+
+            self.assertEqual(load_keyframe_index('/path/to/source.mp4'), [0.0, 2.0])
+            mock_get.assert_called_once_with('/path/to/source.mp4', 1000, 1234.5)
+
+        # Confirm returns None without querying database if unable to stat
+        with patch('encoder.get_keyframe_index') as mock_get:
+            self.assertIsNone(load_keyframe_index('/path/to/source.mp4'))
+            self.assertFalse(mock_get.called)
+
+    def test_schedule_keyframe_index(self):
+        # Confirm starts background thread if source not indexed
+        with patch('encoder.get_source_signature', return_value=(1000, 1234.5)), \
+             patch('encoder.load_keyframe_index', return_value=None), \
+             patch('encoder.threading.Thread') as mock_thread:
+
+            schedule_keyframe_index('/path/to/source.mp4')
+            mock_thread.assert_called_once_with(
+                target=build_keyframe_index,
+                args=('/path/to/source.mp4',),
+                daemon=True
+            )
+
+            # Confirm does not start second thread while first is running
+            schedule_keyframe_index('/path/to/source.mp4')
+            self.assertEqual(mock_thread.call_count, 1)
+
+        # Confirm no thread started if source already indexed
+        with patch('encoder.get_source_signature', return_value=(1000, 1234.5)), \
+             patch('encoder.load_keyframe_index', return_value=[0.0]), \
+             patch('encoder.threading.Thread') as mock_thread:
+
+            schedule_keyframe_index('/path/to/other.mp4')
+            self.assertFalse(mock_thread.called)
+
+
+class TestSmartCutMp4(TestCase):
+    def test_smart_cut_mp4(self):
+        # Save concat playlist contents when concat demuxer input is created
+        playlist = []
+        def mock_input(filename, **kwargs):
+            if kwargs.get('f') == 'concat':
+                with open(filename, 'r', encoding='utf-8') as file:
+                    playlist.extend(file.read().splitlines())
+            return MagicMock()
+
+        with tempfile.TemporaryDirectory() as tmp, \
+             patch('encoder.encode_video_piece') as mock_encode_piece, \
+             patch('encoder.run_ffmpeg') as mock_run_ffmpeg, \
+             patch('encoder.ffmpeg') as mock_ffmpeg:
+
+            mock_ffmpeg.input.side_effect = mock_input
+
+            # Cut 20 second clip with keyframes 2 and 18 seconds in
+            smart_cut_mp4(
+                '/path/to/source.mp4',
+                1,
+                '10.0',
+                '20.0',
+                os.path.join(tmp, 'output.mp4'),
+                1500000,
+                [12.0, 16.0, 28.0],
+                'yuv420p',
+                video_options={'profile:v': 'high', 'level': '4.1'}
+            )
+
+            # Confirm only partial GOPs at each end were re-encoded
+            self.assertEqual(mock_encode_piece.call_count, 2)
+            head = mock_encode_piece.call_args_list[0].args
+            tail = mock_encode_piece.call_args_list[1].args
+            self.assertEqual(head[:2], ('/path/to/source.mp4', '10.0'))
+            self.assertAlmostEqual(head[2], 2.0)
+            self.assertEqual(head[4:6], (1500000, 'yuv420p'))
+            self.assertEqual(tail[:2], ('/path/to/source.mp4', 28.0))
+            self.assertAlmostEqual(tail[2], 2.0)
+
+            # Confirm edges encoded with settings matching source
+            for call in mock_encode_piece.call_args_list:
+                self.assertEqual(call.kwargs['video_options'], {'profile:v': 'high', 'level': '4.1'})
+
+            # Confirm middle copied starting from first keyframe
+            mock_ffmpeg.input.assert_any_call('/path/to/source.mp4', ss=12.001, t=16.0)
+
+            # Confirm pieces joined in order
+            self.assertEqual(len(playlist), 3)
+            self.assertTrue(playlist[0].endswith("head.ts'"))
+            self.assertTrue(playlist[1].endswith("middle.ts'"))
+            self.assertTrue(playlist[2].endswith("tail.ts'"))
+
+            # Confirm joined video copied, audio re-encoded
+            self.assertEqual(mock_ffmpeg.output.call_args.kwargs, {'vcodec': 'copy', 'acodec': 'aac', 'ac': '2'})
+
+            # Confirm progress reported for copied middle and join steps
+            self.assertEqual(mock_run_ffmpeg.call_args_list[0].args[3], (0.25, 0.3))
+            self.assertEqual(mock_run_ffmpeg.call_args_list[1].args[3], (0.5, 1.0))
+
+            # Confirm temporary pieces removed
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_smart_cut_mp4_starts_on_keyframe(self):
+        # Confirm head not re-encoded if clip starts and ends on keyframes
+        with tempfile.TemporaryDirectory() as tmp, \
+             patch('encoder.encode_video_piece') as mock_encode_piece, \
+             patch('encoder.run_ffmpeg'), \
+             patch('encoder.ffmpeg'):
+
+            smart_cut_mp4(
+                '/path/to/source.mp4',
+                0,
+                '10.0',
+                '20.0',
+                os.path.join(tmp, 'output.mp4'),
+                1500000,
+                [10.0, 30.0]
+            )
+            self.assertFalse(mock_encode_piece.called)
+
+
+class TestSegmentedEncode(TestCase):
+    def test_get_segment_count(self):
+        with patch('encoder.get_allowed_cpus', return_value={0, 1, 2, 3, 4, 5, 6, 7}), \
+             patch('encoder.get_thread_options', return_value={}), \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            # Confirm not segmented if disabled
+            mock_addon.return_value.getSetting = lambda _: 'false'
+            self.assertEqual(get_segment_count('300.0'), 1)
+
+            # Confirm short clips not segmented
+            mock_addon.return_value.getSetting = mock_segmented_setting
+            self.assertEqual(get_segment_count('60.0'), 1)
+
+            # Confirm 8 cores split into 4 segments with 2 threads each
+            self.assertEqual(get_segment_count('300.0'), 4)
+
+            # Confirm limited by minimum segment length
+            self.assertEqual(get_segment_count('120.0'), 4)
+            with patch('encoder.get_thread_options', return_value={'threads': '4'}):
+                self.assertEqual(get_segment_count('300.0'), 2)
+
+            # Confirm cores shared with other running encodes
+            with patch('encoder.scheduler.running', 2):
+                self.assertEqual(get_segment_count('300.0'), 2)
+
+    def test_get_segments(self):
+        # Confirm 300 second clip split on keyframes closest to even split points
+        keyframes = [float(i) for i in range(0, 400, 4)]
+        self.assertEqual(
+            get_segments(keyframes, '10.0', '300.0', 4),
+            [(10.0, 74.0), (84.0, 76.0), (160.0, 76.0), (236.0, 74.0)]
+        )
+
+        # Confirm fewer segments if not enough keyframes
+        self.assertEqual(
+            get_segments([0.0, 50.0, 300.0], '10.0', '200.0', 4),
+            [(10.0, 40.0), (50.0, 160.0)]
+        )
+
+        # Confirm keyframes too close to clip edges not used
+        self.assertEqual(get_segments([0.0, 15.0, 205.0], '10.0', '200.0', 4), [(10.0, 200.0)])
+
+    def test_segment_slots(self):
+        segments = [(10.0, 50.0), (60.0, 50.0), (110.0, 50.0), (160.0, 50.0)]
+
+        # Confirm slot taken for each segment after the first, released after block
+        with patch('encoder.scheduler.acquire', return_value=True) as mock_acquire, \
+             patch('encoder.scheduler.release') as mock_release:
+            with segment_slots(segments) as result:
+                self.assertEqual(result, segments)
+                self.assertEqual(mock_acquire.call_count, 3)
+                mock_acquire.assert_called_with(blocking=False)
+                self.assertFalse(mock_release.called)
+            self.assertEqual(mock_release.call_count, 3)
+
+        # Simulate 1 free slot, confirm segments merged on existing boundaries
+        with patch('encoder.scheduler.acquire', side_effect=[True, False]), \
+             patch('encoder.scheduler.release') as mock_release:
+            with segment_slots(segments) as result:
+                self.assertEqual(result, [(10.0, 100.0), (110.0, 100.0)])
+            self.assertEqual(mock_release.call_count, 1)
+
+        # Confirm slots released if encode fails
+        with patch('encoder.scheduler.acquire', return_value=True), \
+             patch('encoder.scheduler.release') as mock_release:
+            with self.assertRaises(ffmpeg.Error), segment_slots(segments):
+                raise ffmpeg.Error('ffmpeg', None, b'error')
+            self.assertEqual(mock_release.call_count, 3)
+
+    def test_segmented_encode_mp4(self):
+        # Save concat playlist contents when concat demuxer input is created
+        playlist = []
+        def mock_input(filename, **kwargs):
+            if kwargs.get('f') == 'concat':
+                with open(filename, 'r', encoding='utf-8') as file:
+                    playlist.extend(file.read().splitlines())
+            return MagicMock()
+
+        with tempfile.TemporaryDirectory() as tmp, \
+             patch('encoder.encode_video_piece') as mock_encode_piece, \
+             patch('encoder.run_ffmpeg') as mock_run_ffmpeg, \
+             patch('encoder.ffmpeg') as mock_ffmpeg:
+
+            mock_ffmpeg.input.side_effect = mock_input
+            job = Job(MagicMock(), ())
+
+            segmented_encode_mp4(
+                '/path/to/source.mp4',
+                1,
+                '10.0',
+                '200.0',
+                os.path.join(tmp, 'output.mp4'),
+                1500000,
+                [(10.0, 40.0), (50.0, 160.0)],
+                'yuv420p',
+                job
+            )
+
+            # Confirm each segment encoded with own progress part and thread cap
+            self.assertEqual(mock_encode_piece.call_count, 2)
+            first, second = sorted(mock_encode_piece.call_args_list, key=lambda call: call.args[1])
+            self.assertEqual(first.args[:3], ('/path/to/source.mp4', 10.0, 40.0))
+            self.assertEqual(first.args[4:], (1500000, 'yuv420p', job, (0.0, 0.18), 0, 2))
+            self.assertEqual(second.args[:3], ('/path/to/source.mp4', 50.0, 160.0))
+            self.assertEqual(second.args[4:], (1500000, 'yuv420p', job, (0.0, 0.72), 1, 2))
+
+            # Confirm segments joined in order, audio from whole clip
+            self.assertEqual(len(playlist), 2)
+            self.assertTrue(playlist[0].endswith("0.ts'"))
+            self.assertTrue(playlist[1].endswith("1.ts'"))
+            mock_ffmpeg.input.assert_any_call('/path/to/source.mp4', ss='10.0', t='200.0')
+            self.assertEqual(mock_run_ffmpeg.call_args.args[3], (0.9, 1.0))
+
+            # Confirm temporary segments removed
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_segmented_encode_mp4_error(self):
+        # Simulate second segment failing
+        error = ffmpeg.Error(cmd="", stdout="", stderr="".encode())
+        with tempfile.TemporaryDirectory() as tmp, \
+             patch('encoder.encode_video_piece', side_effect=[None, error]), \
+             patch('encoder.run_ffmpeg') as mock_run_ffmpeg:
+
+            # Confirm error raised, segments not joined
+            with self.assertRaises(ffmpeg.Error):
+                segmented_encode_mp4(
+                    '/path/to/source.mp4',
+                    1,
+                    '10.0',
+                    '200.0',
+                    os.path.join(tmp, 'output.mp4'),
+                    1500000,
+                    [(10.0, 40.0), (50.0, 160.0)]
+                )
+            self.assertFalse(mock_run_ffmpeg.called)
+
+
+class TestGenMp4(TestCase):
+    def test_generate_linked_output(self):
+        # Simulate output hard linked to a deduplicated clip
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+        original = os.path.join(tmp.name, 'original.mp4')
+        with open(original, 'w', encoding='utf-8') as file:
+            file.write('original')
+        os.link(original, os.path.join(tmp.name, 'output.mp4'))
+
+        # Mock encoder overwriting output in place (ffmpeg -y)
+        def write_output(*args, **_):
+            with open(args[4], 'w', encoding='utf-8') as file:
+                file.write('new')
+
+        with patch('encoder.output_path', tmp.name), \
+             patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value=mock_probe_1080p), \
+             patch('encoder.load_keyframe_index', return_value=None), \
+             patch('encoder.schedule_keyframe_index'), \
+             patch('encoder.encode_mp4', side_effect=write_output):
+            self.assertEqual(gen_mp4('/path/to/source.mp4', 0, '23.4567', '100.0', 'output'), 'encode')
+
+        # Confirm new output written to its own file, other clip unchanged
+        with open(original, 'r', encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'original')
+        with open(os.path.join(tmp.name, 'output.mp4'), 'r', encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'new')
+
+    def test_generate(self):
+        # Mock ffmpeg, mock get_bitrate to return arbitrary value
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.run_ffmpeg'), \
+             patch('encoder.ffmpeg') as mock_ffmpeg:
+
+            # Mock ffmpeg.probe to return a lower bitrate than get_bitrate
+            mock_ffmpeg.probe.return_value = {'format': {'bit_rate': '1500000'}}
+
+            # Call function with mock arguments, should return True
+            self.assertTrue(gen_mp4(
+                '/path/to/source.mp4',
+                0,
+                '23.4567',
+                '100.0',
+                'output'
+            ))
+
+            # Confirm correct args passed to ffmpeg methods (source not indexed,
+            # seeks on input side to start)
+            mock_ffmpeg.input.assert_called_with('/path/to/source.mp4', ss='23.4567')
+            mock_ffmpeg.input.return_value.output.assert_called_with(
+                os.path.join(output_path, 'output.mp4'),
+                t='100.0',
+                vcodec="libx264",
+                b="1500000",
+                acodec="aac",
+                ac="2",
+                map=['0:v:0', '0:a:0']
+            )
+
+    def test_generate_fragmented(self):
+        # Mock ffmpeg, mock progressive download setting enabled
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.run_ffmpeg'), \
+             patch('encoder.ffmpeg') as mock_ffmpeg, \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_ffmpeg.probe.return_value = {'format': {'bit_rate': '1500000'}}
+            mock_addon.return_value.getSetting = lambda setting: 'true' if setting == 'progressive_download' else None
+
+            # Confirm output written as fragmented MP4
+            self.assertEqual(gen_mp4('/path/to/source.mp4', 0, '23.4567', '100.0', 'output'), 'encode')
+            mock_ffmpeg.input.return_value.output.assert_called_with(
+                os.path.join(output_path, 'output.mp4'),
+                t='100.0',
+                vcodec="libx264",
+                b="1500000",
+                acodec="aac",
+                ac="2",
+                map=['0:v:0', '0:a:0'],
+                movflags='frag_keyframe+empty_moov+default_base_moof'
+            )
+
+    def test_generate_cancelled(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+             patch('encoder.output_path', tmp), \
+             patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value={'format': {'bit_rate': '1500000'}}), \
+             patch('encoder.encode_mp4', side_effect=EncodeCancelled) as mock_encode_mp4:
+
+            # Create partial output file
+            with open(os.path.join(tmp, 'output.mp4'), 'w', encoding='utf-8'):
+                pass
+
+            # Confirm returns None, job passed to encode_mp4, partial output removed
+            job = Job(MagicMock(), ())
+            self.assertIsNone(gen_mp4('/path/to/source.mp4', 0, '23.4567', '100.0', 'output', job))
+            self.assertIs(mock_encode_mp4.call_args.kwargs['job'], job)
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_generate_error(self):
+        # Mock ffmpeg to raise exception, mock get_bitrate and ffmpeg.probe to return arbitrary values
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.ffmpeg.probe', return_value={'format': {'bit_rate': '1500000'}}), \
+             patch('encoder.ffmpeg.input', side_effect=ffmpeg.Error(cmd="", stdout="", stderr="".encode())):
+
+            # Call function with mock arguments, should return False
+            self.assertFalse(gen_mp4(
+                '/path/to/source.mp4',
+                0,
+                '23.4567',
+                '100.0',
+                'output'
+            ))
+
+    def test_generate_stream_copy(self):
+        # Mock compatible source, enable stream copy setting
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.ffmpeg.probe', return_value=mock_probe_h264_aac), \
+             patch('encoder.ffmpeg.input') as mock_input, \
+             patch('encoder.run_ffmpeg'), \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_stream_copy_setting
+
+            # Call function with mock arguments, should return remux mode
+            self.assertEqual(gen_mp4(
+                '/path/to/source.mp4',
+                0,
+                '23.4567',
+                '100.0',
+                'output'
+            ), 'remux')
+
+            # Confirm seeks on input side and copies streams
+            mock_input.assert_called_once_with('/path/to/source.mp4', ss='23.4567')
+            mock_input.return_value.output.assert_called_once_with(
+                os.path.join(output_path, 'output.mp4'),
+                t='100.0',
+                c="copy",
+                avoid_negative_ts="make_zero",
+                map=['0:v:0', '0:a:0']
+            )
+
+    def test_generate_stream_copy_disabled(self):
+        # Mock compatible source, leave stream copy setting disabled
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.ffmpeg.probe', return_value=mock_probe_h264_aac), \
+             patch('encoder.remux_mp4') as mock_remux_mp4, \
+             patch('encoder.encode_mp4') as mock_encode_mp4:
+
+            # Confirm re-encoded
+            self.assertEqual(gen_mp4('/path/to/source.mp4', 0, '23.4567', '100.0', 'output'), 'encode')
+            self.assertFalse(mock_remux_mp4.called)
+            self.assertTrue(mock_encode_mp4.called)
+
+    def test_generate_stream_copy_fallback(self):
+        # Mock compatible source, mock remux_mp4 to raise ffmpeg error
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.ffmpeg.probe', return_value=mock_probe_h264_aac), \
+             patch('encoder.remux_mp4', side_effect=ffmpeg.Error(cmd="", stdout="", stderr="".encode())), \
+             patch('encoder.encode_mp4') as mock_encode_mp4, \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_stream_copy_setting
+
+            # Confirm still succeeds, confirm fell back to re-encode
+            self.assertEqual(gen_mp4('/path/to/source.mp4', 0, '23.4567', '100.0', 'output'), 'encode')
+            mock_encode_mp4.assert_called_once_with(
+                '/path/to/source.mp4',
+                0,
+                '23.4567',
+                '100.0',
+                os.path.join(output_path, 'output.mp4'),
+                1500000,
+                None,
+                job=None,
+                video_options={}
+            )
+
+    def test_generate_smart_cut(self):
+        # Mock compatible source with keyframes inside clip, enable smart cut
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.ffmpeg.probe', return_value=mock_probe_h264_high), \
+             patch('encoder.get_keyframes', return_value=[30.0, 60.0, 90.0]) as mock_get_keyframes, \
+             patch('encoder.smart_cut_mp4') as mock_smart_cut_mp4, \
+             patch('encoder.remux_mp4') as mock_remux_mp4, \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_smart_cut_setting
+
+            # Confirm smart cut used with keyframes in clip range, source pixel
+            # format, and edge encoder settings matching source
+            self.assertEqual(gen_mp4('/path/to/source.mp4', 0, '23.4567', '100.0', 'output'), 'smartcut')
+            mock_get_keyframes.assert_called_once_with('/path/to/source.mp4', 23.4567, 123.4567)
+            mock_smart_cut_mp4.assert_called_once_with(
+                '/path/to/source.mp4',
+                0,
+                '23.4567',
+                '100.0',
+                os.path.join(output_path, 'output.mp4'),
+                1500000,
+                [30.0, 60.0, 90.0],
+                'yuv420p',
+                None,
+                {'profile:v': 'high', 'level': '4.1', 'refs': '4'}
+            )
+            self.assertFalse(mock_remux_mp4.called)
+
+    def test_generate_smart_cut_not_enough_keyframes(self):
+        # Mock compatible source with only 1 keyframe inside clip
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.ffmpeg.probe', return_value=mock_probe_h264_high), \
+             patch('encoder.get_keyframes', return_value=[30.0]), \
+             patch('encoder.smart_cut_mp4') as mock_smart_cut_mp4, \
+             patch('encoder.remux_mp4') as mock_remux_mp4, \
+             patch('encoder.encode_mp4') as mock_encode_mp4, \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_smart_cut_setting
+
+            # Confirm remuxed instead (no partial GOPs to re-encode)
+            self.assertEqual(gen_mp4('/path/to/source.mp4', 0, '23.4567', '100.0', 'output'), 'remux')
+            self.assertFalse(mock_smart_cut_mp4.called)
+            self.assertTrue(mock_remux_mp4.called)
+            self.assertFalse(mock_encode_mp4.called)
+
+    def test_generate_smart_cut_short_clip(self):
+        # Mock compatible source, request clip shorter than smart cut minimum
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.ffmpeg.probe', return_value=mock_probe_h264_high), \
+             patch('encoder.get_keyframes') as mock_get_keyframes, \
+             patch('encoder.remux_mp4') as mock_remux_mp4, \
+             patch('encoder.encode_mp4') as mock_encode_mp4, \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_smart_cut_setting
+
+            # Confirm remuxed without reading keyframes (not re-encoded)
+            self.assertEqual(gen_mp4('/path/to/source.mp4', 0, '23.4567', '5.0', 'output'), 'remux')
+            self.assertFalse(mock_get_keyframes.called)
+            mock_remux_mp4.assert_called_once_with(
+                '/path/to/source.mp4', 0, '23.4567', '5.0', os.path.join(output_path, 'output.mp4'), None
+            )
+            self.assertFalse(mock_encode_mp4.called)
+
+    def test_generate_smart_cut_incompatible_profile(self):
+        # Mock 10-bit source (edges can't be encoded with matching settings)
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.ffmpeg.probe', return_value=mock_probe_h264_aac), \
+             patch('encoder.get_keyframes') as mock_get_keyframes, \
+             patch('encoder.smart_cut_mp4') as mock_smart_cut_mp4, \
+             patch('encoder.remux_mp4') as mock_remux_mp4, \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_smart_cut_setting
+
+            # Confirm remuxed instead of smart cut, keyframes not read
+            self.assertEqual(gen_mp4('/path/to/source.mp4', 0, '23.4567', '100.0', 'output'), 'remux')
+            self.assertFalse(mock_get_keyframes.called)
+            self.assertFalse(mock_smart_cut_mp4.called)
+            self.assertTrue(mock_remux_mp4.called)
+
+    def test_get_smart_cut_options(self):
+        # Confirm options match source profile, level, and reference frames
+        self.assertEqual(
+            get_smart_cut_options(mock_probe_h264_high),
+            {'profile:v': 'high', 'level': '4.1', 'refs': '4'}
+        )
+        main = {'streams': [{'codec_type': 'video', 'profile': 'Main', 'level': 40, 'pix_fmt': 'yuv420p'}]}
+        self.assertEqual(get_smart_cut_options(main), {'profile:v': 'main', 'level': '4'})
+
+        # Confirm None if profile, pixel format, level, or scan type can't be matched
+        for stream in (
+            {'profile': 'High 10', 'level': 41, 'pix_fmt': 'yuv420p10le'},
+            {'profile': 'High', 'level': 41, 'pix_fmt': 'yuv420p10le'},
+            {'profile': 'High', 'level': -99, 'pix_fmt': 'yuv420p'},
+            {'profile': 'High', 'pix_fmt': 'yuv420p'},
+            {'profile': 'High', 'level': 41, 'pix_fmt': 'yuv420p', 'field_order': 'tt'},
+        ):
+            self.assertIsNone(get_smart_cut_options({'streams': [{'codec_type': 'video', **stream}]}))
+
+    def test_generate_smart_cut_fallback(self):
+        # Mock compatible source, mock smart_cut_mp4 to raise ffmpeg error
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.ffmpeg.probe', return_value=mock_probe_h264_high), \
+             patch('encoder.get_keyframes', return_value=[30.0, 60.0]), \
+             patch('encoder.smart_cut_mp4', side_effect=ffmpeg.Error(cmd="", stdout="", stderr="".encode())), \
+             patch('encoder.encode_mp4') as mock_encode_mp4, \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_smart_cut_setting
+
+            # Confirm fell back to re-encode
+            self.assertEqual(gen_mp4('/path/to/source.mp4', 0, '23.4567', '100.0', 'output'), 'encode')
+            self.assertTrue(mock_encode_mp4.called)
+
+    def test_generate_indexed_source(self):
+        # Mock keyframe index for source
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.load_keyframe_index', return_value=[0.0, 20.0, 40.0]), \
+             patch('encoder.schedule_keyframe_index') as mock_schedule, \
+             patch('encoder.run_ffmpeg'), \
+             patch('encoder.ffmpeg') as mock_ffmpeg:
+
+            mock_ffmpeg.probe.return_value = {'format': {'bit_rate': '1500000'}}
+            self.assertEqual(gen_mp4('/path/to/source.mp4', 0, '23.4567', '100.0', 'output'), 'encode')
+
+            # Confirm seeks on input side to keyframe before start, trims exactly on output side
+            mock_ffmpeg.input.assert_called_with('/path/to/source.mp4', ss=20.0)
+            self.assertEqual(mock_ffmpeg.input.return_value.output.call_args.kwargs['ss'], 3.4567)
+            self.assertEqual(mock_ffmpeg.input.return_value.output.call_args.kwargs['t'], '100.0')
+
+            # Confirm did not schedule index (already indexed)
+            self.assertFalse(mock_schedule.called)
+
+    def test_generate_segmented(self):
+        # Mock indexed source, clip long enough to split into 2 segments
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value=mock_probe_h264_aac), \
+             patch('encoder.load_keyframe_index', return_value=[float(i) for i in range(0, 400, 4)]), \
+             patch('encoder.get_segment_count', return_value=2), \
+             patch('encoder.segmented_encode_mp4') as mock_segmented, \
+             patch('encoder.encode_mp4') as mock_encode_mp4:
+
+            # Confirm segments split on keyframe, source pixel format used
+            self.assertEqual(gen_mp4('/path/to/source.mp4', 0, '10.0', '300.0', 'output'), 'segmented')
+            self.assertEqual(mock_segmented.call_args.args[6], [(10.0, 150.0), (160.0, 150.0)])
+            self.assertEqual(mock_segmented.call_args.args[7], 'yuv420p10le')
+            self.assertFalse(mock_encode_mp4.called)
+
+            # Confirm extra scheduler slot released after encode
+            self.assertEqual(scheduler.running, 0)
+
+            # Simulate no free scheduler slots, confirm encoded in one process
+            with patch('encoder.scheduler.acquire', return_value=False):
+                self.assertEqual(gen_mp4('/path/to/source.mp4', 0, '10.0', '300.0', 'output'), 'encode')
+                self.assertEqual(mock_segmented.call_count, 1)
+                self.assertTrue(mock_encode_mp4.called)
+
+    def test_generate_smart_cut_indexed_source(self):
+        # Mock compatible source with keyframe index, enable smart cut
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.ffmpeg.probe', return_value=mock_probe_h264_high), \
+             patch('encoder.load_keyframe_index', return_value=[0.0, 20.0, 40.0, 60.0, 200.0]), \
+             patch('encoder.get_keyframes') as mock_get_keyframes, \
+             patch('encoder.smart_cut_mp4') as mock_smart_cut_mp4, \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_smart_cut_setting
+
+            # Confirm keyframes inside clip read from index instead of source
+            self.assertEqual(gen_mp4('/path/to/source.mp4', 0, '23.4567', '100.0', 'output'), 'smartcut')
+            self.assertFalse(mock_get_keyframes.called)
+            self.assertEqual(mock_smart_cut_mp4.call_args.args[6], [40.0, 60.0])
+
+
+class TestGenMp4Batch(TestCase):
+    def test_generate_batch(self):
+        # Clips 7 seconds apart (within max gap)
+        clips = [('23.0', '10.0', 'clip1'), ('40.0', '5.0', 'clip2')]
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value={'format': {'bit_rate': '1500000'}}), \
+             patch('encoder.load_keyframe_index', return_value=[0.0, 20.0, 40.0]), \
+             patch('encoder.run_ffmpeg') as mock_run_ffmpeg, \
+             patch('encoder.ffmpeg') as mock_ffmpeg:
+
+            self.assertEqual(gen_mp4_batch('/path/to/source.mp4', 1, clips), ['batch', 'batch'])
+
+            # Confirm source read once from keyframe before earliest clip
+            mock_ffmpeg.input.assert_called_once_with('/path/to/source.mp4', ss=20.0)
+
+            # Confirm one output per clip, each trimmed exactly
+            outputs = mock_ffmpeg.input.return_value.output.call_args_list
+            self.assertEqual(len(outputs), 2)
+            self.assertEqual(outputs[0].args, (os.path.join(output_path, 'clip1.mp4'),))
+            self.assertEqual(outputs[0].kwargs['ss'], 3.0)
+            self.assertEqual(outputs[0].kwargs['t'], '10.0')
+            self.assertEqual(outputs[0].kwargs['map'], ['0:v:0', '0:a:1'])
+            self.assertEqual(outputs[1].args, (os.path.join(output_path, 'clip2.mp4'),))
+            self.assertEqual(outputs[1].kwargs['ss'], 20.0)
+            self.assertEqual(outputs[1].kwargs['t'], '5.0')
+
+            # Confirm all outputs written by a single ffmpeg process
+            self.assertEqual(len(mock_ffmpeg.merge_outputs.call_args.args), 2)
+            mock_run_ffmpeg.assert_called_once_with(mock_ffmpeg.merge_outputs.return_value, None, 10.0, (0.0, 1.0))
+
+    def test_generate_batch_distant_clips(self):
+        # Clips an hour apart, 2 overlapping clips near the start
+        clips = [('3600.0', '10.0', 'late'), ('23.0', '10.0', 'clip1'), ('30.0', '10.0', 'clip2')]
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value={'format': {'bit_rate': '1500000'}}), \
+             patch('encoder.load_keyframe_index', return_value=[0.0, 20.0, 3598.0]), \
+             patch('encoder.run_ffmpeg') as mock_run_ffmpeg, \
+             patch('encoder.ffmpeg') as mock_ffmpeg:
+
+            self.assertEqual(gen_mp4_batch('/path/to/source.mp4', 0, clips), ['batch', 'batch', 'batch'])
+
+            # Confirm distant clip encoded by separate pass seeking to its own
+            # keyframe (gap between clips never decoded)
+            self.assertEqual(mock_ffmpeg.input.call_args_list, [
+                call('/path/to/source.mp4', ss=20.0),
+                call('/path/to/source.mp4', ss=3598.0)
+            ])
+            outputs = mock_ffmpeg.input.return_value.output.call_args_list
+            self.assertEqual([output.args[0] for output in outputs], [
+                os.path.join(output_path, 'clip1.mp4'),
+                os.path.join(output_path, 'clip2.mp4'),
+                os.path.join(output_path, 'late.mp4')
+            ])
+            self.assertEqual(outputs[2].kwargs['ss'], 2.0)
+
+            # Confirm progress split between passes
+            self.assertEqual([c.args[3] for c in mock_run_ffmpeg.call_args_list], [(0.0, 0.5), (0.5, 1.0)])
+
+    def test_get_batch_groups(self):
+        # Confirm overlapping and nearby clips grouped, sorted by start
+        self.assertEqual(get_batch_groups([
+            ('100.0', '10.0', 'd'),
+            ('0.0', '10.0', 'a'),
+            ('15.0', '5.0', 'b'),
+            ('5.0', '2.0', 'c'),
+            ('31.0', '5.0', 'e')
+        ]), [[1, 3, 2], [4], [0]])
+
+    def test_generate_batch_stream_copy(self):
+        # Confirm compatible sources generated one clip at a time
+        clips = [('23.0', '10.0', 'clip1'), ('45.0', '5.0', 'clip2')]
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value=mock_probe_h264_aac), \
+             patch('encoder.gen_mp4', side_effect=['remux', 'smartcut']) as mock_gen_mp4, \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_stream_copy_setting
+            self.assertEqual(gen_mp4_batch('/path/to/source.mp4', 0, clips), ['remux', 'smartcut'])
+            mock_gen_mp4.assert_any_call('/path/to/source.mp4', 0, '45.0', '5.0', 'clip2', None)
+
+    def test_generate_batch_error(self):
+        clips = [('23.0', '10.0', 'clip1'), ('45.0', '5.0', 'clip2')]
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value={'format': {'bit_rate': '1500000'}}), \
+             patch('encoder.load_keyframe_index', return_value=None), \
+             patch('encoder.schedule_keyframe_index'), \
+             patch('encoder.ffmpeg.input'), \
+             patch('encoder.ffmpeg.merge_outputs'), \
+             patch('encoder.run_ffmpeg', side_effect=ffmpeg.Error(cmd="", stdout="", stderr="".encode())):
+
+            # Confirm every clip failed
+            self.assertEqual(gen_mp4_batch('/path/to/source.mp4', 0, clips), [None, None])
+
+
+# Mock ffprobe output for 1080p HEVC source
+mock_probe_1080p = {
+    'format': {'bit_rate': '8000000'},
+    'streams': [{'codec_type': 'video', 'codec_name': 'hevc', 'height': 1080}]
+}
+
+
+class TestGenMp4Renditions(TestCase):
+    def test_get_rendition_profiles(self):
+        with patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+            mock_addon.return_value.getSetting = lambda setting: 'true' if setting == 'rendition_480p' else 'false'
+            self.assertEqual(get_rendition_profiles(), ['480p'])
+
+    def test_generate_renditions(self):
+        renditions = [('clip', None), ('clip_480p', '480p'), ('clip_720p', '720p')]
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value=mock_probe_1080p), \
+             patch('encoder.load_keyframe_index', return_value=[0.0, 20.0, 40.0]), \
+             patch('encoder.run_ffmpeg') as mock_run_ffmpeg:
+
+            self.assertEqual(gen_mp4_renditions('/path/to/source.mkv', 1, '23.0', '10.0', renditions), 'renditions')
+
+            # Confirm source read once from keyframe, decoded video split between encoders
+            mock_run_ffmpeg.assert_called_once()
+            stream, job, duration = mock_run_ffmpeg.call_args.args
+            self.assertIsNone(job)
+            self.assertEqual(duration, '10.0')
+            args = stream.get_args()
+            self.assertEqual(args[:4], ['-ss', '20.0', '-i', '/path/to/source.mkv'])
+            self.assertEqual(args.count('-i'), 1)
+            graph = args[args.index('-filter_complex') + 1]
+            self.assertIn('split=3', graph)
+            self.assertIn('scale=-2:480', graph)
+            self.assertIn('scale=-2:720', graph)
+
+            # Confirm each output trimmed exactly, full quality at quality setting bitrate
+            for filename in ('clip.mp4', 'clip_480p.mp4', 'clip_720p.mp4'):
+                self.assertIn(os.path.join(output_path, filename), args)
+            self.assertEqual(args.count('3.0'), 3)
+            self.assertEqual(args.count('0:a:1'), 3)
+            bitrates = [args[i + 1] for i, arg in enumerate(args) if arg == '-b']
+            self.assertEqual(bitrates, ['2796202', '1000000', '2500000'])
+
+        # Confirm calibrated preset applied to every rendition
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value=mock_probe_1080p), \
+             patch('encoder.load_keyframe_index', return_value=[0.0, 20.0, 40.0]), \
+             patch('encoder.get_preset', return_value=('veryfast', 1.5)), \
+             patch('encoder.run_ffmpeg') as mock_run_ffmpeg:
+            gen_mp4_renditions('/path/to/source.mkv', 1, '23.0', '10.0', renditions)
+            args = mock_run_ffmpeg.call_args.args[0].get_args()
+            self.assertEqual([args[i + 1] for i, arg in enumerate(args) if arg == '-preset'], ['veryfast'] * 3)
+
+    def test_generate_single_rendition(self):
+        # Simulate regenerating 720p rendition of 480p source
+        probe = {'format': {'bit_rate': '1500000'}, 'streams': [{'codec_type': 'video', 'height': 480}]}
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value=probe), \
+             patch('encoder.load_keyframe_index', return_value=None), \
+             patch('encoder.schedule_keyframe_index'), \
+             patch('encoder.run_ffmpeg') as mock_run_ffmpeg:
+
+            self.assertEqual(gen_mp4_renditions('/path/to/source.mkv', 0, '23.0', '10.0', [('clip_720p', '720p')]), 'renditions')
+
+            # Confirm no split, source not upscaled, bitrate clamped to source
+            args = mock_run_ffmpeg.call_args.args[0].get_args()
+            self.assertNotIn('-filter_complex', args)
+            self.assertEqual(args[args.index('-b') + 1], '1500000')
+
+    def test_generate_renditions_error(self):
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+
+        # Simulate ffmpeg failing after writing first output
+        def fail(*_):
+            with open(os.path.join(tmp.name, 'clip.mp4'), 'w', encoding='utf-8'):
+                pass
+            raise ffmpeg.Error('ffmpeg', None, b'error')
+
+        with patch('encoder.output_path', tmp.name), \
+             patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value=mock_probe_1080p), \
+             patch('encoder.load_keyframe_index', return_value=[0.0]), \
+             patch('encoder.run_ffmpeg', side_effect=fail):
+
+            # Confirm failed, partial output removed (group is all or nothing)
+            self.assertIsNone(gen_mp4_renditions('/path/to/source.mkv', 0, '23.0', '10.0', [('clip', None), ('clip_480p', '480p')]))
+            self.assertEqual(os.listdir(tmp.name), [])
+
+
+class TestGenSnapshot(TestCase):
+    def test_generate_snapshot(self):
+        with patch('encoder.run_ffmpeg') as mock_run_ffmpeg:
+            self.assertEqual(gen_snapshot('/path/to/source.mkv', 123.4567, 'frame'), 'snapshot')
+
+            # Confirm seeks on input side, writes single full resolution frame
+            args = mock_run_ffmpeg.call_args.args[0].get_args()
+            self.assertEqual(args[:4], ['-ss', '123.4567', '-i', '/path/to/source.mkv'])
+            self.assertIn('-vframes', args)
+            self.assertNotIn('-vf', args)
+            self.assertEqual(args[-1], os.path.join(output_path, 'frame.jpg'))
+
+    def test_generate_snapshot_error(self):
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+
+        # Simulate ffmpeg failing after writing partial output
+        def fail(stream):
+            with open(stream.get_args()[-1], 'w', encoding='utf-8'):
+                pass
+            raise ffmpeg.Error('ffmpeg', None, b'error')
+
+        with patch('encoder.output_path', tmp.name), \
+             patch('encoder.run_ffmpeg', side_effect=fail):
+            self.assertIsNone(gen_snapshot('/path/to/source.mkv', 123.4567, 'frame'))
+            self.assertEqual(os.listdir(tmp.name), [])
+
+
+class TestPipeMp4(TestCase):
+    def test_pipe_encode(self):
+        # Mock incompatible source with keyframe index
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value={'format': {'bit_rate': '1500000'}, 'streams': []}), \
+             patch('encoder.load_keyframe_index', return_value=[0.0, 20.0, 40.0]), \
+             patch('encoder.ffmpeg.input') as mock_input:
+
+            # Confirm returns process and mode
+            process, mode = pipe_mp4('/path/to/source.mkv', 0, '23.4567', '100.0')
+            self.assertEqual(mode, 'encode')
+            mock_output = mock_input.return_value.output
+            self.assertIs(process, mock_output.return_value.global_args.return_value.run_async.return_value)
+
+            # Confirm seeks to indexed keyframe, writes fragmented MP4 to stdout
+            mock_input.assert_called_once_with('/path/to/source.mkv', ss=20.0)
+            mock_output.assert_called_once_with(
+                'pipe:1',
+                ss=3.4567,
+                t='100.0',
+                vcodec="libx264",
+                b="1500000",
+                acodec="aac",
+                ac="2",
+                map=['0:v:0', '0:a:0'],
+                f='mp4',
+                movflags='frag_keyframe+empty_moov+default_base_moof'
+            )
+            mock_output.return_value.global_args.return_value.run_async.assert_called_once_with(
+                cmd=['ffmpeg'],
+                pipe_stdout=True,
+                pipe_stderr=True
+            )
+
+        # Confirm calibrated preset applied
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value=mock_probe_1080p), \
+             patch('encoder.load_keyframe_index', return_value=[0.0]), \
+             patch('encoder.get_preset', return_value=('veryfast', 1.5)), \
+             patch('encoder.ffmpeg.input') as mock_input:
+            pipe_mp4('/path/to/source.mkv', 0, '23.4567', '100.0')
+            self.assertEqual(mock_input.return_value.output.call_args.kwargs['preset'], 'veryfast')
+
+    def test_pipe_remux(self):
+        # Mock compatible source, enable stream copy
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', return_value=mock_probe_h264_aac), \
+             patch('encoder.ffmpeg.input') as mock_input, \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_stream_copy_setting
+
+            # Confirm streams copied to stdout
+            _, mode = pipe_mp4('/path/to/source.mp4', 0, '23.4567', '100.0')
+            self.assertEqual(mode, 'remux')
+            mock_input.return_value.output.assert_called_once_with(
+                'pipe:1',
+                t='100.0',
+                c="copy",
+                avoid_negative_ts="make_zero",
+                map=['0:v:0', '0:a:0'],
+                f='mp4',
+                movflags='frag_keyframe+empty_moov+default_base_moof'
+            )
+
+    def test_pipe_error(self):
+        # Simulate ffprobe error, confirm returns None
+        with patch('encoder.get_bitrate', return_value=2796202), \
+             patch('encoder.probe_source', side_effect=ffmpeg.Error(cmd="", stdout="", stderr="".encode())):
+            self.assertIsNone(pipe_mp4('/path/to/source.mp4', 0, '23.4567', '100.0'))
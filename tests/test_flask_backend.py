@@ -1,25 +1,34 @@
 # pylint: disable=line-too-long, missing-module-docstring, missing-function-docstring
 
+import io
 import os
 import json
+import time
+import tempfile
 import socket
 import threading
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
-import ffmpeg
 from sqlalchemy.exc import OperationalError
 import mock_kodi_modules
+import flask_backend
 from paths import output_path, qr_path
+from jobs import Job
+from scheduler import scheduler, QueueFullError, REGENERATE, MAINTENANCE
 from flask_backend import (
     app,
-    get_bitrate,
     player,
-    gen_mp4,
     address_available,
     wait_for_address_release,
     run_server,
-    generate_qr_code_link
+    generate_qr_code_link,
+    add_ephemeral_clip,
+    stream_process_output,
+    generate_clip,
+    regenerate_clip,
+    regenerate_missing_clips
 )
+from database import get_fingerprint
 
 
 class TestAddressChecks(TestCase):
@@ -201,13 +210,44 @@ class TestEndpoints(TestCase):
     def setUp(self):
         self.app = app.test_client()
 
+        # Mock quality setting (used in clip fingerprint)
+        patcher = patch('flask_backend.get_bitrate', return_value=2796202)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_get_playtime(self):
         # Mock endpoint to return 123 seconds
-        with patch.object(player, 'getTime', return_value=123):
+        with patch.object(player, 'getTime', return_value=123), \
+             patch.object(player, 'getPlayingFile', return_value='/path/to/source.mp4'), \
+             patch('flask_backend.schedule_keyframe_index') as mock_schedule:
             response = self.app.get('/get_playtime')
             # Confirm contents and status code
             self.assertEqual(response.get_json(), {'playtime': 123})
             self.assertEqual(response.status_code, 200)
+            # Confirm started indexing playing file
+            mock_schedule.assert_called_once_with('/path/to/source.mp4')
+
+    def test_get_playtime_speculative(self):
+        # Mock speculative encoding setting enabled
+        def mock_get_settings(setting):
+            if setting == 'speculative_encoding':
+                return 'true'
+            return None
+
+        # Mock start_session to return session with known ID
+        with patch.object(player, 'getTime', return_value=123), \
+             patch.object(player, 'getPlayingFile', return_value='/path/to/source.mkv'), \
+             patch('flask_backend.schedule_keyframe_index'), \
+             patch('flask_backend.start_session', return_value=MagicMock(id='abc123')) as mock_start_session, \
+             patch('flask_backend.xbmc.executeJSONRPC', return_value='{"result": {"currentaudiostream": {"index": 1}}}'), \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_get_settings
+
+            # Confirm response contains session ID, session started with correct args
+            response = self.app.get('/get_playtime')
+            self.assertEqual(response.get_json(), {'playtime': 123, 'session_id': 'abc123'})
+            mock_start_session.assert_called_once_with('/path/to/source.mkv', 1, 123)
 
     def test_get_playtime_nothing_playing(self):
         # Mock endpoint to simulate nothing playing
@@ -277,12 +317,12 @@ class TestEndpoints(TestCase):
         payload = json.dumps({'startTime': '23.4567'})
 
         # Mock player object methods to return the mocked video_info_tag, current playtime
-        # Mock gen_mp4 to return True, mock log_generated_file to confirm correct args
+        # Mock gen_mp4 to return mode, mock log_generated_file to confirm correct args
         # Mock xbmc.executeJSONRPC (used to check audio track) to simulate first track
         with patch.object(player, 'getVideoInfoTag', return_value=mock_video_info_tag), \
              patch.object(player, 'getTime', return_value=123.4567), \
              patch.object(player, 'getPlayingFile', return_value='/path/to/source.mp4'), \
-             patch('flask_backend.gen_mp4', return_value=True), \
+             patch('batching.gen_mp4', return_value='encode'), \
              patch('flask_backend.log_generated_file', MagicMock()) as mock_log_generated_file, \
              patch('flask_backend.xbmc.executeJSONRPC', return_value='{"result": {"currentaudiostream": {"index": 0}}}'):
 
@@ -291,12 +331,18 @@ class TestEndpoints(TestCase):
                 data=payload,
                 content_type='application/json'
             )
-            # Confirm status code, confirm response contains 20 character random filename
-            self.assertEqual(response.status_code, 200)
+            # Confirm status code, confirm response contains job ID and 20 character random filename
+            self.assertEqual(response.status_code, 202)
             data = response.get_json()
             self.assertEqual(type(data), dict)
+            self.assertIn('job_id', data)
             self.assertEqual(len(data['filename']), 20)
 
+            # Wait for job to finish, confirm result contains same filename and mode
+            response = self.app.get(f"/jobs/{data['job_id']}/result")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json(), {'filename': data['filename'], 'mode': 'encode'})
+
             # Confirm log_generated_file was called with correct arguments
             self.assertTrue(mock_log_generated_file.called_once)
             mock_log_generated_file.assert_called_with(
@@ -306,9 +352,257 @@ class TestEndpoints(TestCase):
                 '100.0',
                 data['filename'].replace('.mp4', ''),
                 'Show Name',
-                'Episode Name'
+                'Episode Name',
+                get_fingerprint('/path/to/source.mp4', 0, '23.4567', '100.0', 2796202),
+                renditions=[]
+            )
+
+    def test_submit_duplicate(self):
+        # Simulate identical clip (same fingerprint) already on disk
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+        existing = os.path.join(tmp.name, 'existing.mp4')
+        with open(existing, 'w', encoding='utf-8') as file:
+            file.write('clip')
+
+        mock_video_info_tag = MagicMock()
+        mock_video_info_tag.getTVShowTitle.return_value = "Show Name"
+        mock_video_info_tag.getTitle.return_value = "Episode Name"
+
+        payload = json.dumps({'startTime': '23.4567'})
+        with patch('flask_backend.output_path', tmp.name), \
+             patch.object(player, 'getVideoInfoTag', return_value=mock_video_info_tag), \
+             patch.object(player, 'getTime', return_value=123.4567), \
+             patch.object(player, 'getPlayingFile', return_value='/path/to/source.mp4'), \
+             patch('flask_backend.get_fingerprint_matches', return_value=['missing.mp4', 'existing.mp4']) as mock_matches, \
+             patch('batching.gen_mp4') as mock_gen_mp4, \
+             patch('flask_backend.log_generated_file') as mock_log_generated_file, \
+             patch('flask_backend.xbmc.executeJSONRPC', return_value='{"result": {"currentaudiostream": {"index": 0}}}'):
+
+            response = self.app.post('/submit', data=payload, content_type='application/json')
+            data = response.get_json()
+            response = self.app.get(f"/jobs/{data['job_id']}/result")
+            self.assertEqual(response.get_json(), {'filename': data['filename'], 'mode': 'dedup'})
+
+            # Confirm looked up by fingerprint, existing clip hard linked instead of encoding
+            fingerprint = get_fingerprint('/path/to/source.mp4', 0, '23.4567', '100.0', 2796202)
+            mock_matches.assert_called_once_with(fingerprint)
+            self.assertFalse(mock_gen_mp4.called)
+            output = os.path.join(tmp.name, data['filename'])
+            self.assertEqual(os.stat(output).st_ino, os.stat(existing).st_ino)
+
+            # Confirm new clip logged with same fingerprint
+            self.assertEqual(mock_log_generated_file.call_args.args[7], fingerprint)
+
+    def test_submit_speculative(self):
+        # Create mock speculative session that finalizes successfully
+        mock_session = MagicMock()
+        mock_session.matches.return_value = True
+        mock_session.finalize.return_value = True
+
+        # Create mock request payload with session ID
+        payload = json.dumps({'startTime': '23.4567', 'sessionId': 'abc123'})
+
+        with patch.object(player, 'getVideoInfoTag', return_value=MagicMock()), \
+             patch.object(player, 'getTime', return_value=123.4567), \
+             patch.object(player, 'getPlayingFile', return_value='/path/to/source.mkv'), \
+             patch('flask_backend.pop_session', return_value=mock_session) as mock_pop_session, \
+             patch('batching.gen_mp4') as mock_gen_mp4, \
+             patch('flask_backend.log_generated_file') as mock_log_generated_file, \
+             patch('flask_backend.xbmc.executeJSONRPC', return_value='{"result": {"currentaudiostream": {"index": 0}}}'):
+
+            response = self.app.post('/submit', data=payload, content_type='application/json')
+            self.assertEqual(response.status_code, 202)
+            mock_pop_session.assert_called_once_with('abc123')
+
+            # Wait for job, confirm session finalized instead of calling gen_mp4
+            data = response.get_json()
+            response = self.app.get(f"/jobs/{data['job_id']}/result")
+            self.assertEqual(response.get_json(), {'filename': data['filename'], 'mode': 'speculative'})
+            mock_session.finalize.assert_called_once_with(100.0, data['filename'].replace('.mp4', ''))
+            self.assertFalse(mock_gen_mp4.called)
+            self.assertTrue(mock_log_generated_file.called)
+
+    def test_submit_speculative_source_changed(self):
+        # Create mock speculative session started with different source
+        mock_session = MagicMock()
+        mock_session.matches.return_value = False
+
+        # Create mock request payload with session ID
+        payload = json.dumps({'startTime': '23.4567', 'sessionId': 'abc123'})
+
+        with patch.object(player, 'getVideoInfoTag', return_value=MagicMock()), \
+             patch.object(player, 'getTime', return_value=123.4567), \
+             patch.object(player, 'getPlayingFile', return_value='/path/to/source.mkv'), \
+             patch('flask_backend.pop_session', return_value=mock_session), \
+             patch('batching.gen_mp4', return_value='encode') as mock_gen_mp4, \
+             patch('flask_backend.log_generated_file'), \
+             patch('flask_backend.xbmc.executeJSONRPC', return_value='{"result": {"currentaudiostream": {"index": 0}}}'):
+
+            response = self.app.post('/submit', data=payload, content_type='application/json')
+
+            # Confirm session cancelled, clip generated normally
+            mock_session.cancel.assert_called_once()
+            response = self.app.get(f"/jobs/{response.get_json()['job_id']}/result")
+            self.assertEqual(response.get_json()['mode'], 'encode')
+            self.assertFalse(mock_session.finalize.called)
+            self.assertTrue(mock_gen_mp4.called)
+
+    def test_submit_ephemeral(self):
+        # Mock ephemeral clips setting enabled
+        def mock_get_settings(setting):
+            if setting == 'ephemeral_clips':
+                return 'true'
+            return None
+
+        with patch.object(player, 'getVideoInfoTag', return_value=MagicMock()), \
+             patch.object(player, 'getTime', return_value=123.4567), \
+             patch.object(player, 'getPlayingFile', return_value='/path/to/source.mkv'), \
+             patch('batching.gen_mp4') as mock_gen_mp4, \
+             patch('flask_backend.log_generated_file') as mock_log_generated_file, \
+             patch('flask_backend.pipe_mp4') as mock_pipe_mp4, \
+             patch('flask_backend.xbmc.executeJSONRPC', return_value='{"result": {"currentaudiostream": {"index": 1}}}'), \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_get_settings
+
+            # Confirm returns stream URL instead of job ID, clip logged but not generated
+            response = self.app.post('/submit', data=json.dumps({'startTime': '23.4567'}), content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            data = response.get_json()
+            self.assertNotIn('job_id', data)
+            self.assertTrue(data['stream'].startswith('ephemeral/'))
+            self.assertFalse(mock_gen_mp4.called)
+            self.assertEqual(mock_log_generated_file.call_args.args[:5], (
+                '/path/to/source.mkv',
+                1,
+                '23.4567',
+                '100.0',
+                data['filename'].replace('.mp4', '')
+            ))
+
+            # Confirm fingerprint logged (regenerated clip can be deduplicated)
+            self.assertEqual(
+                mock_log_generated_file.call_args.args[7],
+                get_fingerprint('/path/to/source.mkv', 1, '23.4567', '100.0', 2796202)
             )
 
+            # Mock ffmpeg process writing output to stdout
+            mock_process = MagicMock()
+            mock_process.stdout = io.BytesIO(b'ftypmoovmoofmdat')
+            mock_process.communicate.return_value = (b'', b'')
+            mock_process.returncode = 0
+            mock_pipe_mp4.return_value = (mock_process, 'encode')
+
+            # Download clip, confirm received ffmpeg output and correct args
+            response = self.app.get(f"/{data['stream']}")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, b'ftypmoovmoofmdat')
+            self.assertIn(f"filename={data['filename']}", response.headers['Content-Disposition'])
+            mock_pipe_mp4.assert_called_once_with('/path/to/source.mkv', 1, '23.4567', '100.0')
+
+            # Confirm scheduler slot held until response closed, ffmpeg not killed
+            self.assertEqual(scheduler.running, 1)
+            response.close()
+            self.assertEqual(scheduler.running, 0)
+            self.assertFalse(mock_process.kill.called)
+
+            # Confirm can only be downloaded once
+            response = self.app.get(f"/{data['stream']}")
+            self.assertEqual(response.status_code, 404)
+
+    def test_ephemeral_download_ffmpeg_error(self):
+        # Add mock ephemeral clip, mock pipe_mp4 to simulate ffmpeg error
+        with patch('flask_backend.log_generated_file'), \
+             patch('flask_backend.pipe_mp4', return_value=None):
+
+            data = add_ephemeral_clip('/path/to/source.mkv', 0, '23.4567', '100.0', 'clip', '', '')
+            response = self.app.get(f"/{data['stream']}")
+            self.assertEqual(response.status_code, 500)
+
+            # Confirm scheduler slot released
+            self.assertEqual(scheduler.running, 0)
+
+    def test_ephemeral_download_exception(self):
+        # Mock pipe_mp4 to raise unexpected error (e.g. ffmpeg binary missing)
+        with patch('flask_backend.log_generated_file'), \
+             patch('flask_backend.pipe_mp4', side_effect=OSError('ffmpeg not found')):
+
+            data = add_ephemeral_clip('/path/to/source.mkv', 0, '23.4567', '100.0', 'clip', '', '')
+            response = self.app.get(f"/{data['stream']}")
+            self.assertEqual(response.status_code, 500)
+
+            # Confirm scheduler slot released
+            self.assertEqual(scheduler.running, 0)
+
+    def test_ephemeral_download_queue_full(self):
+        # Simulate scheduler queue saturated
+        with patch('flask_backend.log_generated_file'), \
+             patch('flask_backend.pipe_mp4', return_value=None) as mock_pipe_mp4, \
+             patch('flask_backend.scheduler.admit', side_effect=QueueFullError(30)):
+
+            # Confirm 429 with Retry-After header, slot not taken
+            data = add_ephemeral_clip('/path/to/source.mkv', 0, '23.4567', '100.0', 'clip', '', '')
+            response = self.app.get(f"/{data['stream']}")
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers['Retry-After'], '30')
+            self.assertFalse(mock_pipe_mp4.called)
+            self.assertEqual(scheduler.running, 0)
+
+        # Confirm clip can still be downloaded once queue has room
+        with patch('flask_backend.pipe_mp4', return_value=None) as mock_pipe_mp4:
+            self.app.get(f"/{data['stream']}")
+            self.assertTrue(mock_pipe_mp4.called)
+
+    def test_stream_process_output_disconnected(self):
+        # Mock ffmpeg process with more output than client reads
+        mock_process = MagicMock()
+        mock_process.stdout = io.BytesIO(b'0' * 200000)
+        mock_process.communicate.return_value = (b'', b'')
+
+        # Read first chunk then close generator (simulate client disconnect)
+        generator = stream_process_output(mock_process)
+        self.assertEqual(len(next(generator)), 65536)
+        generator.close()
+
+        # Confirm ffmpeg killed
+        mock_process.kill.assert_called_once()
+
+    def test_submit_queue_full(self):
+        # Simulate scheduler queue saturated
+        with patch.object(player, 'getTime', return_value=123.4567), \
+             patch('flask_backend.scheduler.admit', side_effect=QueueFullError(45)), \
+             patch('flask_backend.submit_job') as mock_submit_job:
+
+            # Confirm 429 with Retry-After header, job not queued
+            response = self.app.post('/submit', data=json.dumps({'startTime': '23.4567'}), content_type='application/json')
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers['Retry-After'], '45')
+            self.assertEqual(response.get_json()['retry_after'], 45)
+            self.assertFalse(mock_submit_job.called)
+
+    def test_regenerate_queue_full(self):
+        # Simulate scheduler queue saturated, confirm 429
+        with patch('flask_backend.scheduler.admit', side_effect=QueueFullError(10)) as mock_admit:
+            response = self.app.post('/regenerate', data=json.dumps({'filename': 'clip.mp4'}), content_type='application/json')
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers['Retry-After'], '10')
+            mock_admit.assert_called_once_with(REGENERATE)
+
+    def test_queue_status(self):
+        # Confirm returns scheduler stats
+        response = self.app.get('/queue')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['queued'], 0)
+        self.assertIn('estimated_wait', response.get_json())
+
+    def test_history_cache_status(self):
+        # Confirm returns history read cache stats
+        response = self.app.get('/history_cache')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hits', response.get_json())
+        self.assertIn('misses', response.get_json())
+
     def test_submit_sql_error(self):
         # Create mock video_info_tag simulating TV show playing
         mock_video_info_tag = MagicMock()
@@ -324,7 +618,7 @@ class TestEndpoints(TestCase):
         with patch.object(player, 'getVideoInfoTag', return_value=mock_video_info_tag), \
              patch.object(player, 'getTime', return_value=123.4567), \
              patch.object(player, 'getPlayingFile', return_value='/path/to/source.mp4'), \
-             patch('flask_backend.gen_mp4', return_value=True), \
+             patch('batching.gen_mp4', return_value=True), \
              patch('flask_backend.log_generated_file', side_effect=OperationalError("", "", "Database locked")), \
              patch('flask_backend.xbmc.executeJSONRPC', return_value='{"result": {"currentaudiostream": {"index": 0}}}'):
 
@@ -333,7 +627,11 @@ class TestEndpoints(TestCase):
                 data=payload,
                 content_type='application/json'
             )
-            # Confirm status code and error response
+            # Confirm job queued
+            self.assertEqual(response.status_code, 202)
+
+            # Wait for job to finish, confirm status code and error response
+            response = self.app.get(f"/jobs/{response.get_json()['job_id']}/result")
             self.assertEqual(response.status_code, 500)
             self.assertEqual(
                 response.get_json(),
@@ -354,12 +652,120 @@ class TestEndpoints(TestCase):
                 {'error': 'Unable to generate file, see Kodi logs for details'}
             )
 
+    def test_submit_renditions(self):
+        # Simulate 480p rendition enabled, speculative session started
+        mock_session = MagicMock()
+        with patch('flask_backend.get_rendition_profiles', return_value=['480p']), \
+             patch('flask_backend.gen_mp4_renditions', return_value='renditions') as mock_gen_renditions, \
+             patch('flask_backend.log_generated_file') as mock_log_generated_file, \
+             patch('batching.gen_mp4') as mock_gen_mp4:
+
+            job = Job(generate_clip, ('/path/to/source.mp4', 0, '23.4567', '100.0', 'clip', 'Show Name', 'Episode Name', mock_session))
+            job.run()
+
+            # Confirm full quality clip and rendition generated in one pass
+            self.assertEqual(job.result, {'filename': 'clip.mp4', 'mode': 'renditions', 'renditions': ['clip_480p.mp4']})
+            self.assertEqual(mock_gen_renditions.call_args.args[4], [('clip', None), ('clip_480p', '480p')])
+            self.assertFalse(mock_gen_mp4.called)
+            mock_session.cancel.assert_called_once()
+
+            # Confirm rendition logged linked to clip
+            self.assertEqual(mock_log_generated_file.call_args.kwargs['renditions'], [('clip_480p', '480p')])
+
+    def test_regenerate_rendition(self):
+        mock_entry = MagicMock(source='/path/to/source.mp4', audio_track=0, start_time=23.4567, duration=100.0, media_type='clip', rendition='480p')
+        with patch('flask_backend.get_orm_entry', return_value=mock_entry), \
+             patch('flask_backend.gen_mp4_renditions', return_value='renditions') as mock_gen_renditions:
+
+            response = self.app.post(
+                '/regenerate',
+                data=json.dumps({'filename': 'clip_480p.mp4'}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 202)
+
+            # Confirm only rendition regenerated
+            response = self.app.get(f"/jobs/{response.get_json()['job_id']}/result")
+            self.assertEqual(response.get_json(), {'filename': 'clip_480p.mp4', 'mode': 'renditions'})
+            self.assertEqual(mock_gen_renditions.call_args.args[:5], ('/path/to/source.mp4', 0, 23.4567, 100.0, [('clip_480p', '480p')]))
+            self.assertEqual(scheduler.running, 0)
+
+    def test_snapshot(self):
+        mock_video_info_tag = MagicMock()
+        mock_video_info_tag.getTVShowTitle.return_value = "Show Name"
+        mock_video_info_tag.getTitle.return_value = "Episode Name"
+
+        with patch.object(player, 'getVideoInfoTag', return_value=mock_video_info_tag), \
+             patch.object(player, 'getTime', return_value=123.4567), \
+             patch.object(player, 'getPlayingFile', return_value='/path/to/source.mp4'), \
+             patch('flask_backend.gen_snapshot', return_value='snapshot') as mock_gen_snapshot, \
+             patch('flask_backend.log_generated_file') as mock_log_generated_file:
+
+            # Confirm returns JPEG filename immediately (no job)
+            response = self.app.post('/snapshot')
+            self.assertEqual(response.status_code, 200)
+            data = response.get_json()
+            self.assertEqual(data['mode'], 'snapshot')
+            self.assertTrue(data['filename'].endswith('.jpg'))
+            self.assertEqual(len(data['filename']), 20)
+
+            # Confirm frame at current playtime extracted, logged as snapshot
+            filename = data['filename'].replace('.jpg', '')
+            mock_gen_snapshot.assert_called_once_with('/path/to/source.mp4', 123.4567, filename)
+            mock_log_generated_file.assert_called_once_with(
+                '/path/to/source.mp4',
+                0,
+                123.4567,
+                0,
+                filename,
+                'Show Name',
+                'Episode Name',
+                media_type='snapshot'
+            )
+
+            # Confirm not logged if ffmpeg failed
+            mock_gen_snapshot.return_value = None
+            mock_log_generated_file.reset_mock()
+            response = self.app.post('/snapshot')
+            self.assertEqual(response.status_code, 500)
+            self.assertFalse(mock_log_generated_file.called)
+
+    def test_snapshot_nothing_playing(self):
+        with patch.object(player, 'getTime', side_effect=RuntimeError("Nothing is playing")):
+            response = self.app.post('/snapshot')
+            self.assertEqual(response.status_code, 500)
+            self.assertEqual(
+                response.get_json(),
+                {'error': 'Unable to generate snapshot, see Kodi logs for details'}
+            )
+
+    def test_regenerate_snapshot(self):
+        mock_entry = MagicMock(source='/path/to/source.mp4', start_time=123.4567, media_type='snapshot', rendition=None)
+        with patch('flask_backend.get_orm_entry', return_value=mock_entry), \
+             patch('flask_backend.gen_snapshot', return_value='snapshot') as mock_gen_snapshot, \
+             patch('batching.gen_mp4') as mock_gen_mp4:
+
+            response = self.app.post(
+                '/regenerate',
+                data=json.dumps({'filename': 'frame.jpg'}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.get_json()['filename'], 'frame.jpg')
+
+            # Confirm frame extracted again instead of generating clip
+            response = self.app.get(f"/jobs/{response.get_json()['job_id']}/result")
+            self.assertEqual(response.get_json(), {'filename': 'frame.jpg', 'mode': 'snapshot'})
+            mock_gen_snapshot.assert_called_once_with('/path/to/source.mp4', 123.4567, 'frame')
+            self.assertFalse(mock_gen_mp4.called)
+
     def test_regenerate(self):
         # Create mock request payload
         payload = json.dumps({'filename': 'target_file'})
 
         # Create mock ORM entry
         mock_entry = MagicMock()
+        mock_entry.rendition = None
         mock_entry.source = "/path/to/source.mp4"
         mock_entry.start_time = "100"
         mock_entry.duration = "10"
@@ -368,7 +774,7 @@ class TestEndpoints(TestCase):
 
         # Mock get_orm_entry to return mocked entry
         with patch('flask_backend.get_orm_entry', return_value=mock_entry), \
-             patch('flask_backend.gen_mp4', return_value=True), \
+             patch('batching.gen_mp4', return_value='remux'), \
              patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
 
             # Mock quality setting to 20 MB/min
@@ -380,12 +786,43 @@ class TestEndpoints(TestCase):
                 content_type='application/json'
             )
             # Confirm status code and response
-            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.status_code, 202)
             self.assertEqual(
                 response.get_json()['filename'],
                 'target_file.mp4'
             )
 
+            # Wait for job to finish, confirm result contains filename and mode
+            response = self.app.get(f"/jobs/{response.get_json()['job_id']}/result")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.get_json(),
+                {'filename': 'target_file.mp4', 'mode': 'remux'}
+            )
+
+    def test_regenerate_ffmpeg_error(self):
+        # Create mock request payload
+        payload = json.dumps({'filename': 'target_file'})
+
+        # Mock get_orm_entry to return mocked entry, mock gen_mp4 to simulate ffmpeg error
+        with patch('flask_backend.get_orm_entry', return_value=MagicMock(rendition=None)), \
+             patch('batching.gen_mp4', return_value=None):
+
+            response = self.app.post(
+                '/regenerate',
+                data=payload,
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 202)
+
+            # Wait for job to finish, confirm status code and error response
+            response = self.app.get(f"/jobs/{response.get_json()['job_id']}/result")
+            self.assertEqual(response.status_code, 500)
+            self.assertEqual(
+                response.get_json(),
+                {'error': 'Unable to generate file, see Kodi logs for details'}
+            )
+
     def test_regenerate_sql_error(self):
         # Create mock request payload
         payload = json.dumps({'filename': 'target_file'})
@@ -404,6 +841,292 @@ class TestEndpoints(TestCase):
                 {'error': 'Unable to generate file, see Kodi logs for details'}
             )
 
+    def test_job_status(self):
+        # Mock get_job to return job that is still running
+        mock_job = MagicMock()
+        mock_job.to_dict.return_value = {'job_id': 'abc', 'status': 'running', 'result': None}
+        with patch('flask_backend.get_job', return_value=mock_job):
+            response = self.app.get('/jobs/abc')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()['status'], 'running')
+
+    def test_job_status_not_found(self):
+        # Confirm 404 for unknown job ID
+        response = self.app.get('/jobs/unknown')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_json(), {'error': 'Job not found'})
+        response = self.app.get('/jobs/unknown/result')
+        self.assertEqual(response.status_code, 404)
+
+    def test_job_result_timeout(self):
+        # Mock get_job to return job that does not finish before timeout
+        mock_job = MagicMock()
+        mock_job.wait.return_value = False
+        mock_job.to_dict.return_value = {'job_id': 'abc', 'status': 'queued', 'result': None}
+        with patch('flask_backend.get_job', return_value=mock_job):
+            # Confirm 202 with current status, confirm timeout query param used
+            response = self.app.get('/jobs/abc/result?timeout=1')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.get_json()['status'], 'queued')
+            mock_job.wait.assert_called_once_with(1.0)
+
+            # Confirm timeout clamped to 0-60 seconds
+            self.app.get('/jobs/abc/result?timeout=-5')
+            mock_job.wait.assert_called_with(0)
+            self.app.get('/jobs/abc/result?timeout=600')
+            mock_job.wait.assert_called_with(60)
+
+            # Confirm 400 if timeout is not a number
+            for timeout in ('abc', 'nan', ''):
+                response = self.app.get(f'/jobs/abc/result?timeout={timeout}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.get_json(), {'error': 'timeout must be a number'})
+            self.assertEqual(mock_job.wait.call_count, 3)
+
+    def test_submit_progressive_download(self):
+        # Mock progressive download setting enabled
+        def mock_get_settings(setting):
+            if setting == 'progressive_download':
+                return 'true'
+            return None
+
+        with patch.object(player, 'getVideoInfoTag', return_value=MagicMock()), \
+             patch.object(player, 'getTime', return_value=123.4567), \
+             patch.object(player, 'getPlayingFile', return_value='/path/to/source.mkv'), \
+             patch('flask_backend.submit_job', return_value=Job(MagicMock(), (), '/output/clip.mp4')) as mock_submit_job, \
+             patch('flask_backend.xbmc.executeJSONRPC', return_value='{"result": {"currentaudiostream": {"index": 0}}}'), \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting = mock_get_settings
+
+            # Confirm response contains stream URL, job output is full path
+            response = self.app.post('/submit', data=json.dumps({'startTime': '23.4567'}), content_type='application/json')
+            self.assertEqual(response.status_code, 202)
+            data = response.get_json()
+            self.assertEqual(data['stream'], f"jobs/{data['job_id']}/download")
+            self.assertEqual(
+                mock_submit_job.call_args.kwargs['output'],
+                os.path.join(output_path, data['filename'])
+            )
+
+    def test_job_download(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'clip.mp4')
+
+            # Simulate ffmpeg writing fragments to output over time
+            def write_fragments():
+                with open(output, 'wb') as file:
+                    for i in range(3):
+                        file.write(f'fragment{i}'.encode())
+                        file.flush()
+                        time.sleep(0.3)
+                return {'filename': 'clip.mp4'}
+
+            # Start job in background thread, request stream immediately
+            job = Job(write_fragments, (), output)
+            threading.Thread(target=job.run).start()
+            with patch('flask_backend.get_job', return_value=job):
+                response = self.app.get(f'/jobs/{job.id}/download')
+
+                # Confirm received all fragments written while job was running
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.mimetype, 'video/mp4')
+                self.assertEqual(response.data, b'fragment0fragment1fragment2')
+                self.assertIn('filename=clip.mp4', response.headers['Content-Disposition'])
+                self.assertTrue(job.finished.is_set())
+
+    def test_job_download_no_output(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # Simulate job that fails before creating output
+            job = Job(MagicMock(return_value=None), (), os.path.join(tmp, 'clip.mp4'))
+            job.run()
+            with patch('flask_backend.get_job', return_value=job):
+                response = self.app.get(f'/jobs/{job.id}/download')
+                self.assertEqual(response.data, b'')
+
+    def test_job_download_not_streamable(self):
+        # Confirm 404 if job does not exist or output can't be streamed
+        response = self.app.get('/jobs/unknown/download')
+        self.assertEqual(response.status_code, 404)
+        with patch('flask_backend.get_job', return_value=Job(MagicMock(), ())):
+            response = self.app.get('/jobs/abc/download')
+            self.assertEqual(response.status_code, 404)
+
+    def test_job_result_cancelled(self):
+        # Submit job that is cancelled before it runs
+        job = Job(MagicMock(), ())
+        job.cancel()
+        job.run()
+        with patch('flask_backend.get_job', return_value=job):
+            response = self.app.get(f'/jobs/{job.id}/result')
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.get_json()['status'], 'cancelled')
+
+    def test_job_events(self):
+        # Simulate running job 40% done
+        job = Job(MagicMock(), ())
+        job.status = 'running'
+        job.update_progress(0.4)
+
+        # Finish job after first event is sent
+        def finish_job(*_):
+            job.result = {'filename': 'clip.mp4'}
+            job.finish()
+            return True
+
+        with patch('flask_backend.get_job', return_value=job), \
+             patch.object(job, 'wait', side_effect=finish_job):
+            response = self.app.get(f'/jobs/{job.id}/events')
+            self.assertEqual(response.mimetype, 'text/event-stream')
+
+            # Confirm progress event followed by done event with result
+            events = response.data.decode().strip().split('\n\n')
+            self.assertEqual(len(events), 2)
+            progress = json.loads(events[0].removeprefix('data: '))
+            self.assertEqual(progress['status'], 'running')
+            self.assertEqual(progress['progress']['percent'], 40.0)
+            self.assertIn('queue', progress)
+            self.assertTrue(events[1].startswith('event: done\ndata: '))
+            done = json.loads(events[1].split('data: ')[1])
+            self.assertEqual(done['status'], 'complete')
+            self.assertEqual(done['result'], {'filename': 'clip.mp4'})
+
+    def test_job_cancel(self):
+        # Simulate running job with ffmpeg process
+        job = Job(MagicMock(), ())
+        process = MagicMock()
+        job.add_process(process)
+
+        with patch('flask_backend.get_job', return_value=job):
+            # Confirm ffmpeg killed
+            response = self.app.post(f'/jobs/{job.id}/cancel')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()['status'], 'cancelling')
+            process.kill.assert_called_once()
+
+            # Confirm 409 if job already finished
+            job.run()
+            response = self.app.post(f'/jobs/{job.id}/cancel')
+            self.assertEqual(response.status_code, 409)
+
+        # Confirm 404 if job does not exist
+        self.assertEqual(self.app.get('/jobs/unknown/events').status_code, 404)
+        self.assertEqual(self.app.post('/jobs/unknown/cancel').status_code, 404)
+
+    def test_regenerate_duplicate(self):
+        # Simulate renamed clip with identical parameters still on disk
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+        with open(os.path.join(tmp.name, 'renamed.mp4'), 'w', encoding='utf-8') as file:
+            file.write('clip')
+
+        with patch('flask_backend.output_path', tmp.name), \
+             patch('flask_backend.get_fingerprint_matches', return_value=['renamed.mp4']), \
+             patch('flask_backend.set_fingerprint') as mock_set_fingerprint, \
+             patch('batching.gen_mp4') as mock_gen_mp4:
+
+            # Confirm linked instead of encoding, fingerprint updated
+            result = regenerate_clip('/path/to/source.mp4', 0, 23.4567, 100.0, 'deleted', 'deleted.mp4')
+            self.assertEqual(result, {'filename': 'deleted.mp4', 'mode': 'dedup'})
+            self.assertFalse(mock_gen_mp4.called)
+            self.assertTrue(os.path.exists(os.path.join(tmp.name, 'deleted.mp4')))
+            mock_set_fingerprint.assert_called_once_with(
+                'deleted.mp4',
+                get_fingerprint('/path/to/source.mp4', 0, 23.4567, 100.0, 2796202)
+            )
+
+    def test_regenerate_missing(self):
+        job = Job(MagicMock(), ())
+        with patch('flask_backend.submit_unique_job', return_value=job) as mock_submit_job:
+            response = self.app.post('/regenerate_missing')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.get_json()['job_id'], job.id)
+            self.assertIn('queue', response.get_json())
+            mock_submit_job.assert_called_once_with(regenerate_missing_clips)
+
+    def test_calibrate(self):
+        # Confirm starts calibration even if already calibrated, returns job
+        job = Job(MagicMock(), ())
+        with patch('flask_backend.start_calibration', return_value=job) as mock_start_calibration:
+            response = self.app.post('/calibrate')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.get_json()['job_id'], job.id)
+            mock_start_calibration.assert_called_once_with(force=True)
+
+    def test_calibration_status(self):
+        stats = {'enabled': True, 'target': 1.0, 'calibration': None, 'presets': {}}
+        with patch('flask_backend.get_calibration_stats', return_value=stats):
+            response = self.app.get('/calibration')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json(), stats)
+
+    def test_regenerate_missing_clips(self):
+        # Simulate 3 missing clips (already sorted by source), second fails
+        entries = [
+            MagicMock(source='/path/to/a.mkv', audio_track=0, start_time=10.0, duration=5.0, output='a1.mp4', rendition=None),
+            MagicMock(source='/path/to/a.mkv', audio_track=1, start_time=20.0, duration=5.0, output='a2.mp4', rendition=None),
+            MagicMock(source='/path/to/b.mkv', audio_track=0, start_time=10.0, duration=5.0, output='b1.mp4', rendition=None),
+        ]
+        def mock_regenerate(*args):
+            return None if args[5] == 'a2.mp4' else {'filename': args[5], 'mode': 'encode'}
+
+        with patch('flask_backend.get_missing_files', return_value=entries), \
+             patch('flask_backend.regenerate_clip', side_effect=mock_regenerate) as mock_regenerate_clip, \
+             patch.object(scheduler, 'get_limit', return_value=1):
+
+            job = Job(regenerate_missing_clips, ())
+            job.run()
+
+            # Confirm clips regenerated in source order with lowest priority
+            self.assertEqual(mock_regenerate_clip.call_args_list[0].args, ('/path/to/a.mkv', 0, 10.0, 5.0, 'a1', 'a1.mp4', MAINTENANCE))
+            self.assertEqual([call.args[5] for call in mock_regenerate_clip.call_args_list], ['a1.mp4', 'a2.mp4', 'b1.mp4'])
+
+            # Confirm summary lists successes and failures, progress complete
+            self.assertEqual(job.result, {'total': 3, 'regenerated': ['a1.mp4', 'b1.mp4'], 'failed': ['a2.mp4']})
+            self.assertEqual(job.progress, 1)
+
+    def test_regenerate_missing_snapshot(self):
+        entries = [MagicMock(source='/path/to/a.mkv', start_time=10.0, output='frame.jpg', media_type='snapshot', rendition=None)]
+        with patch('flask_backend.get_missing_files', return_value=entries), \
+             patch('flask_backend.gen_snapshot', return_value='snapshot') as mock_gen_snapshot, \
+             patch('flask_backend.regenerate_clip') as mock_regenerate_clip:
+
+            job = Job(regenerate_missing_clips, ())
+            job.run()
+
+            # Confirm frame extracted again instead of generating clip
+            mock_gen_snapshot.assert_called_once_with('/path/to/a.mkv', 10.0, 'frame')
+            self.assertFalse(mock_regenerate_clip.called)
+            self.assertEqual(job.result, {'total': 1, 'regenerated': ['frame.jpg'], 'failed': []})
+
+    def test_regenerate_missing_clips_cancelled(self):
+        entries = [
+            MagicMock(source='/path/to/a.mkv', audio_track=0, start_time=float(i), duration=5.0, output=f'a{i}.mp4', rendition=None)
+            for i in range(3)
+        ]
+
+        # Cancel job while first clip is regenerating
+        def cancel_job(*args):
+            job.cancel()
+            return {'filename': args[5], 'mode': 'encode'}
+
+        with patch('flask_backend.get_missing_files', return_value=entries), \
+             patch('flask_backend.regenerate_clip', side_effect=cancel_job) as mock_regenerate_clip, \
+             patch.object(scheduler, 'get_limit', return_value=1):
+
+            job = Job(regenerate_missing_clips, ())
+            job.run()
+
+            # Confirm running clip finished, queued clips skipped
+            mock_regenerate_clip.assert_called_once()
+            self.assertEqual(job.status, 'cancelled')
+
+    def test_regenerate_missing_clips_sql_error(self):
+        with patch('flask_backend.get_missing_files', side_effect=OperationalError('Mock error', 'mock', 'mock')):
+            job = Job(regenerate_missing_clips, ())
+            job.run()
+            self.assertEqual(job.status, 'failed')
+
     def test_download(self):
         with patch('flask_backend.send_from_directory') as mock_send_from_directory:
             # Create mock filename and contents
@@ -418,6 +1141,32 @@ class TestEndpoints(TestCase):
             # Confirm mock called with correct args
             mock_send_from_directory.assert_called_once_with(output_path, filename, as_attachment=True)
 
+    def test_thumbnail(self):
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+        thumbnail = os.path.join(tmp.name, '.clip.mp4.jpg')
+        with open(thumbnail, 'wb') as file:
+            file.write(b'jpeg')
+
+        with patch('flask_backend.output_path', tmp.name), \
+             patch('flask_backend.get_thumbnail', return_value=thumbnail) as mock_get_thumbnail:
+
+            # Confirm thumbnail served with long-lived cache headers
+            response = self.app.get('/thumbnail/clip.mp4?v=2023-09-22_23:24:31.218942')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, b'jpeg')
+            self.assertEqual(response.mimetype, 'image/jpeg')
+            self.assertEqual(response.cache_control.max_age, 365 * 24 * 60 * 60)
+            self.assertTrue(response.cache_control.immutable)
+            mock_get_thumbnail.assert_called_once_with('clip.mp4')
+            response.close()
+
+            # Confirm 404 if clip missing, 503 if still waiting for worker
+            mock_get_thumbnail.return_value = None
+            self.assertEqual(self.app.get('/thumbnail/missing.mp4').status_code, 404)
+            mock_get_thumbnail.side_effect = TimeoutError
+            self.assertEqual(self.app.get('/thumbnail/clip.mp4').status_code, 503)
+
     def test_get_history(self):
         # Create mock history JSON
         mock_history = {
@@ -432,6 +1181,99 @@ class TestEndpoints(TestCase):
             self.assertEqual(response.status_code, 200)
             self.assertEqual(response.get_json(), mock_history)
 
+    def test_get_history_page(self):
+        # Confirm paginated response if limit given, filters parsed
+        mock_page = ([['2023-09-22_23:24:33.295994', 'output2.mp4', []]], 'cursor2')
+        with patch('flask_backend.load_history_page', return_value=mock_page) as mock_load_history_page, \
+             patch('flask_backend.get_history_seq', return_value=5):
+            response = self.app.get('/get_history?limit=1&cursor=cursor1&show=Show&renamed=false&start=&media_type=clip')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json(), {'history': mock_page[0], 'next_cursor': 'cursor2', 'seq': 5})
+            mock_load_history_page.assert_called_once_with(
+                None,
+                {'show': 'Show', 'renamed': False, 'media_type': 'clip'},
+                'cursor1',
+                1,
+                5
+            )
+
+            # Confirm search takes same params in JSON body
+            response = self.app.post(
+                '/search_history',
+                data=json.dumps({'query': 'search', 'limit': 20, 'cursor': None, 'renamed': True}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.get_json(), {'history': mock_page[0], 'next_cursor': 'cursor2'})
+            mock_load_history_page.assert_called_with('search', {'renamed': True}, None, 20, None)
+
+        # Confirm filters without limit return unpaginated list
+        with patch('flask_backend.load_history_json', return_value=[]) as mock_load_history_json, \
+             patch('flask_backend.get_history_seq', return_value=5):
+            self.assertEqual(self.app.get('/get_history?show=Show').get_json(), [])
+            mock_load_history_json.assert_called_once_with({'show': 'Show'}, 5)
+
+    def test_get_history_changes(self):
+        mock_changes = ([['2023-09-22_23:24:33.295994', 'output2.mp4', []]], ['output1.mp4'])
+        with patch('flask_backend.load_history_changes', return_value=mock_changes) as mock_load_history_changes, \
+             patch('flask_backend.get_history_seq', return_value=7):
+            # Confirm returns changes since given seq with current seq and ETag
+            response = self.app.get('/get_history?since=3&show=Show')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json(), {'seq': 7, 'changed': mock_changes[0], 'deleted': ['output1.mp4']})
+            self.assertEqual(response.headers['ETag'], '"history-7"')
+            self.assertIn('no-cache', response.headers['Cache-Control'])
+            mock_load_history_changes.assert_called_once_with(3, {'show': 'Show'}, 7)
+
+            # Confirm 304 with no body if history unchanged since client's seq
+            response = self.app.get('/get_history?since=7', headers={'If-None-Match': '"history-7"'})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b'')
+
+            # Confirm full history also revalidated by ETag
+            with patch('flask_backend.load_history_json', return_value=[]):
+                response = self.app.get('/get_history', headers={'If-None-Match': '"history-6"'})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.headers['ETag'], '"history-7"')
+                response = self.app.get('/get_history', headers={'If-None-Match': '"history-7"'})
+                self.assertEqual(response.status_code, 304)
+
+            # Confirm 410 if changes since client's seq were pruned (must reload)
+            with patch('flask_backend.get_oldest_history_seq', return_value=5):
+                response = self.app.get('/get_history?since=3')
+                self.assertEqual(response.status_code, 410)
+                self.assertIn('error', response.get_json())
+                self.assertEqual(self.app.get('/get_history?since=5').status_code, 200)
+
+            # Confirm 400 if since is not a number or newer than current seq
+            # (database changed, client must reload)
+            for query in ('since=abc', 'since=-1', 'since=8'):
+                response = self.app.get(f'/get_history?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.get_json())
+
+    def test_get_history_invalid_params(self):
+        # Confirm 400 if page size out of range or not a number
+        for query in ('limit=0', 'limit=201', 'limit=ten'):
+            response = self.app.get(f'/get_history?{query}')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.get_json())
+
+        # Confirm 400 if database rejects cursor or filters
+        with patch('flask_backend.load_history_page', side_effect=ValueError('Invalid cursor')):
+            response = self.app.get('/get_history?limit=20&cursor=invalid')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json(), {'error': 'Invalid cursor'})
+
+        # Confirm 400 (not 500) if search cursor in JSON body is not a string
+        for cursor in (5, ['cursor'], {'cursor': 1}):
+            response = self.app.post(
+                '/search_history',
+                data=json.dumps({'query': 'search', 'limit': 20, 'cursor': cursor}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json(), {'error': 'Invalid cursor'})
+
     def test_search_history(self):
         # Create mock history JSON
         mock_history = {
@@ -482,6 +1324,15 @@ class TestEndpoints(TestCase):
                 {'filename': 'new_name.mp4'}
             )
 
+    def test_rename_snapshot(self):
+        # Confirm snapshot keeps JPEG extension
+        payload = json.dumps({'old': 'frame.jpg', 'new': 'new_name'})
+        with patch('flask_backend.rename_entry') as mock_rename_entry, \
+             patch('flask_backend.is_duplicate', return_value=False):
+            response = self.app.post('/rename', data=payload, content_type='application/json')
+            self.assertEqual(response.get_json(), {'filename': 'new_name.jpg'})
+            mock_rename_entry.assert_called_once_with('frame.jpg', 'new_name.jpg')
+
     def test_rename_duplicate(self):
         # Create mock request payload
         payload = json.dumps({'old': 'original.mp4', 'new': 'new_name'})
@@ -501,63 +1352,3 @@ class TestEndpoints(TestCase):
                 response.get_json(),
                 {'error': 'File named new_name.mp4 already exists'}
             )
-
-
-class TestGetBitrate(TestCase):
-    def test_get_bitrate(self):
-        with patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
-            # Mock quality setting to 20 MB/min
-            mock_addon.return_value.getSetting.return_value = '20'
-            # Confirm correct bitrate
-            self.assertEqual(get_bitrate(), 2796202)
-
-
-class TestGenMp4(TestCase):
-    def test_generate(self):
-        # Mock ffmpeg, mock get_bitrate to return arbitrary value
-        with patch('flask_backend.get_bitrate', return_value=2796202), \
-             patch('flask_backend.ffmpeg', MagicMock) as mock_ffmpeg:
-
-            # Mock ffmpeg.probe to return a lower bitrate than get_bitrate
-            mock_ffmpeg.probe = MagicMock(return_value={'format': {'bit_rate': '1500000'}})
-            # Mock methods to confirm called with correct args
-            mock_ffmpeg.input = MagicMock()
-            mock_ffmpeg.output = MagicMock()
-            mock_ffmpeg.run = MagicMock()
-
-            # Call function with mock arguments, should return True
-            self.assertTrue(gen_mp4(
-                '/path/to/source.mp4',
-                0,
-                '23.4567',
-                '100.0',
-                'output'
-            ))
-
-            # Confirm correct args passed to ffmpeg methods
-            mock_ffmpeg.input.assert_called_with('/path/to/source.mp4')
-            mock_ffmpeg.output.assert_called_with(
-                os.path.join(output_path, 'output.mp4'),
-                ss='23.4567',
-                t='100.0',
-                vcodec="libx264",
-                b="1500000",
-                acodec="aac",
-                ac="2",
-                map=['0:v:0', '0:a:0']
-            )
-
-    def test_generate_error(self):
-        # Mock ffmpeg to raise exception, mock get_bitrate and ffmpeg.probe to return arbitrary values
-        with patch('flask_backend.get_bitrate', return_value=2796202), \
-             patch('flask_backend.ffmpeg.probe', return_value={'format': {'bit_rate': '1500000'}}), \
-             patch('flask_backend.ffmpeg.input', side_effect=ffmpeg.Error(cmd="", stdout="", stderr="".encode())):
-
-            # Call function with mock arguments, should return False
-            self.assertFalse(gen_mp4(
-                '/path/to/source.mp4',
-                0,
-                '23.4567',
-                '100.0',
-                'output'
-            ))
@@ -0,0 +1,177 @@
+# pylint: disable=line-too-long, missing-module-docstring, missing-function-docstring
+
+import os
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+import mock_kodi_modules
+from governor import (
+    Governor,
+    get_allowed_cpus,
+    get_throttled_cpus,
+    get_ffmpeg_command,
+    get_thread_options,
+    get_ffmpeg_pids,
+    is_playback_active,
+    apply_limits,
+    THROTTLED_NICE
+)
+
+
+def mock_settings(**settings):
+    '''Returns patch that mocks Addon().getSetting with keyword arg values.'''
+    mock_addon = MagicMock()
+    mock_addon.return_value.getSetting = lambda setting: settings.get(setting, '')
+    return patch('xbmcaddon.Addon', mock_addon)
+
+
+def mock_playback(playing, paused=False):
+    '''Returns patches that mock Kodi player state.'''
+    return (
+        patch('governor.xbmc.Player', return_value=MagicMock(isPlaying=MagicMock(return_value=playing))),
+        patch('governor.xbmc.getCondVisibility', return_value=paused)
+    )
+
+
+class TestSettings(TestCase):
+    def test_get_allowed_cpus(self):
+        with patch('governor.os.cpu_count', return_value=4):
+            # Confirm all cores if not configured
+            with mock_settings():
+                self.assertEqual(get_allowed_cpus(), {0, 1, 2, 3})
+
+            # Confirm configured cores used, cores that don't exist ignored
+            with mock_settings(encoder_cpus='2,3,7'):
+                self.assertEqual(get_allowed_cpus(), {2, 3})
+                self.assertEqual(get_throttled_cpus(), {3})
+
+            # Confirm invalid setting falls back to all cores
+            with mock_settings(encoder_cpus='two'):
+                self.assertEqual(get_allowed_cpus(), {0, 1, 2, 3})
+                self.assertEqual(get_throttled_cpus(), {2, 3})
+
+    def test_is_playback_active(self):
+        playing, paused = mock_playback(True)
+        with mock_settings(throttle_playback='true'), playing, paused:
+            self.assertTrue(is_playback_active())
+
+        # Confirm False when paused
+        playing, paused = mock_playback(True, True)
+        with mock_settings(throttle_playback='true'), playing, paused:
+            self.assertFalse(is_playback_active())
+
+        # Confirm False when throttling disabled
+        playing, paused = mock_playback(True)
+        with mock_settings(throttle_playback='false'), playing, paused:
+            self.assertFalse(is_playback_active())
+
+    def test_get_ffmpeg_command(self):
+        # Confirm no wrappers if nothing configured
+        with mock_settings(encoder_ionice='Normal'):
+            self.assertEqual(get_ffmpeg_command(), ['ffmpeg'])
+
+        # Confirm wrappers added for configured limits
+        with mock_settings(encoder_nice='10', encoder_ionice='Idle', encoder_cpus='2,3'), \
+             patch('governor.os.cpu_count', return_value=4), \
+             patch('governor.shutil.which', return_value='/usr/bin/tool'):
+            self.assertEqual(get_ffmpeg_command(), [
+                'nice', '-n', '10',
+                'ionice', '-c', '3',
+                'taskset', '-c', '2,3',
+                'ffmpeg'
+            ])
+
+        # Confirm wrappers skipped if not installed
+        with mock_settings(encoder_nice='10', encoder_ionice='Idle', encoder_cpus='2,3'), \
+             patch('governor.shutil.which', return_value=None):
+            self.assertEqual(get_ffmpeg_command(), ['ffmpeg'])
+
+    def test_get_thread_options(self):
+        # Confirm no cap by default, configured cap used
+        with mock_settings():
+            self.assertEqual(get_thread_options(), {})
+        with mock_settings(encoder_threads='4'):
+            self.assertEqual(get_thread_options(), {'threads': '4'})
+
+        # Confirm halved during playback (half of cores if not configured)
+        playing, paused = mock_playback(True)
+        with mock_settings(encoder_threads='4', throttle_playback='true'), playing, paused:
+            self.assertEqual(get_thread_options(), {'threads': '2'})
+
+            # Confirm not halved if throttle disabled (calibration)
+            self.assertEqual(get_thread_options(throttle=False), {'threads': '4'})
+        with mock_settings(throttle_playback='true'), playing, paused, \
+             patch('governor.os.cpu_count', return_value=8):
+            self.assertEqual(get_thread_options(), {'threads': '4'})
+
+
+class TestGovernor(TestCase):
+    def test_get_ffmpeg_pids(self):
+        # Confirm child processes not named ffmpeg are ignored
+        with patch('governor.glob.glob', return_value=['/proc/1/task/1/children']), \
+             patch('builtins.open') as mock_open:
+            mock_open.return_value.__enter__.return_value.read.side_effect = ['100 200', 'ffmpeg\n', 'python3\n']
+            self.assertEqual(get_ffmpeg_pids(), [100])
+
+    def test_update(self):
+        governor = Governor()
+        with patch('governor.get_ffmpeg_pids', return_value=[100]), \
+             patch('governor.get_allowed_cpus', return_value={0, 1, 2, 3}), \
+             patch('governor.apply_limits') as mock_apply_limits:
+
+            # Simulate playback started, confirm process throttled once
+            with patch('governor.is_playback_active', return_value=True):
+                governor.update()
+                governor.update()
+                mock_apply_limits.assert_called_once_with(100, {2, 3}, THROTTLED_NICE)
+
+            # Simulate playback paused, confirm cores restored (niceness never lowered)
+            mock_apply_limits.reset_mock()
+            with patch('governor.is_playback_active', return_value=False):
+                governor.update()
+                mock_apply_limits.assert_called_once_with(100, {0, 1, 2, 3})
+                self.assertEqual(governor.throttled, set())
+
+    def test_update_process_exited(self):
+        # Simulate throttled process exited, confirm forgotten
+        governor = Governor()
+        governor.throttled = {100}
+        with patch('governor.get_ffmpeg_pids', return_value=[]), \
+             patch('governor.is_playback_active', return_value=True):
+            governor.update()
+            self.assertEqual(governor.throttled, set())
+
+    def test_apply_limits(self):
+        # Simulate process with 3 threads, one already at lowest priority
+        with patch('governor.os.listdir', return_value=['100', '101', '102']), \
+             patch('governor.os.sched_setaffinity', create=True) as mock_setaffinity, \
+             patch('governor.os.getpriority', side_effect=[0, 19, 5], create=True), \
+             patch('governor.os.setpriority', create=True) as mock_setpriority:
+            self.assertTrue(apply_limits(100, {2, 3}, THROTTLED_NICE))
+
+            # Confirm every thread limited, niceness only raised
+            self.assertEqual([call.args[0] for call in mock_setaffinity.call_args_list], [100, 101, 102])
+            self.assertEqual(
+                [call.args for call in mock_setpriority.call_args_list],
+                [(os.PRIO_PROCESS, 100, 19), (os.PRIO_PROCESS, 102, 19)]
+            )
+
+        # Confirm niceness not changed if not given
+        with patch('governor.os.listdir', return_value=['100']), \
+             patch('governor.os.sched_setaffinity', create=True), \
+             patch('governor.os.setpriority', create=True) as mock_setpriority:
+            self.assertTrue(apply_limits(100, {0, 1}))
+            self.assertFalse(mock_setpriority.called)
+
+    def test_apply_limits_errors(self):
+        # Confirm threads that exited ignored, failures logged
+        with patch('governor.os.listdir', return_value=['100', '101']), \
+             patch('governor.os.sched_setaffinity', side_effect=[ProcessLookupError, PermissionError], create=True), \
+             patch('governor.xbmc.log') as mock_log:
+            self.assertFalse(apply_limits(100, {0}, 10))
+            mock_log.assert_called_once()
+
+        # Confirm falls back to PID if threads can't be listed
+        with patch('governor.os.listdir', side_effect=FileNotFoundError), \
+             patch('governor.os.sched_setaffinity', create=True) as mock_setaffinity:
+            self.assertTrue(apply_limits(100, {0}))
+            mock_setaffinity.assert_called_once_with(100, {0})
@@ -0,0 +1,152 @@
+# pylint: disable=line-too-long, missing-module-docstring, missing-function-docstring
+
+import time
+import threading
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+import mock_kodi_modules
+from jobs import Job, jobs, submit_job, submit_unique_job, get_job, get_current_job, prune_jobs
+
+
+class TestJobs(TestCase):
+    def tearDown(self):
+        # Clear job registry after each test
+        jobs.clear()
+
+    def test_job_successful(self):
+        # Submit job that returns a result, wait for job to finish
+        job = submit_job(lambda a, b: {'sum': a + b}, 1, 2)
+        self.assertTrue(job.wait(5))
+
+        # Confirm status and result
+        self.assertEqual(job.status, 'complete')
+        self.assertEqual(job.to_dict(), {
+            'job_id': job.id,
+            'status': 'complete',
+            'result': {'sum': 3}
+        })
+
+    def test_job_failed(self):
+        # Submit job that returns None (failed), confirm status
+        job = submit_job(lambda: None)
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNone(job.result)
+
+    def test_job_unexpected_exception(self):
+        # Submit job that raises exception, confirm status and error logged
+        with patch('jobs.xbmc.log', MagicMock()) as mock_log:
+            job = submit_job(MagicMock(side_effect=ValueError('bad value')))
+            self.assertTrue(job.wait(5))
+            self.assertEqual(job.status, 'failed')
+            self.assertTrue(mock_log.called)
+
+    def test_job_queued_status(self):
+        # Create job without submitting, confirm initial status
+        job = Job(MagicMock(), ())
+        self.assertEqual(job.status, 'queued')
+        self.assertFalse(job.wait(0))
+
+    def test_get_job(self):
+        # Confirm submitted job can be retrieved by ID, unknown ID returns None
+        job = submit_job(lambda: {})
+        self.assertIs(get_job(job.id), job)
+        self.assertIsNone(get_job('unknown'))
+
+    def test_submit_unique_job(self):
+        # Simulate long-running job
+        started = threading.Event()
+        release = threading.Event()
+        def target():
+            started.set()
+            release.wait(5)
+            return {}
+
+        # Confirm second submit returns same job while first is still running
+        job = submit_unique_job(target)
+        self.assertTrue(started.wait(5))
+        self.assertIs(submit_unique_job(target), job)
+
+        # Confirm jobs with a different target are not affected
+        other = submit_unique_job(lambda: {})
+        self.assertIsNot(other, job)
+
+        # Confirm new job started once first finishes
+        release.set()
+        self.assertTrue(job.wait(5))
+        self.assertIsNot(submit_unique_job(target), job)
+
+    def test_prune_jobs(self):
+        # Submit 2 jobs, wait for both to finish
+        old_job = submit_job(lambda: {})
+        new_job = submit_job(lambda: {})
+        self.assertTrue(old_job.wait(5))
+        self.assertTrue(new_job.wait(5))
+
+        # Simulate first job finished 2 hours ago, prune
+        old_job.finished_time = time.time() - 7200
+        prune_jobs()
+
+        # Confirm only old job removed
+        self.assertIsNone(get_job(old_job.id))
+        self.assertIs(get_job(new_job.id), new_job)
+
+    def test_current_job(self):
+        # Submit job that returns current job, confirm returns itself
+        job = submit_job(lambda: get_current_job().id)
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.result, job.id)
+        self.assertIsNone(get_current_job())
+
+    def test_cancel_queued_job(self):
+        # Cancel job before it runs, confirm target not called
+        target = MagicMock()
+        job = Job(target, ())
+        self.assertTrue(job.cancel())
+        job.run()
+        self.assertEqual(job.status, 'cancelled')
+        self.assertFalse(target.called)
+
+        # Confirm can't cancel finished job
+        self.assertFalse(job.cancel())
+
+    def test_cancel_running_job(self):
+        # Simulate job running ffmpeg process
+        job = Job(MagicMock(), ())
+        process = MagicMock()
+        exited = MagicMock()
+        job.add_process(process)
+        job.add_process(exited)
+        job.remove_process(exited)
+
+        # Confirm running process killed when cancelled
+        job.cancel()
+        process.kill.assert_called_once()
+        self.assertFalse(exited.kill.called)
+
+        # Confirm process started after cancel is killed immediately
+        late_process = MagicMock()
+        job.add_process(late_process)
+        late_process.kill.assert_called_once()
+
+    def test_get_progress(self):
+        # Confirm no ETA before progress reported
+        job = Job(MagicMock(), ())
+        self.assertEqual(job.get_progress(), {'percent': 0.0, 'speed': None, 'eta': None})
+
+        # Simulate 25% done after 10 seconds, confirm ETA is 30 seconds
+        job.encode_started = time.time() - 10
+        job.speed = '1.5x'
+        job.update_progress(0.25)
+        progress = job.get_progress()
+        self.assertEqual(progress['percent'], 25.0)
+        self.assertEqual(progress['speed'], '1.5x')
+        self.assertAlmostEqual(progress['eta'], 30, delta=1)
+
+    def test_update_progress_parts(self):
+        # Simulate 2 segments encoded at the same time, confirm progress summed
+        job = Job(MagicMock(), ())
+        job.update_progress(0.2, part=0)
+        job.update_progress(0.1, part=1)
+        job.update_progress(0.3, part=0)
+        self.assertAlmostEqual(job.progress, 0.4)
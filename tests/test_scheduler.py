@@ -0,0 +1,125 @@
+# pylint: disable=line-too-long, missing-module-docstring, missing-function-docstring
+
+import time
+import threading
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+import mock_kodi_modules
+from scheduler import (
+    Scheduler,
+    QueueFullError,
+    get_default_limit,
+    INTERACTIVE,
+    REGENERATE,
+    MAINTENANCE,
+    MAX_QUEUED
+)
+
+
+def mock_limit(limit):
+    '''Returns patch that mocks max_encodes setting.'''
+    mock_addon = MagicMock()
+    mock_addon.return_value.getSetting.return_value = str(limit)
+    return patch('xbmcaddon.Addon', mock_addon)
+
+
+class TestScheduler(TestCase):
+    def test_get_limit(self):
+        # Confirm uses configured limit
+        with mock_limit(3):
+            self.assertEqual(Scheduler.get_limit(), 3)
+
+        # Confirm 0 (automatic) and invalid values use default
+        with mock_limit(0):
+            self.assertEqual(Scheduler.get_limit(), get_default_limit())
+        with mock_limit(''):
+            self.assertEqual(Scheduler.get_limit(), get_default_limit())
+
+        # Confirm default is half of cores (at least 1)
+        with patch('scheduler.os.cpu_count', return_value=8):
+            self.assertEqual(get_default_limit(), 4)
+        with patch('scheduler.os.cpu_count', return_value=1):
+            self.assertEqual(get_default_limit(), 1)
+
+    def test_slot(self):
+        scheduler = Scheduler()
+        with mock_limit(2):
+            # Confirm slot held while block runs, released after
+            with scheduler.slot():
+                self.assertEqual(scheduler.get_stats()['running'], 1)
+            self.assertEqual(scheduler.get_stats()['running'], 0)
+
+            # Confirm released if block raises exception
+            with self.assertRaises(ValueError):
+                with scheduler.slot():
+                    raise ValueError
+            self.assertEqual(scheduler.running, 0)
+
+    def test_acquire_non_blocking(self):
+        scheduler = Scheduler()
+        with mock_limit(1):
+            # Confirm second caller can't take slot until first releases
+            self.assertTrue(scheduler.acquire(blocking=False))
+            self.assertFalse(scheduler.acquire(blocking=False))
+            scheduler.release()
+            self.assertTrue(scheduler.acquire(blocking=False))
+            scheduler.release()
+
+    def test_priority_order(self):
+        scheduler = Scheduler()
+        order = []
+
+        def worker(priority, name):
+            with scheduler.slot(priority):
+                order.append(name)
+
+        with mock_limit(1):
+            # Hold only slot, queue callers in reverse priority order
+            scheduler.acquire()
+            threads = []
+            for priority, name in [(MAINTENANCE, 'maintenance'), (REGENERATE, 'regenerate'), (INTERACTIVE, 'interactive')]:
+                threads.append(threading.Thread(target=worker, args=(priority, name)))
+                threads[-1].start()
+                while len(scheduler.waiting) < len(threads):
+                    time.sleep(0.01)
+
+            # Confirm stats show queued callers by priority
+            stats = scheduler.get_stats()
+            self.assertEqual(stats['queued'], 3)
+            self.assertEqual(stats['queued_by_priority'], {'interactive': 1, 'regenerate': 1, 'maintenance': 1})
+
+            # Release slot, confirm callers ran in priority order
+            scheduler.release()
+            for thread in threads:
+                thread.join(5)
+            self.assertEqual(order, ['interactive', 'regenerate', 'maintenance'])
+
+    def test_admit(self):
+        scheduler = Scheduler()
+        with mock_limit(1):
+            # Simulate slot in use and MAX_QUEUED regenerate callers waiting
+            scheduler.running = 1
+            scheduler.waiting = [(REGENERATE, i) for i in range(MAX_QUEUED)]
+
+            # Confirm interactive still admitted (runs first), regenerate rejected
+            scheduler.admit(INTERACTIVE)
+            with self.assertRaises(QueueFullError) as context:
+                scheduler.admit(REGENERATE)
+
+            # Confirm retry_after is estimated wait
+            self.assertEqual(context.exception.retry_after, (MAX_QUEUED + 1) * 30)
+
+    def test_estimate_wait(self):
+        scheduler = Scheduler()
+        with mock_limit(2):
+            # Confirm no wait when slots free
+            self.assertEqual(scheduler.get_stats()['estimated_wait'], 0)
+
+            # Simulate both slots in use, confirm waits ~1 encode
+            scheduler.running = 2
+            self.assertEqual(scheduler.get_stats()['estimated_wait'], 30)
+
+            # Simulate 2 encodes finishing in 10 seconds, confirm estimate drops
+            scheduler.release(10)
+            scheduler.running = 2
+            self.assertLess(scheduler.get_stats()['estimated_wait'], 30)
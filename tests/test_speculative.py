@@ -0,0 +1,242 @@
+# pylint: disable=line-too-long, missing-module-docstring, missing-function-docstring
+
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+import ffmpeg
+import mock_kodi_modules
+from scheduler import scheduler
+from speculative import (
+    SpeculativeSession,
+    sessions,
+    start_session,
+    pop_session,
+    cancel_all_sessions,
+    MAX_SESSIONS
+)
+
+
+# Mock ffprobe output for HEVC source (must be re-encoded)
+mock_probe_hevc = {
+    'format': {'bit_rate': '8000000'},
+    'streams': [
+        {'codec_type': 'video', 'codec_name': 'hevc'},
+        {'codec_type': 'audio', 'codec_name': 'eac3', 'channels': 6}
+    ]
+}
+
+
+def create_started_session(encoded, poll=None):
+    '''Returns session with mock ffmpeg process that has encoded N seconds.'''
+    session = SpeculativeSession('/path/to/source.mkv', 0, '23.4567')
+    session.process = MagicMock()
+    session.process.poll.return_value = poll
+    session.started = True
+    session.encoded = encoded
+    return session
+
+
+class TestSpeculativeSession(TestCase):
+    def tearDown(self):
+        sessions.clear()
+
+    def test_matches(self):
+        session = SpeculativeSession('/path/to/source.mkv', 1, 23.4567)
+        self.assertTrue(session.matches('/path/to/source.mkv', 1, '23.4567'))
+        self.assertFalse(session.matches('/path/to/other.mkv', 1, '23.4567'))
+        self.assertFalse(session.matches('/path/to/source.mkv', 0, '23.4567'))
+        self.assertFalse(session.matches('/path/to/source.mkv', 1, '30.0'))
+
+    def test_start(self):
+        session = SpeculativeSession('/path/to/source.mkv', 1, '23.4567')
+
+        # Mock source that must be re-encoded, mock ffmpeg process output
+        with patch('speculative.probe_source', return_value=mock_probe_hevc), \
+             patch('speculative.get_bitrate', return_value=2796202), \
+             patch('speculative.ffmpeg.input') as mock_input, \
+             patch('speculative.threading.Thread') as mock_thread:
+
+            session.start()
+            self.assertTrue(session.started)
+
+            # Confirm reads source in real time from start time, encodes at target bitrate
+            mock_input.assert_called_once_with('/path/to/source.mkv', ss=23.4567, re=None)
+            mock_output = mock_input.return_value.output
+            self.assertEqual(mock_output.call_args.args, (session.temp_output,))
+            self.assertEqual(mock_output.call_args.kwargs['b'], '2796202')
+            self.assertEqual(mock_output.call_args.kwargs['map'], ['0:v:0', '0:a:1'])
+
+            # Confirm progress written to stdout, process saved, reader threads started
+            mock_output.return_value.global_args.assert_called_once_with('-nostats', '-progress', 'pipe:1')
+            self.assertIsNotNone(session.process)
+            self.assertEqual(mock_thread.call_count, 2)
+
+            # Confirm holds scheduler slot until ffmpeg exits
+            self.assertTrue(session.holds_slot)
+            self.assertEqual(scheduler.running, 1)
+            session.release_slot()
+            session.release_slot()
+            self.assertEqual(scheduler.running, 0)
+
+        session.timer.cancel()
+
+    def test_start_no_free_slot(self):
+        session = SpeculativeSession('/path/to/source.mkv', 0, '23.4567')
+
+        # Simulate all scheduler slots in use, confirm ffmpeg not started
+        with patch('speculative.probe_source', return_value=mock_probe_hevc), \
+             patch('speculative.get_bitrate', return_value=2796202), \
+             patch('speculative.scheduler.acquire', return_value=False), \
+             patch('speculative.ffmpeg.input') as mock_input:
+
+            session.start()
+            self.assertTrue(session.started)
+            self.assertIsNone(session.process)
+            self.assertFalse(mock_input.called)
+        session.timer.cancel()
+
+    def test_start_stream_copy_source(self):
+        session = SpeculativeSession('/path/to/source.mp4', 0, '23.4567')
+
+        # Mock source that can be stream copied, enable stream copy setting
+        with patch('speculative.probe_source', return_value=mock_probe_hevc), \
+             patch('speculative.get_bitrate', return_value=2796202), \
+             patch('speculative.can_copy_video', return_value=True), \
+             patch('speculative.ffmpeg.input') as mock_input, \
+             patch('xbmcaddon.Addon', return_value=MagicMock()) as mock_addon:
+
+            mock_addon.return_value.getSetting.return_value = 'true'
+
+            # Confirm ffmpeg not started
+            session.start()
+            self.assertTrue(session.started)
+            self.assertIsNone(session.process)
+            self.assertFalse(mock_input.called)
+
+        # Confirm finalize returns False immediately (generate normally)
+        self.assertFalse(session.finalize(10.0, 'output'))
+
+    def test_start_ffmpeg_error(self):
+        session = SpeculativeSession('/path/to/source.mkv', 0, '23.4567')
+        with patch('speculative.probe_source', side_effect=ffmpeg.Error(cmd="", stdout="", stderr="".encode())):
+            session.start()
+            self.assertTrue(session.started)
+            self.assertIsNone(session.process)
+        session.timer.cancel()
+
+    def test_read_progress(self):
+        # Simulate ffmpeg -progress output
+        session = create_started_session(0.0)
+        session.process.stdout = [
+            b'frame=120\n',
+            b'out_time_us=N/A\n',
+            b'out_time_us=5005000\n',
+            b'progress=continue\n'
+        ]
+        session.read_progress()
+        self.assertEqual(session.encoded, 5.005)
+
+    def test_read_stderr(self):
+        # Simulate more stderr lines than kept
+        session = create_started_session(0.0)
+        session.process.stderr = [f'line {i}\n'.encode() for i in range(100)]
+        session.read_stderr()
+        self.assertEqual(len(session.stderr), 50)
+        self.assertEqual(session.stderr[-1], 'line 99')
+
+    def test_finalize(self):
+        # Simulate encoder already past stop time
+        session = create_started_session(12.5)
+        with patch('speculative.ffmpeg.input') as mock_input, \
+             patch('speculative.run_ffmpeg') as mock_run_ffmpeg:
+            self.assertTrue(session.finalize(10.0, 'output'))
+
+            # Confirm ffmpeg asked to quit, output trimmed to duration without re-encoding
+            session.process.stdin.write.assert_called_once_with(b'q')
+            mock_input.assert_called_once_with(session.temp_output)
+            mock_input.return_value.output.assert_called_once_with(
+                os.path.join('./output', 'output.mp4'),
+                t=10.0,
+                c="copy"
+            )
+            mock_run_ffmpeg.assert_called_once_with(mock_input.return_value.output.return_value)
+
+    def test_finalize_removes_temp_output(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+             patch('speculative.ffmpeg.input'), \
+             patch('speculative.run_ffmpeg'):
+
+            # Create temp output file
+            session = create_started_session(12.5)
+            session.temp_output = os.path.join(tmp, '.speculative.mp4')
+            with open(session.temp_output, 'w', encoding='utf-8'):
+                pass
+
+            # Confirm deleted after finalizing
+            self.assertTrue(session.finalize(10.0, 'output'))
+            self.assertFalse(os.path.exists(session.temp_output))
+
+    def test_finalize_encoder_exited_early(self):
+        # Simulate encoder exited before reaching stop time
+        session = create_started_session(5.0, poll=1)
+        with patch('speculative.ffmpeg.input') as mock_input:
+            self.assertFalse(session.finalize(10.0, 'output'))
+            self.assertTrue(session.cancelled)
+            self.assertFalse(mock_input.called)
+
+    def test_finalize_ffmpeg_error(self):
+        # Simulate error while trimming output
+        session = create_started_session(12.5)
+        with patch('speculative.ffmpeg.input', side_effect=ffmpeg.Error(cmd="", stdout="", stderr="".encode())):
+            self.assertFalse(session.finalize(10.0, 'output'))
+
+    def test_cancel(self):
+        # Add running session to registry
+        session = create_started_session(5.0)
+        sessions[session.id] = session
+
+        # Confirm process killed, session removed from registry
+        session.cancel()
+        self.assertTrue(session.cancelled)
+        session.process.kill.assert_called_once()
+        self.assertNotIn(session.id, sessions)
+
+    def test_timeout(self):
+        # Confirm abandoned session is cancelled
+        session = create_started_session(5.0)
+        session.timeout()
+        self.assertTrue(session.cancelled)
+        session.process.kill.assert_called_once()
+
+
+class TestSessionRegistry(TestCase):
+    def tearDown(self):
+        sessions.clear()
+
+    def test_start_session(self):
+        with patch.object(SpeculativeSession, 'start') as mock_start:
+            # Confirm session added to registry and started in background thread
+            session = start_session('/path/to/source.mkv', 0, 23.4567)
+            self.assertIs(sessions[session.id], session)
+            mock_start.assert_called_once()
+
+            # Confirm pop_session removes from registry
+            self.assertIs(pop_session(session.id), session)
+            self.assertIsNone(pop_session(session.id))
+            self.assertIsNone(pop_session(None))
+
+    def test_start_session_limit(self):
+        with patch.object(SpeculativeSession, 'start'):
+            for _ in range(MAX_SESSIONS):
+                self.assertIsNotNone(start_session('/path/to/source.mkv', 0, 23.4567))
+
+            # Confirm no more sessions can be started
+            self.assertIsNone(start_session('/path/to/source.mkv', 0, 23.4567))
+
+    def test_cancel_all_sessions(self):
+        with patch.object(SpeculativeSession, 'start'):
+            start_session('/path/to/source.mkv', 0, 23.4567)
+            start_session('/path/to/source.mkv', 0, 50.0)
+        cancel_all_sessions()
+        self.assertEqual(sessions, {})
@@ -0,0 +1,135 @@
+# pylint: disable=line-too-long, missing-module-docstring, missing-function-docstring
+
+import os
+import time
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+import ffmpeg
+import mock_kodi_modules
+import thumbnails
+from thumbnails import get_thumbnail, pending
+
+
+def write_thumbnail(stream):
+    '''Mock run_ffmpeg that writes empty output file.'''
+    with open(stream.get_args()[-1], 'w', encoding='utf-8'):
+        pass
+
+
+class TestThumbnails(TestCase):
+    def setUp(self):
+        # Write clips and thumbnails to temporary directory
+        tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp.cleanup)
+        self.output_path = tmp.name
+        for target in ('thumbnails.output_path', 'paths.output_path'):
+            patcher = patch(target, tmp.name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # Create mock clip
+        self.clip = os.path.join(tmp.name, 'clip.mp4')
+        with open(self.clip, 'w', encoding='utf-8') as file:
+            file.write('clip')
+        self.thumbnail = os.path.join(tmp.name, '.clip.mp4.jpg')
+
+    def tearDown(self):
+        self.assertEqual(pending, {})
+
+    def test_generate_thumbnail(self):
+        with patch('thumbnails.get_orm_entry', return_value=MagicMock(duration=20.0)), \
+             patch('thumbnails.run_ffmpeg', side_effect=write_thumbnail) as mock_run_ffmpeg:
+
+            # Confirm thumbnail generated next to clip, returns path
+            self.assertEqual(get_thumbnail('clip.mp4'), self.thumbnail)
+            self.assertTrue(os.path.exists(self.thumbnail))
+            self.assertFalse(os.path.exists(f'{self.thumbnail}.part'))
+
+            # Confirm single frame taken at 25% of clip with fast input seek
+            args = mock_run_ffmpeg.call_args.args[0].get_args()
+            self.assertEqual(args[:4], ['-ss', '5.0', '-i', self.clip])
+            self.assertIn('-vframes', args)
+            self.assertIn('scale=320:-2', args)
+
+            # Confirm cached thumbnail served without running ffmpeg again
+            self.assertEqual(get_thumbnail('clip.mp4'), self.thumbnail)
+            mock_run_ffmpeg.assert_called_once()
+
+    def test_outdated_thumbnail(self):
+        # Simulate thumbnail generated before clip was regenerated
+        with open(self.thumbnail, 'w', encoding='utf-8'):
+            pass
+        os.utime(self.thumbnail, (time.time() - 60, time.time() - 60))
+
+        with patch('thumbnails.get_orm_entry', return_value=MagicMock(duration=20.0)), \
+             patch('thumbnails.run_ffmpeg', side_effect=write_thumbnail) as mock_run_ffmpeg:
+            self.assertEqual(get_thumbnail('clip.mp4'), self.thumbnail)
+            mock_run_ffmpeg.assert_called_once()
+
+    def test_missing_clip(self):
+        with patch('thumbnails.run_ffmpeg') as mock_run_ffmpeg:
+            self.assertIsNone(get_thumbnail('missing.mp4'))
+            self.assertIsNone(get_thumbnail('..'))
+            self.assertFalse(mock_run_ffmpeg.called)
+
+    def test_clip_not_in_database(self):
+        with patch('thumbnails.get_orm_entry', return_value=None), \
+             patch('thumbnails.run_ffmpeg') as mock_run_ffmpeg:
+            self.assertIsNone(get_thumbnail('clip.mp4'))
+            self.assertFalse(mock_run_ffmpeg.called)
+
+    def test_ffmpeg_error(self):
+        def fail(stream):
+            write_thumbnail(stream)
+            raise ffmpeg.Error('ffmpeg', None, b'error')
+
+        with patch('thumbnails.get_orm_entry', return_value=MagicMock(duration=20.0)), \
+             patch('thumbnails.run_ffmpeg', side_effect=fail):
+            # Confirm returns None, partial output removed
+            self.assertIsNone(get_thumbnail('clip.mp4'))
+            self.assertEqual(os.listdir(self.output_path), ['clip.mp4'])
+
+    def test_concurrent_requests(self):
+        # Simulate slow ffmpeg, 3 requests for the same thumbnail
+        release = threading.Event()
+        def slow_ffmpeg(stream):
+            release.wait(10)
+            write_thumbnail(stream)
+
+        with patch('thumbnails.get_orm_entry', return_value=MagicMock(duration=20.0)), \
+             patch('thumbnails.run_ffmpeg', side_effect=slow_ffmpeg) as mock_run_ffmpeg:
+            results = []
+            threads = [
+                threading.Thread(target=lambda: results.append(get_thumbnail('clip.mp4')))
+                for _ in range(3)
+            ]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.1)
+            release.set()
+            for thread in threads:
+                thread.join(timeout=10)
+
+            # Confirm generated once, every request got thumbnail
+            mock_run_ffmpeg.assert_called_once()
+            self.assertEqual(results, [self.thumbnail] * 3)
+
+    def test_timeout(self):
+        # Simulate worker busy with another thumbnail
+        release = threading.Event()
+        def slow_ffmpeg(stream):
+            release.wait(10)
+            write_thumbnail(stream)
+
+        with patch('thumbnails.get_orm_entry', return_value=MagicMock(duration=20.0)), \
+             patch('thumbnails.run_ffmpeg', side_effect=slow_ffmpeg), \
+             patch('thumbnails.THUMBNAIL_TIMEOUT', 0.1):
+            with self.assertRaises(TimeoutError):
+                get_thumbnail('clip.mp4')
+
+            # Confirm thumbnail still finishes in background
+            release.set()
+            thumbnails.pool.submit(lambda: None).result(timeout=10)
+            self.assertTrue(os.path.exists(self.thumbnail))
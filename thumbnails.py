@@ -0,0 +1,129 @@
+'''Poster frame thumbnails shown on history menu cards. Thumbnails are only
+generated when first requested (history cards load them lazily), by a single
+background worker so they never compete with clip encodes for more than one
+core. Each thumbnail is a small JPEG cached next to its clip (hidden file,
+renamed/deleted with the clip) and regenerated if the clip is newer.
+'''
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import xbmc
+import ffmpeg
+from sqlalchemy.exc import OperationalError
+from paths import output_path, get_thumbnail_path
+from encoder import run_ffmpeg
+from database import get_orm_entry
+
+
+# Thumbnail width in pixels (height keeps clip aspect ratio)
+THUMBNAIL_WIDTH = 320
+
+# Fraction of clip duration where poster frame is taken
+THUMBNAIL_POSITION = 0.25
+
+# JPEG quality (2-31, lower is better)
+THUMBNAIL_QUALITY = 5
+
+# Maximum seconds a request waits for its thumbnail to be generated
+THUMBNAIL_TIMEOUT = 30
+
+# Generates thumbnails one at a time in the background
+pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='record_button_thumbnail')
+
+# Thumbnails waiting for or being generated (filename keys, Future values)
+pending = {}
+pending_lock = threading.Lock()
+
+
+def is_thumbnail_current(clip, thumbnail):
+    '''Takes clip and thumbnail paths, returns True if thumbnail exists and
+    was generated after clip was last written.
+    '''
+    try:
+        return os.path.getmtime(thumbnail) >= os.path.getmtime(clip)
+    except OSError:
+        return False
+
+
+def get_thumbnail(filename):
+    '''Takes clip filename, returns path to cached thumbnail (queues thumbnail
+    and waits up to THUMBNAIL_TIMEOUT seconds if missing or outdated). Returns
+    None if clip does not exist or thumbnail could not be generated. Raises
+    TimeoutError if thumbnail is still waiting after timeout.
+    '''
+    clip = os.path.join(output_path, filename)
+    if not os.path.isfile(clip):
+        return None
+
+    thumbnail = get_thumbnail_path(filename)
+    if is_thumbnail_current(clip, thumbnail):
+        return thumbnail
+
+    # Wait for thumbnail already queued by another request or queue new
+    with pending_lock:
+        future = pending.get(filename)
+        if future is None:
+            future = pending[filename] = pool.submit(generate_thumbnail, filename)
+
+    try:
+        return future.result(timeout=THUMBNAIL_TIMEOUT)
+    except FutureTimeoutError as e:
+        # Only an alias of the builtin on python 3.11+
+        raise TimeoutError(f"Thumbnail for {filename} not ready") from e
+
+
+def generate_thumbnail(filename):
+    '''Runs in thumbnail worker thread. Takes clip filename, writes poster
+    frame to thumbnail path. Returns thumbnail path if successful, None if
+    clip is not in database or ffmpeg failed.
+    '''
+    clip = os.path.join(output_path, filename)
+    thumbnail = get_thumbnail_path(filename)
+    temp = f'{thumbnail}.part'
+    try:
+        # Get clip duration from database (only clips in history have thumbnails)
+        try:
+            entry = get_orm_entry(filename)
+        except OperationalError as e:
+            xbmc.log(
+                f"Failed to generate thumbnail for {filename} due to SQL error:",
+                xbmc.LOGERROR
+            )
+            xbmc.log(e.args[0], xbmc.LOGERROR)
+            return None
+        if entry is None:
+            return None
+
+        # Seek on input side (decodes from the keyframe before the position)
+        stream = ffmpeg.input(
+            clip,
+            ss=round(float(entry.duration) * THUMBNAIL_POSITION, 3)
+        ).output(
+            temp,
+            f='mjpeg',
+            vframes=1,
+            vf=f'scale={THUMBNAIL_WIDTH}:-2',
+            **{'q:v': THUMBNAIL_QUALITY}
+        )
+        run_ffmpeg(stream)
+
+        # Replace atomically (requests never serve a partial thumbnail)
+        os.replace(temp, thumbnail)
+        return thumbnail
+
+    except ffmpeg.Error as e:
+        xbmc.log(f"Failed to generate thumbnail for {filename}:", xbmc.LOGERROR)
+        xbmc.log(e.stderr.decode(errors='replace'), xbmc.LOGERROR)
+        if os.path.exists(temp):
+            os.remove(temp)
+        return None
+
+    finally:
+        with pending_lock:
+            pending.pop(filename, None)
+
+
+def shutdown():
+    '''Cancels queued thumbnails, called when Kodi exits.'''
+    pool.shutdown(wait=False, cancel_futures=True)